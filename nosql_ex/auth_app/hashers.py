@@ -0,0 +1,237 @@
+"""hashers.py
+
+This file hashes and verifies the passwords of the users stored in MongoDB, using Django's password hashers
+(see https://docs.djangoproject.com/en/5.1/topics/auth/passwords/).
+
+The hasher used for new passwords is the first entry of the 'PASSWORD_HASHERS' setting. The hashers below are
+PBKDF2, scrypt and Argon2 with their cost read from the 'AUTH_APP_PASSWORD_HASHER_COST' setting, so the time spent
+per hash can be tuned to the CPU budget (see the 'benchmark_hashers' command). Argon2 needs the 'argon2-cffi'
+package. When the cost or the preferred hasher changes, each password is rehashed the next time its user logs in.
+
+Passwords stored before this module existed are unsalted SHA-256 hex digests. They are still accepted by
+'verify_password', which asks for them to be replaced with a hash of the preferred hasher.
+
+Hashing is deliberately slow, so it runs on a bounded pool of threads ('AUTH_APP_HASHER_THREADS'). This limits the
+CPU a burst of logins can use, and lets async views await a hash without blocking the event loop.
+"""
+
+# Import 'asyncio' to await hashes from async views, 'hashlib' for the legacy SHA-256 digests and 're' to find them.
+import asyncio
+import hashlib
+import re
+# Import 'os' and 'threading' to create the thread pool once per process, and the executor that runs the hashes.
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+# Import the settings module to read the cost and the pool size.
+from django.conf import settings
+# Import the 'setting_changed' signal so the pool is rebuilt when tests override its size.
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+# Import Django's password hashing functions and the hashers that are tuned below.
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher, BasePasswordHasher, PBKDF2PasswordHasher, ScryptPasswordHasher, check_password,
+    make_password, mask_hash,
+)
+# Import 'constant_time_compare' to compare digests without leaking timing information.
+from django.utils.crypto import constant_time_compare
+
+# Matches a legacy password: the hex digest of an unsalted SHA-256 hash, with no algorithm prefix.
+LEGACY_SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# Default number of threads hashing passwords at the same time, used when 'AUTH_APP_HASHER_THREADS' isn't set.
+DEFAULT_THREADS = min(4, os.cpu_count() or 1)
+
+# Default number of seconds a hash may wait for a free thread, used when 'AUTH_APP_HASHER_TIMEOUT' isn't set.
+DEFAULT_TIMEOUT = 10
+
+
+class Cost:
+    """Hasher attribute read from the 'AUTH_APP_PASSWORD_HASHER_COST' setting, keyed by the hasher's algorithm.
+
+    For example {'pbkdf2_sha256': {'iterations': 600000}} sets the PBKDF2 iterations. Django's value is used for
+    any parameter that isn't set.
+    """
+    def __init__(self, default):
+        self.default = default
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        costs = getattr(settings, 'AUTH_APP_PASSWORD_HASHER_COST', {}).get(owner.algorithm, {})
+        return costs.get(self.name, self.default)
+
+
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2 with SHA-256, with the number of iterations read from the settings.
+    """
+    iterations = Cost(PBKDF2PasswordHasher.iterations)
+
+
+class TunableScryptPasswordHasher(ScryptPasswordHasher):
+    """scrypt, with its work factor, block size and parallelism read from the settings.
+
+    scrypt uses 128 * work_factor * block_size bytes of memory per hash, 'maxmem' must be at least that.
+    """
+    work_factor = Cost(ScryptPasswordHasher.work_factor)
+    block_size = Cost(ScryptPasswordHasher.block_size)
+    parallelism = Cost(ScryptPasswordHasher.parallelism)
+    maxmem = Cost(ScryptPasswordHasher.maxmem)
+
+
+class TunableArgon2PasswordHasher(Argon2PasswordHasher):
+    """Argon2id, with its time cost, memory cost (in KiB) and parallelism read from the settings.
+    """
+    time_cost = Cost(Argon2PasswordHasher.time_cost)
+    memory_cost = Cost(Argon2PasswordHasher.memory_cost)
+    parallelism = Cost(Argon2PasswordHasher.parallelism)
+
+
+class LegacySHA256PasswordHasher(BasePasswordHasher):
+    """Verifies the unsalted SHA-256 digests stored by earlier versions of the app. Never use it for new passwords.
+
+    The stored digests have no prefix, 'verify_password' adds the 'sha256_legacy$$' prefix before checking them.
+    """
+    algorithm = 'sha256_legacy'
+
+    def salt(self):
+        return ''
+
+    def encode(self, password, salt):
+        if salt != '':
+            raise ValueError('salt must be empty.')
+        return f'{self.algorithm}$${hashlib.sha256(password.encode("utf-8")).hexdigest()}'
+
+    def decode(self, encoded):
+        algorithm, empty, digest = encoded.split('$', 2)
+        return {'algorithm': algorithm, 'hash': digest, 'salt': None}
+
+    def verify(self, password, encoded):
+        return constant_time_compare(encoded, self.encode(password, ''))
+
+    def safe_summary(self, encoded):
+        return {'algorithm': self.algorithm, 'hash': mask_hash(self.decode(encoded)['hash'])}
+
+    def must_update(self, encoded):
+        return True
+
+    def harden_runtime(self, password, encoded):
+        pass
+
+
+class HasherPool:
+    """Runs password hashing on a bounded pool of threads, created once per process.
+
+    At most 'AUTH_APP_HASHER_THREADS' hashes run at the same time. Further requests wait for a free thread,
+    up to 'AUTH_APP_HASHER_TIMEOUT' seconds, then raise 'HasherBusy'.
+    """
+    def __init__(self):
+        self._executor = None
+        self._slots = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get_executor(self):
+        """Returns the executor of the current process, creating it (again after a fork) if needed.
+        """
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    threads = getattr(settings, 'AUTH_APP_HASHER_THREADS', DEFAULT_THREADS)
+                    self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='hasher')
+                    self._slots = threading.BoundedSemaphore(threads)
+                    self._pid = os.getpid()
+        return self._executor
+
+    def submit(self, function, *args):
+        """Runs a function on the pool and returns its future, once a thread is free.
+        """
+        executor = self.get_executor()
+        slots = self._slots
+        if not slots.acquire(timeout=getattr(settings, 'AUTH_APP_HASHER_TIMEOUT', DEFAULT_TIMEOUT)):
+            raise HasherBusy('All password hashing threads are busy.')
+        future = executor.submit(function, *args)
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+    def run(self, function, *args):
+        """Runs a function on the pool and returns its result.
+        """
+        return self.submit(function, *args).result()
+
+    async def arun(self, function, *args):
+        """Runs a function on the pool and awaits its result, without blocking the event loop.
+        """
+        # Waiting for a free thread blocks, so it is done in the loop's default executor.
+        loop = asyncio.get_running_loop()
+        future = await loop.run_in_executor(None, self.submit, function, *args)
+        return await asyncio.wrap_future(future)
+
+    def reset(self):
+        """Shuts down the executor, the next hash creates a new one.
+        """
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False)
+            self._executor = None
+            self._pid = None
+
+
+class HasherBusy(Exception):
+    """Raised when no password hashing thread became free in time.
+    """
+
+
+# The pool shared by the whole process.
+pool = HasherPool()
+
+
+def _verify(password, encoded):
+    """Returns (is_correct, new_hash), where new_hash is set if the stored hash should be replaced.
+    """
+    if encoded and LEGACY_SHA256_PATTERN.match(encoded):
+        encoded = f'{LegacySHA256PasswordHasher.algorithm}$${encoded}'
+    new_hashes = []
+    is_correct = check_password(password, encoded, setter=lambda raw: new_hashes.append(make_password(raw)))
+    return is_correct, (new_hashes[0] if new_hashes else None)
+
+
+def hash_password(password):
+    """Returns the hash of a password, made by the preferred hasher on the thread pool.
+    """
+    return pool.run(make_password, password)
+
+
+def verify_password(password, encoded):
+    """Checks a password against its stored hash on the thread pool.
+
+    Returns (is_correct, new_hash). 'new_hash' is None unless the password is correct and its hash is outdated
+    (a legacy SHA-256 digest, another hasher or another cost), in which case it should be stored instead.
+    """
+    return pool.run(_verify, password, encoded)
+
+
+async def ahash_password(password):
+    """Async version of 'hash_password'.
+    """
+    return await pool.arun(make_password, password)
+
+
+async def averify_password(password, encoded):
+    """Async version of 'verify_password'.
+    """
+    return await pool.arun(_verify, password, encoded)
+
+
+if hasattr(os, 'register_at_fork'):
+    # Threads don't survive a fork, the child creates its own pool on first use.
+    os.register_at_fork(after_in_child=lambda: pool.__init__())
+
+
+@receiver(setting_changed)
+def reset_pool(setting, **kwargs):
+    """Shuts down the thread pool when its size changes, so the next hash uses the new size.
+    """
+    if setting == 'AUTH_APP_HASHER_THREADS':
+        pool.reset()
@@ -0,0 +1,122 @@
+"""benchmark_hashers.py
+
+Management command that measures login latency for each password hasher at several cost settings, to choose the
+'AUTH_APP_PASSWORD_HASHER_COST' values that fit the CPU budget. Run it with:
+
+    python manage.py benchmark_hashers --logins 100 --concurrency 8
+
+Each login verifies a password on the hasher thread pool (see 'auth_app/hashers.py'), so the latencies include the
+time spent waiting for a free thread when more logins arrive than there are threads, as they would under load.
+The p99 latency of each setting is charted in the output, and every row can be saved with '--csv'.
+"""
+
+# Import 'csv' to save the results, 'statistics' to summarise them and 'perf_counter' to time each login.
+import csv
+import statistics
+from time import perf_counter
+# Import the executor used to send logins concurrently.
+from concurrent.futures import ThreadPoolExecutor
+# Import 'BaseCommand' and 'CommandError' to define a custom 'manage.py' command.
+from django.core.management.base import BaseCommand, CommandError
+# Import 'override_settings' to apply each cost setting in turn.
+from django.test.utils import override_settings
+# Import Django's function to hash the benchmark password, and the hashers module.
+from django.contrib.auth.hashers import make_password
+from auth_app import hashers
+
+# Hasher class and cost settings benchmarked for each algorithm, from cheapest to most expensive.
+LEVELS = {
+    'pbkdf2_sha256': ('auth_app.hashers.TunablePBKDF2PasswordHasher', [
+        {'iterations': iterations} for iterations in (100_000, 300_000, 600_000, 870_000, 1_200_000)
+    ]),
+    'scrypt': ('auth_app.hashers.TunableScryptPasswordHasher', [
+        # maxmem is raised to twice the memory scrypt needs (128 * work_factor * block_size bytes).
+        {'work_factor': 2 ** power, 'block_size': 8, 'parallelism': 1, 'maxmem': 2 * 128 * 2 ** power * 8}
+        for power in (13, 14, 15, 16)
+    ]),
+    'argon2': ('auth_app.hashers.TunableArgon2PasswordHasher', [
+        {'time_cost': time_cost, 'memory_cost': 102400, 'parallelism': 8} for time_cost in (1, 2, 3, 4)
+    ]),
+}
+
+# Width of the longest bar of the p99 chart, in characters.
+CHART_WIDTH = 40
+
+
+class Command(BaseCommand):
+    """Benchmarks login latency for each password hasher and cost setting.
+    """
+    help = 'Measures login p50/p99 latency and throughput for each password hasher at several cost settings.'
+
+    def add_arguments(self, parser):
+        """Defines the command line options of the benchmark.
+        """
+        parser.add_argument('--algorithms', default='pbkdf2_sha256,scrypt',
+                            help=f'Comma separated algorithms to benchmark, from: {", ".join(LEVELS)}.')
+        parser.add_argument('--logins', type=int, default=50, help='Number of logins timed per cost setting.')
+        parser.add_argument('--concurrency', type=int, default=4, help='Number of logins sent at the same time.')
+        parser.add_argument('--threads', type=int, help='Size of the hasher thread pool (AUTH_APP_HASHER_THREADS).')
+        parser.add_argument('--csv', help='File to save the results to.')
+
+    def handle(self, *args, **options):
+        """Times the logins of every cost setting, then prints a table and a chart of the p99 latencies.
+        """
+        algorithms = [algorithm.strip() for algorithm in options['algorithms'].split(',')]
+        unknown = set(algorithms) - set(LEVELS)
+        if unknown:
+            raise CommandError(f'Unknown algorithms: {", ".join(sorted(unknown))}.')
+        thread_settings = {'AUTH_APP_HASHER_THREADS': options['threads']} if options['threads'] else {}
+
+        rows = []
+        with override_settings(**thread_settings):
+            for algorithm in algorithms:
+                hasher, levels = LEVELS[algorithm]
+                for cost in levels:
+                    try:
+                        with override_settings(PASSWORD_HASHERS=[hasher],
+                                               AUTH_APP_PASSWORD_HASHER_COST={algorithm: cost}):
+                            rows.append(self.benchmark(algorithm, cost, options['logins'], options['concurrency']))
+                    except ValueError as error:
+                        # e.g. the 'argon2-cffi' package isn't installed.
+                        self.stderr.write(f'Skipping {algorithm} {cost}: {error}')
+                        break
+
+        self.stdout.write(f'{"algorithm":<14} {"cost":<40} {"p50 ms":>8} {"p99 ms":>8} {"logins/s":>9}')
+        for row in rows:
+            self.stdout.write(f'{row["algorithm"]:<14} {row["cost"]:<40} {row["p50_ms"]:>8.1f} '
+                              f'{row["p99_ms"]:>8.1f} {row["logins_per_second"]:>9.1f}')
+
+        self.stdout.write('\np99 login latency')
+        longest = max((row['p99_ms'] for row in rows), default=0)
+        for row in rows:
+            bar = '#' * max(round(row['p99_ms'] / longest * CHART_WIDTH), 1) if longest else ''
+            self.stdout.write(f'{row["algorithm"]:<14} {row["cost"]:<40} {bar} {row["p99_ms"]:.0f} ms')
+
+        if options['csv'] and rows:
+            with open(options['csv'], 'w', newline='') as file:
+                writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+                writer.writeheader()
+                writer.writerows(rows)
+
+    def benchmark(self, algorithm, cost, logins, concurrency):
+        """Returns the latency percentiles and throughput of verifying a password with the current settings.
+        """
+        encoded = make_password('benchmark-password')
+
+        def login():
+            start = perf_counter()
+            is_correct, _ = hashers.verify_password('benchmark-password', encoded)
+            assert is_correct
+            return (perf_counter() - start) * 1000
+
+        start = perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as clients:
+            latencies = sorted(clients.map(lambda _: login(), range(logins)))
+        elapsed = perf_counter() - start
+        return {
+            'algorithm': algorithm,
+            'cost': ','.join(f'{name}={value}' for name, value in cost.items() if name != 'maxmem'),
+            'p50_ms': statistics.median(latencies),
+            'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+            'logins_per_second': logins / elapsed,
+        }
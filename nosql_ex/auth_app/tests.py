@@ -5,7 +5,238 @@ Django's testing framework provides a way to create unit tests
 that ensure your models, views, and other components behave as expected.
 """
 
-# Import the 'TestCase' class from Django's testing framework to create unit tests for the application.
-from django.test import TestCase
+# Import 'asyncio' to run the async hashers, 'hashlib' to build legacy password digests, 'json' to read responses and 'threading' to hold the pool.
+import asyncio
+import hashlib
+import json
+import threading
+# Import 'skipUnless' to skip the Argon2 tests when 'argon2-cffi' isn't installed.
+from unittest import skipUnless
+# Import 'override_settings' to use cheap hasher costs in the tests.
+from django.test import AsyncRequestFactory, SimpleTestCase, override_settings
+# Import Django's function that finds the hasher of a stored hash.
+from django.contrib.auth.hashers import identify_hasher
+# Import the shared MongoDB connection, and the base class that points it at an empty test database.
+from config import mongo
+from main_app.tests import MongoTestCase
+# Import the password hashers and their thread pool.
+from auth_app import hashers
+from auth_app.views import AsyncUserLoginApiView, AsyncUserManageApiView
 
-# Create your tests here.
+try:
+    import argon2
+except ImportError:
+    argon2 = None
+
+# Cheap hasher costs, so the tests run quickly.
+TEST_HASHER_COST = {
+    'pbkdf2_sha256': {'iterations': 1000},
+    'scrypt': {'work_factor': 2 ** 10},
+    'argon2': {'time_cost': 1, 'memory_cost': 1024, 'parallelism': 1},
+}
+
+# Hashers used by the tests, PBKDF2 preferred.
+TEST_PASSWORD_HASHERS = [
+    'auth_app.hashers.TunablePBKDF2PasswordHasher',
+    'auth_app.hashers.TunableScryptPasswordHasher',
+    'auth_app.hashers.TunableArgon2PasswordHasher',
+    'auth_app.hashers.LegacySHA256PasswordHasher',
+]
+
+
+class UserManageStreamingTests(MongoTestCase):
+    """Tests for the streamed list of users.
+    """
+    url = '/auth_app/api/user_manage/'
+
+    def setUp(self):
+        super().setUp()
+        mongo.get_collection('users').insert_many([
+            {'username': f'user{number}', 'roles': ['user'], 'profile_data': {}} for number in range(3)
+        ])
+
+    def test_list_users(self):
+        """Every user is streamed as a JSON array, with the ObjectId converted to a string.
+        """
+        response = self.client.get(self.url)
+        self.assertTrue(response.streaming)
+        users = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([user['username'] for user in users], ['user0', 'user1', 'user2'])
+        self.assertIsInstance(users[0]['_id'], str)
+
+    def test_list_users_ndjson(self):
+        """Users are streamed one per line when NDJSON is asked for.
+        """
+        response = self.client.get(self.url, headers={'Accept': 'application/x-ndjson'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['username'] for line in lines], ['user0', 'user1', 'user2'])
+
+
+@override_settings(PASSWORD_HASHERS=TEST_PASSWORD_HASHERS, AUTH_APP_PASSWORD_HASHER_COST=TEST_HASHER_COST)
+class PasswordHasherTests(SimpleTestCase):
+    """Tests for the tunable hashers and the hasher thread pool.
+    """
+    def test_cost_from_settings(self):
+        """The cost of each hasher is read from the settings.
+        """
+        encoded = hashers.hash_password('secret')
+        self.assertTrue(encoded.startswith('pbkdf2_sha256$1000$'))
+        self.assertEqual(hashers.verify_password('secret', encoded), (True, None))
+        self.assertEqual(hashers.verify_password('wrong', encoded), (False, None))
+
+    def test_scrypt(self):
+        """scrypt hashes use the work factor from the settings.
+        """
+        with self.settings(PASSWORD_HASHERS=TEST_PASSWORD_HASHERS[1:]):
+            encoded = hashers.hash_password('secret')
+            self.assertEqual(identify_hasher(encoded).algorithm, 'scrypt')
+            self.assertTrue(encoded.startswith('scrypt$'))
+            self.assertIn(f'${2 ** 10}$', encoded)
+            self.assertEqual(hashers.verify_password('secret', encoded), (True, None))
+
+    @skipUnless(argon2, "The 'argon2-cffi' package isn't installed")
+    def test_argon2(self):
+        """Argon2 hashes use the time and memory cost from the settings.
+        """
+        with self.settings(PASSWORD_HASHERS=TEST_PASSWORD_HASHERS[2:]):
+            encoded = hashers.hash_password('secret')
+            self.assertIn('m=1024,t=1,p=1', encoded)
+            self.assertEqual(hashers.verify_password('secret', encoded), (True, None))
+
+    def test_cost_change_rehashes(self):
+        """A hash made with another cost or another hasher is replaced when the password is verified.
+        """
+        encoded = hashers.hash_password('secret')
+        with self.settings(AUTH_APP_PASSWORD_HASHER_COST={'pbkdf2_sha256': {'iterations': 2000}}):
+            is_correct, new_hash = hashers.verify_password('secret', encoded)
+        self.assertTrue(is_correct)
+        self.assertTrue(new_hash.startswith('pbkdf2_sha256$2000$'))
+        # The old hasher must stay listed to verify the old hashes.
+        with self.settings(PASSWORD_HASHERS=[TEST_PASSWORD_HASHERS[1], *TEST_PASSWORD_HASHERS]):
+            is_correct, new_hash = hashers.verify_password('secret', encoded)
+        self.assertTrue(is_correct)
+        self.assertTrue(new_hash.startswith('scrypt$'))
+
+    def test_legacy_sha256(self):
+        """Unsalted SHA-256 digests are accepted and always replaced.
+        """
+        digest = hashlib.sha256(b'secret').hexdigest()
+        is_correct, new_hash = hashers.verify_password('secret', digest)
+        self.assertTrue(is_correct)
+        self.assertTrue(new_hash.startswith('pbkdf2_sha256$1000$'))
+        self.assertEqual(hashers.verify_password('wrong', digest), (False, None))
+
+    @override_settings(AUTH_APP_HASHER_THREADS=1, AUTH_APP_HASHER_TIMEOUT=0.01)
+    def test_pool_busy(self):
+        """HasherBusy is raised when every thread stays busy for longer than the timeout.
+        """
+        release = threading.Event()
+        future = hashers.pool.submit(release.wait)
+        try:
+            with self.assertRaises(hashers.HasherBusy):
+                hashers.hash_password('secret')
+        finally:
+            release.set()
+            future.result()
+        self.assertTrue(hashers.hash_password('secret').startswith('pbkdf2_sha256$'))
+
+    def test_async(self):
+        """The async functions hash and verify on the pool too.
+        """
+        async def login():
+            encoded = await hashers.ahash_password('secret')
+            return await hashers.averify_password('secret', encoded)
+
+        self.assertEqual(asyncio.run(login()), (True, None))
+
+
+@override_settings(PASSWORD_HASHERS=TEST_PASSWORD_HASHERS, AUTH_APP_PASSWORD_HASHER_COST=TEST_HASHER_COST)
+class UserLoginTests(MongoTestCase):
+    """Tests for the login endpoint.
+    """
+    url = '/auth_app/api/login/'
+
+    def login(self, username, password):
+        return self.client.post(self.url, {'username': username, 'password': password},
+                                content_type='application/json')
+
+    def test_legacy_password_rehashed(self):
+        """Logging in with a legacy SHA-256 password replaces it with a hash of the preferred hasher.
+        """
+        users = mongo.get_collection('users')
+        users.insert_one({'username': 'luke', 'password': hashlib.sha256(b'secret').hexdigest(), 'roles': ['user']})
+        response = self.login('luke', 'secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['roles'], ['user'])
+        user = users.find_one({'username': 'luke'})
+        self.assertTrue(user['password'].startswith('pbkdf2_sha256$1000$'))
+        self.assertIn('last_login', user)
+        self.assertEqual(self.login('luke', 'secret').status_code, 200)
+
+    def test_created_user_can_log_in(self):
+        """Users created through the API are stored with a salted hash and can log in.
+        """
+        self.client.post('/auth_app/api/user_manage/', {'username': 'luke', 'password': 'secret'},
+                         content_type='application/json')
+        stored = mongo.get_collection('users').find_one({'username': 'luke'})['password']
+        self.assertEqual(identify_hasher(stored).algorithm, 'pbkdf2_sha256')
+        self.assertEqual(self.login('luke', 'secret').status_code, 200)
+
+    def test_invalid_login(self):
+        """A wrong password or an unknown user is rejected with status 401.
+        """
+        mongo.get_collection('users').insert_one({'username': 'luke', 'password': hashers.hash_password('secret')})
+        self.assertEqual(self.login('luke', 'wrong').status_code, 401)
+        self.assertEqual(self.login('nobody', 'secret').status_code, 401)
+
+
+@override_settings(PASSWORD_HASHERS=TEST_PASSWORD_HASHERS, AUTH_APP_PASSWORD_HASHER_COST=TEST_HASHER_COST)
+class AsyncUserManageTests(MongoTestCase):
+    """Tests for the async (Motor) version of the user management API.
+    """
+    view = staticmethod(AsyncUserManageApiView.as_view())
+
+    async def test_create_and_list(self):
+        """Users created through the async view are hashed and streamed back.
+        """
+        factory = AsyncRequestFactory()
+        request = factory.post('/', {'username': 'luke', 'password': 'secret'}, content_type='application/json')
+        self.assertEqual((await self.view(request)).status_code, 201)
+        response = await self.view(factory.get('/'))
+        users = json.loads(b''.join([chunk async for chunk in response.streaming_content]))
+        self.assertEqual([user['username'] for user in users], ['luke'])
+        self.assertTrue(users[0]['password'].startswith('pbkdf2_sha256$1000$'))
+
+
+@override_settings(PASSWORD_HASHERS=TEST_PASSWORD_HASHERS, AUTH_APP_PASSWORD_HASHER_COST=TEST_HASHER_COST)
+class AsyncUserLoginTests(MongoTestCase):
+    """Tests for the async version of the login endpoint.
+    """
+    view = staticmethod(AsyncUserLoginApiView.as_view())
+
+    async def login(self, username, password):
+        request = AsyncRequestFactory().post('/', {'username': username, 'password': password},
+                                             content_type='application/json')
+        return await self.view(request)
+
+    async def test_legacy_password_rehashed(self):
+        """Logging in with a legacy SHA-256 password replaces it with a hash of the preferred hasher.
+        """
+        users = mongo.get_async_collection('users')
+        await users.insert_one({'username': 'luke', 'password': hashlib.sha256(b'secret').hexdigest(),
+                                'roles': ['user']})
+        response = await self.login('luke', 'secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['roles'], ['user'])
+        user = await users.find_one({'username': 'luke'})
+        self.assertTrue(user['password'].startswith('pbkdf2_sha256$1000$'))
+        self.assertIn('last_login', user)
+        self.assertEqual((await self.login('luke', 'secret')).status_code, 200)
+
+    async def test_invalid_login(self):
+        """A wrong password or an unknown user is rejected with status 401.
+        """
+        await mongo.get_async_collection('users').insert_one({'username': 'luke',
+                                                               'password': await hashers.ahash_password('secret')})
+        self.assertEqual((await self.login('luke', 'wrong')).status_code, 401)
+        self.assertEqual((await self.login('nobody', 'secret')).status_code, 401)
@@ -5,6 +5,8 @@ It extends the base URL patterns defined in the main project's URL configuration
 Each URL pattern is considered an endpoint (or API endpoint for API views), providing specific routes to access the app's functionalities.
 """
 
+# Import the settings module to choose between the sync and async views.
+from django.conf import settings
 # Import 'path' from Django's URL dispatcher to define URL patterns and map them to specific views.
 from django.urls import path
 # Import all views from 'views.py' to utilize specific functions and classes for handling requests and responses.
@@ -13,7 +15,16 @@ from . import views
 # URL patterns define the routes for the application, mapping specific URL paths to their corresponding view functions.
 # The base URL is defined in 'config/urls.py' (auth_app/), so these serve as an extension to that.
 # For example when using 'python manage.py runserver' -> http://127.0.0.1:8000/main_app/api/user_manage/
+# The async views serve the same URLs when 'MONGODB_ASYNC_VIEWS' is True (e.g. when running under an ASGI server).
+if getattr(settings, 'MONGODB_ASYNC_VIEWS', False):
+    user_manage_view = views.AsyncUserManageApiView
+    login_view = views.AsyncUserLoginApiView
+else:
+    user_manage_view = views.UserManageApiView
+    login_view = views.UserLoginApiView
+
 urlpatterns = [
     path('',views.index,name='index'),
-    path('api/user_manage/', views.UserManageApiView.as_view())
+    path('api/user_manage/', user_manage_view.as_view()),
+    path('api/login/', login_view.as_view()),
     ]
\ No newline at end of file
@@ -10,16 +10,15 @@ from django.views import View
 from .serializers import UserSerializer
 import json
 from bson import ObjectId
-import hashlib
 from datetime import datetime, timezone
 import requests
 from django.views.decorators.csrf import csrf_exempt
-import pymongo
+from config.mongo import get_async_collection, get_collection
+from config.streaming import astreaming_json_response, streaming_json_response
+from .hashers import HasherBusy, ahash_password, averify_password, hash_password, verify_password
 
-# use pymongo to connect to db
-client = pymongo.MongoClient('mongodb+srv://<user>:<password@djangolab-cluster.y0zsa4f.mongodb.net/')
-dbname = client['nasa_data_db']
-collection = dbname['users']
+# Name of the collection holding the users. The connection is shared with main_app (see 'config/mongo.py').
+COLLECTION_NAME = 'users'
 
 # MongoDB Atlas API credentials
 MONGODB_ATLAS_API_PUBLIC_KEY = ''
@@ -27,11 +26,6 @@ MONGODB_ATLAS_API_PRIVATE_KEY = ''
 MONGODB_ATLAS_PROJECT_ID = ''
 MONGODB_ATLAS_GROUP_ID = ''
 
-def hash_password(password):
-    """Hash the password using SHA-256 or another suitable hashing algorithm.
-    """
-    return hashlib.sha256(password.encode('utf-8')).hexdigest()
-
 """
 def create_mongodb_atlas_user(username, password):
     url = f"https://cloud.mongodb.com/api/atlas/v1.0/groups/{MONGODB_ATLAS_GROUP_ID}/databaseUsers"
@@ -61,6 +55,38 @@ def create_mongodb_atlas_user(username, password):
         print(f"Failed to create MongoDB Atlas user: {response.json()}")
 """
 
+def read_new_user(body, hashed_password):
+    """Returns the user document to insert for a POST body.
+    """
+    return {
+        "username": body.get('username'),
+        "password": hashed_password,  
+        "roles": body.get('roles', ["user"]),             # Default role to 'user' if not provided
+        "last_login": datetime.now(timezone.utc),         # Use timezone-aware datetime for last_login
+        "profile_data": {
+            "first_name": body.get('profile_data', {}).get('first_name'),
+            "last_name": body.get('profile_data', {}).get('last_name'),
+            "email": body.get('profile_data', {}).get('email')
+        }
+    }
+
+def read_user_update(body, hashed_password):
+    """Returns the fields to set for a PUT body.
+    """
+    update_data = {
+        "username": body.get('username'),
+        "password": hashed_password,
+        "roles": body.get('roles'),
+        "profile_data": {
+            "first_name": body.get('first_name'),
+            "last_name": body.get('last_name'),
+            "email": body.get('email')
+        }
+    }
+
+    # Remove fields with None values (to prevent overwriting with None)
+    return {k: v for k, v in update_data.items() if v is not None}
+
 # Regular views - Regular views in Django respond to HTTP requests by returning HTML content. 
 # They can utilize the 'render' function, which points to a given template (like 'index.html') with context data to 
 # produce a complete HTML response. Alternatively, views can directly return a 'HttpResponse' object for simpler responses.
@@ -88,7 +114,7 @@ class UserManageApiView(View):
         The expected input for post and put actions is in JSON format:
         {
             "username": "luke",                    # Expects a string with the username.
-            "password": "hashed_password",         # Expects a string with the hashed password.
+            "password": "password",                # Expects a string with the password, stored as a salted hash.
             "roles": ["administrator", "user"],    # Expects a list of strings indicating user roles.
             "last_login": "2024-08-09T04:05:23Z",  # Expects a string in ISO 8601 format representing the last login time.
             "profile_data": {                      # Expects a dictionary containing profile information.
@@ -99,7 +125,8 @@ class UserManageApiView(View):
         }
 
     Returns:
-        - get: A JSON response with a list of serialized user instances.
+        - get: A streamed JSON response with a list of serialized user instances. Send a 'format=ndjson' query
+          parameter (or 'Accept: application/x-ndjson') to receive one user per line instead.
         - post: A JSON response with the ID of the newly created user instance.
         - put: A JSON response indicating success or failure. Status 200 if the record was updated.
         - delete: A JSON response indicating success or failure. Status 200 if the record was deleted.
@@ -107,29 +134,21 @@ class UserManageApiView(View):
     def get(self, request):
         """Retrieve a list of users.
         """
-        cursor = collection.find()
-        list_cur = list(cursor)
-        serialized_users = [UserSerializer(user) for user in list_cur]
-        return JsonResponse(serialized_users, safe=False)
+        # Stream the users as they are read, so the whole collection is never held in memory
+        cursor = get_collection(COLLECTION_NAME).find()
+        return streaming_json_response(request, cursor, UserSerializer)
 
     def post(self, request):
         """Create a new user record.
         """
         body = json.loads(request.body.decode("utf-8"))
-        hashed_password = hash_password(body.get('password')) # Hash the password before storing
-        new_user = {
-            "username": body.get('username'),
-            "password": hashed_password,  
-            "roles": body.get('roles', ["user"]),             # Default role to 'user' if not provided
-            "last_login": datetime.now(timezone.utc),         # Use timezone-aware datetime for last_login
-            "profile_data": {
-                "first_name": body.get('profile_data', {}).get('first_name'),
-                "last_name": body.get('profile_data', {}).get('last_name'),
-                "email": body.get('profile_data', {}).get('email')
-            }
-        }
+        try:
+            hashed_password = hash_password(body.get('password')) # Hash the password before storing
+        except HasherBusy:
+            return JsonResponse({"error": "The server is busy, please try again"}, status=503)
+        new_user = read_new_user(body, hashed_password)
 
-        result = collection.insert_one(new_user)
+        result = get_collection(COLLECTION_NAME).insert_one(new_user)
         data = {"_id": str(result.inserted_id)}
         # Create a MongoDB Atlas admin user
         # create_mongodb_atlas_user(new_user['username'], hashed_password)
@@ -139,29 +158,141 @@ class UserManageApiView(View):
         """Update an existing user record.
         """
         body = json.loads(request.body.decode("utf-8"))
-        update_data = {
-            "username": body.get('username'),
-            "password": hash_password(body.get('password')) if body.get('password') else None,
-            "roles": body.get('roles'),
-            "profile_data": {
-                "first_name": body.get('first_name'),
-                "last_name": body.get('last_name'),
-                "email": body.get('email')
-            }
-        }
+        try:
+            hashed_password = hash_password(body.get('password')) if body.get('password') else None
+        except HasherBusy:
+            return JsonResponse({"error": "The server is busy, please try again"}, status=503)
+        update_data = read_user_update(body, hashed_password)
+        result = get_collection(COLLECTION_NAME).update_one({"_id": ObjectId(user_id)}, {"$set": update_data})
+        if result.matched_count == 0:
+            return JsonResponse({"error": "User not found"}, status=404)
+        return JsonResponse({"message": "User updated successfully"}, status=200)
+
+    def delete(self, request, user_id):
+        """Delete a user record.
+        """
+        result = get_collection(COLLECTION_NAME).delete_one({"_id": ObjectId(user_id)})
+        if result.deleted_count == 0:
+            return JsonResponse({"error": "User not found"}, status=404)
+        return JsonResponse({"message": "User deleted successfully"}, status=200)
+
+
+
+# Async API views - Run on the event loop under an ASGI server, querying MongoDB with Motor and hashing passwords on
+# the hasher thread pool without blocking. The URLs use them when the 'MONGODB_ASYNC_VIEWS' setting is True.
+class AsyncUserManageApiView(View):
+    """Async version of 'UserManageApiView', with the same parameters and responses.
+    """
+    async def get(self, request):
+        """Retrieve a list of users.
+        """
+        cursor = get_async_collection(COLLECTION_NAME).find()
+        return astreaming_json_response(request, cursor, UserSerializer)
 
-        # Remove fields with None values (to prevent overwriting with None)
-        update_data = {k: v for k, v in update_data.items() if v is not None}
+    async def post(self, request):
+        """Create a new user record.
+        """
+        body = json.loads(request.body.decode("utf-8"))
+        try:
+            hashed_password = await ahash_password(body.get('password'))
+        except HasherBusy:
+            return JsonResponse({"error": "The server is busy, please try again"}, status=503)
+        result = await get_async_collection(COLLECTION_NAME).insert_one(read_new_user(body, hashed_password))
+        return JsonResponse({"_id": str(result.inserted_id)}, status=201)
 
-        result = collection.update_one({"_id": ObjectId(user_id)}, {"$set": update_data})
+    async def put(self, request, user_id):
+        """Update an existing user record.
+        """
+        body = json.loads(request.body.decode("utf-8"))
+        try:
+            hashed_password = await ahash_password(body.get('password')) if body.get('password') else None
+        except HasherBusy:
+            return JsonResponse({"error": "The server is busy, please try again"}, status=503)
+        update_data = read_user_update(body, hashed_password)
+        result = await get_async_collection(COLLECTION_NAME).update_one({"_id": ObjectId(user_id)},
+                                                                         {"$set": update_data})
         if result.matched_count == 0:
             return JsonResponse({"error": "User not found"}, status=404)
         return JsonResponse({"message": "User updated successfully"}, status=200)
 
-    def delete(self, request, user_id):
+    async def delete(self, request, user_id):
         """Delete a user record.
         """
-        result = collection.delete_one({"_id": ObjectId(user_id)})
+        result = await get_async_collection(COLLECTION_NAME).delete_one({"_id": ObjectId(user_id)})
         if result.deleted_count == 0:
             return JsonResponse({"error": "User not found"}, status=404)
         return JsonResponse({"message": "User deleted successfully"}, status=200)
+
+class UserLoginApiView(View):
+    """This view checks a user's username and password.
+
+    Passwords are verified with the hashers in 'hashers.py', on a bounded thread pool. When the stored hash is
+    outdated (an unsalted SHA-256 digest from earlier versions of the app, or a hash made with another hasher or
+    cost) it is replaced with a new hash of the password, so stored hashes are upgraded as users log in.
+
+    Methods:
+        - post: (POST) Check a username and password, and record the login time.
+
+    Parameters:
+        The expected input is in JSON format:
+        {
+            "username": "luke",     # Expects a string with the username.
+            "password": "password"  # Expects a string with the password.
+        }
+
+    Returns:
+        - post: A JSON response with the user's ID and roles if the password is correct (status 200),
+          status 401 if the username or password is wrong, or status 503 if the server is too busy to check it.
+    """
+    def post(self, request):
+        """Check a username and password.
+        """
+        body = json.loads(request.body.decode("utf-8"))
+        username, password = body.get('username'), body.get('password')
+        collection = get_collection(COLLECTION_NAME)
+        user = collection.find_one({"username": username}) if username and password else None
+        try:
+            if user is None:
+                # Hash the password anyway, so a missing user takes as long to reject as a wrong password
+                hash_password(password or '')
+                is_correct, new_hash = False, None
+            else:
+                is_correct, new_hash = verify_password(password, user.get('password'))
+        except HasherBusy:
+            return JsonResponse({"error": "The server is busy, please try again"}, status=503)
+        if not is_correct:
+            return JsonResponse({"error": "Invalid username or password"}, status=401)
+
+        update_data = {"last_login": datetime.now(timezone.utc)}
+        if new_hash:
+            update_data["password"] = new_hash
+        collection.update_one({"_id": user["_id"]}, {"$set": update_data})
+        return JsonResponse({"_id": str(user["_id"]), "username": user["username"], "roles": user.get("roles", [])})
+
+class AsyncUserLoginApiView(View):
+    """Async version of 'UserLoginApiView', with the same parameters and responses.
+    """
+    async def post(self, request):
+        """Check a username and password.
+        """
+        body = json.loads(request.body.decode("utf-8"))
+        username, password = body.get('username'), body.get('password')
+        collection = get_async_collection(COLLECTION_NAME)
+        user = await collection.find_one({"username": username}) if username and password else None
+        try:
+            if user is None:
+                # Hash the password anyway, so a missing user takes as long to reject as a wrong password
+                await ahash_password(password or '')
+                is_correct, new_hash = False, None
+            else:
+                is_correct, new_hash = await averify_password(password, user.get('password'))
+        except HasherBusy:
+            return JsonResponse({"error": "The server is busy, please try again"}, status=503)
+        if not is_correct:
+            return JsonResponse({"error": "Invalid username or password"}, status=401)
+
+        update_data = {"last_login": datetime.now(timezone.utc)}
+        if new_hash:
+            update_data["password"] = new_hash
+        await collection.update_one({"_id": user["_id"]}, {"$set": update_data})
+        return JsonResponse({"_id": str(user["_id"]), "username": user["username"], "roles": user.get("roles", [])})
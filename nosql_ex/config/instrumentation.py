@@ -0,0 +1,286 @@
+"""instrumentation.py
+
+This file measures how much work each request does, with the 'InstrumentationMiddleware' (see 'MIDDLEWARE' in
+'settings.py'):
+    - the number of MongoDB commands and the time the server took to answer them, counted by a pymongo
+      'CommandListener' registered on the shared clients (see 'get_client_options' in 'mongo.py').
+    - the time spent serializing the response body (the sections of the views wrapped in 'measure_serialization'),
+      and the size of the body.
+    - the total time of the request.
+
+Sampled requests get a 'Server-Timing' header, which browsers show in their developer tools, e.g.:
+    Server-Timing: db;dur=3.2;desc="2 commands", serialize;dur=1.1, total;dur=9.8, size;desc="5120 bytes"
+
+Every request is counted, and the totals of the process are served in the Prometheus text format by 'metrics_view'
+(at '/metrics/', see 'urls.py'), together with the connection pool counters of 'get_pool_metrics()'. The counters
+are kept per process, so with several workers each one reports its own and Prometheus sums them.
+
+Settings:
+    - INSTRUMENTATION_SAMPLE_RATE: Fraction of requests whose commands and serialization are measured (0 to 1).
+      Requests that aren't sampled only pay for a clock read and a counter update. At 0 the command listener isn't
+      registered on new clients at all, so pymongo doesn't build an event for each command.
+    - INSTRUMENTATION_SERVER_TIMING: Whether sampled responses get the 'Server-Timing' header. It shows how the
+      server spends its time, so it should only be turned on in production when that is acceptable.
+    - INSTRUMENTATION_METRICS_TOKEN: When set, '/metrics/' requires an 'Authorization: Bearer <token>' header.
+"""
+
+# Import 'random' to sample requests, 'threading' to update the counters from several threads, and 'perf_counter' to
+# time each step.
+import random
+import threading
+from time import perf_counter
+# Import 'contextmanager' to time the serialization sections of the views.
+from contextlib import contextmanager
+# Import 'ContextVar' to find the metrics of the current request from the command listener. Motor copies the variable
+# into the threads that run its commands, so the commands of async views are counted too.
+from contextvars import ContextVar
+# Import 'iscoroutinefunction' and 'markcoroutinefunction' so the middleware runs natively under WSGI and ASGI.
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+# Import the settings module to read the instrumentation settings.
+from django.conf import settings
+# Import 'constant_time_compare' to check the metrics token, and the response classes of the metrics view.
+from django.utils.crypto import constant_time_compare
+from django.http import HttpResponse, HttpResponseForbidden
+# Import 'monitoring' from pymongo to listen for command events.
+from pymongo import monitoring
+
+# Upper bounds (in seconds) of the request duration histogram buckets.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# The metrics of the request being handled, or None if it isn't sampled.
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+class RequestMetrics:
+    """Measurements of a sampled request.
+    """
+    def __init__(self):
+        self.db_count = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.response_size = None
+
+    def record_command(self, duration):
+        """Counts a command that took 'duration' seconds.
+        """
+        self.db_count += 1
+        self.db_time += duration
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Command listener counting the commands of sampled requests, and the time the server took to answer them.
+    """
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.record(event)
+
+    def failed(self, event):
+        self.record(event)
+
+    def record(self, event):
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.record_command(event.duration_micros / 1_000_000)
+
+
+class MetricsRegistry:
+    """Totals of the requests handled by the current process, by view, method and status.
+
+    Functions added with 'add_collector' return more lines of metrics, e.g. the connection pool counters.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.collectors = []
+        self.reset()
+
+    def reset(self):
+        """Sets every total back to zero.
+        """
+        with self._lock:
+            self.requests = {}
+            self.durations = {}
+            self.sampled = {}
+
+    def add_collector(self, collector):
+        """Adds a function returning lines of metrics in the Prometheus text format.
+        """
+        if collector not in self.collectors:
+            self.collectors.append(collector)
+
+    def observe(self, view, method, status, duration, metrics=None):
+        """Adds a request that took 'duration' seconds, with its measurements if it was sampled.
+        """
+        with self._lock:
+            key = (view, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            buckets = self.durations.setdefault(view, [0] * len(DURATION_BUCKETS) + [0, 0.0])
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    buckets[index] += 1
+            buckets[-2] += 1
+            buckets[-1] += duration
+            if metrics is not None:
+                totals = self.sampled.setdefault(view, [0, 0, 0.0, 0.0, 0])
+                totals[0] += 1
+                totals[1] += metrics.db_count
+                totals[2] += metrics.db_time
+                totals[3] += metrics.serialize_time
+                totals[4] += metrics.response_size or 0
+
+    def render(self):
+        """Returns the totals, and the lines of the collectors, in the Prometheus text exposition format.
+        """
+        with self._lock:
+            requests = dict(self.requests)
+            durations = {view: list(buckets) for view, buckets in self.durations.items()}
+            sampled = {view: list(totals) for view, totals in self.sampled.items()}
+
+        lines = ['# HELP http_requests_total Requests handled, by view, method and status.',
+                 '# TYPE http_requests_total counter']
+        for (view, method, status), count in sorted(requests.items()):
+            lines.append(f'http_requests_total{format_labels(view=view, method=method, status=status)} {count}')
+
+        lines += ['# HELP http_request_duration_seconds Time taken to handle each request.',
+                  '# TYPE http_request_duration_seconds histogram']
+        for view, buckets in sorted(durations.items()):
+            for bound, count in zip(DURATION_BUCKETS, buckets):
+                lines.append(f'http_request_duration_seconds_bucket{format_labels(view=view, le=bound)} {count}')
+            lines.append(f'http_request_duration_seconds_bucket{format_labels(view=view, le="+Inf")} {buckets[-2]}')
+            lines.append(f'http_request_duration_seconds_sum{format_labels(view=view)} {buckets[-1]}')
+            lines.append(f'http_request_duration_seconds_count{format_labels(view=view)} {buckets[-2]}')
+
+        # The measurements of sampled requests, divide them by 'http_requests_sampled_total' for per request averages.
+        for index, (name, description) in enumerate([
+            ('http_requests_sampled_total', 'Requests whose commands and serialization were measured.'),
+            ('http_request_mongo_commands_total', 'MongoDB commands run by sampled requests.'),
+            ('http_request_mongo_seconds_total', 'Time spent running the MongoDB commands of sampled requests.'),
+            ('http_request_serialization_seconds_total', 'Time spent serializing the responses of sampled requests.'),
+            ('http_response_size_bytes_total', 'Size of the response bodies of sampled requests.'),
+        ]):
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} counter']
+            for view, totals in sorted(sampled.items()):
+                lines.append(f'{name}{format_labels(view=view)} {totals[index]}')
+
+        for collector in self.collectors:
+            lines += collector()
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(**labels):
+    """Returns the labels of a sample, with their values escaped.
+    """
+    values = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, values)) + '}'
+
+
+# The registry of the current process.
+registry = MetricsRegistry()
+
+
+def get_sample_rate():
+    """Returns the fraction of requests that are measured.
+    """
+    return getattr(settings, 'INSTRUMENTATION_SAMPLE_RATE', 1.0)
+
+
+@contextmanager
+def measure_serialization():
+    """Adds the time spent in the block to the serialization time of the current request, if it is sampled.
+    """
+    metrics = current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serialize_time += perf_counter() - start
+
+
+def get_view_name(request):
+    """Returns the name of the view that handled a request, which keeps the number of label values small.
+    """
+    match = getattr(request, 'resolver_match', None)
+    return (match.view_name or match.route) if match is not None else 'unmatched'
+
+
+def get_server_timing(metrics, duration):
+    """Returns the 'Server-Timing' header value of a sampled request.
+    """
+    timing = [f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.db_count} commands"',
+              f'serialize;dur={metrics.serialize_time * 1000:.1f}', f'total;dur={duration * 1000:.1f}']
+    if metrics.response_size is not None:
+        timing.append(f'size;desc="{metrics.response_size} bytes"')
+    return ', '.join(timing)
+
+
+class InstrumentationMiddleware:
+    """Middleware counting every request, and measuring the commands, serialization and response size of sampled
+    ones.
+
+    It should be the first middleware, so its timings include the others.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start, metrics = perf_counter(), self.start(request)
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, start, metrics)
+
+    async def __acall__(self, request):
+        start, metrics = perf_counter(), self.start(request)
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, start, metrics)
+
+    def start(self, request):
+        """Returns the metrics of a sampled request, or None if it isn't sampled.
+        """
+        sample_rate = get_sample_rate()
+        return RequestMetrics() if sample_rate >= 1 or random.random() < sample_rate else None
+
+    def finish(self, request, response, start, metrics):
+        """Records the request in the registry, and adds the 'Server-Timing' header to sampled responses.
+
+        Streaming responses are sent after this runs, so their size and the commands reading them aren't known.
+        """
+        if metrics is not None and not response.streaming:
+            metrics.response_size = len(response.content)
+        duration = perf_counter() - start
+        registry.observe(get_view_name(request), request.method, response.status_code, duration, metrics)
+        if metrics is not None and getattr(settings, 'INSTRUMENTATION_SERVER_TIMING', False):
+            response['Server-Timing'] = get_server_timing(metrics, duration)
+        return response
+
+
+def metrics_view(request):
+    """Serves the totals of the current process in the Prometheus text format.
+
+    Requests must send the 'INSTRUMENTATION_METRICS_TOKEN' when one is set. Without a token, the totals are only
+    served when DEBUG is True, so a production server never exposes them by default.
+    """
+    token = getattr(settings, 'INSTRUMENTATION_METRICS_TOKEN', None)
+    if token:
+        if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponseForbidden()
+    elif not settings.DEBUG:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,288 @@
+"""mongo.py
+
+This file provides the MongoDB connection shared by every app in the project. Instead of each app creating its own
+'MongoClient' when its views are imported, they call 'get_collection()' and receive a collection from a single client.
+
+The client is configured by the 'MONGODB' setting (see 'settings.py') and is only created the first time it is used,
+so importing the project never touches the network. A MongoClient holds a pool of connections and background
+monitoring threads, neither of which survive a fork, so a process that was forked after the client was created
+(e.g. a gunicorn prefork worker) discards the inherited client and creates its own.
+
+Pool activity is counted by a connection pool listener and can be read with 'get_pool_metrics()', or scraped from
+'/metrics/' with the request metrics (see 'instrumentation.py'). The commands of sampled requests are counted by
+the command listener of 'instrumentation.py'.
+
+Async views use 'get_async_collection()' instead, which returns a collection of a Motor client
+('AsyncIOMotorClient' by default, see 'ASYNC_CLIENT_CLASS'). Its queries are awaited on the event loop rather than
+blocking a thread. A Motor client is bound to the event loop it was first used on, so one is created per loop and
+kept until that loop is closed. Several loops can run at once (e.g. the server's loop and the loop of an
+'async_to_sync' call in another thread), each with its own client.
+"""
+
+# Import 'asyncio' to find the running event loop, 'os' to detect forked processes, 'threading' to create the
+# client only once when threads race and 'weakref' to forget the Motor clients of loops that no longer exist.
+import asyncio
+import os
+import threading
+import weakref
+# Import the settings module to read the 'MONGODB' setting.
+from django.conf import settings
+# Import the 'setting_changed' signal so the client is rebuilt when tests override the 'MONGODB' setting.
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+# Import 'import_string' to load the client class from a dotted path (e.g. 'mongomock.MongoClient' in tests).
+from django.utils.module_loading import import_string
+# Import 'monitoring' from pymongo to listen for connection pool events.
+from pymongo import monitoring
+# Import the request instrumentation, to count the commands of each request and to serve the pool counters.
+from .instrumentation import CommandMetricsListener, get_sample_rate, registry
+
+# Default configuration, each key can be overridden by the 'MONGODB' setting.
+DEFAULTS = {
+    'CLIENT_CLASS': 'pymongo.MongoClient',
+    'ASYNC_CLIENT_CLASS': 'motor.motor_asyncio.AsyncIOMotorClient',
+    'URI': 'mongodb://localhost:27017/',
+    'NAME': 'nasa_data_db',
+    'OPTIONS': {},
+}
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Connection pool listener that counts the connections opened, closed and checked out of the pool.
+
+    The counters are totals for the current process, 'checked_out' is the number of connections in use right now.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Sets every counter back to zero.
+        """
+        with self._lock:
+            self.counters = dict.fromkeys((
+                'pools_created', 'pools_cleared', 'connections_created', 'connections_closed',
+                'checkouts', 'checkout_failures', 'checked_out',
+            ), 0)
+
+    def snapshot(self):
+        """Returns a copy of the counters.
+        """
+        with self._lock:
+            return dict(self.counters)
+
+    def _increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def pool_created(self, event):
+        self._increment('pools_created')
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._increment('pools_cleared')
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._increment('connections_created')
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._increment('connections_closed')
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._increment('checkout_failures')
+
+    def connection_checked_out(self, event):
+        self._increment('checkouts')
+        self._increment('checked_out')
+
+    def connection_checked_in(self, event):
+        self._increment('checked_out', -1)
+
+
+class MongoConnectionManager:
+    """Creates the shared MongoClient on first use and rebuilds it after a fork or a settings change.
+    """
+    def __init__(self):
+        self._client = None
+        self._pid = None
+        # The Motor client of each event loop, created by the process '_async_pid'.
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._async_pid = None
+        self._lock = threading.Lock()
+        self.metrics = PoolMetricsListener()
+        self.commands = CommandMetricsListener()
+
+    def get_config(self):
+        """Returns the 'MONGODB' setting merged over the defaults.
+        """
+        return {**DEFAULTS, **getattr(settings, 'MONGODB', {})}
+
+    def get_client(self):
+        """Returns the MongoClient of the current process, creating it if needed.
+        """
+        if self._client is None or self._pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._pid != os.getpid():
+                    config = self.get_config()
+                    client_class = import_string(config['CLIENT_CLASS'])
+                    self._client = client_class(config['URI'], **self.get_client_options(config))
+                    self._pid = os.getpid()
+        return self._client
+
+    def get_client_options(self, config):
+        """Returns the keyword arguments of a new client.
+        """
+        # The command listener is left out when no request is sampled, so pymongo doesn't build an event per command.
+        listeners = [self.metrics, self.commands] if get_sample_rate() > 0 else [self.metrics]
+        # 'connect=False' delays opening connections and starting monitor threads until the first query.
+        return {'connect': False, 'event_listeners': listeners, **config['OPTIONS']}
+
+    def get_async_client(self):
+        """Returns the Motor client of the running event loop, creating it if needed.
+
+        Must be called from a coroutine. The clients of other loops are left alone, since those loops may still be
+        running in other threads. The clients of loops that have been closed (e.g. by a previous 'async_to_sync'
+        call) are closed when a new client is created.
+        """
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None or self._async_pid != os.getpid():
+            with self._lock:
+                if self._async_pid != os.getpid():
+                    # The clients inherited from the parent process are still used by the parent.
+                    self._async_clients = weakref.WeakKeyDictionary()
+                    self._async_pid = os.getpid()
+                client = self._async_clients.get(loop)
+                if client is None:
+                    for other_loop, other_client in list(self._async_clients.items()):
+                        if other_loop.is_closed():
+                            other_client.close()
+                            del self._async_clients[other_loop]
+                    config = self.get_config()
+                    client_class = import_string(config['ASYNC_CLIENT_CLASS'])
+                    client = client_class(config['URI'], **self.get_client_options(config))
+                    self._async_clients[loop] = client
+        return client
+
+    def get_async_database(self, name=None):
+        """Returns a database of the Motor client, by default the one named in the 'MONGODB' setting.
+        """
+        return self.get_async_client()[name or self.get_config()['NAME']]
+
+    def get_async_collection(self, name, database=None):
+        """Returns a collection of the default (or given) database, from the Motor client.
+        """
+        return self.get_async_database(database)[name]
+
+    def get_database(self, name=None):
+        """Returns a database, by default the one named in the 'MONGODB' setting.
+        """
+        return self.get_client()[name or self.get_config()['NAME']]
+
+    def get_collection(self, name, database=None):
+        """Returns a collection of the default (or given) database.
+        """
+        return self.get_database(database)[name]
+
+    def close(self):
+        """Closes the clients of the current process. The next call to 'get_client' creates a new one.
+        """
+        with self._lock:
+            if self._client is not None and self._pid == os.getpid():
+                self._client.close()
+            if self._async_pid == os.getpid():
+                for client in self._async_clients.values():
+                    client.close()
+            self._client = None
+            self._pid = None
+            self._async_clients = weakref.WeakKeyDictionary()
+            self._async_pid = None
+
+    def after_fork(self):
+        """Forgets the clients inherited from the parent process without closing them, since the parent still uses it.
+        """
+        self._client = None
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._async_pid = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.metrics.reset()
+
+
+# The manager shared by the whole project.
+manager = MongoConnectionManager()
+
+# Drop the inherited client in forked children straight away. The pid check in 'get_client' also covers forks
+# that bypass 'os.fork' hooks.
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=manager.after_fork)
+
+
+def get_client():
+    """Returns the shared MongoClient.
+    """
+    return manager.get_client()
+
+
+def get_database(name=None):
+    """Returns a database of the shared MongoClient, by default the one named in the 'MONGODB' setting.
+    """
+    return manager.get_database(name)
+
+
+def get_collection(name, database=None):
+    """Returns a collection of the shared MongoClient.
+    """
+    return manager.get_collection(name, database)
+
+
+def get_async_database(name=None):
+    """Returns a database of the Motor client of the running event loop.
+    """
+    return manager.get_async_database(name)
+
+
+def get_async_collection(name, database=None):
+    """Returns a collection of the Motor client of the running event loop.
+    """
+    return manager.get_async_collection(name, database)
+
+
+def get_pool_metrics():
+    """Returns the connection pool counters of the current process.
+    """
+    return manager.metrics.snapshot()
+
+
+def render_pool_metrics():
+    """Returns the connection pool counters in the Prometheus text format, for the '/metrics/' endpoint.
+    """
+    lines = []
+    for name, value in get_pool_metrics().items():
+        # 'checked_out' is the number of connections in use right now, the others only ever grow.
+        metric, kind = (f'mongo_pool_{name}', 'gauge') if name == 'checked_out' else (f'mongo_pool_{name}_total',
+                                                                                      'counter')
+        lines += [f'# TYPE {metric} {kind}', f'{metric} {value}']
+    return lines
+
+
+registry.add_collector(render_pool_metrics)
+
+
+@receiver(setting_changed)
+def reset_client(setting, **kwargs):
+    """Closes the shared clients when the 'MONGODB' setting changes, so the next query uses the new settings.
+    """
+    if setting == 'MONGODB':
+        manager.close()
@@ -11,6 +11,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -51,6 +52,7 @@ INSTALLED_APPS = [
 
 # Middleware to process requests and responses globally.
 MIDDLEWARE = [
+    'config.instrumentation.InstrumentationMiddleware',           # Command counts, timings and response sizes
     'django.middleware.security.SecurityMiddleware',              # Security enhancements
     'django.contrib.sessions.middleware.SessionMiddleware',       # Session support
     'django.middleware.common.CommonMiddleware',                  # Common functionalities
@@ -101,6 +103,68 @@ DATABASES = {
 }
 """
 
+# MongoDB
+# The connection shared by all apps (see 'config/mongo.py'). The client is created on first use, not at import time.
+# 'URI' should include credentials, e.g. 'mongodb+srv://<user>:<password>@djangolab-cluster.y0zsa4f.mongodb.net/'.
+# 'OPTIONS' are passed to the MongoClient, see https://pymongo.readthedocs.io/en/stable/api/pymongo/mongo_client.html
+MONGODB = {
+    'CLIENT_CLASS': 'pymongo.MongoClient',                                  # Use 'mongomock.MongoClient' for tests
+    'ASYNC_CLIENT_CLASS': 'motor.motor_asyncio.AsyncIOMotorClient',         # Client used by the async views
+    'URI': os.environ.get('MONGODB_URI', 'mongodb://localhost:27017/'),     # Connection string of the cluster
+    'NAME': os.environ.get('MONGODB_NAME', 'nasa_data_db'),                 # Database used by the apps
+    'OPTIONS': {
+        'maxPoolSize': int(os.environ.get('MONGODB_MAX_POOL_SIZE', 50)),    # Connections per server, per process
+        'minPoolSize': int(os.environ.get('MONGODB_MIN_POOL_SIZE', 0)),     # Connections kept open while idle
+        'maxIdleTimeMS': 60000,                                             # Close connections idle for a minute
+        'waitQueueTimeoutMS': 2000,                                         # Fail if the pool is exhausted for 2s
+        'serverSelectionTimeoutMS': int(os.environ.get('MONGODB_SERVER_SELECTION_TIMEOUT_MS', 5000)),
+        'connectTimeoutMS': 5000,                                           # Time allowed to open a connection
+        'socketTimeoutMS': 30000,                                           # Time allowed for a reply
+        'readPreference': os.environ.get('MONGODB_READ_PREFERENCE', 'primaryPreferred'),
+        'appname': 'nosql_ex',                                              # Shown in the server logs
+    },
+}
+
+# Create the MongoDB indexes used by the API when the server starts (see 'main_app/indexes.py').
+# Off by default, the 'ensure_indexes' management command does the same as part of a deployment.
+MONGODB_ENSURE_INDEXES = os.environ.get('MONGODB_ENSURE_INDEXES', '').lower() in ('1', 'true')
+
+# Serve the API with the async views, which query MongoDB with Motor ('MONGODB["ASYNC_CLIENT_CLASS"]'), instead of
+# the sync views. Only worth it under an ASGI server (e.g. 'uvicorn config.asgi:application'): under WSGI every
+# request would start its own event loop.
+MONGODB_ASYNC_VIEWS = os.environ.get('MONGODB_ASYNC_VIEWS', '').lower() in ('1', 'true')
+
+# Default and maximum number of results per page returned by the main_app API views ('page_size' query parameter).
+MAIN_APP_PAGE_SIZE = 50
+MAIN_APP_MAX_PAGE_SIZE = 500
+
+# Number of seconds the meteorite landing statistics stay cached (see 'main_app/stats.py').
+MAIN_APP_STATS_CACHE_TIMEOUT = 300
+
+# Number of documents read from MongoDB per round-trip when a response is streamed (see 'config/streaming.py').
+STREAMING_BATCH_SIZE = 1000
+
+# Request instrumentation (see 'config/instrumentation.py').
+# Fraction of requests whose MongoDB commands, serialization time and response size are measured. Every request is
+# counted. At 0 the command listener isn't registered on the clients at all.
+INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get('INSTRUMENTATION_SAMPLE_RATE', 1.0 if DEBUG else 0.05))
+# Whether sampled responses get a 'Server-Timing' header with these measurements.
+INSTRUMENTATION_SERVER_TIMING = os.environ.get('INSTRUMENTATION_SERVER_TIMING', str(DEBUG)).lower() in ('1', 'true')
+# When set, the Prometheus endpoint at '/metrics/' requires an 'Authorization: Bearer <token>' header. Without it,
+# the endpoint is only served when DEBUG is True.
+INSTRUMENTATION_METRICS_TOKEN = os.environ.get('INSTRUMENTATION_METRICS_TOKEN')
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Used to keep the results of expensive MongoDB aggregations between requests. The local memory cache is private
+# to each process, use a shared backend (e.g. Redis or Memcached) when running several worker processes.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -121,6 +185,37 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing
+# https://docs.djangoproject.com/en/5.1/topics/auth/passwords/
+# Hashers used for the passwords of the users stored in MongoDB (see 'auth_app/hashers.py'). New passwords are hashed
+# with the first hasher, chosen with 'AUTH_APP_PASSWORD_HASHER' ('pbkdf2', 'scrypt' or 'argon2', which needs the
+# 'argon2-cffi' package). The others, and the legacy unsalted SHA-256 digests, are still accepted and are replaced
+# with a hash of the first hasher when their user logs in.
+AUTH_APP_PASSWORD_HASHERS = {
+    'pbkdf2': 'auth_app.hashers.TunablePBKDF2PasswordHasher',
+    'scrypt': 'auth_app.hashers.TunableScryptPasswordHasher',
+    'argon2': 'auth_app.hashers.TunableArgon2PasswordHasher',
+}
+_preferred_hasher = AUTH_APP_PASSWORD_HASHERS[os.environ.get('AUTH_APP_PASSWORD_HASHER', 'pbkdf2')]
+PASSWORD_HASHERS = [_preferred_hasher] + [
+    hasher for hasher in AUTH_APP_PASSWORD_HASHERS.values() if hasher != _preferred_hasher
+] + ['auth_app.hashers.LegacySHA256PasswordHasher']
+
+# Cost of each hasher, keyed by algorithm. Higher costs are slower for attackers and for logins alike, use
+# 'python manage.py benchmark_hashers' to choose values that keep login latency within the CPU budget.
+AUTH_APP_PASSWORD_HASHER_COST = {
+    'pbkdf2_sha256': {'iterations': int(os.environ.get('AUTH_APP_PBKDF2_ITERATIONS', 870000))},
+    'scrypt': {'work_factor': int(os.environ.get('AUTH_APP_SCRYPT_WORK_FACTOR', 2 ** 14)), 'block_size': 8,
+               'parallelism': 1, 'maxmem': 0},
+    'argon2': {'time_cost': int(os.environ.get('AUTH_APP_ARGON2_TIME_COST', 2)), 'memory_cost': 102400,
+               'parallelism': 8},
+}
+
+# Number of threads hashing passwords at the same time, and how long (in seconds) a request waits for one.
+AUTH_APP_HASHER_THREADS = int(os.environ.get('AUTH_APP_HASHER_THREADS', min(4, os.cpu_count() or 1)))
+AUTH_APP_HASHER_TIMEOUT = 10
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
 # Configure language and timezone settings for the application.
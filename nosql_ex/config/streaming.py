@@ -0,0 +1,149 @@
+"""streaming.py
+
+This file provides streaming JSON responses for large MongoDB result sets, shared by every app in the project.
+
+A 'JsonResponse' needs the whole result as a list before it can encode it, so the documents are held in memory
+twice (the list and the encoded body). A streaming response instead reads the pymongo cursor one batch at a time and
+sends each document as soon as it is encoded, so memory use stays the same however many documents are returned.
+
+Two formats are supported:
+    - JSON array (application/json): the same body a 'JsonResponse' of the list would produce.
+    - NDJSON (application/x-ndjson): one JSON document per line, easier to process line by line on the client.
+
+NDJSON is chosen with a 'format=ndjson' query parameter or an 'Accept: application/x-ndjson' header.
+
+Async views stream a Motor cursor with 'astreaming_json_response', which Django serves from the event loop when
+running under ASGI.
+"""
+
+# Import 'inspect' to await the 'close' method of async cursors.
+import inspect
+# Import the settings module to read the cursor batch size.
+from django.conf import settings
+# Import Django's JSON encoder, the one used by 'JsonResponse', to encode dates, decimals and UUIDs.
+from django.core.serializers.json import DjangoJSONEncoder
+# Import 'StreamingHttpResponse' to send the body as it is generated.
+from django.http import StreamingHttpResponse
+
+# Content types of the two formats.
+JSON_CONTENT_TYPE = 'application/json'
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+# Default number of documents fetched from MongoDB per round-trip, used when 'STREAMING_BATCH_SIZE' isn't set.
+DEFAULT_BATCH_SIZE = 1000
+
+# Number of characters gathered before a chunk is sent, so the server doesn't write one tiny chunk per document.
+CHUNK_SIZE = 64 * 1024
+
+
+def wants_ndjson(request):
+    """Returns True if the request asks for NDJSON rather than a JSON array.
+    """
+    if request.GET.get('format') == 'ndjson':
+        return True
+    return NDJSON_CONTENT_TYPE in request.headers.get('Accept', '')
+
+
+class JsonChunker:
+    """Encodes documents as a JSON array or as NDJSON, and gathers them into chunks of about CHUNK_SIZE characters.
+    """
+    def __init__(self, serializer=None, ndjson=False):
+        self.encoder = DjangoJSONEncoder()
+        self.serializer = serializer
+        self.ndjson = ndjson
+        # The same separator as 'json.dumps', so a JSON array is identical to the body of a 'JsonResponse'.
+        self.separator = '\n' if ndjson else ', '
+        self.chunk = [] if ndjson else ['[']
+        self.size = 0
+        self.first = True
+
+    def add(self, document):
+        """Encodes a document, and returns the chunk to send if it is full (None otherwise).
+        """
+        encoded = self.encoder.encode(self.serializer(document) if self.serializer else document)
+        if self.ndjson:
+            self.chunk.append(encoded + self.separator)
+        else:
+            self.chunk.append(encoded if self.first else self.separator + encoded)
+        self.first = False
+        self.size += len(encoded) + len(self.separator)
+        if self.size >= CHUNK_SIZE:
+            chunk, self.chunk, self.size = ''.join(self.chunk), [], 0
+            return chunk
+        return None
+
+    def finish(self):
+        """Returns the last chunk to send, closing the JSON array (None if there is nothing left).
+        """
+        if not self.ndjson:
+            self.chunk.append(']')
+        return ''.join(self.chunk) or None
+
+
+def iter_json(documents, serializer=None, ndjson=False):
+    """Yields the documents encoded as a JSON array or as NDJSON, in chunks of about CHUNK_SIZE characters.
+
+    If the documents are a pymongo cursor it is closed when the generator finishes or is closed early
+    (e.g. when the client disconnects).
+    """
+    chunker = JsonChunker(serializer, ndjson)
+    try:
+        for document in documents:
+            chunk = chunker.add(document)
+            if chunk:
+                yield chunk
+        chunk = chunker.finish()
+        if chunk:
+            yield chunk
+    finally:
+        if hasattr(documents, 'close'):
+            documents.close()
+
+
+async def aiter_json(documents, serializer=None, ndjson=False):
+    """Async version of 'iter_json', for the async cursors of Motor.
+    """
+    chunker = JsonChunker(serializer, ndjson)
+    try:
+        async for document in documents:
+            chunk = chunker.add(document)
+            if chunk:
+                yield chunk
+        chunk = chunker.finish()
+        if chunk:
+            yield chunk
+    finally:
+        if hasattr(documents, 'close'):
+            closing = documents.close()
+            if inspect.isawaitable(closing):
+                await closing
+
+
+def streaming_json_response(request, cursor, serializer=None, status=200):
+    """Returns a response that streams the documents of a pymongo cursor in the format the request asks for.
+
+    The cursor is read 'STREAMING_BATCH_SIZE' documents at a time, and each document is passed through the
+    serializer (a function taking and returning a document) before it is encoded.
+    """
+    if hasattr(cursor, 'batch_size'):
+        cursor = cursor.batch_size(getattr(settings, 'STREAMING_BATCH_SIZE', DEFAULT_BATCH_SIZE))
+    ndjson = wants_ndjson(request)
+    return StreamingHttpResponse(
+        iter_json(cursor, serializer, ndjson),
+        content_type=NDJSON_CONTENT_TYPE if ndjson else JSON_CONTENT_TYPE,
+        status=status,
+    )
+
+
+def astreaming_json_response(request, cursor, serializer=None, status=200):
+    """Returns a response that streams the documents of an async (Motor) cursor, see 'streaming_json_response'.
+
+    The body is an async iterator, so it must be served by an ASGI server to avoid blocking a thread.
+    """
+    cursor = cursor.batch_size(getattr(settings, 'STREAMING_BATCH_SIZE', DEFAULT_BATCH_SIZE))
+    ndjson = wants_ndjson(request)
+    return StreamingHttpResponse(
+        aiter_json(cursor, serializer, ndjson),
+        content_type=NDJSON_CONTENT_TYPE if ndjson else JSON_CONTENT_TYPE,
+        status=status,
+    )
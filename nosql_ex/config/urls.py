@@ -26,6 +26,8 @@ from django.urls import path, include, re_path
 # Import functions from drf_yasg to create schema views for API documentation.
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+# Import the view serving the request metrics in the Prometheus text format.
+from config.instrumentation import metrics_view
 
 # Create a schema view for generating API documentation, specifying metadata like title, version, and contact information.
 main_app_schema_view = get_schema_view(
@@ -61,4 +63,6 @@ urlpatterns = [
     # Auth application URLs - same as Main application but for authentication fucntionalities defined in auth_app.
     # This app handles user/role syncronisation with MongoDB and uses the data for authentication purposes.
     path('auth_app/', include('auth_app.urls')),
+    # Request metrics (command counts, timings, response sizes and pool counters) in the Prometheus text format.
+    path('metrics/', metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -4,8 +4,16 @@ This file defines the configuration for the Django app. It specifies the app's n
 and default settings for model fields, ensuring consistent behavior across the app.
 """
 
+# Import 'logging' to report indexes that couldn't be created on startup.
+import logging
 # Import 'AppConfig' to define the configuration of the Django app.
 from django.apps import AppConfig
+# Import the settings module to check whether indexes should be created on startup.
+from django.conf import settings
+# Import pymongo's base error, raised when MongoDB can't be reached.
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
 
 class MainAppConfig(AppConfig):
     """Configuration class for a Django application. It defines application-specific settings 
@@ -13,3 +21,18 @@ class MainAppConfig(AppConfig):
     """
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main_app'
+
+    def ready(self):
+        """Creates the MongoDB indexes of the app on startup when the 'MONGODB_ENSURE_INDEXES' setting is True.
+
+        A failure is logged rather than raised, so the server still starts while MongoDB is unavailable.
+        The 'ensure_indexes' management command does the same on demand.
+        """
+        if not getattr(settings, 'MONGODB_ENSURE_INDEXES', False):
+            return
+        from config.mongo import get_database
+        from .indexes import ensure_indexes
+        try:
+            ensure_indexes(get_database())
+        except PyMongoError as error:
+            logger.warning('Could not create the MongoDB indexes on startup: %s', error)
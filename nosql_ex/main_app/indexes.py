@@ -0,0 +1,62 @@
+"""indexes.py
+
+This file defines the MongoDB indexes of the 'meteorite_landings' collection and the filters and sorts they support.
+
+Without an index matching the sort, MongoDB has to sort the matching documents in memory, which fails once they
+exceed its 100MB in-memory sort limit. The API only sorts on the fields listed in 'SORT_FIELDS', and every
+combination of an equality filter and a sort has a compound index of the form (filter field, sort field, _id),
+following the equality, sort, range rule. Pages are sorted on (sort field, _id) and continue from a range on
+those fields (see 'queries.py'), so each page is read straight from the index.
+
+A '2dsphere' index on the GeoJSON 'location' point serves the geospatial filters ('near', 'bbox' and 'polygon').
+An index on the NASA 'id' lets the bulk ingest find the document to update for each record (see 'ingest.py').
+
+The indexes are created by the 'ensure_indexes' management command, or on startup when the
+'MONGODB_ENSURE_INDEXES' setting is True.
+"""
+
+# Import 'IndexModel' and the index types from pymongo to describe the indexes.
+from pymongo import ASCENDING, GEOSPHERE, IndexModel
+# Import the name of the field holding the GeoJSON point of each document.
+from .queries import LOCATION_FIELD
+
+# Name of the collection holding the meteorite landings.
+COLLECTION_NAME = 'meteorite_landings'
+
+# Fields the API can sort on.
+SORT_FIELDS = ('name', 'year', 'mass (g)', 'recclass')
+
+# Fields the API can filter on with an exact match.
+FILTER_FIELDS = ('name', 'year')
+
+
+def get_index_keys():
+    """Returns the keys of every index needed by the supported filter and sort combinations, without duplicates.
+
+    An ascending index also serves descending sorts, since MongoDB can walk it backwards.
+    """
+    keys = []
+    for filter_field in (None, *FILTER_FIELDS):
+        for sort_field in SORT_FIELDS:
+            fields = [sort_field] if filter_field in (None, sort_field) else [filter_field, sort_field]
+            key = [(field, ASCENDING) for field in fields] + [('_id', ASCENDING)]
+            if key not in keys:
+                keys.append(key)
+    return keys
+
+
+def get_index_models():
+    """Returns the indexes of the collection as pymongo 'IndexModel' objects.
+    """
+    return [IndexModel(key) for key in get_index_keys()] + [
+        IndexModel([(LOCATION_FIELD, GEOSPHERE)]),
+        IndexModel([('id', ASCENDING)]),
+    ]
+
+
+def ensure_indexes(database):
+    """Creates any missing index of the collection and returns the names of all of them.
+
+    Creating an index that already exists does nothing, so this is safe to run on every deployment.
+    """
+    return database[COLLECTION_NAME].create_indexes(get_index_models())
@@ -0,0 +1,150 @@
+"""ingest.py
+
+This file loads meteorite landings in bulk, from the NASA CSV export or from NDJSON (one JSON document per line).
+
+Records are parsed one at a time from a stream, so a file of any size can be loaded with flat memory use, and are
+written with 'bulk_write' in batches of upserts keyed on the NASA 'id'. Loading the same file again updates the
+existing documents instead of duplicating them. The batches are unordered, so MongoDB can apply the writes in
+parallel and one failing write doesn't stop the rest of the batch.
+
+Values are converted to the types the API relies on: 'mass (g)', 'reclat' and 'reclong' become numbers, 'year' an
+integer (the CSV stores it as a date) and a GeoJSON 'location' point is added for the geospatial filters.
+"""
+
+# Import 'csv' and 'json' to parse the two supported formats, and 're' to find the year in a date.
+import csv
+import json
+import re
+# Import the pymongo write operation and error used for the batches.
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+# Import the helper that builds the GeoJSON point of a landing.
+from .queries import LOCATION_FIELD, get_document_location
+
+# Fields stored for each landing, the same as the fields accepted by 'MeteoriteLandingsApiView.post'.
+FIELDS = ('name', 'id', 'nametype', 'recclass', 'mass (g)', 'fall', 'year', 'reclat', 'reclong', 'GeoLocation')
+
+# Other names used for the fields in NASA exports, mapped to the names stored in the collection.
+FIELD_ALIASES = {'mass': 'mass (g)', 'geolocation': 'GeoLocation'}
+
+# Default number of documents written per 'bulk_write'.
+DEFAULT_BATCH_SIZE = 1000
+
+# Matches the year of a date such as '01/01/1880 12:00:00 AM' or '1880-01-01T00:00:00.000'.
+YEAR_PATTERN = re.compile(r'(?<!\d)(\d{4})(?!\d)')
+
+
+def to_float(value):
+    """Returns a value as a float, or None if it is empty or not a number.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_year(value):
+    """Returns the year of a number, a year string or a date string, or None if there is none.
+    """
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        match = YEAR_PATTERN.search(value)
+        if match:
+            return int(match.group(1))
+        return int(value) if value.strip().isdigit() else None
+    return None
+
+
+def coerce_landing(record):
+    """Returns the landing document of a parsed record, with its values converted to the stored types.
+
+    Empty strings (as found in CSV files) become None and unknown fields are dropped.
+    """
+    record = {FIELD_ALIASES.get(key, key): value for key, value in record.items()}
+    landing = {field: None if record.get(field) == '' else record.get(field) for field in FIELDS}
+    number = to_float(landing['id'])
+    landing['id'] = int(number) if number is not None else None
+    landing['mass (g)'] = to_float(landing['mass (g)'])
+    landing['year'] = to_year(landing['year'])
+    landing['reclat'] = to_float(landing['reclat'])
+    landing['reclong'] = to_float(landing['reclong'])
+    if not isinstance(landing['GeoLocation'], (str, type(None))):
+        # NASA's JSON export stores the location as an object, keep the string form used by the CSV export.
+        landing['GeoLocation'] = None
+    location = get_document_location(landing)
+    if location:
+        landing[LOCATION_FIELD] = location
+    return landing
+
+
+def iter_csv(lines):
+    """Yields a record for each row of a CSV file with a header row, given as an iterable of text lines.
+    """
+    yield from csv.DictReader(lines)
+
+
+def iter_ndjson(lines):
+    """Yields a record for each non-empty line of an NDJSON file, given as an iterable of text lines.
+
+    Raises ValueError with the line number if a line isn't a JSON object.
+    """
+    for number, line in enumerate(lines, start=1):
+        if line.strip():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as error:
+                raise ValueError(f'Line {number} is not valid JSON: {error}') from None
+            if not isinstance(record, dict):
+                raise ValueError(f'Line {number} is not a JSON object')
+            yield record
+
+
+def get_parser(format):
+    """Returns the record parser of a format, 'csv' or 'ndjson', raising ValueError for any other format.
+    """
+    parsers = {'csv': iter_csv, 'ndjson': iter_ndjson}
+    if format not in parsers:
+        raise ValueError(f"Unsupported format {format!r}, expected 'csv' or 'ndjson'")
+    return parsers[format]
+
+
+def ingest(collection, records, batch_size=DEFAULT_BATCH_SIZE, on_batch=None):
+    """Upserts the landings of the records into the collection, keyed on 'id', and returns the totals.
+
+    Records without a numeric 'id' can't be matched to an existing document and are skipped. 'on_batch' is called
+    with the running totals after every batch, e.g. to report progress.
+    """
+    totals = dict.fromkeys(('processed', 'upserted', 'modified', 'matched', 'skipped', 'errors'), 0)
+    operations = []
+
+    def write():
+        try:
+            result = collection.bulk_write(operations, ordered=False).bulk_api_result
+        except BulkWriteError as error:
+            # The other writes of an unordered batch are still applied, so the batch is counted as usual.
+            result = error.details
+            totals['errors'] += len(result['writeErrors'])
+        totals['upserted'] += result['nUpserted']
+        totals['modified'] += result['nModified']
+        totals['matched'] += result['nMatched']
+        operations.clear()
+        if on_batch:
+            on_batch(totals)
+
+    for record in records:
+        landing = coerce_landing(record)
+        totals['processed'] += 1
+        if landing['id'] is None:
+            totals['skipped'] += 1
+            continue
+        update = {'$set': landing}
+        if LOCATION_FIELD not in landing:
+            # Coordinates that are no longer valid remove the point left by an earlier load.
+            update['$unset'] = {LOCATION_FIELD: ''}
+        operations.append(UpdateOne({'id': landing['id']}, update, upsert=True))
+        if len(operations) >= batch_size:
+            write()
+    if operations:
+        write()
+    return totals
@@ -0,0 +1,62 @@
+"""backfill_locations.py
+
+Management command that adds a GeoJSON 'location' point to the meteorite landings, built from their 'reclat' and
+'reclong' fields (or their 'GeoLocation' string), and creates the '2dsphere' index used by the geospatial filters
+of the API. Run it once after upgrading, and again after importing data that has no 'location':
+
+    python manage.py backfill_locations
+
+Only documents without a 'location' are updated, unless '--all' is given. Documents without valid coordinates are
+left without a 'location' and are never matched by the geospatial filters.
+"""
+
+# Import 'BaseCommand' to define a custom 'manage.py' command.
+from django.core.management.base import BaseCommand
+# Import 'UpdateOne' from pymongo to update the documents in batches.
+from pymongo import UpdateOne
+# Import the shared MongoDB connection, the index definitions and the function that builds the points.
+from config.mongo import get_database
+from main_app.indexes import COLLECTION_NAME, ensure_indexes
+from main_app.queries import LOCATION_FIELD, get_document_location
+
+
+class Command(BaseCommand):
+    """Backfills the GeoJSON 'location' point of the meteorite landings and creates its '2dsphere' index.
+    """
+    help = 'Adds a GeoJSON location point to the meteorite landings and creates the 2dsphere index.'
+
+    def add_arguments(self, parser):
+        """Defines the command line options.
+        """
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of documents updated per write.')
+        parser.add_argument('--all', action='store_true', help='Rebuild the location of every document.')
+
+    def handle(self, *args, **options):
+        """Updates the documents in batches, then creates the indexes.
+        """
+        database = get_database()
+        collection = database[COLLECTION_NAME]
+        query = {} if options['all'] else {LOCATION_FIELD: {'$exists': False}}
+        documents = collection.find(query, {'reclat': 1, 'reclong': 1, 'GeoLocation': 1}) \
+            .batch_size(options['batch_size'])
+
+        operations, updated, skipped = [], 0, 0
+        for document in documents:
+            location = get_document_location(document)
+            if location is not None:
+                operations.append(UpdateOne({'_id': document['_id']}, {'$set': {LOCATION_FIELD: location}}))
+                updated += 1
+            else:
+                # A rebuilt document whose coordinates are no longer valid loses its old point.
+                if options['all']:
+                    operations.append(UpdateOne({'_id': document['_id']}, {'$unset': {LOCATION_FIELD: ''}}))
+                skipped += 1
+            if len(operations) >= options['batch_size']:
+                collection.bulk_write(operations, ordered=False)
+                operations = []
+        if operations:
+            collection.bulk_write(operations, ordered=False)
+
+        ensure_indexes(database)
+        self.stdout.write(self.style.SUCCESS(
+            f'Added a location to {updated} documents, {skipped} documents have no valid coordinates.'))
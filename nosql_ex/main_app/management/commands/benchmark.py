@@ -0,0 +1,405 @@
+"""benchmark.py
+
+Management command that seeds a synthetic meteorite landings collection and measures every endpoint of
+'main_app/urls.py' and 'auth_app/urls.py' that doesn't change the data, reporting the throughput, the p50/p95/p99
+latencies and the number of MongoDB commands per request as JSON. Run it against a local mongod, e.g.:
+
+    MONGODB_URI=mongodb://localhost:27017/ python manage.py benchmark --landings 45000 --output baseline.json
+    python manage.py benchmark --landings 45000 --baseline baseline.json --fail-on-regression
+
+The landings and users are generated from '--seed' into a scratch database ('--database', by default the name in the
+'MONGODB' setting followed by '_benchmark'), with the indexes of 'main_app/indexes.py'. It is dropped at the end, so
+two runs with the same options measure the same data and the project's database is never touched.
+
+Each endpoint is measured in the requested '--modes':
+    - client: '--requests' sequential requests through the Django test client, in this process. This measures the
+      cost of the code alone.
+    - server: '--clients' concurrent keep-alive connections for '--duration' seconds against a uvicorn server (the
+      'uvicorn' package is needed), using the same database. Set 'MONGODB_ASYNC_VIEWS=1' to measure the async views.
+In both modes the commands are read from the 'Server-Timing' header (see 'config/instrumentation.py'). The commands
+of streamed responses run after the header is sent, so they aren't counted. The login is measured as it is used,
+with a POST of a seeded user's password, and includes the password hashing. The other writes are not measured,
+since they would change the dataset between endpoints and runs.
+
+With '--baseline', each result is compared with the same mode and endpoint of a previous report. A result is
+flagged as a regression when its throughput drops or its p95 latency grows by more than '--tolerance', or when it
+runs more commands per request.
+"""
+
+# Import 'json' to write and read the reports, 'os', 'subprocess', 'sys' and 'tempfile' to run the server,
+# 'importlib.util' to check it is installed, 'platform' to record the environment, 'random' to generate the dataset,
+# 're' to read the command count header and 'threading' to run the clients.
+import importlib.util
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+# Import 'http.client' to send requests over keep-alive connections, and the timers.
+import http.client
+from time import monotonic, perf_counter, sleep
+# Import 'django' and 'pymongo' to record their versions, and 'BaseCommand' and 'CommandError' to define a custom
+# 'manage.py' command.
+import django
+import pymongo
+from django.core.management.base import BaseCommand, CommandError
+# Import the settings module to read the MongoDB settings, and 'override_settings' to point the views at the scratch
+# database.
+from django.conf import settings
+from django.test.utils import override_settings
+# Import the test client, which sends requests through the whole middleware stack without a server.
+from django.test import Client
+# Import the shared MongoDB connection, the indexes used by the API, and the documents generated by 'seed'.
+from config import mongo
+from main_app.indexes import ensure_indexes
+from main_app.management.commands.seed import generate_landing, generate_user
+# Import the password hasher used for the seeded users.
+from auth_app.hashers import hash_password
+
+# Names of the collections read by main_app and auth_app.
+LANDINGS_COLLECTION = 'meteorite_landings'
+USERS_COLLECTION = 'users'
+
+# Password of the seeded users, sent to the login endpoint.
+PASSWORD = 'benchmark-password'
+
+# Number of seconds the server has to start answering.
+STARTUP_TIMEOUT = 30
+
+# Reads the command count from the 'Server-Timing' header, e.g. 'db;dur=1.2;desc="2 commands"'.
+COMMAND_COUNT = re.compile(r'desc="(\d+) commands"')
+
+
+def percentile(values, fraction):
+    """Returns the value at a fraction (e.g. 0.95) of sorted values, or 0 if there are none.
+    """
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+
+def summarize(latencies, errors, elapsed, commands):
+    """Returns the throughput, latency percentiles and commands per request of the successful requests.
+    """
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'requests_per_second': round(len(latencies) / elapsed, 1) if elapsed else 0,
+        'p50_ms': round(percentile(latencies, 0.5), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'commands_per_request': round(sum(commands) / len(commands), 2) if commands else None,
+    }
+
+
+def get_command_count(header):
+    """Returns the number of commands in a 'Server-Timing' header, or None if it has none.
+    """
+    match = COMMAND_COUNT.search(header or '')
+    return int(match.group(1)) if match else None
+
+
+def compare(results, baseline, tolerance):
+    """Returns the comparison of each result with the same mode and endpoint of a baseline report.
+    """
+    previous = {(result['mode'], result['endpoint']): result for result in baseline['results']}
+    rows = []
+    for result in results:
+        before = previous.get((result['mode'], result['endpoint']))
+        if before is None:
+            continue
+        throughput = result['requests_per_second'] / before['requests_per_second'] - 1 \
+            if before['requests_per_second'] else 0
+        latency = result['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0
+        commands = (result['commands_per_request'] or 0) - (before['commands_per_request'] or 0)
+        rows.append({
+            'mode': result['mode'], 'endpoint': result['endpoint'],
+            'requests_per_second_change': round(throughput, 3), 'p95_ms_change': round(latency, 3),
+            'commands_per_request_change': round(commands, 2),
+            'regression': throughput < -tolerance or latency > tolerance or commands > 0,
+        })
+    return rows
+
+
+class Command(BaseCommand):
+    """Benchmarks every read endpoint of main_app and auth_app on a seeded collection, optionally against a baseline
+    report.
+    """
+    help = 'Seeds meteorite landings and reports throughput, latency percentiles and commands per request of each endpoint.'
+
+    def add_arguments(self, parser):
+        """Defines the command line options of the benchmark.
+        """
+        parser.add_argument('--landings', type=int, default=45_000, help='Number of meteorite landings.')
+        parser.add_argument('--users', type=int, default=100, help='Number of users.')
+        parser.add_argument('--seed', type=int, default=42, help='Seed for the generated dataset.')
+        parser.add_argument('--database', help='Scratch database the dataset is written to.')
+        parser.add_argument('--modes', default='client', help='Comma separated modes to run: client, server.')
+        parser.add_argument('--endpoints', help='Comma separated endpoints to run (all of them by default).')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint in client mode.')
+        parser.add_argument('--warmup', type=int, default=10, help='Requests not measured before each endpoint.')
+        parser.add_argument('--clients', type=int, default=8, help='Concurrent connections in server mode.')
+        parser.add_argument('--duration', type=float, default=5, help='Seconds each endpoint runs in server mode.')
+        parser.add_argument('--port', type=int, default=8768, help='Port the server listens on.')
+        parser.add_argument('--output', help='File to write the JSON report to (printed if not given).')
+        parser.add_argument('--baseline', help='Report of a previous run to compare the results with.')
+        parser.add_argument('--tolerance', type=float, default=0.15,
+                            help='Fraction the throughput or p95 latency can worsen by before it is a regression.')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='Exit with an error if a result regressed against the baseline.')
+
+    def handle(self, *args, **options):
+        """Seeds the scratch database, measures each endpoint in each mode, then writes the report.
+        """
+        modes = [mode.strip() for mode in options['modes'].split(',')]
+        if set(modes) - {'client', 'server'}:
+            raise CommandError('--modes must be a comma separated list of: client, server.')
+        if 'server' in modes and importlib.util.find_spec('uvicorn') is None:
+            raise CommandError("The 'uvicorn' package is needed for the server mode, install it with pip.")
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)
+
+        database_name = options['database'] or f'{settings.MONGODB["NAME"]}_benchmark'
+        if database_name == settings.MONGODB['NAME']:
+            raise CommandError('--database must not be the database of the project, it is dropped at the end.')
+        # Every request is measured, so the command listener is registered on the clients created from here on.
+        with override_settings(MONGODB={**settings.MONGODB, 'NAME': database_name}, INSTRUMENTATION_SAMPLE_RATE=1.0,
+                               INSTRUMENTATION_SERVER_TIMING=True):
+            database = mongo.get_database()
+            database.client.drop_database(database_name)
+            try:
+                dataset = self.seed(database, options)
+                endpoints = self.get_endpoints(dataset, options['endpoints'])
+                results = []
+                if 'client' in modes:
+                    results += self.run_client(endpoints, options)
+                if 'server' in modes:
+                    results += self.run_server(database_name, endpoints, options)
+            finally:
+                database.client.drop_database(database_name)
+                mongo.manager.close()
+
+        report = {
+            'dataset': {option: options[option] for option in ('landings', 'users', 'seed')},
+            'environment': {'python': platform.python_version(), 'django': django.get_version(),
+                            'pymongo': pymongo.version, 'machine': platform.machine(),
+                            'async_views': getattr(settings, 'MONGODB_ASYNC_VIEWS', False)},
+            'results': results,
+        }
+        if baseline is not None:
+            if baseline.get('dataset') != report['dataset']:
+                self.stderr.write('The baseline was measured on another dataset, the comparison may not be fair.')
+            report['comparison'] = compare(results, baseline, options['tolerance'])
+
+        self.write_summary(report)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+        else:
+            self.stdout.write(json.dumps(report, indent=2))
+
+        regressions = [row for row in report.get('comparison', []) if row['regression']]
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f'{len(regressions)} results regressed against the baseline: '
+                               f'{", ".join(row["mode"] + " " + row["endpoint"] for row in regressions)}.')
+
+    def seed(self, database, options):
+        """Generates the landings and users, and returns the values the endpoints use.
+        """
+        rng = random.Random(options['seed'])
+        landings = [generate_landing(rng, number) for number in range(1, options['landings'] + 1)]
+        for start in range(0, len(landings), 10_000):
+            database[LANDINGS_COLLECTION].insert_many(landings[start:start + 10_000])
+        # The users share a single hash, so seeding doesn't take as long as hashing each password.
+        password = hash_password(PASSWORD)
+        users = [generate_user(rng, number, password) for number in range(max(options['users'], 1))]
+        database[USERS_COLLECTION].insert_many(users)
+        ensure_indexes(database)
+
+        return {
+            'year': landings[len(landings) // 2]['year'] if landings else 2000,
+            'name': landings[len(landings) // 2]['name'] if landings else 'Landing 1',
+            'username': users[0]['username'],
+        }
+
+    def get_endpoints(self, dataset, names=None):
+        """Returns the (name, method, path, body) of every endpoint measured, or of the named ones.
+        """
+        landings, stats = '/main_app/api/meteorite_landings/', '/main_app/api/meteorite_landings/stats/'
+        login = json.dumps({'username': dataset['username'], 'password': PASSWORD})
+        endpoints = [
+            ('main_app-index', 'GET', '/main_app/', None),
+            ('auth_app-index', 'GET', '/auth_app/', None),
+            ('landings-list', 'GET', landings, None),
+            ('landings-sort', 'GET', f'{landings}?sort=year&order=desc&page_size=100', None),
+            ('landings-name', 'GET', f'{landings}?name={dataset["name"].replace(" ", "+")}', None),
+            ('landings-year', 'GET', f'{landings}?year={dataset["year"]}&sort=year', None),
+            ('landings-fields', 'GET', f'{landings}?fields=name,year,recclass&page_size=500', None),
+            ('landings-near', 'GET', f'{landings}?near=50.775,6.0833&max_km=1000', None),
+            ('landings-bbox', 'GET', f'{landings}?bbox=45,0,55,15', None),
+            ('landings-stream', 'GET', f'{landings}?stream=true&fields=name,year', None),
+            ('stats', 'GET', stats, None),
+            ('stats-year', 'GET', f'{stats}?group_by=year&limit=100', None),
+            ('user_manage', 'GET', '/auth_app/api/user_manage/', None),
+            ('login', 'POST', '/auth_app/api/login/', login),
+        ]
+        if names:
+            names = {name.strip() for name in names.split(',')}
+            unknown = names - {endpoint[0] for endpoint in endpoints}
+            if unknown:
+                raise CommandError(f'Unknown endpoints: {", ".join(sorted(unknown))}.')
+            endpoints = [endpoint for endpoint in endpoints if endpoint[0] in names]
+        return endpoints
+
+    def run_client(self, endpoints, options):
+        """Measures each endpoint with sequential requests through the test client.
+        """
+        client = Client()
+        results = []
+        for name, method, path, body in endpoints:
+            def send():
+                if method == 'POST':
+                    response = client.post(path, body, content_type='application/json')
+                else:
+                    response = client.get(path)
+                # Read streamed responses, so their time is included.
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                return response
+
+            for _ in range(options['warmup']):
+                send()
+            latencies, commands, errors = [], [], 0
+            start = perf_counter()
+            for _ in range(options['requests']):
+                request_start = perf_counter()
+                response = send()
+                latency = (perf_counter() - request_start) * 1000
+                if response.status_code == 200:
+                    latencies.append(latency)
+                    count = get_command_count(response.get('Server-Timing'))
+                    if count is not None:
+                        commands.append(count)
+                else:
+                    errors += 1
+            results.append({'mode': 'client', 'endpoint': name, 'method': method, 'path': path,
+                            **summarize(latencies, errors, perf_counter() - start, commands)})
+            self.stderr.write(f'client {name}: {results[-1]["requests_per_second"]} req/s')
+        return results
+
+    def run_server(self, database, endpoints, options):
+        """Measures each endpoint with concurrent connections against a uvicorn server using the same database.
+        """
+        environment = {**os.environ, 'MONGODB_URI': settings.MONGODB['URI'], 'MONGODB_NAME': database,
+                       'INSTRUMENTATION_SAMPLE_RATE': '1', 'INSTRUMENTATION_SERVER_TIMING': '1'}
+        # The output goes to a file rather than a pipe, which would block the server once full.
+        output = tempfile.TemporaryFile()
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'config.asgi:application', '--port', str(options['port']),
+             '--log-level', 'warning'],
+            cwd=settings.BASE_DIR, env=environment, stdout=output, stderr=subprocess.STDOUT)
+        results = []
+        try:
+            self.wait_for_server(process, output, options['port'])
+            for name, method, path, body in endpoints:
+                for _ in range(options['warmup']):
+                    self.request(options['port'], method, path, body)
+                results.append({'mode': 'server', 'endpoint': name, 'method': method, 'path': path,
+                                **self.run_clients(options, method, path, body)})
+                self.stderr.write(f'server {name}: {results[-1]["requests_per_second"]} req/s')
+        finally:
+            process.terminate()
+            process.wait()
+        return results
+
+    def wait_for_server(self, process, output, port):
+        """Waits until the server answers, or raises CommandError if it stops or takes too long.
+        """
+        deadline = monotonic() + STARTUP_TIMEOUT
+        while True:
+            if process.poll() is not None:
+                output.seek(0)
+                raise CommandError(f'The server stopped:\n{output.read().decode()}')
+            try:
+                self.request(port, 'GET', '/main_app/', None)
+                return
+            except OSError:
+                if monotonic() > deadline:
+                    process.kill()
+                    raise CommandError(f'The server did not start within {STARTUP_TIMEOUT} seconds.')
+                sleep(0.2)
+
+    def request(self, port, method, path, body):
+        """Sends a single request and returns its status code.
+        """
+        client = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        try:
+            client.request(method, path, body, headers={'Content-Type': 'application/json'})
+            response = client.getresponse()
+            response.read()
+            return response.status
+        finally:
+            client.close()
+
+    def run_clients(self, options, method, path, body):
+        """Sends requests from concurrent connections for a number of seconds, and returns the results.
+        """
+        deadline = monotonic() + options['duration']
+        latencies, commands, errors, lock = [], [], [0], threading.Lock()
+
+        def run():
+            client = http.client.HTTPConnection('127.0.0.1', options['port'], timeout=30)
+            timings, counts, failures = [], [], 0
+            while monotonic() < deadline:
+                start = perf_counter()
+                try:
+                    client.request(method, path, body, headers={'Content-Type': 'application/json'})
+                    response = client.getresponse()
+                    response.read()
+                except (OSError, http.client.HTTPException):
+                    failures += 1
+                    client.close()
+                    continue
+                if response.status == 200:
+                    timings.append((perf_counter() - start) * 1000)
+                    count = get_command_count(response.getheader('Server-Timing'))
+                    if count is not None:
+                        counts.append(count)
+                else:
+                    failures += 1
+            client.close()
+            with lock:
+                latencies.extend(timings)
+                commands.extend(counts)
+                errors[0] += failures
+
+        threads = [threading.Thread(target=run) for _ in range(options['clients'])]
+        start = perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return summarize(latencies, errors[0], perf_counter() - start, commands)
+
+    def write_summary(self, report):
+        """Prints a table of the results, with the change against the baseline when there is one.
+        """
+        comparison = {(row['mode'], row['endpoint']): row for row in report.get('comparison', [])}
+        self.stderr.write(f'\n{"mode":<7} {"endpoint":<18} {"req/s":>9} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} '
+                          f'{"commands":>9} {"errors":>7}  {"vs baseline"}')
+        for result in report['results']:
+            row = comparison.get((result['mode'], result['endpoint']))
+            change = ''
+            if row is not None:
+                change = (f'{row["requests_per_second_change"]:+.0%} req/s, {row["p95_ms_change"]:+.0%} p95, '
+                          f'{row["commands_per_request_change"]:+g} commands'
+                          f'{"  REGRESSION" if row["regression"] else ""}')
+            commands = result['commands_per_request']
+            self.stderr.write(f'{result["mode"]:<7} {result["endpoint"]:<18} {result["requests_per_second"]:>9.1f} '
+                              f'{result["p50_ms"]:>8.2f} {result["p95_ms"]:>8.2f} {result["p99_ms"]:>8.2f} '
+                              f'{"-" if commands is None else commands:>9} {result["errors"]:>7}  {change}')
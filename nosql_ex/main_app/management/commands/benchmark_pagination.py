@@ -0,0 +1,86 @@
+"""benchmark_pagination.py
+
+Management command that compares the latency of 'skip()' pagination with the range-based pagination used by the
+meteorite landings API, at increasingly deep pages. Run it with:
+
+    python manage.py benchmark_pagination --count 45000
+
+The documents are written to a scratch collection of the database in the 'MONGODB' setting, which is dropped at the
+end. With range-based pagination every page should take about the same time, while 'skip()' grows with the depth.
+"""
+
+# Import 'random' and 'statistics' to generate the documents and summarise the timings.
+import random
+import statistics
+# Import 'perf_counter' to time each page.
+from time import perf_counter
+# Import 'BaseCommand' to define a custom 'manage.py' command.
+from django.core.management.base import BaseCommand
+# Import the sort direction used for the pages.
+from pymongo import ASCENDING
+# Import the shared MongoDB connection and the pagination helpers used by the views.
+from config.mongo import get_collection
+from main_app.queries import encode_cursor, find_page
+
+# Name of the scratch collection the benchmark writes to.
+COLLECTION_NAME = 'benchmark_meteorite_landings'
+
+
+class Command(BaseCommand):
+    """Benchmarks 'skip()' pagination against range-based pagination at increasing page depths.
+    """
+    help = 'Compares skip() pagination with range-based pagination at increasingly deep pages.'
+
+    def add_arguments(self, parser):
+        """Defines the command line options of the benchmark.
+        """
+        parser.add_argument('--count', type=int, default=45_000, help='Number of documents to generate.')
+        parser.add_argument('--page-size', type=int, default=50, help='Number of documents per page.')
+        parser.add_argument('--sort', default='year', help='Field to sort the pages on.')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of times each page is timed.')
+        parser.add_argument('--seed', type=int, default=42, help='Seed for the generated documents.')
+
+    def handle(self, *args, **options):
+        """Fills the scratch collection, then times one page at each depth with both approaches.
+        """
+        rng = random.Random(options['seed'])
+        collection = get_collection(COLLECTION_NAME)
+        collection.drop()
+        collection.insert_many([
+            {'name': f'Landing {number}', 'id': number, 'recclass': rng.choice(['L5', 'H5', 'L6', 'H6', 'LL5']),
+             'mass (g)': round(rng.lognormvariate(5, 2), 1), 'year': rng.randint(1800, 2013)}
+            for number in range(options['count'])
+        ])
+        sort_field, page_size = options['sort'], options['page_size']
+        collection.create_index([(sort_field, ASCENDING), ('_id', ASCENDING)])
+
+        last_page = max(options['count'] // page_size - 1, 0)
+        depths = sorted({0, 10, 100, last_page // 2, last_page} & set(range(last_page + 1)))
+        self.stdout.write(f'{"page":>8} {"skip ms":>10} {"range ms":>10}')
+        try:
+            for page in depths:
+                skip = self.time(options['repeat'], lambda: list(
+                    collection.find().sort([(sort_field, ASCENDING), ('_id', ASCENDING)])
+                    .skip(page * page_size).limit(page_size)))
+
+                # The cursor of a deep page is built from the document just before it, as a client would receive it.
+                cursor = None
+                if page:
+                    previous = next(collection.find().sort([(sort_field, ASCENDING), ('_id', ASCENDING)])
+                                    .skip(page * page_size - 1).limit(1))
+                    cursor = encode_cursor(sort_field, ASCENDING, previous.get(sort_field), previous['_id'])
+                ranged = self.time(options['repeat'], lambda: find_page(
+                    collection, {}, sort_field, ASCENDING, page_size, cursor))
+                self.stdout.write(f'{page:>8} {skip:>10.2f} {ranged:>10.2f}')
+        finally:
+            collection.drop()
+
+    def time(self, repeat, function):
+        """Returns the median time of a function in milliseconds.
+        """
+        timings = []
+        for _ in range(repeat):
+            start = perf_counter()
+            function()
+            timings.append((perf_counter() - start) * 1000)
+        return statistics.median(timings)
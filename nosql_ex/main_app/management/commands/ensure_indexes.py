@@ -0,0 +1,29 @@
+"""ensure_indexes.py
+
+Management command that creates the MongoDB indexes used by the meteorite landings API (see 'main_app/indexes.py').
+Run it after deploying, or whenever the supported filters and sorts change:
+
+    python manage.py ensure_indexes
+
+Indexes that already exist are left as they are, so the command can be run any number of times.
+"""
+
+# Import 'BaseCommand' to define a custom 'manage.py' command.
+from django.core.management.base import BaseCommand
+# Import the shared MongoDB connection and the function that creates the indexes.
+from config.mongo import get_database
+from main_app.indexes import COLLECTION_NAME, ensure_indexes
+
+
+class Command(BaseCommand):
+    """Creates any missing index of the 'meteorite_landings' collection.
+    """
+    help = 'Creates the MongoDB indexes used by the meteorite landings API.'
+
+    def handle(self, *args, **options):
+        """Creates the indexes and lists them.
+        """
+        names = ensure_indexes(get_database())
+        for name in names:
+            self.stdout.write(f'{COLLECTION_NAME}: {name}')
+        self.stdout.write(self.style.SUCCESS(f'{len(names)} indexes are in place.'))
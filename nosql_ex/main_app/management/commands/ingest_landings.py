@@ -0,0 +1,72 @@
+"""ingest_landings.py
+
+Management command that loads meteorite landings from a NASA CSV export or an NDJSON file (see 'main_app/ingest.py'),
+reporting its throughput as it runs. Run it with:
+
+    python manage.py ingest_landings Meteorite_Landings.csv
+    python manage.py ingest_landings landings.ndjson --batch-size 5000
+
+The format is taken from the file extension unless '--format' is given. Use '-' as the path to read from stdin.
+Existing landings are updated rather than duplicated, so the same file can be loaded again.
+"""
+
+# Import 'sys' to read from stdin and 'perf_counter' to measure the throughput.
+import sys
+from time import perf_counter
+# Import 'BaseCommand' and 'CommandError' to define a custom 'manage.py' command.
+from django.core.management.base import BaseCommand, CommandError
+# Import the shared MongoDB connection and the bulk ingest functions.
+from config.mongo import get_collection
+from main_app.indexes import COLLECTION_NAME
+from main_app.ingest import DEFAULT_BATCH_SIZE, get_parser, ingest
+from main_app.stats import invalidate_stats
+
+# Formats used for each file extension.
+EXTENSIONS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
+
+class Command(BaseCommand):
+    """Loads meteorite landings from a CSV or NDJSON file in bulk.
+    """
+    help = 'Loads meteorite landings from a CSV or NDJSON file with batched upserts keyed on the NASA id.'
+
+    def add_arguments(self, parser):
+        """Defines the command line arguments.
+        """
+        parser.add_argument('path', help="File to load, or '-' for stdin.")
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Format of the file.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Number of documents written per batch.')
+
+    def handle(self, *args, **options):
+        """Loads the file, printing the running totals and throughput after every batch.
+        """
+        path = options['path']
+        format = options['format'] or next(
+            (value for extension, value in EXTENSIONS.items() if path.lower().endswith(extension)), None)
+        if format is None:
+            raise CommandError('Could not tell the format from the file name, use --format.')
+        start = perf_counter()
+
+        def report(totals):
+            elapsed = perf_counter() - start
+            self.stdout.write(f"{totals['processed']} records in {elapsed:.1f}s "
+                              f"({totals['processed'] / elapsed if elapsed else 0:.0f} records/s)")
+
+        try:
+            file = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        except OSError as error:
+            raise CommandError(error)
+        try:
+            totals = ingest(get_collection(COLLECTION_NAME), get_parser(format)(file), options['batch_size'], report)
+        except ValueError as error:
+            raise CommandError(error)
+        finally:
+            if file is not sys.stdin:
+                file.close()
+            invalidate_stats()
+
+        elapsed = perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {totals['processed']} records in {elapsed:.1f}s: {totals['upserted']} new, "
+            f"{totals['modified']} updated, {totals['skipped']} skipped without an id, {totals['errors']} errors."))
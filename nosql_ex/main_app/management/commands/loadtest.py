@@ -0,0 +1,189 @@
+"""loadtest.py
+
+Management command that compares the throughput and latency of the API served three ways:
+    - sync-wsgi: the sync views under gunicorn (WSGI), one thread per request.
+    - sync-asgi: the sync views under uvicorn (ASGI), each request handed to a thread by 'sync_to_async'.
+    - async-asgi: the async Motor views under uvicorn (ASGI), every request on the event loop.
+
+Each mode starts its own server on a local port, with 'MONGODB_ASYNC_VIEWS' set accordingly, then sends requests
+from '--clients' concurrent keep-alive connections for '--duration' seconds. Run it against a local mongod holding
+the meteorite landings, e.g.:
+
+    MONGODB_URI=mongodb://localhost:27017/ python manage.py loadtest --clients 64 --duration 20
+
+The servers need the 'gunicorn' and 'uvicorn' packages, which are only used by this command. The clients are
+Python threads in this process, so use a server with fewer CPUs than the machine to keep the client from being the
+bottleneck.
+"""
+
+# Import 'csv' to save the results, 'statistics' to summarise them, 'os' and 'subprocess' to run the servers,
+# 'sys' to find the Python interpreter, 'tempfile' to hold the server output, 'importlib.util' to check the servers
+# are installed and 'threading' to run the clients.
+import csv
+import importlib.util
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+# Import 'http.client' to send requests over keep-alive connections, and the timers.
+import http.client
+from time import monotonic, perf_counter, sleep
+# Import 'BaseCommand' and 'CommandError' to define a custom 'manage.py' command.
+from django.core.management.base import BaseCommand, CommandError
+# Import the settings module to find the project directory.
+from django.conf import settings
+
+# Server command line and value of 'MONGODB_ASYNC_VIEWS' of each mode. '{workers}', '{threads}' and '{port}' are filled in.
+MODES = {
+    'sync-wsgi': ('gunicorn', ['config.wsgi:application', '--workers', '{workers}', '--threads', '{threads}',
+                               '--bind', '127.0.0.1:{port}', '--log-level', 'warning'], '0'),
+    'sync-asgi': ('uvicorn', ['config.asgi:application', '--workers', '{workers}', '--port', '{port}',
+                              '--log-level', 'warning'], '0'),
+    'async-asgi': ('uvicorn', ['config.asgi:application', '--workers', '{workers}', '--port', '{port}',
+                               '--log-level', 'warning'], '1'),
+}
+
+# Number of seconds a server has to start answering.
+STARTUP_TIMEOUT = 30
+
+
+class Command(BaseCommand):
+    """Load tests the API under WSGI, under ASGI with the sync views and under ASGI with the async views.
+    """
+    help = 'Compares req/s and p99 latency of the sync views under WSGI and ASGI and of the async views under ASGI.'
+
+    def add_arguments(self, parser):
+        """Defines the command line options of the load test.
+        """
+        parser.add_argument('--modes', default=','.join(MODES),
+                            help=f'Comma separated modes to test, from: {", ".join(MODES)}.')
+        parser.add_argument('--path', default='/main_app/api/meteorite_landings/?page_size=50&sort=year',
+                            help='Path (and query string) requested by the clients.')
+        parser.add_argument('--clients', type=int, default=32, help='Number of concurrent connections.')
+        parser.add_argument('--duration', type=float, default=10, help='Number of seconds each mode is measured.')
+        parser.add_argument('--warmup', type=float, default=2, help='Number of seconds of requests not measured.')
+        parser.add_argument('--workers', type=int, default=1, help='Number of server processes.')
+        parser.add_argument('--threads', type=int, default=32, help='Number of threads per gunicorn worker.')
+        parser.add_argument('--port', type=int, default=8765, help='Port the servers listen on.')
+        parser.add_argument('--csv', help='File to save the results to.')
+
+    def handle(self, *args, **options):
+        """Runs the load test of every mode, then prints the results.
+        """
+        modes = [mode.strip() for mode in options['modes'].split(',')]
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f'Unknown modes: {", ".join(sorted(unknown))}.')
+        for server in {MODES[mode][0] for mode in modes}:
+            if importlib.util.find_spec(server) is None:
+                raise CommandError(f"The '{server}' package is needed to run the load test, install it with pip.")
+
+        rows = []
+        for mode in modes:
+            self.stdout.write(f'Testing {mode}...')
+            with self.run_server(mode, options):
+                self.run_clients(options, options['warmup'])
+                rows.append({'mode': mode, **self.run_clients(options, options['duration'])})
+
+        self.stdout.write(f'\n{"mode":<12} {"requests":>9} {"errors":>7} {"req/s":>9} {"p50 ms":>8} {"p99 ms":>8}')
+        for row in rows:
+            self.stdout.write(f'{row["mode"]:<12} {row["requests"]:>9} {row["errors"]:>7} '
+                              f'{row["requests_per_second"]:>9.1f} {row["p50_ms"]:>8.1f} {row["p99_ms"]:>8.1f}')
+
+        if options['csv'] and rows:
+            with open(options['csv'], 'w', newline='') as file:
+                writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+                writer.writeheader()
+                writer.writerows(rows)
+
+    def run_server(self, mode, options):
+        """Starts the server of a mode and returns it once it answers, to be used as a context manager.
+        """
+        server, arguments, async_views = MODES[mode]
+        arguments = [argument.format(**options) for argument in arguments]
+        environment = {**os.environ, 'MONGODB_ASYNC_VIEWS': async_views}
+        # The output goes to a file rather than a pipe, which would block the server once full.
+        output = tempfile.TemporaryFile()
+        process = subprocess.Popen([sys.executable, '-m', server, *arguments], cwd=settings.BASE_DIR,
+                                   env=environment, stdout=output, stderr=subprocess.STDOUT)
+        deadline = monotonic() + STARTUP_TIMEOUT
+        while True:
+            if process.poll() is not None:
+                output.seek(0)
+                raise CommandError(f'The {mode} server stopped:\n{output.read().decode()}')
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', options['port'], timeout=5)
+                connection.request('GET', options['path'])
+                connection.getresponse().read()
+                connection.close()
+                break
+            except OSError:
+                if monotonic() > deadline:
+                    process.kill()
+                    raise CommandError(f'The {mode} server did not start within {STARTUP_TIMEOUT} seconds.')
+                sleep(0.2)
+        return ServerProcess(process)
+
+    def run_clients(self, options, duration):
+        """Sends requests from concurrent connections for a number of seconds, and returns the results.
+        """
+        deadline = monotonic() + duration
+        latencies, errors, lock = [], [0], threading.Lock()
+
+        def client():
+            connection = http.client.HTTPConnection('127.0.0.1', options['port'], timeout=30)
+            timings, failures = [], 0
+            while monotonic() < deadline:
+                start = perf_counter()
+                try:
+                    connection.request('GET', options['path'])
+                    response = connection.getresponse()
+                    response.read()
+                except (OSError, http.client.HTTPException):
+                    failures += 1
+                    connection.close()
+                    continue
+                if response.status == 200:
+                    timings.append((perf_counter() - start) * 1000)
+                else:
+                    failures += 1
+            connection.close()
+            with lock:
+                latencies.extend(timings)
+                errors[0] += failures
+
+        threads = [threading.Thread(target=client) for _ in range(options['clients'])]
+        start = perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = perf_counter() - start
+
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'errors': errors[0],
+            'requests_per_second': len(latencies) / elapsed,
+            'p50_ms': statistics.median(latencies) if latencies else 0,
+            'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0,
+        }
+
+
+class ServerProcess:
+    """Context manager stopping a server process on exit.
+    """
+    def __init__(self, process):
+        self.process = process
+
+    def __enter__(self):
+        return self.process
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
@@ -0,0 +1,175 @@
+"""seed.py
+
+Management command that fills MongoDB with generated meteorite landings and users, to reproduce a production sized
+dataset locally. Run it with:
+
+    MONGODB_URI=mongodb://localhost:27017/ python manage.py seed --landings 5000000 --users 100000
+
+The documents are generated from '--seed' in chunks of '--chunk-size' documents, each from its own random generator,
+so the same seed on an empty database always gives the same documents, whatever the number of '--workers'. Each
+worker process generates its chunks and writes them with 'insert_many' over its own connection, so generation and
+writes run in parallel. The landings look like the NASA dataset: Zipf-like classes, log-normal masses, most of them
+found rather than seen falling, and the GeoJSON point of 'queries.py' when they have coordinates.
+
+The users all share the hash of '--password', so seeding doesn't take as long as hashing each one. The new landings
+are numbered after the largest NASA 'id', and the users after the ones seeded before. The indexes of
+'main_app/indexes.py' are created once the landings are written, which is faster than updating them on every insert,
+and the cached statistics are invalidated.
+"""
+
+# Import 'os' to count the CPUs, 'random' to generate the documents, 're' to find the users seeded before, 'deque' to
+# keep track of the chunks being written, and the process pool that writes them.
+import os
+import random
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+# Import 'perf_counter' to time each kind of documents.
+from time import perf_counter
+# Import 'django' to set up the worker processes, and 'BaseCommand' and 'CommandError' to define a custom 'manage.py'
+# command.
+import django
+from django.core.management.base import BaseCommand, CommandError
+# Import the shared MongoDB connection, the indexes, the helper storing the GeoJSON points and the statistics cache.
+from config.mongo import get_database
+from main_app.indexes import COLLECTION_NAME, ensure_indexes
+from main_app.queries import LOCATION_FIELD, get_document_location
+from main_app.stats import invalidate_stats
+# Import the password hasher used for the users.
+from auth_app.hashers import hash_password
+
+# Name of the collection holding the users (see 'auth_app/views.py').
+USERS_COLLECTION = 'users'
+
+# Prefix of the usernames of the seeded users.
+USERNAME_PREFIX = 'seed_user'
+
+# Meteorite classes picked from, the most common first, as in the NASA dataset.
+RECCLASSES = ['L6', 'H5', 'L5', 'H6', 'H4', 'LL5', 'LL6', 'L4', 'H4/5', 'CM2', 'H3', 'L3', 'CO3', 'Ureilite', 'Iron, IIIAB']
+RECCLASS_WEIGHTS = [1 / (rank + 1) for rank in range(len(RECCLASSES))]
+
+# Syllables combined into the made up words used for names.
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'ze', 'qua', 'bri', 'dor', 'fen', 'gal', 'hux', 'jin']
+WORDS = [a + b for a in SYLLABLES for b in SYLLABLES]
+
+
+def get_random(seed, kind, chunk):
+    """Returns the random generator of a chunk, which only depends on the seed, the kind of documents and the chunk.
+    """
+    return random.Random(f'{seed}:{kind}:{chunk}')
+
+
+def generate_landing(rng, number):
+    """Returns a meteorite landing document with the NASA 'id' 'number'.
+    """
+    landing = {
+        'name': f'{rng.choice(WORDS).title()} {number:03}', 'id': number,
+        'nametype': 'Valid' if rng.random() < 0.99 else 'Relict',
+        'recclass': rng.choices(RECCLASSES, RECCLASS_WEIGHTS)[0], 'mass (g)': round(rng.lognormvariate(4, 2.5), 1),
+        'fall': 'Fell' if rng.random() < 0.03 else 'Found', 'year': int(rng.triangular(1800, 2013, 2000)),
+    }
+    # Most landings have coordinates, the others only have a name.
+    if rng.random() < 0.85:
+        landing['reclat'], landing['reclong'] = round(rng.uniform(-85, 85), 5), round(rng.uniform(-180, 180), 5)
+        landing['GeoLocation'] = f'({landing["reclat"]}, {landing["reclong"]})'
+    location = get_document_location(landing)
+    if location:
+        landing[LOCATION_FIELD] = location
+    return landing
+
+
+def generate_user(rng, number, password):
+    """Returns a user document, with the hash 'password'.
+    """
+    first_name, last_name = rng.choice(WORDS).title(), rng.choice(WORDS).title()
+    return {
+        'username': f'{USERNAME_PREFIX}{number}', 'password': password,
+        'roles': ['administrator', 'user'] if rng.random() < 0.05 else ['user'], 'last_login': None,
+        'profile_data': {'first_name': first_name, 'last_name': last_name,
+                         'email': f'{first_name.lower()}.{last_name.lower()}{number}@example.com'},
+    }
+
+
+def write_chunk(kind, seed, chunk, start, stop, context):
+    """Generates the documents of a chunk, numbered from 'start' up to 'stop', and inserts them. Runs in the worker
+    processes, and returns the number of documents written.
+    """
+    rng = get_random(seed, kind, chunk)
+    if kind == 'landings':
+        documents = [generate_landing(rng, number) for number in range(start, stop)]
+        collection = COLLECTION_NAME
+    else:
+        documents = [generate_user(rng, number, context['password']) for number in range(start, stop)]
+        collection = USERS_COLLECTION
+    if documents:
+        get_database(context['database'])[collection].insert_many(documents, ordered=False)
+    return len(documents)
+
+
+class Command(BaseCommand):
+    """Seeds MongoDB with generated meteorite landings and users.
+    """
+    help = 'Generates deterministic meteorite landings and users and reports documents per second.'
+
+    def add_arguments(self, parser):
+        """Defines the command line options of the seed.
+        """
+        parser.add_argument('--landings', type=int, default=1_000_000, help='Number of meteorite landings.')
+        parser.add_argument('--users', type=int, default=10_000, help='Number of users.')
+        parser.add_argument('--password', default='password', help='Password of every seeded user.')
+        parser.add_argument('--seed', type=int, default=42, help='Seed for the generated documents.')
+        parser.add_argument('--database', help='Database to seed (the one in the MONGODB setting by default).')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of processes writing the documents (0 writes them in this process).')
+        parser.add_argument('--chunk-size', type=int, default=10_000, help='Number of documents per chunk.')
+
+    def handle(self, *args, **options):
+        """Writes the landings then the users, creates the indexes, and reports the documents per second.
+        """
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1.')
+        database = get_database(options['database'])
+        context = {'database': database.name, 'password': hash_password(options['password'])}
+
+        # Number the new documents after the existing ones, so seeding twice adds to the dataset.
+        last = next(database[COLLECTION_NAME].find({'id': {'$type': 'number'}}, {'id': 1})
+                    .sort('id', -1).limit(1), None)
+        first_landing = int(last['id']) + 1 if last else 1
+        first_user = database[USERS_COLLECTION].count_documents(
+            {'username': {'$regex': f'^{re.escape(USERNAME_PREFIX)}'}})
+
+        self.stdout.write(f'{"documents":<10} {"count":>10} {"seconds":>9} {"docs/s":>10}')
+        start, total = perf_counter(), 0
+        for kind, first, count in [('landings', first_landing, options['landings']),
+                                   ('users', first_user, options['users'])]:
+            kind_start = perf_counter()
+            tasks = [(kind, options['seed'], chunk, chunk_start, min(chunk_start + options['chunk_size'], first + count),
+                      context)
+                     for chunk, chunk_start in enumerate(range(first, first + count, options['chunk_size']))]
+            written = sum(self.write(tasks, options['workers']))
+            if kind == 'landings':
+                ensure_indexes(database)
+            seconds = perf_counter() - kind_start
+            total += written
+            self.stdout.write(f'{kind:<10} {written:>10} {seconds:>9.2f} {written / seconds if seconds else 0:>10.0f}')
+        invalidate_stats()
+        elapsed = perf_counter() - start
+        self.stdout.write(f'{"total":<10} {total:>10} {elapsed:>9.2f} {total / elapsed if elapsed else 0:>10.0f}')
+
+    def write(self, tasks, workers):
+        """Yields the number of documents written by each task, run by the worker processes. At most two chunks per
+        worker are waiting, so the memory used doesn't grow with the dataset.
+        """
+        if not workers:
+            for task in tasks:
+                yield write_chunk(*task)
+            return
+
+        with ProcessPoolExecutor(workers, initializer=django.setup) as executor:
+            pending = deque()
+            for task in tasks:
+                pending.append(executor.submit(write_chunk, *task))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
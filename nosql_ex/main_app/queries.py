@@ -0,0 +1,218 @@
+"""queries.py
+
+This file contains the MongoDB query helpers used by the views in 'views.py'.
+
+Pages of results are fetched with range-based pagination. Using 'skip()' forces the server to walk over every
+skipped document, so deep pages get slower the further they are. Instead, the documents are sorted on
+(sort field, _id) and each page starts after the last document of the previous one. With an index on those
+fields every page costs the same. The position of the last document is returned as an opaque cursor token.
+
+Geospatial filters match the GeoJSON 'location' point of each document (see the 'backfill_locations' command),
+using its '2dsphere' index, so the filtering is done by MongoDB rather than in Python.
+"""
+
+# Import 'base64' to make cursor tokens safe to use in a URL.
+import base64
+# Import 'json_util' from bson to encode cursor positions that contain ObjectIds, dates and other BSON types.
+from bson import json_util
+# Import the BSON errors raised when a cursor token can't be decoded.
+from bson.errors import InvalidId
+# Import the sort directions used by pymongo.
+from pymongo import ASCENDING, DESCENDING
+
+# Name of the field holding the GeoJSON point of each document.
+LOCATION_FIELD = 'location'
+
+# Mean radius of the Earth in kilometres, used to turn distances into the radians expected by '$centerSphere'.
+EARTH_RADIUS_KM = 6378.1
+
+# Distance used by 'near' queries when 'max_km' isn't given.
+DEFAULT_MAX_KM = 100
+
+
+def encode_cursor(sort_field, direction, value, _id):
+    """Returns a URL-safe token for the position of a document in a sorted result set.
+    """
+    data = json_util.dumps({'s': sort_field, 'd': direction, 'v': value, 'id': _id})
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(token, sort_field, direction):
+    """Returns the (value, _id) position of a cursor token, raising ValueError if the token is invalid
+    or was created for a different sort order.
+    """
+    try:
+        data = json_util.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        position = data['s'], data['d'], data['v'], data['id']
+    except (ValueError, TypeError, KeyError, InvalidId) as error:
+        raise ValueError('Invalid cursor') from error
+    if position[:2] != (sort_field, direction):
+        raise ValueError('The cursor does not match the requested sort order')
+    return position[2:]
+
+
+def get_range_filter(sort_field, direction, value, _id):
+    """Returns a filter matching the documents that come after the position (value, _id) in the sort order.
+
+    MongoDB sorts missing and null values before every other value, so they need their own conditions.
+    Comparisons only match values of the same BSON type, so a field should hold a single type (e.g. numbers).
+    """
+    id_operator = '$gt' if direction == ASCENDING else '$lt'
+    same_value = {sort_field: value, '_id': {id_operator: _id}}
+    if value is None:
+        if direction == ASCENDING:
+            return {'$or': [same_value, {sort_field: {'$ne': None}}]}
+        return same_value
+    if direction == ASCENDING:
+        return {'$or': [same_value, {sort_field: {'$gt': value}}]}
+    return {'$or': [same_value, {sort_field: {'$lt': value}}, {sort_field: None}]}
+
+
+def get_projection(fields, sort_field):
+    """Returns the projection for a list of requested fields, or None to return whole documents.
+
+    The sort field is always included because it is needed to build the next cursor.
+    """
+    if not fields:
+        return None
+    return {field: 1 for field in [*fields, sort_field]}
+
+
+def get_value(document, field):
+    """Returns the value of a field in a document, following dotted paths into embedded documents.
+    """
+    for key in field.split('.'):
+        if not isinstance(document, dict):
+            return None
+        document = document.get(key)
+    return document
+
+
+def find_page_documents(collection, query, sort_field, direction=ASCENDING, page_size=50, cursor=None,
+                        fields=None):
+    """Returns the pymongo (or Motor) cursor reading a page of documents, plus one more to find out whether there
+    is a next page.
+    """
+    if cursor:
+        value, _id = decode_cursor(cursor, sort_field, direction)
+        range_filter = get_range_filter(sort_field, direction, value, _id)
+        query = {'$and': [query, range_filter]} if query else range_filter
+    return collection.find(query, get_projection(fields, sort_field)) \
+        .sort([(sort_field, direction), ('_id', direction)]) \
+        .limit(page_size + 1) \
+        .batch_size(page_size + 1)
+
+
+def get_page(documents, sort_field, direction, page_size):
+    """Returns the page and the cursor token of the next page from the documents read by 'find_page_documents'.
+    """
+    if len(documents) <= page_size:
+        return documents, None
+    last = documents[page_size - 1]
+    return documents[:page_size], encode_cursor(sort_field, direction, get_value(last, sort_field), last['_id'])
+
+
+def find_page(collection, query, sort_field, direction=ASCENDING, page_size=50, cursor=None, fields=None):
+    """Returns a page of documents and the cursor token of the next page (None on the last page).
+
+    One more document than the page size is requested to find out whether there is a next page,
+    so no count query is needed.
+    """
+    results = find_page_documents(collection, query, sort_field, direction, page_size, cursor, fields)
+    return get_page(list(results), sort_field, direction, page_size)
+
+
+async def afind_page(collection, query, sort_field, direction=ASCENDING, page_size=50, cursor=None, fields=None):
+    """Async version of 'find_page', for a Motor collection.
+    """
+    results = find_page_documents(collection, query, sort_field, direction, page_size, cursor, fields)
+    return get_page(await results.to_list(page_size + 1), sort_field, direction, page_size)
+
+
+def get_direction(order):
+    """Returns the pymongo sort direction of an 'order' query parameter, ascending for 'asc' and descending otherwise.
+    """
+    return ASCENDING if order == 'asc' else DESCENDING
+
+
+def get_location(reclat, reclong):
+    """Returns a GeoJSON point for a latitude and longitude, or None if they aren't valid coordinates.
+
+    GeoJSON lists the longitude first. Values stored as strings (as in the original NASA data) are converted.
+    """
+    try:
+        latitude, longitude = float(reclat), float(reclong)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return {'type': 'Point', 'coordinates': [longitude, latitude]}
+
+
+def get_document_location(document):
+    """Returns the GeoJSON point of a meteorite landing from its 'reclat'/'reclong' fields, falling back to its
+    'GeoLocation' string (e.g. '(50.775, 6.0833)'). Returns None if neither holds valid coordinates.
+    """
+    location = get_location(document.get('reclat'), document.get('reclong'))
+    geolocation = document.get('GeoLocation')
+    if location is None and isinstance(geolocation, str) and geolocation.count(',') == 1:
+        location = get_location(*geolocation.strip('() ').split(','))
+    return location
+
+
+def parse_coordinates(value, count=None):
+    """Parses 'lat,lng;lat,lng;...' into a list of [lng, lat] GeoJSON positions, raising ValueError if invalid.
+    """
+    positions = []
+    for pair in value.split(';'):
+        location = get_location(*pair.split(',')) if pair.count(',') == 1 else None
+        if location is None:
+            raise ValueError(f'Invalid coordinates: {pair!r}, expected latitude,longitude')
+        positions.append(location['coordinates'])
+    if count is not None and len(positions) != count:
+        raise ValueError(f'Expected {count} latitude,longitude pairs')
+    return positions
+
+
+def get_geo_filter(params):
+    """Returns the filter of the 'near'/'max_km', 'bbox' or 'polygon' query parameters, or None if there are none.
+
+    - near=lat,lng&max_km=N: landings within N kilometres of the point.
+    - bbox=south,west,north,east: landings within the box. Its edges follow great circles, like every polygon
+      on a sphere, so the north and south edges bulge slightly towards the poles on very wide boxes.
+    - polygon=lat,lng;lat,lng;lat,lng[;...]: landings within the polygon, which is closed automatically.
+
+    Raises ValueError if the parameters are invalid or more than one kind of shape is given.
+    """
+    shapes = [name for name in ('near', 'bbox', 'polygon') if params.get(name)]
+    if not shapes:
+        return None
+    if len(shapes) > 1:
+        raise ValueError('Only one of near, bbox or polygon can be used at a time')
+
+    if shapes[0] == 'near':
+        [center] = parse_coordinates(params['near'], 1)
+        try:
+            max_km = float(params.get('max_km', DEFAULT_MAX_KM))
+        except ValueError:
+            raise ValueError('max_km must be a number') from None
+        if max_km <= 0:
+            raise ValueError('max_km must be greater than 0')
+        # '$centerSphere' can be combined with the sort of the page, unlike '$near' which always sorts by distance.
+        return {LOCATION_FIELD: {'$geoWithin': {'$centerSphere': [center, max_km / EARTH_RADIUS_KM]}}}
+
+    if shapes[0] == 'bbox':
+        corners = params['bbox'].split(',')
+        if len(corners) != 4:
+            raise ValueError('bbox must be given as south,west,north,east')
+        south, west, north, east = corners
+        [[west, south], [east, north]] = parse_coordinates(f'{south},{west};{north},{east}', 2)
+        ring = [[west, south], [east, south], [east, north], [west, north]]
+    else:
+        ring = parse_coordinates(params['polygon'])
+        if len(ring) < 3:
+            raise ValueError('A polygon needs at least 3 latitude,longitude pairs')
+    # Close the ring, GeoJSON polygons start and end with the same position.
+    if ring[0] != ring[-1]:
+        ring = [*ring, ring[0]]
+    return {LOCATION_FIELD: {'$geoWithin': {'$geometry': {'type': 'Polygon', 'coordinates': [ring]}}}}
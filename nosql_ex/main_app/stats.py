@@ -0,0 +1,192 @@
+"""stats.py
+
+This file computes the meteorite landing statistics served by the 'MeteoriteStatsApiView' with a single MongoDB
+aggregation pipeline, so clients receive a few kilobytes of results instead of every landing.
+
+The pipeline filters the landings, then computes each statistic in its own '$facet':
+    - groups: number of landings and their total and average mass per value of the group-by field.
+    - mass: count, minimum, maximum, mean and percentiles of the mass.
+    - mass_buckets: number of landings per order of magnitude of the mass ('$bucket').
+    - decades: number of landings per decade.
+
+The percentiles are computed by the '$percentile' accumulator on MongoDB 7.0 and later. Older servers read each one
+with its own query instead, which sorts the masses (using the index on the mass, or the disk for large sorts) and
+skips to its rank, so no stage ever holds every mass of the collection in one document.
+
+Only numeric masses and years are used, values stored as strings are ignored (the 'ingest_landings' command stores
+numbers). Results are cached with Django's cache framework, keyed by a hash of the pipeline, and expire after
+'MAIN_APP_STATS_CACHE_TIMEOUT' seconds. Every write made through the API also invalidates them straight away by
+bumping a version number that is part of every key.
+"""
+
+# Import 'hashlib' to build the cache key from the pipeline, 'time' to create unique version numbers and 'weakref' to
+# remember the server version of each client.
+import hashlib
+import time
+import weakref
+# Import the settings module to read the cache timeout.
+from django.conf import settings
+# Import the default cache, which is shared between requests.
+from django.core.cache import cache
+# Import 'json_util' from bson to serialize pipelines that contain BSON types, such as ObjectIds, into a stable key.
+from bson import json_util
+
+# Fields the landings can be grouped by.
+GROUP_BY_FIELDS = ('recclass', 'fall', 'nametype', 'year')
+
+# Field holding the mass of a landing, in grams.
+MASS_FIELD = 'mass (g)'
+
+# Percentiles of the mass returned by the 'mass' statistic.
+PERCENTILES = (25, 50, 75, 90, 99)
+
+# Lower bounds of the mass buckets in grams, one per order of magnitude. Heavier landings go in the 'larger' bucket.
+MASS_BOUNDARIES = [0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+
+# Default number of seconds results stay cached, used when 'MAIN_APP_STATS_CACHE_TIMEOUT' isn't set.
+DEFAULT_CACHE_TIMEOUT = 300
+
+# Cache key holding the current version of the cached statistics.
+VERSION_KEY = 'main_app:stats:version'
+
+# Whether the server of each client has the '$percentile' accumulator.
+_percentile_support = weakref.WeakKeyDictionary()
+
+
+def supports_percentile(client):
+    """Returns whether the MongoDB server of a client has the '$percentile' accumulator (MongoDB 7.0 and later).
+    """
+    if client not in _percentile_support:
+        _percentile_support[client] = tuple(client.server_info()['versionArray'][:2]) >= (7, 0)
+    return _percentile_support[client]
+
+
+def build_stats_pipeline(query, group_by='recclass', limit=20, percentile_operator=False):
+    """Returns the aggregation pipeline computing the statistics of the landings matching the query. The mass
+    percentiles are only included with 'percentile_operator', otherwise 'get_mass_percentiles' reads them.
+    """
+    has_mass = {MASS_FIELD: {'$type': 'number'}}
+    mass = f'${MASS_FIELD}'
+    mass_group = {'_id': None, 'count': {'$sum': 1}, 'min': {'$min': mass}, 'max': {'$max': mass},
+                  'mean': {'$avg': mass}}
+    mass_fields = {'_id': 0, 'count': 1, 'min': 1, 'max': 1, 'mean': 1}
+    if percentile_operator:
+        mass_group['percentiles'] = {'$percentile': {
+            'input': mass, 'p': [percentile / 100 for percentile in PERCENTILES], 'method': 'approximate'}}
+        mass_fields.update({f'p{percentile}': {'$arrayElemAt': ['$percentiles', index]}
+                            for index, percentile in enumerate(PERCENTILES)})
+    return [
+        {'$match': query},
+        {'$facet': {
+            'groups': [
+                {'$group': {'_id': f'${group_by}', 'count': {'$sum': 1},
+                            'total_mass': {'$sum': mass}, 'mean_mass': {'$avg': mass}}},
+                {'$sort': {'count': -1, '_id': 1}},
+                {'$limit': limit},
+            ],
+            'mass': [
+                {'$match': has_mass},
+                {'$group': mass_group},
+                {'$project': mass_fields},
+            ],
+            'mass_buckets': [
+                {'$match': has_mass},
+                {'$bucket': {'groupBy': mass, 'boundaries': MASS_BOUNDARIES, 'default': 'larger',
+                             'output': {'count': {'$sum': 1}}}},
+            ],
+            'decades': [
+                {'$match': {'year': {'$type': 'number'}}},
+                {'$group': {'_id': {'$subtract': ['$year', {'$mod': ['$year', 10]}]}, 'count': {'$sum': 1}}},
+                {'$sort': {'_id': 1}},
+            ],
+        }},
+    ]
+
+
+def get_mass_percentiles(collection, query, count):
+    """Returns the mass percentiles of the 'count' landings with a mass matching the query, for servers without
+    '$percentile'.
+
+    Each percentile is the mass at its rank, read by a query that sorts the masses and skips to it. The sort goes
+    from the closest end, so at most half of the masses are sorted, and may use the disk when they are many.
+    """
+    percentiles = {}
+    for percentile in PERCENTILES:
+        rank = (count - 1) * percentile // 100
+        direction, skip = (1, rank) if rank < count / 2 else (-1, count - 1 - rank)
+        pipeline = [
+            {'$match': query},
+            {'$match': {MASS_FIELD: {'$type': 'number'}}},
+            {'$sort': {MASS_FIELD: direction}},
+            {'$skip': skip},
+            {'$limit': 1},
+            {'$project': {'_id': 0, 'mass': f'${MASS_FIELD}'}},
+        ]
+        document = next(collection.aggregate(pipeline, allowDiskUse=True), None)
+        percentiles[f'p{percentile}'] = document['mass'] if document else None
+    return percentiles
+
+
+def format_stats(result, group_by):
+    """Turns the single document returned by the pipeline into the response of the stats endpoint.
+    """
+    mass = result['mass'][0] if result['mass'] else {'count': 0}
+    return {
+        'group_by': group_by,
+        'groups': [
+            {'value': group['_id'], 'count': group['count'], 'total_mass': group['total_mass'],
+             'mean_mass': group['mean_mass']}
+            for group in result['groups']
+        ],
+        'mass': {
+            'count': mass['count'],
+            'min': mass.get('min'),
+            'max': mass.get('max'),
+            'mean': mass.get('mean'),
+            'percentiles': {f'p{percentile}': mass.get(f'p{percentile}') for percentile in PERCENTILES},
+        },
+        'mass_buckets': [{'min': bucket['_id'], 'count': bucket['count']} for bucket in result['mass_buckets']],
+        'decades': [{'decade': int(decade['_id']), 'count': decade['count']} for decade in result['decades']],
+    }
+
+
+def get_cache_key(pipeline):
+    """Returns the cache key of a pipeline's results, which changes whenever the statistics are invalidated.
+    """
+    digest = hashlib.sha256(json_util.dumps(pipeline, sort_keys=True).encode('utf-8')).hexdigest()
+    return f'main_app:stats:{cache.get_or_set(VERSION_KEY, time.time_ns, None)}:{digest}'
+
+
+def invalidate_stats():
+    """Makes every cached statistic stale, so the next request runs the pipeline again.
+    """
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # The version was evicted from the cache, a new unique value makes the old keys unreachable.
+        cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+async def ainvalidate_stats():
+    """Async version of 'invalidate_stats'.
+    """
+    try:
+        await cache.aincr(VERSION_KEY)
+    except ValueError:
+        await cache.aset(VERSION_KEY, time.time_ns(), None)
+
+
+def get_stats(collection, query, group_by='recclass', limit=20):
+    """Returns the statistics of the landings matching the query, from the cache when possible.
+    """
+    percentile_operator = supports_percentile(collection.database.client)
+    pipeline = build_stats_pipeline(query, group_by, limit, percentile_operator)
+    key = get_cache_key(pipeline)
+    stats = cache.get(key)
+    if stats is None:
+        result = next(collection.aggregate(pipeline, allowDiskUse=True))
+        if result['mass'] and not percentile_operator:
+            result['mass'][0].update(get_mass_percentiles(collection, query, result['mass'][0]['count']))
+        stats = format_stats(result, group_by)
+        cache.set(key, stats, getattr(settings, 'MAIN_APP_STATS_CACHE_TIMEOUT', DEFAULT_CACHE_TIMEOUT))
+    return stats
@@ -5,7 +5,764 @@ Django's testing framework provides a way to create unit tests
 that ensure your models, views, and other components behave as expected.
 """
 
-# Import the 'TestCase' class from Django's testing framework to create unit tests for the application.
-from django.test import TestCase
+# Import 'asyncio' to run event loops, 'os' to simulate a forked process, 'json' to read streamed responses,
+# 'tempfile' to write files to load, 'StringIO' to capture output and 'urllib.parse' to read the cursor of the next
+# page URL.
+import asyncio
+import json
+import os
+import tempfile
+from io import StringIO
+from urllib.parse import parse_qs, urlsplit
+# Import 'call_command' to run management commands.
+from django.core.management import call_command
+# Import the default cache, which holds the cached statistics.
+from django.core.cache import cache
+# Import 'SimpleTestCase' and 'override_settings' from Django's testing framework. The project has no SQL database,
+# so the tests use 'SimpleTestCase', and MongoDB is replaced by mongomock through the 'MONGODB' setting.
+from django.test import AsyncRequestFactory, SimpleTestCase, override_settings
+# Import 'skipUnless' to skip the tests that need a real mongod, and 'mock' to fake the clients of other servers.
+from unittest import mock, skipUnless
+# Import the shared MongoDB connection manager.
+from config import mongo
+# Import the streaming helpers shared by the apps.
+from config.streaming import iter_json
+# Import the request instrumentation, and 'SimpleNamespace' to build command events.
+from types import SimpleNamespace
+from config.instrumentation import CommandMetricsListener, RequestMetrics, current_metrics, registry
+# Import the BSON and pymongo types used to build queries.
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+# Import the async view of the meteorite landings API.
+from main_app.views import AsyncMeteoriteLandingsApiView
+# Import the index definitions and pagination helpers of the meteorite landings API.
+from main_app.indexes import FILTER_FIELDS, SORT_FIELDS, ensure_indexes, get_index_keys, get_index_models
+from main_app.queries import EARTH_RADIUS_KM, encode_cursor, find_page_documents, get_geo_filter
+# Import the statistics pipeline and the check for the '$percentile' accumulator.
+from main_app.stats import build_stats_pipeline, supports_percentile
 
-# Create your tests here.
+# MongoDB settings used by the tests. By default mongomock keeps everything in memory and the URI is never contacted,
+# set 'MONGODB_TEST_URI' (e.g. 'mongodb://localhost:27017/') to run the tests against a real mongod instead. mongomock
+# and mongomock-motor aren't needed in production, they are installed with 'pip install -r requirements-test.txt'.
+MONGODB_TEST_SETTINGS = {
+    'CLIENT_CLASS': 'pymongo.MongoClient' if os.environ.get('MONGODB_TEST_URI') else 'mongomock.MongoClient',
+    'ASYNC_CLIENT_CLASS': ('motor.motor_asyncio.AsyncIOMotorClient' if os.environ.get('MONGODB_TEST_URI')
+                           else 'mongomock_motor.AsyncMongoMockClient'),
+    'URI': os.environ.get('MONGODB_TEST_URI', 'mongodb://localhost:27017/'),
+    'NAME': 'nasa_data_test_db',
+    'OPTIONS': {'maxPoolSize': 5, 'serverSelectionTimeoutMS': 500, 'readPreference': 'primaryPreferred'},
+}
+
+
+@override_settings(MONGODB=MONGODB_TEST_SETTINGS)
+class MongoTestCase(SimpleTestCase):
+    """Base class for tests that use MongoDB, each test starts with an empty test database.
+    """
+    def setUp(self):
+        # Start every test without a client.
+        mongo.manager.close()
+
+    def tearDown(self):
+        # Remove the test data, so every test starts with an empty database.
+        mongo.get_client().drop_database(MONGODB_TEST_SETTINGS['NAME'])
+        mongo.manager.close()
+
+
+class MongoConnectionManagerTests(MongoTestCase):
+    """Tests for the shared MongoDB connection manager in 'config/mongo.py'.
+    """
+    def test_client_is_created_lazily_and_shared(self):
+        """No client exists until a collection is requested, then every collection uses the same client.
+        """
+        self.assertIsNone(mongo.manager._client)
+        landings = mongo.get_collection('meteorite_landings')
+        users = mongo.get_collection('users')
+        self.assertIs(landings.database.client, users.database.client)
+        self.assertEqual(landings.database.name, 'nasa_data_test_db')
+
+    def test_settings_change_rebuilds_client(self):
+        """Overriding the 'MONGODB' setting closes the client, so the next one uses the new settings.
+        """
+        client = mongo.get_client()
+        with self.settings(MONGODB={**MONGODB_TEST_SETTINGS, 'NAME': 'other_db'}):
+            self.assertIsNot(mongo.get_client(), client)
+            self.assertEqual(mongo.get_database().name, 'other_db')
+
+    def test_forked_process_gets_new_client(self):
+        """A client created by another process is replaced, both by the fork hook and by the pid check.
+        """
+        client = mongo.get_client()
+        mongo.manager.after_fork()
+        self.assertIsNot(mongo.get_client(), client)
+
+        client = mongo.get_client()
+        mongo.manager._pid = os.getpid() + 1
+        self.assertIsNot(mongo.get_client(), client)
+
+    def test_async_client_per_event_loop(self):
+        """Each event loop gets its own Motor client, which stays open while other loops are used and is closed once
+        its loop has been closed.
+        """
+        async def get_client():
+            client = mongo.manager.get_async_client()
+            self.assertIs(mongo.manager.get_async_client(), client)
+            return client
+
+        loop = asyncio.new_event_loop()
+        try:
+            client = loop.run_until_complete(get_client())
+            with mock.patch.object(client, 'close') as close:
+                # 'asyncio.run' runs another loop, as 'async_to_sync' does.
+                self.assertIsNot(asyncio.run(get_client()), client)
+                self.assertIs(loop.run_until_complete(get_client()), client)
+                close.assert_not_called()
+                loop.close()
+                asyncio.run(get_client())
+                close.assert_called_once()
+        finally:
+            loop.close()
+
+    def test_pool_metrics(self):
+        """The listener counts connections and checkouts, and tracks the connections in use.
+        """
+        listener = mongo.PoolMetricsListener()
+        listener.connection_created(None)
+        listener.connection_checked_out(None)
+        listener.connection_checked_out(None)
+        listener.connection_checked_in(None)
+        metrics = listener.snapshot()
+        self.assertEqual(metrics['connections_created'], 1)
+        self.assertEqual(metrics['checkouts'], 2)
+        self.assertEqual(metrics['checked_out'], 1)
+
+    def test_api_uses_shared_collection(self):
+        """The meteorite landings API reads from the collection of the shared client.
+        """
+        mongo.get_collection('meteorite_landings').insert_one({'name': 'Aachen', 'year': 1880})
+        response = self.client.get('/main_app/api/meteorite_landings/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([landing['name'] for landing in response.json()['results']], ['Aachen'])
+
+
+class MeteoriteLandingsPaginationTests(MongoTestCase):
+    """Tests for the range-based pagination and projection of the meteorite landings API.
+    """
+    url = '/main_app/api/meteorite_landings/'
+
+    def setUp(self):
+        super().setUp()
+        # Years repeat and some are missing, so pages have to break ties on '_id' and handle null values.
+        mongo.get_collection('meteorite_landings').insert_many([
+            {'name': f'Landing {number:03}', 'year': None if number % 10 == 0 else 1900 + number % 7,
+             'recclass': 'L5', 'mass (g)': number}
+            for number in range(53)
+        ])
+
+    def get_all_pages(self, url):
+        """Follows the 'next' links from a URL and returns the results of every page.
+        """
+        results = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            results.extend(response.json()['results'])
+            url = response.json()['next']
+        return results
+
+    def test_pages_cover_every_document_once(self):
+        """Paging through ascending and descending sorts returns each document once, in sort order.
+        """
+        for order in ('asc', 'desc'):
+            with self.subTest(order=order):
+                results = self.get_all_pages(f'{self.url}?sort=year&order={order}&page_size=5')
+                self.assertEqual(len({landing['_id'] for landing in results}), 53)
+                keys = [(landing['year'] is not None, landing['year'] or 0, landing['_id']) for landing in results]
+                self.assertEqual(keys, sorted(keys, reverse=order == 'desc'))
+
+    def test_page_size(self):
+        """The default page size is used without 'page_size', and larger sizes are capped at the maximum.
+        """
+        self.assertEqual(len(self.client.get(self.url).json()['results']), 50)
+        with self.settings(MAIN_APP_MAX_PAGE_SIZE=10):
+            response = self.client.get(f'{self.url}?page_size=1000')
+        self.assertEqual(len(response.json()['results']), 10)
+        self.assertEqual(self.client.get(f'{self.url}?page_size=abc').status_code, 400)
+
+    def test_fields_projection(self):
+        """Only the requested fields (and '_id') are returned, even when sorting on another field.
+        """
+        results = self.get_all_pages(f'{self.url}?fields=name,recclass&sort=mass (g)&page_size=20')
+        self.assertEqual(len(results), 53)
+        self.assertEqual(set(results[0]), {'_id', 'name', 'recclass'})
+        self.assertEqual(results[0]['name'], 'Landing 000')
+
+    def test_invalid_cursor(self):
+        """A malformed cursor, or a cursor used with a different sort, is rejected with a 400 response.
+        """
+        self.assertEqual(self.client.get(f'{self.url}?cursor=not-a-cursor').status_code, 400)
+        next_url = self.client.get(f'{self.url}?sort=year&page_size=5').json()['next']
+        response = self.client.get(next_url.replace('sort=year', 'sort=name'))
+        self.assertEqual(response.status_code, 400)
+
+
+class StreamingResponseTests(MongoTestCase):
+    """Tests for the streaming JSON array and NDJSON responses of the meteorite landings API.
+    """
+    url = '/main_app/api/meteorite_landings/'
+
+    def setUp(self):
+        super().setUp()
+        mongo.get_collection('meteorite_landings').insert_many([
+            {'name': f'Landing {number:04}', 'year': 1900 + number % 50, 'recclass': 'L5'} for number in range(1200)
+        ])
+
+    def test_stream_json_array(self):
+        """Every matching document is streamed as a JSON array, in sort order and with the requested fields.
+        """
+        response = self.client.get(f'{self.url}?stream=true&sort=name&fields=name')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        results = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(results), 1200)
+        self.assertEqual(results[0], {'_id': results[0]['_id'], 'name': 'Landing 0000'})
+
+    def test_stream_ndjson(self):
+        """NDJSON is streamed with one document per line when asked for with 'format' or the Accept header.
+        """
+        for kwargs in ({'path': f'{self.url}?format=ndjson&year=1900'},
+                       {'path': f'{self.url}?year=1900', 'headers': {'Accept': 'application/x-ndjson'}}):
+            response = self.client.get(**kwargs)
+            self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+            lines = b''.join(response.streaming_content).decode().splitlines()
+            self.assertEqual(len(lines), 24)
+            self.assertEqual(json.loads(lines[0])['year'], 1900)
+
+    def test_iter_json_is_lazy(self):
+        """Documents are read as chunks are sent, not all at once, and the output is the same as json.dumps.
+        """
+        read = []
+
+        def documents():
+            for number in range(5000):
+                read.append(number)
+                yield {'number': number, 'padding': 'x' * 50}
+
+        chunks = iter_json(documents())
+        first = next(chunks)
+        self.assertLess(len(read), 5000)
+        body = first + ''.join(chunks)
+        self.assertEqual(body, json.dumps([{'number': number, 'padding': 'x' * 50} for number in range(5000)]))
+        self.assertEqual(''.join(iter_json([])), '[]')
+
+
+class MeteoriteLandingsIndexTests(MongoTestCase):
+    """Tests for the indexes of the meteorite landings collection and the sort allow-list of the API.
+    """
+    url = '/main_app/api/meteorite_landings/'
+
+    def get_query_shapes(self):
+        """Yields every supported (filter, sort field, direction, cursor) combination the API can send.
+        """
+        sample = {'name': 'Aachen', 'year': 1880, 'mass (g)': 21, 'recclass': 'L5'}
+        for filter_field in (None, *FILTER_FIELDS):
+            query = {filter_field: sample[filter_field]} if filter_field else {}
+            for sort_field in SORT_FIELDS:
+                for direction in (ASCENDING, DESCENDING):
+                    for value in (None, sample[sort_field]):
+                        cursor = encode_cursor(sort_field, direction, value, ObjectId()) if value else None
+                        yield query, sort_field, direction, cursor
+
+    def test_every_query_shape_has_an_index(self):
+        """Each filter and sort combination has an index starting with the filter field, then the sort field.
+        """
+        keys = [[field for field, _ in key] for key in get_index_keys()]
+        for filter_field in (None, *FILTER_FIELDS):
+            for sort_field in SORT_FIELDS:
+                expected = [sort_field, '_id'] if filter_field in (None, sort_field) \
+                    else [filter_field, sort_field, '_id']
+                self.assertIn(expected, keys)
+
+    def test_query_shapes_match_index_prefix(self):
+        """The filter and sort sent for every supported query shape form a (filter, sort, _id) prefix of a declared
+        index, with the cursor's range only on the sort fields. Runs without a real mongod, unlike the 'explain()'
+        check below.
+        """
+        keys = [[field for field, _ in key] for key in get_index_keys()]
+        for query, sort_field, direction, cursor in self.get_query_shapes():
+            with self.subTest(query=query, sort=sort_field, direction=direction, cursor=bool(cursor)):
+                collection = mock.Mock()
+                find_page_documents(collection, query, sort_field, direction, 50, cursor)
+                sent_filter = collection.find.call_args.args[0]
+                sort = collection.find.return_value.sort.call_args.args[0]
+                # An ascending index is walked backwards for descending sorts, so every sort key has one direction.
+                self.assertEqual({order for _, order in sort}, {direction})
+                sort_fields = [field for field, _ in sort]
+                self.assertEqual(sort_fields, [sort_field, '_id'])
+                if cursor:
+                    range_filter = sent_filter['$and'][1] if query else sent_filter
+                    self.assertLessEqual(get_filter_fields(range_filter), set(sort_fields))
+                    if query:
+                        self.assertEqual(sent_filter['$and'][0], query)
+                else:
+                    self.assertEqual(sent_filter, query)
+                prefix = [field for field in query if field != sort_field] + sort_fields
+                self.assertTrue(any(key[:len(prefix)] == prefix for key in keys), prefix)
+
+    def test_ensure_indexes_command(self):
+        """The command creates every index, and running it again changes nothing.
+        """
+        output = StringIO()
+        call_command('ensure_indexes', stdout=output)
+        call_command('ensure_indexes', stdout=output)
+        indexes = mongo.get_collection('meteorite_landings').index_information()
+        self.assertEqual(len(indexes), len(get_index_models()) + 1)
+
+    def test_unsupported_sort(self):
+        """Sorting on a field without an index is rejected with a 400 response.
+        """
+        response = self.client.get(f'{self.url}?sort=GeoLocation')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(f'{self.url}?sort=mass (g)&order=desc').status_code, 200)
+
+    @skipUnless(os.environ.get('MONGODB_TEST_URI'), 'explain() needs a real mongod, set MONGODB_TEST_URI.')
+    def test_query_shapes_use_index(self):
+        """Every supported query shape is answered from an index scan, without a collection scan or in-memory sort.
+
+        This checks the plans chosen by a real mongod, on top of 'test_query_shapes_match_index_prefix'.
+        """
+        collection = mongo.get_collection('meteorite_landings')
+        collection.insert_many([
+            {'name': f'Landing {number}', 'year': 1800 + number % 200, 'mass (g)': number, 'recclass': 'L5'}
+            for number in range(2000)
+        ])
+        ensure_indexes(mongo.get_database())
+        for query, sort_field, direction, cursor in self.get_query_shapes():
+            with self.subTest(query=query, sort=sort_field, direction=direction, cursor=bool(cursor)):
+                plan = find_page_documents(collection, query, sort_field, direction, 50, cursor).explain()
+                stages = set(get_plan_stages(plan['queryPlanner']['winningPlan']))
+                self.assertIn('IXSCAN', stages)
+                self.assertFalse(stages & {'COLLSCAN', 'SORT'}, stages)
+
+
+
+class MeteoriteLandingsGeoTests(MongoTestCase):
+    """Tests for the GeoJSON locations and geospatial filters of the meteorite landings API.
+    """
+    url = '/main_app/api/meteorite_landings/'
+
+    def test_geo_filters(self):
+        """Each shape becomes a '$geoWithin' filter on 'location', with GeoJSON (longitude first) positions.
+        """
+        self.assertIsNone(get_geo_filter({}))
+        near = get_geo_filter({'near': '50.775,6.0833', 'max_km': '250'})
+        self.assertEqual(near['location']['$geoWithin']['$centerSphere'], [[6.0833, 50.775], 250 / EARTH_RADIUS_KM])
+        bbox = get_geo_filter({'bbox': '45,0,55,15'})['location']['$geoWithin']['$geometry']
+        self.assertEqual(bbox['coordinates'], [[[0, 45], [15, 45], [15, 55], [0, 55], [0, 45]]])
+        polygon = get_geo_filter({'polygon': '45,0;55,0;55,15'})['location']['$geoWithin']['$geometry']
+        self.assertEqual(polygon['coordinates'], [[[0, 45], [0, 55], [15, 55], [0, 45]]])
+
+    def test_geo_filters_sent_to_mongodb(self):
+        """The API sends the exact '$geoWithin' documents to MongoDB, so the shapes are filtered by the server: the
+        '$centerSphere' radius in radians, and closed GeoJSON rings. Runs without a real mongod, unlike
+        'test_geo_queries'.
+        """
+        for query, expected in (
+            ('near=50.775,6.0833&max_km=250',
+             {'$centerSphere': [[6.0833, 50.775], 250 / 6378.1]}),
+            ('near=50.775,6.0833',
+             {'$centerSphere': [[6.0833, 50.775], 100 / 6378.1]}),
+            ('bbox=45,0,55,15',
+             {'$geometry': {'type': 'Polygon', 'coordinates': [[[0, 45], [15, 45], [15, 55], [0, 55], [0, 45]]]}}),
+            ('polygon=45,0;55,0;55,15',
+             {'$geometry': {'type': 'Polygon', 'coordinates': [[[0, 45], [0, 55], [15, 55], [0, 45]]]}}),
+            ('polygon=45,0;55,0;55,15;45,0&name=Aachen',
+             {'$geometry': {'type': 'Polygon', 'coordinates': [[[0, 45], [0, 55], [15, 55], [0, 45]]]}}),
+        ):
+            with self.subTest(query=query):
+                with mock.patch('main_app.views.find_page', return_value=([], None)) as find_page:
+                    self.assertEqual(self.client.get(f'{self.url}?{query}').status_code, 200)
+                sent_filter = find_page.call_args.args[1]
+                self.assertEqual(sent_filter.pop('location'), {'$geoWithin': expected})
+                self.assertEqual(sent_filter, {'name': 'Aachen'} if 'name=' in query else {})
+
+    def test_invalid_geo_filters(self):
+        """Invalid coordinates, distances and shapes, or more than one shape, are rejected with a 400 response.
+        """
+        for query in ('near=91,0', 'near=50', 'near=50,6&max_km=-1', 'near=50,6&max_km=far', 'bbox=45,0,55',
+                      'polygon=45,0;55,0', 'near=50,6&bbox=45,0,55,15'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'{self.url}?{query}').status_code, 400)
+
+    def test_backfill_locations_command(self):
+        """The command builds points from 'reclat'/'reclong' (or 'GeoLocation') and creates the 2dsphere index.
+        """
+        collection = mongo.get_collection('meteorite_landings')
+        collection.insert_many([
+            {'name': 'Aachen', 'reclat': 50.775, 'reclong': 6.0833},
+            {'name': 'Aarhus', 'reclat': '56.18333', 'reclong': '10.23333'},
+            {'name': 'Abee', 'GeoLocation': '(54.21667, -113.0)'},
+            {'name': 'Unknown', 'reclat': None, 'reclong': None},
+        ])
+        call_command('backfill_locations', stdout=StringIO())
+        locations = {landing['name']: landing.get('location') for landing in collection.find()}
+        self.assertEqual(locations['Aachen'], {'type': 'Point', 'coordinates': [6.0833, 50.775]})
+        self.assertEqual(locations['Aarhus']['coordinates'], [10.23333, 56.18333])
+        self.assertEqual(locations['Abee']['coordinates'], [-113.0, 54.21667])
+        self.assertIsNone(locations['Unknown'])
+        self.assertIn('location_2dsphere', collection.index_information())
+
+    def test_post_stores_location(self):
+        """A created record gets the GeoJSON point of its coordinates.
+        """
+        response = self.client.post(self.url, {'name': 'Aachen', 'reclat': 50.775, 'reclong': 6.0833},
+                                    content_type='application/json')
+        landing = mongo.get_collection('meteorite_landings').find_one({'_id': ObjectId(response.json()['_id'])})
+        self.assertEqual(landing['location'], {'type': 'Point', 'coordinates': [6.0833, 50.775]})
+
+    @skipUnless(os.environ.get('MONGODB_TEST_URI'), 'Geospatial queries need a real mongod, set MONGODB_TEST_URI.')
+    def test_geo_queries(self):
+        """The near, bbox and polygon filters return the landings inside the shape. Runs in CI against a real mongod
+        (see '.github/workflows/tests.yml').
+        """
+        mongo.get_collection('meteorite_landings').insert_many([
+            {'name': 'Aachen', 'reclat': 50.775, 'reclong': 6.0833},
+            {'name': 'Aarhus', 'reclat': 56.18333, 'reclong': 10.23333},
+            {'name': 'Abee', 'reclat': 54.21667, 'reclong': -113.0},
+        ])
+        call_command('backfill_locations', stdout=StringIO())
+        for query, names in (('near=50.775,6.0833&max_km=10', ['Aachen']),
+                             ('near=50.775,6.0833&max_km=800', ['Aachen', 'Aarhus']),
+                             ('bbox=45,0,60,15', ['Aachen', 'Aarhus']),
+                             ('polygon=50,-120;60,-120;60,-100;50,-100', ['Abee'])):
+            with self.subTest(query=query):
+                results = self.client.get(f'{self.url}?{query}').json()['results']
+                self.assertEqual([landing['name'] for landing in results], names)
+
+
+class MeteoriteStatsTests(MongoTestCase):
+    """Tests for the aggregated statistics of the meteorite landings.
+    """
+    url = '/main_app/api/meteorite_landings/stats/'
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        # Masses 1 to 100 grams, years spread over the 1900s, and a few values stored as strings that are ignored.
+        mongo.get_collection('meteorite_landings').insert_many([
+            {'name': f'Landing {number}', 'recclass': 'L5' if number % 4 else 'H6', 'fall': 'Found',
+             'mass (g)': float(number), 'year': 1900 + number % 30}
+            for number in range(1, 101)
+        ] + [{'name': 'Old record', 'recclass': 'L5', 'mass (g)': '12', 'year': '1880'}])
+
+    def test_stats(self):
+        """Groups, mass percentiles, mass buckets and decades are computed by the pipeline.
+        """
+        stats = self.client.get(self.url).json()
+        self.assertEqual(stats['groups'][0], {'value': 'L5', 'count': 76, 'total_mass': 3750.0, 'mean_mass': 50.0})
+        self.assertEqual(stats['groups'][1]['count'], 25)
+        self.assertEqual(stats['mass']['count'], 100)
+        self.assertEqual((stats['mass']['min'], stats['mass']['max'], stats['mass']['mean']), (1.0, 100.0, 50.5))
+        self.assertEqual(stats['mass']['percentiles'], {'p25': 25.0, 'p50': 50.0, 'p75': 75.0, 'p90': 90.0,
+                                                        'p99': 99.0})
+        self.assertEqual(stats['mass_buckets'], [{'min': 1, 'count': 9}, {'min': 10, 'count': 90},
+                                                 {'min': 100, 'count': 1}])
+        self.assertEqual(stats['decades'], [{'decade': 1900, 'count': 39}, {'decade': 1910, 'count': 31},
+                                            {'decade': 1920, 'count': 30}])
+
+    def test_group_by_and_filters(self):
+        """Landings can be grouped by another allowed field and filtered like the list API.
+        """
+        stats = self.client.get(f'{self.url}?group_by=year&year=1905&limit=1').json()
+        self.assertEqual(stats['groups'], [{'value': 1905, 'count': 4, 'total_mass': 200.0, 'mean_mass': 50.0}])
+        self.assertEqual(self.client.get(f'{self.url}?group_by=name').status_code, 400)
+        self.assertEqual(self.client.get(f'{self.url}?limit=all').status_code, 400)
+
+    def test_results_are_cached_until_a_write(self):
+        """A repeated request is served from the cache, and a write through the API invalidates it.
+        """
+        self.assertEqual(self.client.get(self.url).json()['mass']['count'], 100)
+        mongo.get_collection('meteorite_landings').insert_one({'name': 'Direct', 'mass (g)': 5.0})
+        self.assertEqual(self.client.get(self.url).json()['mass']['count'], 100)
+
+        self.client.post('/main_app/api/meteorite_landings/', {'name': 'Aachen', 'mass (g)': 21},
+                         content_type='application/json')
+        self.assertEqual(self.client.get(self.url).json()['mass']['count'], 102)
+
+    def test_percentiles_never_collect_every_mass(self):
+        """The pipeline uses '$percentile' on MongoDB 7.0 and later, and no stage pushes every mass into an array.
+        """
+        for version, expected in (([5, 0, 5, 0], False), ([7, 0, 2, 0], True)):
+            client = mock.Mock(**{'server_info.return_value': {'versionArray': version}})
+            self.assertEqual(supports_percentile(client), expected)
+        for percentile_operator in (False, True):
+            pipeline = json.dumps(build_stats_pipeline({}, percentile_operator=percentile_operator))
+            self.assertNotIn('$push', pipeline)
+            self.assertEqual('$percentile' in pipeline, percentile_operator)
+
+    def test_results_expire(self):
+        """Cached results expire after the configured timeout.
+        """
+        with self.settings(MAIN_APP_STATS_CACHE_TIMEOUT=0):
+            self.client.get(self.url)
+            mongo.get_collection('meteorite_landings').insert_one({'name': 'Direct', 'mass (g)': 5.0})
+            self.assertEqual(self.client.get(self.url).json()['mass']['count'], 101)
+
+
+class MeteoriteBulkIngestTests(MongoTestCase):
+    """Tests for the bulk ingest API and the 'ingest_landings' command.
+    """
+    url = '/main_app/api/meteorite_landings/bulk/'
+    csv = (
+        'name,id,nametype,recclass,mass (g),fall,year,reclat,reclong,GeoLocation\n'
+        'Aachen,1,Valid,L5,21,Fell,01/01/1880 12:00:00 AM,50.77500,6.08333,"(50.775, 6.08333)"\n'
+        'Aarhus,2,Valid,H6,720,Fell,01/01/1951 12:00:00 AM,56.18333,10.23333,"(56.18333, 10.23333)"\n'
+        'Abee,6,Valid,EH4,107000,Fell,01/01/1952 12:00:00 AM,,,\n'
+        'No id,,Valid,L5,1,Found,,,,\n'
+    )
+
+    def test_ingest_csv(self):
+        """CSV rows are upserted with numeric values, a location and a year taken from the date.
+        """
+        response = self.client.post(f'{self.url}?batch_size=2', self.csv, content_type='text/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'processed': 4, 'upserted': 3, 'modified': 0, 'matched': 0,
+                                           'skipped': 1, 'errors': 0})
+        aachen = mongo.get_collection('meteorite_landings').find_one({'id': 1})
+        self.assertEqual((aachen['mass (g)'], aachen['year'], aachen['reclat']), (21.0, 1880, 50.775))
+        self.assertEqual(aachen['location'], {'type': 'Point', 'coordinates': [6.08333, 50.775]})
+        abee = mongo.get_collection('meteorite_landings').find_one({'id': 6})
+        self.assertEqual((abee['reclat'], abee['GeoLocation']), (None, None))
+        self.assertNotIn('location', abee)
+
+    def test_ingest_is_idempotent(self):
+        """Loading the same records again updates the existing documents instead of duplicating them.
+        """
+        self.client.post(self.url, self.csv, content_type='text/csv')
+        changed = self.csv.replace('Aachen,1,Valid,L5,21', 'Aachen,1,Valid,L5,22')
+        totals = self.client.post(self.url, changed, content_type='text/csv').json()
+        self.assertEqual((totals['upserted'], totals['matched'], totals['modified']), (0, 3, 1))
+        self.assertEqual(mongo.get_collection('meteorite_landings').count_documents({}), 3)
+
+    def test_ingest_ndjson(self):
+        """NDJSON lines are loaded, and a line that isn't JSON is rejected with a 400 response.
+        """
+        body = '{"name": "Aachen", "id": "1", "mass": "21", "year": "1880-01-01T00:00:00.000"}\n\n'
+        response = self.client.post(self.url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.json()['upserted'], 1)
+        aachen = mongo.get_collection('meteorite_landings').find_one({'id': 1})
+        self.assertEqual((aachen['mass (g)'], aachen['year']), (21.0, 1880))
+
+        response = self.client.post(self.url, body + 'not json\n', content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post(self.url, body, content_type='text/plain').status_code, 400)
+
+    def test_ingest_command(self):
+        """The command loads a file and reports its progress after every batch.
+        """
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as file:
+            file.write(self.csv)
+        self.addCleanup(os.remove, file.name)
+        output = StringIO()
+        call_command('ingest_landings', file.name, batch_size=1, stdout=output)
+        self.assertEqual(mongo.get_collection('meteorite_landings').count_documents({}), 3)
+        self.assertEqual(output.getvalue().count('records/s'), 3)
+        self.assertIn('3 new', output.getvalue())
+
+
+class AsyncMeteoriteLandingsTests(MongoTestCase):
+    """Tests for the async (Motor) version of the meteorite landings API.
+
+    With mongomock the async client keeps its own data, so each test inserts its documents through it.
+    """
+    view = staticmethod(AsyncMeteoriteLandingsApiView.as_view())
+
+    def setUp(self):
+        super().setUp()
+        self.factory = AsyncRequestFactory()
+
+    async def seed(self):
+        # The Motor client is bound to the event loop of the test, so it is only requested from the test itself.
+        self.collection = mongo.get_async_collection('meteorite_landings')
+        await self.collection.insert_many([
+            {'name': f'Meteorite {number:02}', 'id': number, 'year': 1900 + number % 3, 'mass (g)': number}
+            for number in range(7)
+        ])
+
+    async def get(self, **params):
+        return await self.view(self.factory.get('/main_app/api/meteorite_landings/', params))
+
+    async def test_pages(self):
+        """Pages are read with the same cursor contract as the sync view.
+        """
+        await self.seed()
+        names = []
+        params = {'page_size': 3, 'sort': 'name'}
+        while True:
+            page = json.loads((await self.get(**params)).content)
+            names += [landing['name'] for landing in page['results']]
+            if not page['next']:
+                break
+            params['cursor'] = parse_qs(urlsplit(page['next']).query)['cursor'][0]
+        self.assertEqual(names, [f'Meteorite {number:02}' for number in range(7)])
+
+    async def test_filter_and_errors(self):
+        """Filters and parameter errors behave as in the sync view.
+        """
+        await self.seed()
+        page = json.loads((await self.get(year=1901, fields='name')).content)
+        self.assertEqual([landing['name'] for landing in page['results']], ['Meteorite 01', 'Meteorite 04'])
+        self.assertEqual(set(page['results'][0]), {'_id', 'name'})
+        self.assertEqual((await self.get(sort='GeoLocation')).status_code, 400)
+
+    async def test_stream(self):
+        """Streamed results are read from the async cursor.
+        """
+        await self.seed()
+        response = await self.get(stream='true', sort='mass (g)', order='desc')
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual([landing['id'] for landing in json.loads(body)], list(range(6, -1, -1)))
+
+    async def test_write(self):
+        """Records created, updated and deleted through the async view are stored by Motor.
+        """
+        await self.seed()
+        request = self.factory.post('/main_app/api/meteorite_landings/', {'name': 'Aachen', 'reclat': 50.775,
+                                    'reclong': 6.0833}, content_type='application/json')
+        _id = json.loads((await self.view(request)).content)['_id']
+        landing = await self.collection.find_one({'_id': ObjectId(_id)})
+        self.assertEqual(landing['location'], {'type': 'Point', 'coordinates': [6.0833, 50.775]})
+        request = self.factory.put('/', {'name': 'Aachen'}, content_type='application/json')
+        self.assertEqual((await self.view(request, meteorite_id=_id)).status_code, 200)
+        self.assertNotIn('location', await self.collection.find_one({'_id': ObjectId(_id)}))
+        self.assertEqual((await self.view(self.factory.delete('/'), meteorite_id=_id)).status_code, 200)
+        self.assertEqual((await self.view(self.factory.delete('/'), meteorite_id=_id)).status_code, 404)
+
+def get_plan_stages(plan):
+    """Returns the names of every stage in an explain() plan, whatever the query engine's plan layout.
+    """
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from get_plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from get_plan_stages(value)
+
+
+def get_filter_fields(query):
+    """Returns the fields a MongoDB filter has conditions on, following '$and', '$or' and '$nor'.
+    """
+    fields = set()
+    for key, value in query.items():
+        if key in ('$and', '$or', '$nor'):
+            for condition in value:
+                fields |= get_filter_fields(condition)
+        else:
+            fields.add(key)
+    return fields
+
+
+@override_settings(INSTRUMENTATION_SAMPLE_RATE=1.0, INSTRUMENTATION_SERVER_TIMING=True,
+                   INSTRUMENTATION_METRICS_TOKEN=None, DEBUG=True)
+class InstrumentationTests(MongoTestCase):
+    """Tests the request instrumentation times the requests and serves Prometheus metrics.
+    """
+    url = '/main_app/api/meteorite_landings/'
+
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+        mongo.get_collection('meteorite_landings').insert_many([{'name': f'Landing {number}'} for number in range(3)])
+
+    def test_server_timing(self):
+        """Sampled responses report the serialization time and the body size, other responses only count.
+        """
+        response = self.client.get(self.url)
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('serialize;dur=', timing)
+        self.assertIn(f'size;desc="{len(response.content)} bytes"', timing)
+
+        with self.settings(INSTRUMENTATION_SAMPLE_RATE=0):
+            self.assertNotIn('Server-Timing', self.client.get(self.url))
+        metrics = self.client.get('/metrics/').content.decode()
+        view = 'main_app.views.MeteoriteLandingsApiView'
+        self.assertIn(f'http_requests_total{{view="{view}",method="GET",status="200"}} 2', metrics)
+        self.assertIn(f'http_requests_sampled_total{{view="{view}"}} 1', metrics)
+
+    def test_command_listener_counts_sampled_commands(self):
+        """The command listener only counts the commands of the request being measured.
+        """
+        listener = CommandMetricsListener()
+        listener.succeeded(SimpleNamespace(duration_micros=1500))
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            listener.succeeded(SimpleNamespace(duration_micros=1500))
+            listener.failed(SimpleNamespace(duration_micros=500))
+        finally:
+            current_metrics.reset(token)
+        self.assertEqual((metrics.db_count, metrics.db_time), (2, 0.002))
+
+    def test_metrics_endpoint(self):
+        """The metrics endpoint includes the connection pool counters, behind a token if one is set.
+        """
+        response = self.client.get('/metrics/')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertIn('mongo_pool_checked_out ', response.content.decode())
+        self.assertIn('# TYPE mongo_pool_checkouts_total counter', response.content.decode())
+
+        with self.settings(INSTRUMENTATION_METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics/').status_code, 403)
+            response = self.client.get('/metrics/', headers={'Authorization': 'Bearer secret'})
+            self.assertEqual(response.status_code, 200)
+
+    def test_metrics_endpoint_denied_without_token(self):
+        """Without a token, the metrics endpoint is only served when DEBUG is True.
+        """
+        with self.settings(DEBUG=False):
+            self.assertEqual(self.client.get('/metrics/').status_code, 403)
+            with self.settings(INSTRUMENTATION_METRICS_TOKEN='secret'):
+                response = self.client.get('/metrics/', headers={'Authorization': 'Bearer secret'})
+                self.assertEqual(response.status_code, 200)
+
+
+class SeedCommandTests(MongoTestCase):
+    """Tests for the 'seed' command generating meteorite landings and users.
+    """
+    options = {'landings': 25, 'users': 5, 'chunk_size': 10, 'workers': 0}
+
+    def get_documents(self, name):
+        """Returns the documents of a collection without their '_id', which MongoDB generates.
+        """
+        return list(mongo.get_collection(name).find({}, {'_id': 0}).sort([('id', ASCENDING), ('username', ASCENDING)]))
+
+    def test_seed_is_deterministic(self):
+        """The same seed gives the same documents, with a location for the landings that have coordinates.
+        """
+        call_command('seed', stdout=StringIO(), **self.options)
+        landings, users = self.get_documents('meteorite_landings'), self.get_documents('users')
+        self.assertEqual([landing['id'] for landing in landings], list(range(1, 26)))
+        self.assertEqual(len(users), 5)
+        for landing in landings:
+            self.assertEqual('location' in landing, 'reclat' in landing)
+
+        mongo.get_collection('meteorite_landings').drop()
+        mongo.get_collection('users').drop()
+        call_command('seed', stdout=StringIO(), **self.options)
+        # The password hashes are salted, so only the rest of each user is compared.
+        self.assertEqual(self.get_documents('meteorite_landings'), landings)
+        self.assertEqual([{**user, 'password': None} for user in self.get_documents('users')],
+                         [{**user, 'password': None} for user in users])
+
+    def test_seed_adds_to_existing_documents(self):
+        """Seeding again numbers the new landings and users after the existing ones.
+        """
+        call_command('seed', stdout=StringIO(), **self.options)
+        output = StringIO()
+        call_command('seed', stdout=output, **self.options)
+        self.assertEqual(mongo.get_collection('meteorite_landings').distinct('id'), list(range(1, 51)))
+        self.assertEqual(len(mongo.get_collection('users').distinct('username')), 10)
+        self.assertIn('docs/s', output.getvalue())
@@ -5,6 +5,8 @@ It extends the base URL patterns defined in the main project's URL configuration
 Each URL pattern is considered an endpoint (or API endpoint for API views), providing specific routes to access the app's functionalities.
 """
 
+# Import the settings module to choose between the sync and async views.
+from django.conf import settings
 # Import 'path' from Django's URL dispatcher to define URL patterns and map them to specific views.
 from django.urls import path
 # Import all views from 'views.py' to utilize specific functions and classes for handling requests and responses.
@@ -13,7 +15,15 @@ from . import views
 # URL patterns define the routes for the application, mapping specific URL paths to their corresponding view functions.
 # The base URL is defined in 'config/urls.py' (main_app/), so these serve as an extension to that.
 # For example when using 'python manage.py runserver' -> http://127.0.0.1:8000/main_app/api/meteorite_landings/
+# The async views serve the same URLs when 'MONGODB_ASYNC_VIEWS' is True (e.g. when running under an ASGI server).
+if getattr(settings, 'MONGODB_ASYNC_VIEWS', False):
+    landings_view = views.AsyncMeteoriteLandingsApiView
+else:
+    landings_view = views.MeteoriteLandingsApiView
+
 urlpatterns = [
     path('',views.index,name='index'),
-    path('api/meteorite_landings/', views.MeteoriteLandingsApiView.as_view())
+    path('api/meteorite_landings/', landings_view.as_view()),
+    path('api/meteorite_landings/stats/', views.MeteoriteStatsApiView.as_view()),
+    path('api/meteorite_landings/bulk/', views.MeteoriteBulkIngestApiView.as_view()),
     ]
\ No newline at end of file
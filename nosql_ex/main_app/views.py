@@ -5,17 +5,115 @@ interacts with the data models, and returns HTTP responses. The views can be cat
 and API views, where API views are designed for programmatic access to resources, typically in JSON format.
 """
 
+from django.conf import settings
 from django.http import JsonResponse, HttpResponse
 from django.views import View
 from .serializers import MeteoriteSerializer
+from .queries import LOCATION_FIELD, afind_page, find_page, get_direction, get_document_location, get_geo_filter, get_projection
+import codecs
 import json
 from bson import ObjectId
-import pymongo
+from config.mongo import get_async_collection, get_collection
+from config.streaming import astreaming_json_response, streaming_json_response, wants_ndjson
+from config.instrumentation import measure_serialization
+# The collection is read through the connection shared with auth_app (see 'config/mongo.py'), and can only be sorted
+# on the fields that have an index (see 'indexes.py').
+from .indexes import COLLECTION_NAME, SORT_FIELDS
+from .stats import GROUP_BY_FIELDS, ainvalidate_stats, get_stats, invalidate_stats
+from .ingest import DEFAULT_BATCH_SIZE, get_parser, ingest
 
-# use pymongo to connect to db
-client = pymongo.MongoClient('mongodb+srv://<user>:<password>!@djangolab-cluster.y0zsa4f.mongodb.net/')
-dbname = client['nasa_data_db']
-collection = dbname['meteorite_landings']
+# Default and maximum number of results per page, used when 'MAIN_APP_PAGE_SIZE'/'MAIN_APP_MAX_PAGE_SIZE' aren't set.
+DEFAULT_PAGE_SIZE = 50
+DEFAULT_MAX_PAGE_SIZE = 500
+
+def get_filter_params(request):
+    """Returns the MongoDB filter for the 'name', 'year' and geospatial query parameters of a request.
+
+    Raises ValueError if a parameter is invalid.
+    """
+    filter_params = {}
+    if 'name' in request.GET:
+        filter_params['name'] = request.GET['name']
+    if 'year' in request.GET:
+        try:
+            filter_params['year'] = int(request.GET['year'])
+        except ValueError:
+            raise ValueError('year must be an integer') from None
+    geo_filter = get_geo_filter(request.GET)
+    if geo_filter:
+        filter_params.update(geo_filter)
+    return filter_params
+
+def get_list_params(request):
+    """Returns the filter, sort field, sort direction, page size and fields of a request listing meteorite landings.
+
+    Raises ValueError if a parameter is invalid.
+    """
+    # Get query parameters for filtering and sorting
+    filter_params = get_filter_params(request)
+
+    # Get sort parameter (default to sorting by 'name' if not provided)
+    sort_param = request.GET.get('sort', 'name')
+    if sort_param not in SORT_FIELDS:
+        raise ValueError(f"sort must be one of: {', '.join(SORT_FIELDS)}")
+    sort_order = get_direction(request.GET.get('order', 'asc'))
+
+    # Get the page size (capped at the maximum) and the fields to return
+    max_page_size = getattr(settings, 'MAIN_APP_MAX_PAGE_SIZE', DEFAULT_MAX_PAGE_SIZE)
+    try:
+        page_size = int(request.GET.get('page_size', getattr(settings, 'MAIN_APP_PAGE_SIZE', DEFAULT_PAGE_SIZE)))
+    except ValueError:
+        raise ValueError('page_size must be an integer') from None
+    page_size = min(max(page_size, 1), max_page_size)
+    fields = [field.strip() for field in request.GET.get('fields', '').split(',') if field.strip()]
+    return filter_params, sort_param, sort_order, page_size, fields
+
+def get_landing_serializer(fields, sort_param):
+    """Returns the function serializing each landing of a list, given the requested fields and the sort field.
+    """
+    def serialize(meteorite):
+        # Remove the sort field if it was only fetched to build the cursor
+        if fields and sort_param not in fields:
+            meteorite.pop(sort_param, None)
+        return MeteoriteSerializer(meteorite)
+    return serialize
+
+def get_next_url(request, next_cursor):
+    """Returns the URL of the next page of a list, or None if there is no next page.
+    """
+    if not next_cursor:
+        return None
+    query = request.GET.copy()
+    query['cursor'] = next_cursor
+    return request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+
+def read_landing(body):
+    """Returns the landing fields of a POST or PUT body.
+    """
+    return {
+        "name": body.get('name'),
+        "id": body.get('id'),
+        "nametype": body.get('nametype'),
+        "recclass": body.get('recclass'),
+        "mass (g)": body.get('mass (g)'),
+        "fall": body.get('fall'),
+        "year": body.get('year'),
+        "reclat": body.get('reclat'),
+        "reclong": body.get('reclong'),
+        "GeoLocation": body.get('GeoLocation')
+    }
+
+def get_landing_update(update_data):
+    """Returns the update of a PUT, which keeps the GeoJSON point in step with the coordinates.
+    """
+    # Remove the point if the coordinates are no longer valid
+    update = {"$set": update_data}
+    location = get_document_location(update_data)
+    if location:
+        update_data[LOCATION_FIELD] = location
+    else:
+        update["$unset"] = {LOCATION_FIELD: ""}
+    return update
 
 # Regular views - Regular views in Django respond to HTTP requests by returning HTML content. 
 # They can utilize the 'render' function, which points to a given template (like 'index.html') with context data to 
@@ -59,7 +157,7 @@ class MeteoriteLandingsApiView(View):
         }
 
     Returns:
-        - get: A JSON response with a list of serialized meteorite landing instances (limited to 10 results). 
+        - get: A JSON response with a page of serialized meteorite landing instances: {"results": [...], "next": url}. 
         - post: A JSON response with the ID of the newly created meteorite landing instance. 
         - put: A JSON response indicating success or failure. Status 200 if the record was updated, 
         - delete: A JSON response indicating success or failure. Status 200 if the record was deleted, 
@@ -67,53 +165,76 @@ class MeteoriteLandingsApiView(View):
     Filtering and Sorting:
         - `name`: Used to filter meteorite landings by an exact name match. Example: `/api/meteorite_landings/?name=Aachen`
         - `year`: Used to filter meteorite landings by the year of occurrence. Example: `/api/meteorite_landings/?year=1880`
-        - `sort`: Specifies the field to sort the results by. Default is 'name'. Example: `/api/meteorite_landings/?sort=year`
+        - `sort`: Specifies the field to sort the results by, one of 'name', 'year', 'mass (g)' or 'recclass'.
+          Default is 'name'. Example: `/api/meteorite_landings/?sort=year`
         - `order`: Specifies the sort order, either 'asc' for ascending or 'desc' for descending. Default is 'asc'. 
           Example: `/api/meteorite_landings/?sort=year&order=desc`
 
         You can combine multiple query parameters in a single URL. For instance: 
         `/api/meteorite_landings/?name=Aachen&year=1880&sort=year&order=desc`
+
+    Geospatial Filtering:
+        Each landing has a GeoJSON 'location' point built from 'reclat' and 'reclong' (see the 'backfill_locations'
+        command), and the filters below are run by MongoDB using its '2dsphere' index. Only one can be used at a time.
+        - `near` and `max_km`: Landings within 'max_km' kilometres (default 100) of a latitude,longitude point.
+          Example: `/api/meteorite_landings/?near=50.775,6.0833&max_km=250`
+        - `bbox`: Landings within a box given as south,west,north,east. Example: `?bbox=45,0,55,15`
+        - `polygon`: Landings within a polygon given as latitude,longitude pairs separated by ';'.
+          Example: `?polygon=45,0;55,0;55,15;45,15`
+
+    Pagination and Projection:
+        - `page_size`: Number of results per page. Default is 50, up to a maximum of 500. Example: `?page_size=100`
+        - `cursor`: Position to continue from. Follow the `next` URL of a response to get the following page,
+          it is null on the last page. A cursor only works with the sort and order it was created with.
+        - `fields`: Comma separated list of the fields to return ('_id' is always returned). Example: `?fields=name,year`
+
+        Each page starts after the last result of the previous one (sorted on the sort field, then '_id'),
+        so deep pages are as fast as the first one.
+
+    Streaming:
+        - `stream`: Set to 'true' to receive every matching result in a single response instead of a page.
+          The results are sent as a JSON array while they are read from the database, so large results
+          don't have to fit in memory. Example: `?stream=true&fields=name,year`
+        - `format`: Set to 'ndjson' (or send 'Accept: application/x-ndjson') to stream one JSON document per line.
     """
     def get(self, request):
         """Retrieve a list of meteorite landings with optional filtering and sorting.
         """
-        # Get query parameters for filtering and sorting
-        filter_params = {}
-        if 'name' in request.GET:
-            filter_params['name'] = request.GET['name']
-        if 'year' in request.GET:
-            filter_params['year'] = int(request.GET['year'])  # Assuming year is an integer
-
-        # Get sort parameter (default to sorting by 'name' if not provided)
-        sort_param = request.GET.get('sort', 'name')
-        sort_order = request.GET.get('order', 'asc')
-        sort_order = 1 if sort_order == 'asc' else -1
-
-        # Find and sort the documents
-        cursor = collection.find(filter_params).sort(sort_param, sort_order).limit(10)
-        list_cur = list(cursor)
+        try:
+            filter_params, sort_param, sort_order, page_size, fields = get_list_params(request)
+        except ValueError as error:
+            return JsonResponse({"error": str(error)}, status=400)
+        serialize = get_landing_serializer(fields, sort_param)
+
+        # Stream every matching document, without loading them all into memory
+        if request.GET.get('stream') == 'true' or wants_ndjson(request):
+            cursor = get_collection(COLLECTION_NAME).find(filter_params, get_projection(fields, sort_param)) \
+                .sort([(sort_param, sort_order), ('_id', sort_order)])
+            return streaming_json_response(request, cursor, serialize)
+
+        # Find the page of sorted documents that follows the cursor
+        try:
+            documents, next_cursor = find_page(get_collection(COLLECTION_NAME), filter_params, sort_param,
+                                               sort_order, page_size, request.GET.get('cursor'), fields)
+        except ValueError as error:
+            return JsonResponse({"error": str(error)}, status=400)
 
         # Serialize the data
-        serialized_meteorite = [MeteoriteSerializer(meteorite) for meteorite in list_cur]
-        return JsonResponse(serialized_meteorite, safe=False)
+        with measure_serialization():
+            serialized_meteorite = [serialize(meteorite) for meteorite in documents]
+            return JsonResponse({"results": serialized_meteorite, "next": get_next_url(request, next_cursor)})
 
     def post(self, request):
         """Create a new meteorite landing record.
         """
         body = json.loads(request.body.decode("utf-8"))
-        newrecord = {
-            "name": body.get('name'),
-            "id": body.get('id'),
-            "nametype": body.get('nametype'),
-            "recclass": body.get('recclass'),
-            "mass (g)": body.get('mass (g)'),
-            "fall": body.get('fall'),
-            "year": body.get('year'),
-            "reclat": body.get('reclat'),
-            "reclong": body.get('reclong'),
-            "GeoLocation": body.get('GeoLocation')
-        }
-        result = collection.insert_one(newrecord)
+        newrecord = read_landing(body)
+        # Store the GeoJSON point used by the geospatial filters, if the record has valid coordinates
+        location = get_document_location(newrecord)
+        if location:
+            newrecord[LOCATION_FIELD] = location
+        result = get_collection(COLLECTION_NAME).insert_one(newrecord)
+        invalidate_stats()
         data = {"_id": str(result.inserted_id)}
         return JsonResponse(data, status=201)
 
@@ -121,27 +242,175 @@ class MeteoriteLandingsApiView(View):
         """Update an existing meteorite landing record.
         """
         body = json.loads(request.body.decode("utf-8"))
-        update_data = {
-            "name": body.get('name'),
-            "id": body.get('id'),
-            "nametype": body.get('nametype'),
-            "recclass": body.get('recclass'),
-            "mass (g)": body.get('mass (g)'),
-            "fall": body.get('fall'),
-            "year": body.get('year'),
-            "reclat": body.get('reclat'),
-            "reclong": body.get('reclong'),
-            "GeoLocation": body.get('GeoLocation')
-        }
-        result = collection.update_one({"_id": ObjectId(meteorite_id)}, {"$set": update_data})
+        update = get_landing_update(read_landing(body))
+        result = get_collection(COLLECTION_NAME).update_one({"_id": ObjectId(meteorite_id)}, update)
         if result.matched_count == 0:
             return JsonResponse({"error": "Record not found"}, status=404)
+        invalidate_stats()
         return JsonResponse({"message": "Record updated successfully"}, status=200)
 
     def delete(self, request, meteorite_id):
         """Delete a meteorite landing record.
         """
-        result = collection.delete_one({"_id": ObjectId(meteorite_id)})
+        result = get_collection(COLLECTION_NAME).delete_one({"_id": ObjectId(meteorite_id)})
         if result.deleted_count == 0:
             return JsonResponse({"error": "Record not found"}, status=404)
-        return JsonResponse({"message": "Record deleted successfully"}, status=200)
\ No newline at end of file
+        invalidate_stats()
+        return JsonResponse({"message": "Record deleted successfully"}, status=200)
+
+
+# Async API views - Async views are coroutines, so under an ASGI server (see 'config/asgi.py') they run on the event
+# loop instead of a thread each. They query MongoDB with Motor, which awaits each reply rather than blocking.
+# The URLs use them instead of the sync views when the 'MONGODB_ASYNC_VIEWS' setting is True (see 'urls.py').
+class AsyncMeteoriteLandingsApiView(View):
+    """Async version of 'MeteoriteLandingsApiView', with the same parameters and responses.
+    """
+    async def get(self, request):
+        """Retrieve a list of meteorite landings with optional filtering and sorting.
+        """
+        try:
+            filter_params, sort_param, sort_order, page_size, fields = get_list_params(request)
+        except ValueError as error:
+            return JsonResponse({"error": str(error)}, status=400)
+        serialize = get_landing_serializer(fields, sort_param)
+        collection = get_async_collection(COLLECTION_NAME)
+
+        # Stream every matching document, without loading them all into memory
+        if request.GET.get('stream') == 'true' or wants_ndjson(request):
+            cursor = collection.find(filter_params, get_projection(fields, sort_param)) \
+                .sort([(sort_param, sort_order), ('_id', sort_order)])
+            return astreaming_json_response(request, cursor, serialize)
+
+        # Find the page of sorted documents that follows the cursor
+        try:
+            documents, next_cursor = await afind_page(collection, filter_params, sort_param, sort_order, page_size,
+                                                      request.GET.get('cursor'), fields)
+        except ValueError as error:
+            return JsonResponse({"error": str(error)}, status=400)
+
+        with measure_serialization():
+            serialized_meteorite = [serialize(meteorite) for meteorite in documents]
+            return JsonResponse({"results": serialized_meteorite, "next": get_next_url(request, next_cursor)})
+
+    async def post(self, request):
+        """Create a new meteorite landing record.
+        """
+        body = json.loads(request.body.decode("utf-8"))
+        newrecord = read_landing(body)
+        location = get_document_location(newrecord)
+        if location:
+            newrecord[LOCATION_FIELD] = location
+        result = await get_async_collection(COLLECTION_NAME).insert_one(newrecord)
+        await ainvalidate_stats()
+        return JsonResponse({"_id": str(result.inserted_id)}, status=201)
+
+    async def put(self, request, meteorite_id):
+        """Update an existing meteorite landing record.
+        """
+        body = json.loads(request.body.decode("utf-8"))
+        update = get_landing_update(read_landing(body))
+        result = await get_async_collection(COLLECTION_NAME).update_one({"_id": ObjectId(meteorite_id)}, update)
+        if result.matched_count == 0:
+            return JsonResponse({"error": "Record not found"}, status=404)
+        await ainvalidate_stats()
+        return JsonResponse({"message": "Record updated successfully"}, status=200)
+
+    async def delete(self, request, meteorite_id):
+        """Delete a meteorite landing record.
+        """
+        result = await get_async_collection(COLLECTION_NAME).delete_one({"_id": ObjectId(meteorite_id)})
+        if result.deleted_count == 0:
+            return JsonResponse({"error": "Record not found"}, status=404)
+        await ainvalidate_stats()
+        return JsonResponse({"message": "Record deleted successfully"}, status=200)
+
+
+class MeteoriteStatsApiView(View):
+    """This view returns statistics about the meteorite landings, computed by MongoDB with an aggregation pipeline.
+
+    Clients get the statistics in one small response instead of downloading every landing to compute them.
+    Results are cached for a few minutes (see 'stats.py'), and recomputed straight away after any write made
+    through 'MeteoriteLandingsApiView'.
+
+    Methods:
+        - get: (GET) Retrieve the statistics of the landings matching the filters.
+
+    Parameters:
+        - `group_by`: Field to count the landings by, one of 'recclass', 'fall', 'nametype' or 'year'.
+          Default is 'recclass'. Example: `/api/meteorite_landings/stats/?group_by=fall`
+        - `limit`: Number of groups to return, largest first. Default is 20, up to a maximum of 100.
+        - `name`, `year`, `near`, `max_km`, `bbox`, `polygon`: The same filters as 'MeteoriteLandingsApiView'.
+
+    Returns:
+        - get: A JSON response with the statistics:
+        {
+            "group_by": "recclass",
+            "groups": [{"value": "L6", "count": 8285, "total_mass": 1234567.8, "mean_mass": 149.0}, ...],
+            "mass": {"count": 45585, "min": 0.0, "max": 60000000.0, "mean": 13278.1,
+                     "percentiles": {"p25": 7.2, "p50": 32.6, "p75": 202.6, "p90": 1500.0, "p99": 87000.0}},
+            "mass_buckets": [{"min": 0, "count": 3890}, {"min": 1, "count": 11022}, ..., {"min": "larger", ...}],
+            "decades": [{"decade": 1880, "count": 136}, ...]
+        }
+    """
+    def get(self, request):
+        """Retrieve the statistics of the meteorite landings, with optional filtering and grouping.
+        """
+        group_by = request.GET.get('group_by', 'recclass')
+        if group_by not in GROUP_BY_FIELDS:
+            return JsonResponse({"error": f"group_by must be one of: {', '.join(GROUP_BY_FIELDS)}"}, status=400)
+        try:
+            filter_params = get_filter_params(request)
+        except ValueError as error:
+            return JsonResponse({"error": str(error)}, status=400)
+        try:
+            limit = min(max(int(request.GET.get('limit', 20)), 1), 100)
+        except ValueError:
+            return JsonResponse({"error": "limit must be an integer"}, status=400)
+
+        stats = get_stats(get_collection(COLLECTION_NAME), filter_params, group_by, limit)
+        return JsonResponse(stats)
+
+
+class MeteoriteBulkIngestApiView(View):
+    """This view loads many meteorite landings in a single request, from a CSV or NDJSON body.
+
+    The body is parsed while it is read and written to MongoDB in batches of upserts keyed on the NASA 'id'
+    (see 'ingest.py'), so the full NASA dataset can be loaded in one request instead of one request per landing.
+    Records that already exist are updated, so the same file can be loaded again safely. Numeric fields are
+    converted from strings, and records without an 'id' are skipped.
+
+    Methods:
+        - post: (POST) Load the landings of the request body.
+
+    Parameters:
+        - Body: The NASA CSV export (with a header row) sent as 'text/csv', or one JSON landing per line sent
+          as 'application/x-ndjson'. The fields are the same as for 'MeteoriteLandingsApiView.post'.
+        - `format`: 'csv' or 'ndjson', overrides the format given by the Content-Type header.
+        - `batch_size`: Number of documents written per batch. Default is 1000, up to a maximum of 10000.
+
+    Returns:
+        - post: A JSON response with the number of records processed, upserted (new), modified, matched,
+          skipped (no 'id') and rejected by MongoDB (errors). Status 400 if the body can't be parsed, in which
+          case the batches before the error have already been written.
+    """
+    # Content types of the supported formats.
+    content_types = {'text/csv': 'csv', 'application/x-ndjson': 'ndjson'}
+
+    def post(self, request):
+        """Load meteorite landing records in bulk.
+        """
+        try:
+            parser = get_parser(request.GET.get('format') or self.content_types.get(request.content_type))
+            batch_size = min(max(int(request.GET.get('batch_size', DEFAULT_BATCH_SIZE)), 1), 10000)
+        except ValueError as error:
+            return JsonResponse({"error": str(error)}, status=400)
+
+        # Iterating the request reads the body one line at a time, instead of loading it all into memory
+        lines = codecs.iterdecode(request, 'utf-8')
+        try:
+            totals = ingest(get_collection(COLLECTION_NAME), parser(lines), batch_size)
+        except (ValueError, UnicodeDecodeError) as error:
+            return JsonResponse({"error": str(error)}, status=400)
+        finally:
+            invalidate_stats()
+        return JsonResponse(totals, status=200)
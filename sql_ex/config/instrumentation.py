@@ -0,0 +1,301 @@
+"""instrumentation.py
+
+This file measures how much work each request does, with the 'InstrumentationMiddleware' (see 'MIDDLEWARE' in
+'settings.py'):
+    - the number of SQL queries and the time spent running them, counted by a wrapper added to every database
+      connection ('connection.execute_wrappers', the list behind 'connection.execute_wrapper()').
+    - the time spent serializing the data of the response (DRF serializers' '.data', see 'MeasuredSerializerMixin' in
+      'main_app/serializers.py', and the sections of the views wrapped in 'measure_serialization').
+    - the time spent rendering the response body (e.g. DRF's JSON renderer), and the size of the body.
+    - the total time of the request.
+
+Sampled requests get a 'Server-Timing' header, which browsers show in their developer tools, e.g.:
+    Server-Timing: db;dur=3.2;desc="4 queries", serialize;dur=1.1, render;dur=0.4, total;dur=9.8, size;desc="5120 bytes"
+
+Every request is counted, and the totals of the process are served in the Prometheus text format by 'metrics_view'
+(at '/metrics/', see 'urls.py'). The counters are kept per process, so with several workers each one reports its
+own and Prometheus sums them.
+
+Settings:
+    - INSTRUMENTATION_SAMPLE_RATE: Fraction of requests whose queries, serialization and rendering are measured (0 to
+      1). Requests that aren't sampled only pay for a clock read and a counter update, which keeps the overhead low in
+      production.
+    - INSTRUMENTATION_SERVER_TIMING: Whether sampled responses get the 'Server-Timing' header. It shows how the
+      server spends its time, so it should only be turned on in production when that is acceptable.
+    - INSTRUMENTATION_METRICS_TOKEN: When set, '/metrics/' requires an 'Authorization: Bearer <token>' header.
+      Without a token, '/metrics/' is only served when DEBUG is True.
+"""
+
+# Import 'random' to sample requests, 'threading' to update the counters from several threads, and 'perf_counter' to
+# time each step.
+import random
+import threading
+from time import perf_counter
+# Import 'contextmanager' to time the serialization sections of the views.
+from contextlib import contextmanager
+# Import 'ContextVar' to find the metrics of the current request from the database wrapper. The variable is copied
+# into the threads that run sync code for async views, so their queries are counted too.
+from contextvars import ContextVar
+# Import 'iscoroutinefunction' and 'markcoroutinefunction' so the middleware runs natively under WSGI and ASGI.
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+# Import the settings module, the connections and the signal sent when one of them opens.
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+# Import 'constant_time_compare' to check the metrics token, and the response classes of the metrics view.
+from django.utils.crypto import constant_time_compare
+from django.http import HttpResponse, HttpResponseForbidden
+
+# Upper bounds (in seconds) of the request duration histogram buckets.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# The metrics of the request being handled, or None if it isn't sampled.
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+class RequestMetrics:
+    """Measurements of a sampled request.
+    """
+    def __init__(self):
+        self.db_count = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+        self.response_size = None
+
+    def record_query(self, duration):
+        """Counts a query that took 'duration' seconds.
+        """
+        self.db_count += 1
+        self.db_time += duration
+
+
+class MetricsRegistry:
+    """Totals of the requests handled by the current process, by view, method and status.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Sets every total back to zero.
+        """
+        with self._lock:
+            self.requests = {}
+            self.durations = {}
+            self.sampled = {}
+
+    def observe(self, view, method, status, duration, metrics=None):
+        """Adds a request that took 'duration' seconds, with its measurements if it was sampled.
+        """
+        with self._lock:
+            key = (view, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            buckets = self.durations.setdefault(view, [0] * len(DURATION_BUCKETS) + [0, 0.0])
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    buckets[index] += 1
+            buckets[-2] += 1
+            buckets[-1] += duration
+            if metrics is not None:
+                totals = self.sampled.setdefault(view, [0, 0, 0.0, 0.0, 0.0, 0])
+                totals[0] += 1
+                totals[1] += metrics.db_count
+                totals[2] += metrics.db_time
+                totals[3] += metrics.serialize_time
+                totals[4] += metrics.render_time
+                totals[5] += metrics.response_size or 0
+
+    def render(self):
+        """Returns the totals in the Prometheus text exposition format.
+        """
+        with self._lock:
+            requests = dict(self.requests)
+            durations = {view: list(buckets) for view, buckets in self.durations.items()}
+            sampled = {view: list(totals) for view, totals in self.sampled.items()}
+
+        lines = ['# HELP http_requests_total Requests handled, by view, method and status.',
+                 '# TYPE http_requests_total counter']
+        for (view, method, status), count in sorted(requests.items()):
+            lines.append(f'http_requests_total{format_labels(view=view, method=method, status=status)} {count}')
+
+        lines += ['# HELP http_request_duration_seconds Time taken to handle each request.',
+                  '# TYPE http_request_duration_seconds histogram']
+        for view, buckets in sorted(durations.items()):
+            for bound, count in zip(DURATION_BUCKETS, buckets):
+                lines.append(f'http_request_duration_seconds_bucket{format_labels(view=view, le=bound)} {count}')
+            lines.append(f'http_request_duration_seconds_bucket{format_labels(view=view, le="+Inf")} {buckets[-2]}')
+            lines.append(f'http_request_duration_seconds_sum{format_labels(view=view)} {buckets[-1]}')
+            lines.append(f'http_request_duration_seconds_count{format_labels(view=view)} {buckets[-2]}')
+
+        # The measurements of sampled requests, divide them by 'http_requests_sampled_total' for per request averages.
+        for index, (name, description) in enumerate([
+            ('http_requests_sampled_total', 'Requests whose queries, serialization and rendering were measured.'),
+            ('http_request_db_queries_total', 'SQL queries run by sampled requests.'),
+            ('http_request_db_seconds_total', 'Time spent running the SQL queries of sampled requests.'),
+            ('http_request_serialization_seconds_total', 'Time spent serializing the data of sampled requests.'),
+            ('http_request_render_seconds_total', 'Time spent rendering the responses of sampled requests.'),
+            ('http_response_size_bytes_total', 'Size of the response bodies of sampled requests.'),
+        ]):
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} counter']
+            for view, totals in sorted(sampled.items()):
+                lines.append(f'{name}{format_labels(view=view)} {totals[index]}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(**labels):
+    """Returns the labels of a sample, with their values escaped.
+    """
+    values = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, values)) + '}'
+
+
+# The registry of the current process.
+registry = MetricsRegistry()
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper timing the queries of sampled requests.
+    """
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(perf_counter() - start)
+
+
+def install_query_wrapper(connection, **kwargs):
+    """Adds 'record_query' to a database connection, once.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+# Connections opened from now on get the wrapper when they connect.
+connection_created.connect(install_query_wrapper)
+
+
+def get_sample_rate():
+    """Returns the fraction of requests that are measured.
+    """
+    return getattr(settings, 'INSTRUMENTATION_SAMPLE_RATE', 1.0)
+
+
+@contextmanager
+def measure_serialization():
+    """Adds the time spent in the block to the serialization time of the current request, if it is sampled.
+    """
+    metrics = current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serialize_time += perf_counter() - start
+
+
+def get_view_name(request):
+    """Returns the name of the view that handled a request, which keeps the number of label values small.
+    """
+    match = getattr(request, 'resolver_match', None)
+    return (match.view_name or match.route) if match is not None else 'unmatched'
+
+
+def get_server_timing(metrics, duration):
+    """Returns the 'Server-Timing' header value of a sampled request.
+    """
+    timing = [f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.db_count} queries"',
+              f'serialize;dur={metrics.serialize_time * 1000:.1f}', f'render;dur={metrics.render_time * 1000:.1f}',
+              f'total;dur={duration * 1000:.1f}']
+    if metrics.response_size is not None:
+        timing.append(f'size;desc="{metrics.response_size} bytes"')
+    return ', '.join(timing)
+
+
+class InstrumentationMiddleware:
+    """Middleware counting every request, and measuring the queries, serialization, rendering and response size of
+    sampled ones.
+
+    It should be the first middleware, so its timings include the others.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # Connections opened before this module was imported don't get the 'connection_created' signal.
+        for connection in connections.all(initialized_only=True):
+            install_query_wrapper(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start, metrics = perf_counter(), self.start(request)
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, start, metrics)
+
+    async def __acall__(self, request):
+        start, metrics = perf_counter(), self.start(request)
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, start, metrics)
+
+    def start(self, request):
+        """Returns the metrics of a sampled request, or None if it isn't sampled.
+        """
+        sample_rate = get_sample_rate()
+        return RequestMetrics() if sample_rate >= 1 or random.random() < sample_rate else None
+
+    def process_template_response(self, request, response):
+        """Times the rendering of responses rendered after the view returns, such as DRF's 'Response'.
+        """
+        metrics = current_metrics.get()
+        if metrics is not None:
+            start = perf_counter()
+
+            def rendered(response):
+                metrics.render_time += perf_counter() - start
+            response.add_post_render_callback(rendered)
+        return response
+
+    def finish(self, request, response, start, metrics):
+        """Records the request in the registry, and adds the 'Server-Timing' header to sampled responses.
+
+        Streaming responses are sent after this runs, so their size isn't known.
+        """
+        if metrics is not None and not response.streaming:
+            metrics.response_size = len(response.content)
+        duration = perf_counter() - start
+        registry.observe(get_view_name(request), request.method, response.status_code, duration, metrics)
+        if metrics is not None and getattr(settings, 'INSTRUMENTATION_SERVER_TIMING', False):
+            response['Server-Timing'] = get_server_timing(metrics, duration)
+        return response
+
+
+def metrics_view(request):
+    """Serves the totals of the current process in the Prometheus text format.
+
+    Requests must send the 'INSTRUMENTATION_METRICS_TOKEN' when one is set. Without a token, the totals are only
+    served when DEBUG is True, so a production server never exposes them by default.
+    """
+    token = getattr(settings, 'INSTRUMENTATION_METRICS_TOKEN', None)
+    if token:
+        if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponseForbidden()
+    elif not settings.DEBUG:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
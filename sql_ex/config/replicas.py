@@ -0,0 +1,240 @@
+"""replicas.py
+
+This file routes the queries of the project between the primary database ('default') and its read replicas (the
+aliases listed in the 'DATABASE_REPLICAS' setting), with the 'ReplicaRouter' (see 'DATABASE_ROUTERS' in 'settings.py'):
+    - writes always go to the primary.
+    - reads go to the primary, except in views that allow replicas, such as the 'list' and 'retrieve' actions of the
+      main_app ViewSets (see 'ReplicaReadMixin' in 'main_app/views.py'). Their reads use one replica per request,
+      picked at random among the healthy ones, so a response never mixes data from two replicas.
+    - once a request writes, its following reads go to the primary, so it reads its own writes. The response sets a
+      cookie for 'DATABASE_REPLICA_STICKY_SECONDS', and the client's next requests read from the primary too, until
+      the replicas have caught up with the write.
+    - a replica whose health check fails is left out until it passes again, and the reads go to the primary when no
+      replica is healthy. Each replica is checked at most every 'DATABASE_REPLICA_HEALTH_INTERVAL' seconds.
+The authorization data of 'main_app/authorization.py' is read from the primary with 'read_primary()', so revoked
+access rights are never cached from a lagging replica. The API responses of 'CachedResponseMixin' are read from a
+replica like any other read, but a response read from a replica ('get_read_replica()') is only cached for
+'DATABASE_REPLICA_CACHE_TIMEOUT' seconds, so a replica's lagging data isn't served long after it has caught up.
+The state of each request is kept by 'ReplicaMiddleware' in a context variable, which is copied into the threads
+that run sync code for async views, so async requests are routed the same way.
+
+Replicas are kept up to date by the database server in production. Locally, SQLite files can be used as replicas and
+kept in sync with 'sync_replicas()' (or the 'sync_replicas' management command), which copies the primary into each
+of them with SQLite's online backup API.
+"""
+
+# Import 'random' to pick a replica, 'threading' to share the health checks between threads, and the timers.
+import random
+import threading
+from time import monotonic, time
+# Import 'ContextVar' to keep the routing state of the current request, and 'contextmanager' to send the reads of a
+# block to the primary.
+from contextvars import ContextVar
+from contextlib import contextmanager
+# Import 'iscoroutinefunction' and 'markcoroutinefunction' so the middleware runs natively under WSGI and ASGI.
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+# Import the settings module, the connections and the errors of the database.
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+# Name of the cookie that sends a client's reads to the primary after a write. Its value is the time it expires.
+STICKY_COOKIE = 'replica_pin'
+
+# The routing state of the request being handled, or None outside of requests (e.g. in management commands).
+current_state = ContextVar('replica_state', default=None)
+
+# Result and time of the last health check of each replica, shared by every thread of the process.
+_health = {}
+_health_lock = threading.Lock()
+
+
+class RequestState:
+    """Routing state of a request.
+    """
+    def __init__(self, pinned=False):
+        # Whether the client wrote recently, so its reads go to the primary.
+        self.pinned = pinned
+        # Whether the view allows its reads to go to a replica.
+        self.use_replicas = False
+        # Whether the request wrote to the primary.
+        self.written = False
+        # The database the request reads from, picked on its first read.
+        self.replica = None
+
+
+def get_replicas():
+    """Returns the aliases of the read replicas.
+    """
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+def use_replicas():
+    """Lets the reads of the current request go to a replica, unless it has written or is pinned to the primary.
+    """
+    state = current_state.get()
+    if state is not None:
+        state.use_replicas = True
+
+
+@contextmanager
+def read_primary():
+    """Sends the reads of the current request made in the block to the primary, for data that is stored in a shared
+    cache.
+    """
+    state = current_state.get()
+    if state is None:
+        yield
+        return
+    allowed, state.use_replicas = state.use_replicas, False
+    try:
+        yield
+    finally:
+        state.use_replicas = allowed
+
+
+def get_read_replica():
+    """Returns the replica the current request has read from, or None if its reads went to the primary.
+    """
+    state = current_state.get()
+    if state is None or state.replica in (None, DEFAULT_DB_ALIAS):
+        return None
+    return state.replica
+
+
+def check_replica(alias):
+    """Returns whether a replica answers a query on the migrations table. SQLite creates an empty database for a
+    missing file, which fails the check since it has no tables.
+    """
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1 FROM django_migrations LIMIT 1')
+        return True
+    except DatabaseError:
+        # Drop the connection, the next check opens a new one.
+        connections[alias].close()
+        return False
+
+
+def is_healthy(alias):
+    """Returns whether a replica can be read from, checking it again if the last check is too old.
+    """
+    healthy, checked_at = _health.get(alias, (None, 0))
+    if healthy is None or monotonic() - checked_at >= getattr(settings, 'DATABASE_REPLICA_HEALTH_INTERVAL', 10):
+        healthy = check_replica(alias)
+        with _health_lock:
+            _health[alias] = (healthy, monotonic())
+    return healthy
+
+
+def reset_health():
+    """Forgets the health checks, so every replica is checked again before its next read.
+    """
+    with _health_lock:
+        _health.clear()
+
+
+class ReplicaRouter:
+    """Database router sending writes to the primary, and the reads of views that allow it to a healthy replica.
+    """
+    def db_for_read(self, model, **hints):
+        state = current_state.get()
+        if state is None or not state.use_replicas or state.pinned or state.written:
+            return DEFAULT_DB_ALIAS
+        # Objects related to an instance are read from the database the instance came from.
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        if state.replica is None:
+            healthy = [alias for alias in get_replicas() if is_healthy(alias)]
+            state.replica = random.choice(healthy) if healthy else DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = current_state.get()
+        if state is not None:
+            state.written = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same rows as the primary, so objects from any of them can be related.
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replicas receive the schema from the primary, with the rest of its data.
+        return False if db in get_replicas() else None
+
+
+def is_pinned(request):
+    """Returns whether the request has a sticky cookie that hasn't expired yet.
+    """
+    try:
+        return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time()
+    except ValueError:
+        return False
+
+
+class ReplicaMiddleware:
+    """Middleware keeping the routing state of each request, and setting the sticky cookie on responses to requests
+    that wrote.
+
+    It should come before any middleware that writes (e.g. the session middleware), so their writes pin the client.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RequestState(pinned=is_pinned(request))
+        token = current_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_state.reset(token)
+        return self.finish(response, state)
+
+    async def __acall__(self, request):
+        state = RequestState(pinned=is_pinned(request))
+        token = current_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_state.reset(token)
+        return self.finish(response, state)
+
+    def finish(self, response, state):
+        """Sets the sticky cookie if the request wrote and there are replicas.
+        """
+        if state.written and get_replicas():
+            seconds = getattr(settings, 'DATABASE_REPLICA_STICKY_SECONDS', 5)
+            response.set_cookie(STICKY_COOKIE, str(time() + seconds), max_age=seconds, httponly=True,
+                                samesite='Lax')
+        return response
+
+
+def sync_replicas(aliases=None):
+    """Copies the primary database into each replica (all of them by default) with SQLite's online backup API, and
+    returns the aliases copied.
+
+    The primary must not be in a transaction, the copy would wait for it to end.
+    """
+    source = connections[DEFAULT_DB_ALIAS]
+    if source.vendor != 'sqlite':
+        raise ValueError('Only SQLite databases can be copied into their replicas.')
+    if source.in_atomic_block:
+        raise ValueError('The primary database is in a transaction.')
+    aliases = get_replicas() if aliases is None else list(aliases)
+    source.ensure_connection()
+    for alias in aliases:
+        target = connections[alias]
+        target.ensure_connection()
+        source.connection.backup(target.connection)
+    return aliases
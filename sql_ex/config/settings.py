@@ -11,6 +11,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -50,8 +51,18 @@ INSTALLED_APPS = [
     'main_app',
 ]
 
+# Django REST Framework settings applied to every API view.
+REST_FRAMEWORK = {
+    # Paginate list responses with keyset (cursor) pagination so that deep pages stay as cheap as the first one.
+    'DEFAULT_PAGINATION_CLASS': 'main_app.pagination.KeysetCursorPagination',
+    # Default number of results per page. Clients can request a different size with '?page_size=' (up to 500).
+    'PAGE_SIZE': 50,
+}
+
 # Middleware to process requests and responses globally.
 MIDDLEWARE = [
+    'config.instrumentation.InstrumentationMiddleware',         # Query counts, timings and response sizes
+    'config.replicas.ReplicaMiddleware',                        # Read replica routing of each request
     'django.middleware.security.SecurityMiddleware',            # Security enhancements
     'django.contrib.sessions.middleware.SessionMiddleware',     # Session support
     'django.middleware.common.CommonMiddleware',                # Common functionalities
@@ -61,6 +72,15 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',   # Clickjacking protection
 ]
 
+# Request instrumentation (see 'config/instrumentation.py').
+# Fraction of requests whose SQL queries, serialization and rendering time and response size are measured. Every request is counted.
+INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get('INSTRUMENTATION_SAMPLE_RATE', 1.0 if DEBUG else 0.05))
+# Whether sampled responses get a 'Server-Timing' header with these measurements.
+INSTRUMENTATION_SERVER_TIMING = os.environ.get('INSTRUMENTATION_SERVER_TIMING', str(DEBUG)).lower() in ('1', 'true')
+# When set, the Prometheus endpoint at '/metrics/' requires an 'Authorization: Bearer <token>' header. Without it,
+# the endpoint is only served when DEBUG is True.
+INSTRUMENTATION_METRICS_TOKEN = os.environ.get('INSTRUMENTATION_METRICS_TOKEN')
+
 # The URL configuration module for this Django project.
 ROOT_URLCONF = 'config.urls'
 
@@ -93,13 +113,104 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Django's ORM allows interaction with the database using Python objects, simplifying CRUD operations.
 # For external NoSQL databases (e.g., MongoDB), use libraries like pymongo directly in your code, 
 # and comment out this section.
+#
+# The SQLite profile is chosen with the 'SQLITE_PROFILE' environment variable (compare them with the
+# 'benchmark_sqlite' command):
+#   - 'default': Django's defaults. Every commit waits for the disk (rollback journal with synchronous=FULL), readers
+#     and writers block each other, and every request opens a new connection.
+#   - 'production': tuned for concurrent requests. Every new connection runs the PRAGMAs of 'init_command':
+#       - journal_mode=WAL: readers and the writer no longer block each other.
+#       - synchronous=NORMAL: commits don't wait for the disk, only WAL checkpoints do. A power loss can lose the
+#         last commits, but can't corrupt the database.
+#       - mmap_size: pages are read from a memory mapping of the file instead of with a system call each.
+#       - cache_size: page cache of each connection, in KiB when negative.
+#       - busy_timeout: milliseconds a connection waits for the write lock before failing with "database is locked".
+#       - temp_store=MEMORY: temporary tables and indexes, e.g. of large sorts, are kept in memory.
+#     Transactions ('transaction.atomic') start with BEGIN IMMEDIATE, which takes the write lock straight away. A
+#     deferred transaction that reads before it writes can't wait for the lock when it upgrades, so it fails with
+#     "database is locked" whatever the busy timeout. Queries outside transactions are not affected.
+#     Connections are kept for 'DATABASE_CONN_MAX_AGE' seconds and checked before they are reused. Under ASGI set it
+#     to 0, since async requests don't reuse the connections of their threads.
+SQLITE_PROFILES = {
+    'default': {
+        'OPTIONS': {},
+        'CONN_MAX_AGE': 0,
+        'CONN_HEALTH_CHECKS': False,
+    },
+    'production': {
+        'OPTIONS': {
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                f'PRAGMA mmap_size={int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))};'
+                f'PRAGMA cache_size={int(os.environ.get("SQLITE_CACHE_SIZE", -64 * 1024))};'
+                f'PRAGMA busy_timeout={int(os.environ.get("SQLITE_BUSY_TIMEOUT", 5000))};'
+                'PRAGMA temp_store=MEMORY;'
+            ),
+            'transaction_mode': 'IMMEDIATE',
+        },
+        'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+    },
+}
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        # The 'DATABASE_NAME' environment variable points the project at another SQLite file, e.g. the database
+        # seeded by the 'benchmark' command for the server it starts.
+        'NAME': os.environ.get('DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
+        **SQLITE_PROFILES[os.environ.get('SQLITE_PROFILE', 'default')],
     }
 }
 
+# Read replicas (see 'config/replicas.py'). The 'DATABASE_REPLICAS' environment variable lists the comma separated
+# SQLite files holding copies of the database, which become the aliases 'replica1', 'replica2', etc. Locally they can
+# be kept in sync with 'python manage.py sync_replicas --interval 1'.
+DATABASE_REPLICAS = []
+for _number, _name in enumerate(filter(None, os.environ.get('DATABASE_REPLICAS', '').split(',')), start=1):
+    DATABASES[f'replica{_number}'] = {**DATABASES['default'], 'NAME': _name.strip()}
+    DATABASE_REPLICAS.append(f'replica{_number}')
+DATABASE_ROUTERS = ['config.replicas.ReplicaRouter']
+# Number of seconds a client reads from the primary after it writes, which should exceed the replication lag.
+DATABASE_REPLICA_STICKY_SECONDS = int(os.environ.get('DATABASE_REPLICA_STICKY_SECONDS', 5))
+# Number of seconds an API response read from a replica stays cached, since it may show data the replica hasn't
+# caught up with yet (see 'main_app/caching.py'). Like the sticky window, it should exceed the replication lag.
+DATABASE_REPLICA_CACHE_TIMEOUT = int(os.environ.get('DATABASE_REPLICA_CACHE_TIMEOUT',
+                                                    DATABASE_REPLICA_STICKY_SECONDS))
+# Number of seconds the result of a replica's health check is reused.
+DATABASE_REPLICA_HEALTH_INTERVAL = 10
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# The cache holds the users' groups and permissions and the cached API responses (see 'main_app/caching.py').
+# The backend is chosen with the 'CACHE_BACKEND' environment variable:
+#   - 'locmem' (default): in the memory of each process. Fine for development and tests, but with several processes
+#     a change only invalidates the responses cached by the process that made it.
+#   - 'file': in the directory given by 'CACHE_LOCATION', shared by every process on the machine.
+#   - 'redis': on the Redis (or Redis compatible, e.g. Valkey) server at 'CACHE_LOCATION', shared by every machine.
+#     Needs the 'redis' package.
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'sql_ex'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / 'cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+}
+_cache_backend, _cache_location = CACHE_BACKENDS[os.environ.get('CACHE_BACKEND', 'locmem')]
+CACHES = {
+    'default': {
+        'BACKEND': _cache_backend,
+        'LOCATION': os.environ.get('CACHE_LOCATION', _cache_location),
+    }
+}
+
+# Number of seconds an API response stays cached (see 'main_app/caching.py'). Cached responses are also replaced as
+# soon as the data they show changes.
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get('RESPONSE_CACHE_TIMEOUT', 600))
+
+# Number of seconds a user's groups and permissions are cached between requests (see 'main_app/authorization.py').
+# Cached entries are also removed as soon as the user's groups or permissions change.
+AUTHORIZATION_CACHE_TIMEOUT = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
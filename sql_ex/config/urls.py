@@ -26,6 +26,8 @@ from rest_framework import permissions
 # Import functions from drf_yasg to create schema views for API documentation.
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+# Import the view serving the request metrics in the Prometheus text format.
+from config.instrumentation import metrics_view
 
 # Create a schema view for generating API documentation, specifying metadata like title, version, and contact information.
 main_app_schema_view = get_schema_view(
@@ -59,4 +61,6 @@ urlpatterns = [
     # Main application URLs - this sets the base URL path and for the app and includes the URL patterns 
     # defined in the main_app's 'urls.py', allowing access to the functionalities specific to that application.
     path('main_app/', include('main_app.urls')),
+    # Request metrics (query counts, timings and response sizes) in the Prometheus text format, for scraping.
+    path('metrics/', metrics_view, name='metrics'),
 ]
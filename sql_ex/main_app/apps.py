@@ -13,3 +13,8 @@ class MainAppConfig(AppConfig):
     """
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main_app'
+
+    def ready(self):
+        """Runs once the app registry is fully populated. Importing the signals module connects its receivers.
+        """
+        from . import signals  # noqa: F401
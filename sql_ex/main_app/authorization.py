@@ -0,0 +1,165 @@
+"""authorization.py
+
+This file provides a request-scoped authorization context for the API views. The group names and permission
+codenames of the authenticated user are loaded together in a single query, then reused by every group or
+permission check made while handling the request.
+
+Async views load the same context with 'aget_authorization_context', after which the sync helpers read it from the
+request without touching the database.
+
+The loaded data is also stored in Django's cache framework, so later requests from the same user can skip the
+query entirely. It is always loaded from the primary database, never from a read replica. Cached entries expire
+after 'AUTHORIZATION_CACHE_TIMEOUT' seconds (see 'settings.py') and are deleted early by the signal handlers in
+'signals.py' whenever the user's groups or permissions change.
+"""
+
+# Import the settings module to read the cache timeout.
+from django.conf import settings
+# Import the default cache, which is shared between requests (and between processes for shared backends).
+from django.core.cache import cache
+# Import 'transaction' to delete the cached entries again once the change is committed.
+from django.db import transaction
+# Import the Group and Permission models to look up the user's access rights.
+from django.contrib.auth.models import Group, Permission
+# Import the query expressions used to combine group and permission rows into a single UNION query.
+from django.db.models import CharField, F, Q, Value
+# Import the helper that reads from the primary database, so a read replica's lagging data is never cached.
+from config.replicas import read_primary
+
+# Default number of seconds a user's groups and permissions stay cached between requests.
+DEFAULT_CACHE_TIMEOUT = 300
+
+
+def get_cache_key(user_id):
+    """Returns the cache key holding the groups and permissions of a user.
+    """
+    return f'main_app:authorization:{user_id}'
+
+
+def invalidate_authorization(user_ids, using=None):
+    """Deletes the cached groups and permissions of the given users, so they are reloaded on their next request.
+
+    The entries are deleted straight away, and again when the current transaction commits. The second delete drops
+    any entry cached from another connection between the change and the commit, which would still grant the old
+    access rights. Outside a transaction the changes are already committed, so one delete is enough.
+    """
+    keys = [get_cache_key(user_id) for user_id in user_ids]
+    cache.delete_many(keys)
+    if transaction.get_connection(using).in_atomic_block:
+        transaction.on_commit(lambda: cache.delete_many(keys), using=using)
+
+
+def get_authorization_query(user):
+    """Returns the query selecting a user's groups and permissions as rows of (kind, value, codename).
+
+    The groups and the permissions (granted directly or through a group) are combined with UNION, so only one
+    round-trip to the database is needed.
+    """
+    text = CharField()
+    # Every column is given as an expression so both parts of the UNION select their columns in the same order.
+    # The default model ordering is cleared because ORDER BY is not allowed inside the parts of a UNION.
+    groups = Group.objects.filter(user=user).order_by().values_list(
+        Value('group', output_field=text), F('name'), Value('', output_field=text))
+    permissions = Permission.objects.filter(Q(user=user) | Q(group__user=user)).order_by().values_list(
+        Value('perm', output_field=text), F('content_type__app_label'), F('codename'))
+    return groups.union(permissions)
+
+
+def collect_authorization(rows):
+    """Turns the rows of 'get_authorization_query' into the sorted group names and permissions of a user.
+    """
+    group_names, permission_names = [], []
+    for kind, value, codename in rows:
+        if kind == 'group':
+            group_names.append(value)
+        else:
+            permission_names.append(f'{value}.{codename}')
+    return {'groups': sorted(group_names), 'permissions': sorted(permission_names)}
+
+
+def load_authorization(user):
+    """Loads a user's group names and permissions (as 'app_label.codename') in a single query.
+    """
+    return collect_authorization(get_authorization_query(user))
+
+
+async def aload_authorization(user):
+    """Async version of 'load_authorization'.
+    """
+    return collect_authorization([row async for row in get_authorization_query(user)])
+
+
+class AuthorizationContext:
+    """Holds the group names and permissions of a user for the duration of a request.
+
+    Permission checks follow the same rules as Django's 'ModelBackend': inactive users have no permissions
+    and active superusers have all of them.
+    """
+    def __init__(self, user, groups=(), permissions=()):
+        self.is_active = user.is_active
+        self.is_superuser = user.is_superuser
+        self.groups = frozenset(groups)
+        self.permissions = frozenset(permissions)
+
+    def in_group(self, name):
+        """Returns True if the user belongs to the named group.
+        """
+        return name in self.groups
+
+    def has_perm(self, perm):
+        """Returns True if the user has the permission, given as 'app_label.codename'.
+        """
+        if not self.is_active:
+            return False
+        return self.is_superuser or perm in self.permissions
+
+
+def get_authorization_context(request):
+    """Returns the authorization context of the request's user, loading it at most once per request.
+
+    The context is stored on the underlying Django HttpRequest so that it is shared by everything that
+    handles the request. If it is not yet loaded, the cross-request cache is checked before the database.
+    """
+    http_request = getattr(request, '_request', request)
+    context = getattr(http_request, '_authorization_context', None)
+    if context is not None:
+        return context
+
+    user = request.user
+    if not user.is_authenticated:
+        context = AuthorizationContext(user)
+    else:
+        key = get_cache_key(user.pk)
+        data = cache.get(key)
+        if data is None:
+            with read_primary():
+                data = load_authorization(user)
+            cache.set(key, data, getattr(settings, 'AUTHORIZATION_CACHE_TIMEOUT', DEFAULT_CACHE_TIMEOUT))
+        context = AuthorizationContext(user, data['groups'], data['permissions'])
+
+    http_request._authorization_context = context
+    return context
+
+
+async def aget_authorization_context(request):
+    """Async version of 'get_authorization_context'. The request's user must already be authenticated.
+    """
+    http_request = getattr(request, '_request', request)
+    context = getattr(http_request, '_authorization_context', None)
+    if context is not None:
+        return context
+
+    user = request.user
+    if not user.is_authenticated:
+        context = AuthorizationContext(user)
+    else:
+        key = get_cache_key(user.pk)
+        data = await cache.aget(key)
+        if data is None:
+            with read_primary():
+                data = await aload_authorization(user)
+            await cache.aset(key, data, getattr(settings, 'AUTHORIZATION_CACHE_TIMEOUT', DEFAULT_CACHE_TIMEOUT))
+        context = AuthorizationContext(user, data['groups'], data['permissions'])
+
+    http_request._authorization_context = context
+    return context
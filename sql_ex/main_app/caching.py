@@ -0,0 +1,155 @@
+"""caching.py
+
+This file caches the responses of read-heavy API views (see 'CachedResponseMixin' in 'views.py'), so repeated
+requests for the same list page or instance are served without querying the database or serializing again.
+
+Responses are stored in Django's cache framework under a key made of:
+    - the cache group of the view (e.g. 'record_label'), and the current version number of that group.
+    - the host, the path, and the query parameters that change the response, normalized so that their order and
+      surrounding whitespace don't matter.
+
+Instead of finding and deleting every cached page when data changes, the signal handlers in 'signals.py' bump the
+version of the groups that show the changed model ('invalidate_model_responses'). Entries of the old version are
+never read again and expire after 'RESPONSE_CACHE_TIMEOUT' seconds. A group lists every model its responses contain,
+e.g. albums nest their record label, so a change to a record label also bumps the 'album' group.
+
+Each cached response keeps the ETag and Last-Modified headers it was created with (or an ETag computed from its
+data), and a request whose 'If-None-Match' header matches it gets an empty 304 Not Modified response. The same
+helpers answer conditional requests for the views that aren't cached (see 'ConditionalGetMixin' in 'views.py').
+
+The version numbers must be shared by every process serving the API, so production should use a file or Redis
+cache (see 'CACHES' in 'settings.py'). The local memory cache is only shared by the threads of one process.
+"""
+
+# Import 'hashlib' to hash the normalized requests and the response data, 'json' to serialize the data for the ETag
+# and 'time' to start the version numbers.
+import hashlib
+import json
+import time
+# Import the settings module to read the cache timeout.
+from django.conf import settings
+# Import the default cache, which is shared between requests (and between processes for shared backends).
+from django.core.cache import cache
+# Import 'transaction' to bump the versions again once the changes are committed.
+from django.db import transaction
+# Import the helpers that answer conditional requests and write the validator headers.
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+# Import the JSON encoder of Django REST Framework, which handles the types found in serialized data.
+from rest_framework.utils.encoders import JSONEncoder
+# Import the models whose responses are cached.
+from .models import RecordLabel, Musician, Album
+
+# Default number of seconds a response stays cached, unless its group's version is bumped first.
+DEFAULT_CACHE_TIMEOUT = 600
+
+# Default number of seconds a response read from a replica stays cached.
+DEFAULT_REPLICA_CACHE_TIMEOUT = 5
+
+# Maps each model to the cache groups whose responses include it. Albums nest their record label and their members.
+MODEL_CACHE_GROUPS = {
+    RecordLabel: ('record_label', 'album'),
+    Album: ('album',),
+    Musician: ('album',),
+}
+
+
+def get_version_key(group):
+    """Returns the cache key holding the version number of a cache group.
+    """
+    return f'main_app:response_version:{group}'
+
+
+def get_cache_version(group):
+    """Returns the current version number of a cache group.
+
+    A group without a version (new, or evicted from the cache) starts from the current time in nanoseconds, so it
+    never reuses the version of an older entry that may still be cached.
+    """
+    key = get_version_key(group)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_cache_versions(groups):
+    """Increments the version number of each cache group, so their cached responses are no longer used.
+    """
+    for group in groups:
+        try:
+            cache.incr(get_version_key(group))
+        except ValueError:
+            # The version is missing, the next read starts a new one.
+            pass
+
+
+def invalidate_responses(groups, using=None):
+    """Invalidates the cached responses of the given cache groups.
+
+    The versions are bumped straight away, and again when the current transaction commits. The second bump drops
+    any response cached from another connection between the change and the commit, which would still show the old
+    data. Outside a transaction the changes are already committed, so one bump is enough.
+    """
+    groups = tuple(groups)
+    bump_cache_versions(groups)
+    if transaction.get_connection(using).in_atomic_block:
+        transaction.on_commit(lambda: bump_cache_versions(groups), using=using)
+
+
+def invalidate_model_responses(model, using=None):
+    """Invalidates the cached responses that include instances of the given model.
+    """
+    groups = MODEL_CACHE_GROUPS.get(model)
+    if groups:
+        invalidate_responses(groups, using=using)
+
+
+def get_response_cache_key(group, request, query_params):
+    """Returns the cache key of a response, for the current version of its group.
+
+    Only the 'query_params' (the parameters the view reads) are part of the key. Their values are stripped, empty
+    values are dropped and the parameters are sorted, so equivalent requests share a cached response.
+    """
+    params = sorted((name, value.strip()) for name in query_params
+                    for value in request.query_params.getlist(name) if value.strip())
+    request_id = json.dumps([request.get_host(), request.path, params])
+    digest = hashlib.md5(request_id.encode(), usedforsecurity=False).hexdigest()
+    return f'main_app:response:{group}:{get_cache_version(group)}:{digest}'
+
+
+def make_etag(data):
+    """Returns the quoted ETag of serialized response data.
+    """
+    content = json.dumps(data, cls=JSONEncoder, sort_keys=True)
+    return f'"{hashlib.md5(content.encode(), usedforsecurity=False).hexdigest()}"'
+
+
+def get_not_modified_response(request, etag, last_modified=None):
+    """Returns a 304 Not Modified response if the request's 'If-None-Match' (or 'If-Modified-Since') header shows the
+    client already has this version of the response, otherwise None.
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+    return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+def set_validators(response, etag, last_modified=None):
+    """Adds the 'ETag' and 'Last-Modified' headers to a response, and asks clients to revalidate it before reuse.
+    """
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_cache_control(response, private=True, no_cache=True)
+
+
+def get_cache_timeout(replica=None):
+    """Returns the number of seconds a response is cached for.
+
+    A response read from a replica may miss changes the replica hasn't received yet, whose versions were already
+    bumped, so it is only cached until the replica should have caught up.
+    """
+    timeout = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', DEFAULT_CACHE_TIMEOUT)
+    if replica is None:
+        return timeout
+    return min(timeout, getattr(settings, 'DATABASE_REPLICA_CACHE_TIMEOUT', DEFAULT_REPLICA_CACHE_TIMEOUT))
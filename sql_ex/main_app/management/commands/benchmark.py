@@ -0,0 +1,414 @@
+"""benchmark.py
+
+Management command that seeds a dataset of a given size and measures every read endpoint of 'main_app/urls.py',
+reporting the throughput, the p50/p95/p99 latencies and the number of queries per request as JSON. Run it with:
+
+    python manage.py benchmark --albums 2000 --output baseline.json
+    python manage.py benchmark --albums 2000 --baseline baseline.json --fail-on-regression
+
+The dataset is generated from '--seed' into a temporary SQLite database, created and migrated like a test database,
+so the project's database is never touched and two runs with the same options measure the same data: '--labels'
+record labels, '--musicians' musicians and '--albums' albums. The number of members of each album is drawn around
+'--members', and a few popular musicians play on many albums, as on real records.
+
+Each endpoint is measured in the requested '--modes':
+    - client: '--requests' sequential requests through the Django test client, in this process. This measures the
+      cost of the code alone, and the queries are counted exactly.
+    - server: '--clients' concurrent keep-alive connections for '--duration' seconds against a uvicorn server (the
+      'uvicorn' package is needed), using the same database. The queries are read from the 'Server-Timing' header
+      (see 'config/instrumentation.py'), which the server is started with.
+The responses are cached (see 'caching.py'), the warmup requests of each endpoint fill the cache so the results
+show the steady state. Writes are not measured, since they would change the dataset between endpoints and runs.
+
+With '--baseline', each result is compared with the same mode and endpoint of a previous report. A result is
+flagged as a regression when its throughput drops or its p95 latency grows by more than '--tolerance', or when it
+runs more queries per request.
+"""
+
+# Import 'json' to write and read the reports, 'os', 'subprocess', 'sys' and 'tempfile' to run the server,
+# 'importlib.util' to check it is installed, 'platform' to record the environment, 'random' to generate the dataset,
+# 're' to read the query count header and 'threading' to run the clients.
+import importlib.util
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+# Import 'http.client' to send requests over keep-alive connections, and the timers.
+import http.client
+from time import monotonic, perf_counter, sleep
+# Import 'django' to record its version, and 'BaseCommand' and 'CommandError' to define a custom 'manage.py' command.
+import django
+from django.core.management.base import BaseCommand, CommandError
+# Import the settings module to find the project directory.
+from django.conf import settings
+# Import the default cache, which is cleared before each endpoint.
+from django.core.cache import cache
+# Import 'connection' to create the temporary database, and 'CaptureQueriesContext' to count the queries.
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+# Import the test client, which sends requests through the whole middleware stack without a server.
+from django.test import Client
+# Import the User and Group models to create the user the requests are sent as.
+from django.contrib.auth.models import Group, User
+# Import the models the dataset is made of.
+from main_app.models import RecordLabel, Musician, Album
+
+# Syllables combined into the made up words used for names, and the genres and instruments picked from.
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'ze', 'qua', 'bri', 'dor', 'fen', 'gal', 'hux', 'jin']
+GENRES = ['Rock', 'Jazz', 'Pop', 'Metal', 'Folk', 'Blues', 'Soul', 'Electronic', 'Classical', 'Hip Hop']
+INSTRUMENTS = ['Guitar', 'Bass', 'Drums', 'Vocals', 'Keys', 'Violin', 'Saxophone', 'Trumpet']
+
+# Number of seconds the server has to start answering.
+STARTUP_TIMEOUT = 30
+
+# Reads the query count from the 'Server-Timing' header, e.g. 'db;dur=1.2;desc="4 queries"'.
+QUERY_COUNT = re.compile(r'desc="(\d+) queries"')
+
+
+def percentile(values, fraction):
+    """Returns the value at a fraction (e.g. 0.95) of sorted values, or 0 if there are none.
+    """
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+
+def summarize(latencies, errors, elapsed, queries):
+    """Returns the throughput, latency percentiles and queries per request of the successful requests.
+    """
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'requests_per_second': round(len(latencies) / elapsed, 1) if elapsed else 0,
+        'p50_ms': round(percentile(latencies, 0.5), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Returns the comparison of each result with the same mode and endpoint of a baseline report.
+    """
+    previous = {(result['mode'], result['endpoint']): result for result in baseline['results']}
+    rows = []
+    for result in results:
+        before = previous.get((result['mode'], result['endpoint']))
+        if before is None:
+            continue
+        throughput = result['requests_per_second'] / before['requests_per_second'] - 1 \
+            if before['requests_per_second'] else 0
+        latency = result['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0
+        queries = (result['queries_per_request'] or 0) - (before['queries_per_request'] or 0)
+        rows.append({
+            'mode': result['mode'], 'endpoint': result['endpoint'],
+            'requests_per_second_change': round(throughput, 3), 'p95_ms_change': round(latency, 3),
+            'queries_per_request_change': round(queries, 2),
+            'regression': throughput < -tolerance or latency > tolerance or queries > 0,
+        })
+    return rows
+
+
+class Command(BaseCommand):
+    """Benchmarks every read endpoint of main_app on a seeded dataset, optionally against a baseline report.
+    """
+    help = 'Seeds a dataset and reports throughput, latency percentiles and queries per request of each endpoint.'
+
+    def add_arguments(self, parser):
+        """Defines the command line options of the benchmark.
+        """
+        parser.add_argument('--labels', type=int, default=100, help='Number of record labels.')
+        parser.add_argument('--musicians', type=int, default=1000, help='Number of musicians.')
+        parser.add_argument('--albums', type=int, default=2000, help='Number of albums.')
+        parser.add_argument('--members', type=float, default=4, help='Average number of members of an album.')
+        parser.add_argument('--seed', type=int, default=42, help='Seed for the generated dataset.')
+        parser.add_argument('--modes', default='client', help='Comma separated modes to run: client, server.')
+        parser.add_argument('--endpoints', help='Comma separated endpoints to run (all of them by default).')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint in client mode.')
+        parser.add_argument('--warmup', type=int, default=10, help='Requests not measured before each endpoint.')
+        parser.add_argument('--clients', type=int, default=8, help='Concurrent connections in server mode.')
+        parser.add_argument('--duration', type=float, default=5, help='Seconds each endpoint runs in server mode.')
+        parser.add_argument('--port', type=int, default=8767, help='Port the server listens on.')
+        parser.add_argument('--output', help='File to write the JSON report to (printed if not given).')
+        parser.add_argument('--baseline', help='Report of a previous run to compare the results with.')
+        parser.add_argument('--tolerance', type=float, default=0.15,
+                            help='Fraction the throughput or p95 latency can worsen by before it is a regression.')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='Exit with an error if a result regressed against the baseline.')
+
+    def handle(self, *args, **options):
+        """Seeds the temporary database, measures each endpoint in each mode, then writes the report.
+        """
+        modes = [mode.strip() for mode in options['modes'].split(',')]
+        if set(modes) - {'client', 'server'}:
+            raise CommandError('--modes must be a comma separated list of: client, server.')
+        if 'server' in modes and importlib.util.find_spec('uvicorn') is None:
+            raise CommandError("The 'uvicorn' package is needed for the server mode, install it with pip.")
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)
+
+        directory = tempfile.TemporaryDirectory()
+        old_name = connection.settings_dict['NAME']
+        connection.settings_dict['TEST'] = {**connection.settings_dict.get('TEST', {}),
+                                            'NAME': os.path.join(directory.name, 'benchmark.sqlite3')}
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            dataset = self.seed(options)
+            endpoints = self.get_endpoints(dataset, options['endpoints'])
+            client = Client()
+            client.force_login(dataset.pop('user'))
+            results = []
+            if 'client' in modes:
+                results += self.run_client(client, endpoints, options)
+            if 'server' in modes:
+                results += self.run_server(client.cookies['sessionid'].value, endpoints, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            directory.cleanup()
+
+        report = {
+            'dataset': {name: options[name] for name in ('labels', 'musicians', 'albums', 'members', 'seed')},
+            'environment': {'python': platform.python_version(), 'django': django.get_version(),
+                            'database': connection.vendor, 'machine': platform.machine()},
+            'results': results,
+        }
+        if baseline is not None:
+            if baseline.get('dataset') != report['dataset']:
+                self.stderr.write('The baseline was measured on another dataset, the comparison may not be fair.')
+            report['comparison'] = compare(results, baseline, options['tolerance'])
+
+        self.write_summary(report)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+        else:
+            self.stdout.write(json.dumps(report, indent=2))
+
+        regressions = [row for row in report.get('comparison', []) if row['regression']]
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f'{len(regressions)} results regressed against the baseline: '
+                               f'{", ".join(row["mode"] + " " + row["endpoint"] for row in regressions)}.')
+
+    def seed(self, options):
+        """Generates the dataset, and returns the user the requests are sent as and the values the endpoints use.
+        """
+        rng = random.Random(options['seed'])
+        words = [a + b for a in SYLLABLES for b in SYLLABLES]
+
+        # An 'Admin' superuser can read every resource and sees every musician, but only retrieves the musicians it
+        # manages, so it is one of the agents.
+        user = User.objects.create_superuser('benchmark', 'benchmark@example.com', None)
+        user.groups.add(Group.objects.get_or_create(name='Admin')[0])
+        agents = [user] + User.objects.bulk_create([User(username=f'agent{index}') for index in range(9)])
+
+        labels = RecordLabel.objects.bulk_create([
+            RecordLabel(name=f'{rng.choice(words).title()} {rng.choice(words).title()} Records',
+                        address=f'{index} Music Lane', email=f'label{index}@example.com')
+            for index in range(options['labels'])
+        ])
+        musicians = Musician.objects.bulk_create([
+            Musician(first_name=rng.choice(words).title(), last_name=rng.choice(words).title(),
+                     instrument=rng.choice(INSTRUMENTS), agent=rng.choice(agents))
+            for _ in range(options['musicians'])
+        ])
+        managed = [musician for musician in musicians if musician.agent_id == user.pk]
+        albums = Album.objects.bulk_create([
+            Album(title=f'{rng.choice(words).title()} {rng.choice(words).title()}',
+                  artist=f'The {rng.choice(words).title()}s', release_date=f'{rng.randint(1960, 2024)}-01-01',
+                  genre=rng.choice(GENRES), label=rng.choice(labels))
+            for _ in range(options['albums'])
+        ])
+
+        # The number of members follows an exponential distribution around the average, and musicians are picked
+        # with Zipf-like weights, so a few of them play on many albums.
+        weights = [1 / (rank + 1) for rank in range(len(musicians))]
+        members = []
+        for album in albums:
+            count = min(round(rng.expovariate(1 / options['members'])) if options['members'] else 0, len(musicians))
+            chosen = set()
+            while len(chosen) < count:
+                chosen.update(rng.choices(range(len(musicians)), weights, k=count - len(chosen)))
+            members += [Album.album_members.through(album_id=album.pk, musician_id=musicians[index].pk)
+                        for index in chosen]
+        Album.album_members.through.objects.bulk_create(members, batch_size=5000)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        return {
+            'user': user,
+            'label': labels[len(labels) // 2].pk if labels else 0,
+            'musician': managed[len(managed) // 2].pk if managed else 0,
+            'album': albums[len(albums) // 2].pk if albums else 0,
+            'label_word': labels[0].name.split()[0] if labels else 'records',
+            'genre': albums[0].genre if albums else 'rock',
+        }
+
+    def get_endpoints(self, dataset, names=None):
+        """Returns the (name, path) of every endpoint measured, or of the named ones.
+        """
+        endpoints = [('index', '/main_app/'), ('api-root', '/main_app/api/')]
+        for prefix, surface in (('', ''), ('async-', 'async/')):
+            api = f'/main_app/api/{surface}'
+            endpoints += [
+                (f'{prefix}record_label-list', f'{api}record_label/'),
+                (f'{prefix}record_label-search', f'{api}record_label/?searchName={dataset["label_word"]}'),
+                (f'{prefix}record_label-ordering', f'{api}record_label/?ordering=-name&page_size=100'),
+                (f'{prefix}record_label-detail', f'{api}record_label/{dataset["label"]}/'),
+                (f'{prefix}musician-list', f'{api}musician/'),
+                (f'{prefix}musician-detail', f'{api}musician/{dataset["musician"]}/'),
+                (f'{prefix}album-list', f'{api}album/'),
+                (f'{prefix}album-search', f'{api}album/?search={dataset["genre"]}'),
+                (f'{prefix}album-detail', f'{api}album/{dataset["album"]}/'),
+            ]
+        if names:
+            names = {name.strip() for name in names.split(',')}
+            unknown = names - {name for name, _ in endpoints}
+            if unknown:
+                raise CommandError(f'Unknown endpoints: {", ".join(sorted(unknown))}.')
+            endpoints = [(name, path) for name, path in endpoints if name in names]
+        return endpoints
+
+    def run_client(self, client, endpoints, options):
+        """Measures each endpoint with sequential requests through the test client.
+        """
+        results = []
+        for name, path in endpoints:
+            cache.clear()
+            for _ in range(options['warmup']):
+                client.get(path)
+            latencies, queries, errors = [], [], 0
+            start = perf_counter()
+            for _ in range(options['requests']):
+                with CaptureQueriesContext(connection) as captured:
+                    request_start = perf_counter()
+                    response = client.get(path)
+                    latency = (perf_counter() - request_start) * 1000
+                if response.status_code == 200:
+                    latencies.append(latency)
+                    queries.append(len(captured))
+                else:
+                    errors += 1
+            results.append({'mode': 'client', 'endpoint': name, 'path': path,
+                            **summarize(latencies, errors, perf_counter() - start, queries)})
+            self.stderr.write(f'client {name}: {results[-1]["requests_per_second"]} req/s')
+        return results
+
+    def run_server(self, session, endpoints, options):
+        """Measures each endpoint with concurrent connections against a uvicorn server using the same database.
+        """
+        headers = {'Cookie': f'{settings.SESSION_COOKIE_NAME}={session}'}
+        environment = {**os.environ, 'DATABASE_NAME': connection.settings_dict['NAME'],
+                       'INSTRUMENTATION_SAMPLE_RATE': '1', 'INSTRUMENTATION_SERVER_TIMING': '1'}
+        # The output goes to a file rather than a pipe, which would block the server once full.
+        output = tempfile.TemporaryFile()
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'config.asgi:application', '--port', str(options['port']),
+             '--log-level', 'warning'],
+            cwd=settings.BASE_DIR, env=environment, stdout=output, stderr=subprocess.STDOUT)
+        results = []
+        try:
+            self.wait_for_server(process, output, options['port'])
+            for name, path in endpoints:
+                # Each server process has its own local memory cache, so it is filled by the warmup requests.
+                for _ in range(options['warmup']):
+                    self.request(options['port'], path, headers)
+                results.append({'mode': 'server', 'endpoint': name, 'path': path,
+                                **self.run_clients(options, path, headers)})
+                self.stderr.write(f'server {name}: {results[-1]["requests_per_second"]} req/s')
+        finally:
+            process.terminate()
+            process.wait()
+        return results
+
+    def wait_for_server(self, process, output, port):
+        """Waits until the server answers, or raises CommandError if it stops or takes too long.
+        """
+        deadline = monotonic() + STARTUP_TIMEOUT
+        while True:
+            if process.poll() is not None:
+                output.seek(0)
+                raise CommandError(f'The server stopped:\n{output.read().decode()}')
+            try:
+                self.request(port, '/main_app/', {})
+                return
+            except OSError:
+                if monotonic() > deadline:
+                    process.kill()
+                    raise CommandError(f'The server did not start within {STARTUP_TIMEOUT} seconds.')
+                sleep(0.2)
+
+    def request(self, port, path, headers):
+        """Sends a single request and returns its status code.
+        """
+        client = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        try:
+            client.request('GET', path, headers=headers)
+            response = client.getresponse()
+            response.read()
+            return response.status
+        finally:
+            client.close()
+
+    def run_clients(self, options, path, headers):
+        """Sends requests from concurrent connections for a number of seconds, and returns the results.
+        """
+        deadline = monotonic() + options['duration']
+        latencies, queries, errors, lock = [], [], [0], threading.Lock()
+
+        def run():
+            client = http.client.HTTPConnection('127.0.0.1', options['port'], timeout=30)
+            timings, counts, failures = [], [], 0
+            while monotonic() < deadline:
+                start = perf_counter()
+                try:
+                    client.request('GET', path, headers=headers)
+                    response = client.getresponse()
+                    response.read()
+                except (OSError, http.client.HTTPException):
+                    failures += 1
+                    client.close()
+                    continue
+                if response.status == 200:
+                    timings.append((perf_counter() - start) * 1000)
+                    match = QUERY_COUNT.search(response.getheader('Server-Timing') or '')
+                    if match:
+                        counts.append(int(match.group(1)))
+                else:
+                    failures += 1
+            client.close()
+            with lock:
+                latencies.extend(timings)
+                queries.extend(counts)
+                errors[0] += failures
+
+        threads = [threading.Thread(target=run) for _ in range(options['clients'])]
+        start = perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return summarize(latencies, errors[0], perf_counter() - start, queries)
+
+    def write_summary(self, report):
+        """Prints a table of the results, with the change against the baseline when there is one.
+        """
+        comparison = {(row['mode'], row['endpoint']): row for row in report.get('comparison', [])}
+        self.stderr.write(f'\n{"mode":<7} {"endpoint":<28} {"req/s":>9} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} '
+                          f'{"queries":>8} {"errors":>7}  {"vs baseline"}')
+        for result in report['results']:
+            row = comparison.get((result['mode'], result['endpoint']))
+            change = ''
+            if row is not None:
+                change = (f'{row["requests_per_second_change"]:+.0%} req/s, {row["p95_ms_change"]:+.0%} p95, '
+                          f'{row["queries_per_request_change"]:+g} queries'
+                          f'{"  REGRESSION" if row["regression"] else ""}')
+            queries = result['queries_per_request']
+            self.stderr.write(f'{result["mode"]:<7} {result["endpoint"]:<28} {result["requests_per_second"]:>9.1f} '
+                              f'{result["p50_ms"]:>8.2f} {result["p95_ms"]:>8.2f} {result["p99_ms"]:>8.2f} '
+                              f'{"-" if queries is None else queries:>8} {result["errors"]:>7}  {change}')
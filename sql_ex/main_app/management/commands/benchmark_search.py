@@ -0,0 +1,91 @@
+"""benchmark_search.py
+
+Management command that compares the latency of the full-text search backend with the 'icontains' search it
+replaced, at increasing numbers of record labels. Run it with:
+
+    python manage.py benchmark_search --rows 1000000
+
+The record labels are generated inside a transaction that is rolled back at the end, so the database is left
+unchanged. The database must be migrated, so the full-text search tables and triggers exist.
+"""
+
+# Import 'random' and 'statistics' to generate deterministic names and summarise the timings.
+import random
+import statistics
+# Import 'perf_counter' to time each search.
+from time import perf_counter
+# Import 'BaseCommand' to define a custom 'manage.py' command.
+from django.core.management.base import BaseCommand
+# Import 'connection' and 'transaction' to gather statistics and roll back the generated rows.
+from django.db import connection, transaction
+# Import the model being searched and the search backends being compared.
+from main_app.models import RecordLabel
+from main_app.search import IcontainsSearchBackend, get_search_backend
+
+# Syllables combined into the made up words used for record label names.
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'ze', 'qua', 'bri', 'dor', 'fen', 'gal', 'hux', 'jin']
+
+
+class Command(BaseCommand):
+    """Benchmarks full-text search against the 'icontains' search at increasing table sizes.
+    """
+    help = 'Compares full-text search latency with the icontains search at increasing numbers of record labels.'
+
+    def add_arguments(self, parser):
+        """Defines the command line options of the benchmark.
+        """
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Number of record labels at the last step.')
+        parser.add_argument('--steps', type=int, default=3, help='Number of table sizes, each 10x the previous one.')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of times each search is timed.')
+        parser.add_argument('--batch-size', type=int, default=10_000, help='Number of rows inserted per batch.')
+        parser.add_argument('--seed', type=int, default=42, help='Seed for the generated names.')
+
+    def handle(self, *args, **options):
+        """Generates record labels up to each table size, then times a first page of results for each search.
+        """
+        backend = get_search_backend()
+        if isinstance(backend, IcontainsSearchBackend):
+            self.stderr.write('The database has no full-text search support, both searches will use icontains.')
+
+        rng = random.Random(options['seed'])
+        words = sorted({a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES})
+        rng.shuffle(words)
+        # A word found in many names, two words rarely found together, and a word that isn't in any name.
+        terms = {'common': words[0], 'rare': f'{words[1]} {words[2]}', 'missing': 'xyzzy'}
+        sizes = [max(options['rows'] // 10 ** step, 1) for step in reversed(range(options['steps']))]
+
+        self.stdout.write(f'{"rows":>10} {"term":>8} {"icontains ms":>13} {"full-text ms":>13} {"speedup":>8}')
+        with transaction.atomic():
+            count = 0
+            for size in sizes:
+                while count < size:
+                    batch = min(options['batch_size'], size - count)
+                    RecordLabel.objects.bulk_create([
+                        RecordLabel(name=' '.join(rng.choice(words) for _ in range(3)) + ' Records',
+                                    address=f'{count + index} Music Lane', email=f'label{count + index}@example.com')
+                        for index in range(batch)
+                    ])
+                    count += batch
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+
+                for name, term in terms.items():
+                    # The previous path: icontains on the name, then the first page in 'id' order.
+                    icontains = self.time(options['repeat'], lambda: list(
+                        RecordLabel.objects.filter(name__icontains=term).order_by('id')[:50]))
+                    full_text = self.time(options['repeat'], lambda: list(
+                        backend.search(RecordLabel.objects.all(), term).order_by('-search_rank')[:50]))
+                    self.stdout.write(f'{size:>10} {name:>8} {icontains:>13.2f} {full_text:>13.2f} '
+                                      f'{icontains / full_text if full_text else 0:>7.1f}x')
+
+            transaction.set_rollback(True)
+
+    def time(self, repeat, function):
+        """Returns the median time of a function in milliseconds.
+        """
+        timings = []
+        for _ in range(repeat):
+            start = perf_counter()
+            function()
+            timings.append((perf_counter() - start) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,107 @@
+"""benchmark_serializers.py
+
+Management command that compares the throughput of the regular AlbumSerializer with the row serializer compiled
+from it (see 'main_app/row_serializers.py'), at increasing page sizes. Run it with:
+
+    python manage.py benchmark_serializers --albums 2000
+
+Each page is timed twice: the serialization alone, from already fetched instances or rows (the row serializer still
+runs its query for the album members, which the instances have prefetched), and end to end, with every query that
+fetches the page. The albums are generated inside a transaction that is rolled back at the end, so the
+database is left unchanged.
+"""
+
+# Import 'statistics' to summarise the timings.
+import statistics
+# Import 'perf_counter' to time each serialization.
+from time import perf_counter
+# Import 'BaseCommand' to define a custom 'manage.py' command.
+from django.core.management.base import BaseCommand
+# Import 'transaction' to roll back the generated rows.
+from django.db import transaction
+# Import the 'User' model to create the agents of the generated musicians.
+from django.contrib.auth.models import User
+# Import the models, the serializer and query planner of the regular path, and the compiled row serializer.
+from main_app.models import RecordLabel, Musician, Album
+from main_app.serializers import AlbumSerializer
+from main_app.querysets import plan_queryset
+from main_app.row_serializers import get_row_serializer
+
+
+class Command(BaseCommand):
+    """Benchmarks the regular album serializer against the compiled row serializer at increasing page sizes.
+    """
+    help = 'Compares the throughput of AlbumSerializer with the row serializer compiled from it.'
+
+    def add_arguments(self, parser):
+        """Defines the command line options of the benchmark.
+        """
+        parser.add_argument('--albums', type=int, default=2000, help='Number of albums generated.')
+        parser.add_argument('--members', type=int, default=4, help='Number of members of each album.')
+        parser.add_argument('--page-sizes', default='50,200,500', help='Comma separated page sizes to time.')
+        parser.add_argument('--repeat', type=int, default=20, help='Number of times each page is timed.')
+
+    def handle(self, *args, **options):
+        """Generates albums, then times each page size with both serializers.
+        """
+        page_sizes = [int(size) for size in options['page_sizes'].split(',')]
+        row_serializer = get_row_serializer(AlbumSerializer)
+
+        self.stdout.write(f'{"page":>6} {"step":>12} {"drf ms":>9} {"rows ms":>9} {"drf/s":>9} {"rows/s":>9} '
+                          f'{"speedup":>8}')
+        with transaction.atomic():
+            self.generate(options['albums'], options['members'])
+            for size in page_sizes:
+                queryset = Album.objects.order_by('pk')[:size]
+                instances = list(plan_queryset(queryset, AlbumSerializer))
+                rows = list(row_serializer.get_queryset(queryset))
+                timings = {
+                    'serialize': (
+                        lambda: AlbumSerializer(instances, many=True).data,
+                        lambda: row_serializer.serialize(rows),
+                    ),
+                    'end to end': (
+                        lambda: AlbumSerializer(list(plan_queryset(queryset, AlbumSerializer)), many=True).data,
+                        lambda: row_serializer.serialize(list(row_serializer.get_queryset(queryset))),
+                    ),
+                }
+                for step, (regular, compiled) in timings.items():
+                    regular = self.time(options['repeat'], regular)
+                    compiled = self.time(options['repeat'], compiled)
+                    self.stdout.write(f'{len(instances):>6} {step:>12} {regular:>9.2f} {compiled:>9.2f} '
+                                      f'{len(instances) * 1000 / regular:>9.0f} '
+                                      f'{len(instances) * 1000 / compiled:>9.0f} {regular / compiled:>7.1f}x')
+
+            transaction.set_rollback(True)
+
+    def generate(self, albums, members):
+        """Creates the albums, each on one of a few record labels and with 'members' musicians.
+        """
+        agent = User.objects.create_user('benchmark_agent')
+        labels = RecordLabel.objects.bulk_create([
+            RecordLabel(name=f'Label {index}', address=f'{index} Music Lane', email=f'label{index}@example.com')
+            for index in range(10)
+        ])
+        musicians = Musician.objects.bulk_create([
+            Musician(first_name=f'First {index}', last_name=f'Last {index}', instrument='Guitar', agent=agent)
+            for index in range(100)
+        ])
+        created = Album.objects.bulk_create([
+            Album(title=f'Album {index}', artist=f'Artist {index}', release_date='2024-01-01', genre='Rock',
+                  label=labels[index % len(labels)])
+            for index in range(albums)
+        ])
+        Album.album_members.through.objects.bulk_create([
+            Album.album_members.through(album_id=album.pk, musician_id=musicians[(index + member) % 100].pk)
+            for index, album in enumerate(created) for member in range(members)
+        ])
+
+    def time(self, repeat, function):
+        """Returns the median time of a function in milliseconds.
+        """
+        timings = []
+        for _ in range(repeat):
+            start = perf_counter()
+            function()
+            timings.append((perf_counter() - start) * 1000)
+        return statistics.median(timings)
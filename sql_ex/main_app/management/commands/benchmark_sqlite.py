@@ -0,0 +1,141 @@
+"""benchmark_sqlite.py
+
+Management command that compares the SQLite profiles of 'SQLITE_PROFILES' (see 'config/settings.py') under
+concurrent writers and readers. Run it with:
+
+    python manage.py benchmark_sqlite --writers 8 --readers 4 --duration 5
+
+Each profile gets a new database file in a temporary directory, with the record label table, and is measured for
+'--duration' seconds by threads that each act as a request handler with their own connection:
+    - writers: check whether a record label name is taken, then create it in the same transaction, like a view
+      validating then saving.
+    - readers: read a page of record labels.
+Connections are closed or kept between requests the same way as by Django's request handler, following the
+'CONN_MAX_AGE' of the profile. The report shows the committed writes and the reads per second, the write latency
+percentiles and the requests that failed with "database is locked".
+"""
+
+# Import 'os', 'tempfile' and 'threading' to run the writers and readers against a temporary database file.
+import os
+import tempfile
+import threading
+# Import the timers.
+from time import monotonic, perf_counter
+# Import 'BaseCommand' and 'CommandError' to define a custom 'manage.py' command.
+from django.core.management.base import BaseCommand, CommandError
+# Import the settings module to read the profiles, and the connections, transactions and errors of the database.
+from django.conf import settings
+from django.db import OperationalError, connections, transaction
+# Import the model written and read by the threads.
+from main_app.models import RecordLabel
+
+
+def percentile(values, fraction):
+    """Returns the value at a fraction (e.g. 0.99) of sorted values, or 0 if there are none.
+    """
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+
+class Command(BaseCommand):
+    """Benchmarks the write throughput and lock errors of the SQLite profiles under concurrency.
+    """
+    help = 'Compares the write and read throughput and "database is locked" errors of the SQLite profiles.'
+
+    def add_arguments(self, parser):
+        """Defines the command line options of the benchmark.
+        """
+        parser.add_argument('--profiles', default=','.join(settings.SQLITE_PROFILES),
+                            help='Comma separated SQLite profiles to compare.')
+        parser.add_argument('--writers', type=int, default=8, help='Number of concurrent writing threads.')
+        parser.add_argument('--readers', type=int, default=4, help='Number of concurrent reading threads.')
+        parser.add_argument('--duration', type=float, default=5, help='Number of seconds each profile is measured.')
+        parser.add_argument('--rows', type=int, default=10_000, help='Number of record labels created beforehand.')
+
+    def handle(self, *args, **options):
+        """Measures each profile on its own database file, then prints the results.
+        """
+        profiles = [profile.strip() for profile in options['profiles'].split(',')]
+        unknown = set(profiles) - set(settings.SQLITE_PROFILES)
+        if unknown:
+            raise CommandError(f'Unknown profiles: {", ".join(sorted(unknown))}.')
+
+        self.stdout.write(f'{"profile":<12} {"writes/s":>9} {"reads/s":>9} {"p50 ms":>8} {"p99 ms":>8} '
+                          f'{"locked":>7}')
+        with tempfile.TemporaryDirectory() as directory:
+            for profile in profiles:
+                alias = f'benchmark_{profile}'
+                connections.settings[alias] = connections.configure_settings({**connections.settings, alias: {
+                    **settings.DATABASES['default'], **settings.SQLITE_PROFILES[profile],
+                    'NAME': os.path.join(directory, f'{profile}.sqlite3'),
+                }})[alias]
+                try:
+                    result = self.run_profile(alias, options)
+                finally:
+                    connections[alias].close()
+                    del connections.settings[alias]
+                self.stdout.write(f'{profile:<12} {result["writes"] / options["duration"]:>9.0f} '
+                                  f'{result["reads"] / options["duration"]:>9.0f} '
+                                  f'{percentile(result["latencies"], 0.5):>8.2f} '
+                                  f'{percentile(result["latencies"], 0.99):>8.2f} {result["locked"]:>7}')
+
+    def run_profile(self, alias, options):
+        """Creates the table on the profile's database, then runs the writers and readers, and returns their totals.
+        """
+        with connections[alias].schema_editor() as editor:
+            editor.create_model(RecordLabel)
+        RecordLabel.objects.using(alias).bulk_create([
+            RecordLabel(name=f'Label {number}', address=f'{number} Music Lane', email=f'label{number}@example.com')
+            for number in range(options['rows'])
+        ])
+        connections[alias].close()
+
+        result = {'writes': 0, 'reads': 0, 'locked': 0, 'latencies': []}
+        lock = threading.Lock()
+        deadline = monotonic() + options['duration']
+
+        def write(number):
+            with transaction.atomic(using=alias):
+                name = f'Writer {threading.get_ident()} {number}'
+                if not RecordLabel.objects.using(alias).filter(name=name).exists():
+                    RecordLabel.objects.using(alias).create(name=name, address='1 Music Lane',
+                                                            email='writer@example.com')
+
+        def read(number):
+            list(RecordLabel.objects.using(alias).order_by('-pk')[:50])
+
+        def run(operation):
+            connection = connections[alias]
+            writes, reads, locked, latencies, number = 0, 0, 0, [], 0
+            while monotonic() < deadline:
+                # Like Django's request handler, close the connection before and after each request if it's too old.
+                connection.close_if_unusable_or_obsolete()
+                start = perf_counter()
+                try:
+                    operation(number)
+                except OperationalError as error:
+                    if 'locked' not in str(error):
+                        raise
+                    locked += 1
+                else:
+                    if operation is write:
+                        writes += 1
+                        latencies.append((perf_counter() - start) * 1000)
+                    else:
+                        reads += 1
+                connection.close_if_unusable_or_obsolete()
+                number += 1
+            connection.close()
+            with lock:
+                result['writes'] += writes
+                result['reads'] += reads
+                result['locked'] += locked
+                result['latencies'] += latencies
+
+        threads = [threading.Thread(target=run, args=(write,)) for _ in range(options['writers'])]
+        threads += [threading.Thread(target=run, args=(read,)) for _ in range(options['readers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        result['latencies'].sort()
+        return result
@@ -0,0 +1,185 @@
+"""loadtest.py
+
+Management command that compares the sync ViewSets ('api/') with the async ViewSets ('api/async/') under uvicorn,
+at increasing numbers of concurrent connections. Run it with:
+
+    python manage.py loadtest --username admin --password secret --clients 8,32,128
+
+A single uvicorn server (ASGI) is started, so both surfaces are served the same way: the sync ViewSets each run in
+a thread through 'sync_to_async', the async ViewSets on the event loop. For each resource and number of connections,
+requests are sent from keep-alive connections for '--duration' seconds and the req/s and p50/p99 latencies are
+reported. The user is authenticated with HTTP Basic authentication and needs access to every resource tested
+(e.g. an 'Admin' user for albums).
+
+The server runs on the 'uvicorn' package from 'requirements.txt'. The clients are Python threads in this process, so
+high connection counts measure the client as well as the server.
+"""
+
+# Import 'base64' to build the Basic authentication header, 'csv' to save the results, 'statistics' to summarise
+# them, 'os', 'subprocess', 'sys' and 'tempfile' to run the server, 'importlib.util' to check it is installed and
+# 'threading' to run the clients.
+import base64
+import csv
+import importlib.util
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+# Import 'http.client' to send requests over keep-alive connections, and the timers.
+import http.client
+from time import monotonic, perf_counter, sleep
+# Import 'BaseCommand' and 'CommandError' to define a custom 'manage.py' command.
+from django.core.management.base import BaseCommand, CommandError
+# Import the settings module to find the project directory.
+from django.conf import settings
+
+# Path prefix of each API surface.
+SURFACES = {'sync': '/main_app/api/', 'async': '/main_app/api/async/'}
+
+# Number of seconds the server has to start answering.
+STARTUP_TIMEOUT = 30
+
+
+class Command(BaseCommand):
+    """Load tests the sync and async ViewSets under uvicorn at increasing numbers of concurrent connections.
+    """
+    help = 'Compares req/s and p99 latency of the sync and async ViewSets under uvicorn.'
+
+    def add_arguments(self, parser):
+        """Defines the command line options of the load test.
+        """
+        parser.add_argument('--username', required=True, help='User the requests are authenticated as.')
+        parser.add_argument('--password', required=True, help='Password of the user.')
+        parser.add_argument('--resources', default='album,musician,record_label',
+                            help='Comma separated resources to request.')
+        parser.add_argument('--query', default='page_size=50', help='Query string added to every request.')
+        parser.add_argument('--clients', default='8,32,128', help='Comma separated numbers of concurrent connections.')
+        parser.add_argument('--duration', type=float, default=10, help='Number of seconds each test is measured.')
+        parser.add_argument('--warmup', type=float, default=2, help='Number of seconds of requests not measured.')
+        parser.add_argument('--workers', type=int, default=1, help='Number of uvicorn worker processes.')
+        parser.add_argument('--port', type=int, default=8766, help='Port the server listens on.')
+        parser.add_argument('--csv', help='File to save the results to.')
+
+    def handle(self, *args, **options):
+        """Starts the server, runs every combination of resource, surface and connections, then prints the results.
+        """
+        if importlib.util.find_spec('uvicorn') is None:
+            raise CommandError("The 'uvicorn' package is needed to run the load test, install 'requirements.txt'.")
+        credentials = base64.b64encode(f'{options["username"]}:{options["password"]}'.encode()).decode()
+        headers = {'Authorization': f'Basic {credentials}'}
+        resources = [resource.strip() for resource in options['resources'].split(',')]
+        client_counts = [int(count) for count in options['clients'].split(',')]
+
+        rows = []
+        process = self.start_server(options, headers)
+        try:
+            for resource in resources:
+                for surface, prefix in SURFACES.items():
+                    path = f'{prefix}{resource}/?{options["query"]}'
+                    status = self.request(options['port'], path, headers)
+                    if status != 200:
+                        raise CommandError(f'GET {path} returned {status}, check the user can access {resource}.')
+                    for clients in client_counts:
+                        self.run_clients(options['port'], path, headers, clients, options['warmup'])
+                        result = self.run_clients(options['port'], path, headers, clients, options['duration'])
+                        rows.append({'resource': resource, 'surface': surface, 'clients': clients, **result})
+                        self.stdout.write(f'{resource} {surface} {clients} connections: '
+                                          f'{result["requests_per_second"]:.1f} req/s')
+        finally:
+            process.terminate()
+            process.wait()
+
+        self.stdout.write(f'\n{"resource":<14} {"surface":<7} {"clients":>7} {"req/s":>9} {"p50 ms":>8} '
+                          f'{"p99 ms":>8} {"errors":>7}')
+        for row in rows:
+            self.stdout.write(f'{row["resource"]:<14} {row["surface"]:<7} {row["clients"]:>7} '
+                              f'{row["requests_per_second"]:>9.1f} {row["p50_ms"]:>8.1f} {row["p99_ms"]:>8.1f} '
+                              f'{row["errors"]:>7}')
+
+        if options['csv'] and rows:
+            with open(options['csv'], 'w', newline='') as file:
+                writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+                writer.writeheader()
+                writer.writerows(rows)
+
+    def start_server(self, options, headers):
+        """Starts uvicorn and returns its process once it answers.
+        """
+        # The output goes to a file rather than a pipe, which would block the server once full.
+        output = tempfile.TemporaryFile()
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'config.asgi:application', '--workers', str(options['workers']),
+             '--port', str(options['port']), '--log-level', 'warning'],
+            cwd=settings.BASE_DIR, env=os.environ.copy(), stdout=output, stderr=subprocess.STDOUT)
+        deadline = monotonic() + STARTUP_TIMEOUT
+        while True:
+            if process.poll() is not None:
+                output.seek(0)
+                raise CommandError(f'The server stopped:\n{output.read().decode()}')
+            try:
+                self.request(options['port'], '/main_app/', headers)
+                return process
+            except OSError:
+                if monotonic() > deadline:
+                    process.kill()
+                    raise CommandError(f'The server did not start within {STARTUP_TIMEOUT} seconds.')
+                sleep(0.2)
+
+    def request(self, port, path, headers):
+        """Sends a single request and returns its status code.
+        """
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        try:
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        finally:
+            connection.close()
+
+    def run_clients(self, port, path, headers, clients, duration):
+        """Sends requests from concurrent connections for a number of seconds, and returns the results.
+        """
+        deadline = monotonic() + duration
+        latencies, errors, lock = [], [0], threading.Lock()
+
+        def client():
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            timings, failures = [], 0
+            while monotonic() < deadline:
+                start = perf_counter()
+                try:
+                    connection.request('GET', path, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                except (OSError, http.client.HTTPException):
+                    failures += 1
+                    connection.close()
+                    continue
+                if response.status == 200:
+                    timings.append((perf_counter() - start) * 1000)
+                else:
+                    failures += 1
+            connection.close()
+            with lock:
+                latencies.extend(timings)
+                errors[0] += failures
+
+        threads = [threading.Thread(target=client) for _ in range(clients)]
+        start = perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = perf_counter() - start
+
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'errors': errors[0],
+            'requests_per_second': len(latencies) / elapsed,
+            'p50_ms': statistics.median(latencies) if latencies else 0,
+            'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0,
+        }
@@ -0,0 +1,238 @@
+"""seed.py
+
+Management command that fills the database with generated record labels, musicians, albums and album members, to
+reproduce a production sized dataset locally. Run it with:
+
+    python manage.py seed --labels 10000 --musicians 1000000 --albums 2000000 --members 4
+
+The rows are generated from '--seed' in chunks of '--chunk-size' rows, each from its own random generator, so the
+same seed on an empty database always gives the same rows, whatever the number of '--workers'. The chunks are
+generated by a pool of worker processes while the previous ones are written with 'bulk_create', one transaction per
+chunk. SQLite only allows one writer at a time, so the writes stay in this process, while generating and building
+the next chunks runs in parallel with them.
+
+The musicians are managed by '--agents' users in the 'Talent Agents' group, created if they don't exist yet. Each
+album has an exponentially distributed number of members around '--members', and a few popular musicians play on
+many albums, as on real records. The new rows are numbered after the existing ones, and the cached API responses
+are invalidated at the end, since 'bulk_create' doesn't send the signals that normally do it.
+"""
+
+# Import 'os' to count the CPUs, 'random' to generate the rows, 'deque' to keep track of the chunks being generated,
+# and the process pool that generates them.
+import os
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+# Import 'perf_counter' to time the writes.
+from time import perf_counter
+# Import 'django' to set up the worker processes, and 'BaseCommand' and 'CommandError' to define a custom 'manage.py'
+# command.
+import django
+from django.core.management.base import BaseCommand, CommandError
+# Import 'Max' to number the new rows after the existing ones, and 'transaction' to write each chunk at once.
+from django.db.models import Max
+from django.db import transaction
+# Import the User and Group models and 'make_password' to create the agents.
+from django.contrib.auth.models import Group, User
+from django.contrib.auth.hashers import make_password
+# Import the models being seeded, and the helpers invalidating the cached responses and authorization.
+from main_app.models import RecordLabel, Musician, Album
+from main_app.caching import invalidate_model_responses
+from main_app.authorization import invalidate_authorization
+
+# Syllables combined into the made up words used for names, and the genres and instruments picked from.
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'ze', 'qua', 'bri', 'dor', 'fen', 'gal', 'hux', 'jin']
+WORDS = [a + b for a in SYLLABLES for b in SYLLABLES]
+GENRES = ['Rock', 'Jazz', 'Pop', 'Metal', 'Folk', 'Blues', 'Soul', 'Electronic', 'Classical', 'Hip Hop']
+INSTRUMENTS = ['Guitar', 'Bass', 'Drums', 'Vocals', 'Keys', 'Violin', 'Saxophone', 'Trumpet']
+
+
+def get_random(seed, kind, chunk):
+    """Returns the random generator of a chunk, which only depends on the seed, the kind of rows and the chunk.
+    """
+    return random.Random(f'{seed}:{kind}:{chunk}')
+
+
+def get_popular_index(rng, count):
+    """Returns an index below 'count'. Most are picked uniformly, and a fifth from a log-uniform (Zipf-like)
+    distribution, so the first few indexes are picked far more often than the others.
+    """
+    return rng.randrange(count) if rng.random() < 0.8 else int(count ** rng.random()) - 1
+
+
+def generate_labels(rng, ids, context):
+    """Returns the (id, name, address, email) of record labels.
+    """
+    return [(pk, f'{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} Records',
+             f'{rng.randint(1, 999)} {rng.choice(WORDS).title()} Street', f'label{pk}@example.com')
+            for pk in ids]
+
+
+def generate_musicians(rng, ids, context):
+    """Returns the (id, first_name, last_name, instrument, agent_id) of musicians.
+    """
+    return [(pk, rng.choice(WORDS).title(), rng.choice(WORDS).title(), rng.choice(INSTRUMENTS),
+             rng.choice(context['agents']))
+            for pk in ids]
+
+
+def generate_albums(rng, ids, context):
+    """Returns the (id, title, artist, release_date, genre, label_id) of albums.
+    """
+    first_label, labels = context['labels']
+    return [(pk, f'{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}', f'The {rng.choice(WORDS).title()}s',
+             f'{rng.randint(1960, 2024)}-{rng.randint(1, 12):02}-{rng.randint(1, 28):02}', rng.choice(GENRES),
+             first_label + get_popular_index(rng, labels))
+            for pk in ids]
+
+
+def generate_members(rng, ids, context):
+    """Returns the (album_id, musician_id) of the members of albums.
+    """
+    first_musician, musicians = context['musicians']
+    rows = []
+    for album_id in ids:
+        count = min(round(rng.expovariate(1 / context['members'])) if context['members'] else 0, musicians)
+        chosen = set()
+        while len(chosen) < count:
+            chosen.add(first_musician + get_popular_index(rng, musicians))
+        rows += [(album_id, musician_id) for musician_id in sorted(chosen)]
+    return rows
+
+
+# Function generating each kind of rows, in the order they are written.
+GENERATORS = {
+    'labels': generate_labels,
+    'musicians': generate_musicians,
+    'albums': generate_albums,
+    'members': generate_members,
+}
+
+
+def generate_chunk(kind, seed, chunk, start, stop, context):
+    """Returns the rows of a chunk, for the ids from 'start' up to 'stop'. Runs in the worker processes.
+    """
+    return GENERATORS[kind](get_random(seed, kind, chunk), range(start, stop), context)
+
+
+def build_instances(kind, rows):
+    """Returns the unsaved model instances of generated rows.
+    """
+    if kind == 'labels':
+        return [RecordLabel(id=pk, name=name, address=address, email=email) for pk, name, address, email in rows]
+    if kind == 'musicians':
+        return [Musician(id=pk, first_name=first_name, last_name=last_name, instrument=instrument, agent_id=agent_id)
+                for pk, first_name, last_name, instrument, agent_id in rows]
+    if kind == 'albums':
+        return [Album(id=pk, title=title, artist=artist, release_date=release_date, genre=genre, label_id=label_id)
+                for pk, title, artist, release_date, genre, label_id in rows]
+    return [Album.album_members.through(album_id=album_id, musician_id=musician_id) for album_id, musician_id in rows]
+
+
+def get_next_id(model):
+    """Returns the id following the largest one of a model's table.
+    """
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+class Command(BaseCommand):
+    """Seeds the database with generated record labels, musicians, albums and album members.
+    """
+    help = 'Generates deterministic record labels, musicians, albums and album members and reports rows per second.'
+
+    def add_arguments(self, parser):
+        """Defines the command line options of the seed.
+        """
+        parser.add_argument('--labels', type=int, default=1000, help='Number of record labels.')
+        parser.add_argument('--agents', type=int, default=100, help='Number of talent agents managing the musicians.')
+        parser.add_argument('--musicians', type=int, default=100_000, help='Number of musicians.')
+        parser.add_argument('--albums', type=int, default=200_000, help='Number of albums.')
+        parser.add_argument('--members', type=float, default=4, help='Average number of members of an album.')
+        parser.add_argument('--seed', type=int, default=42, help='Seed for the generated rows.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of processes generating the rows (0 generates them in this process).')
+        parser.add_argument('--chunk-size', type=int, default=10_000, help='Number of rows generated per chunk.')
+
+    def handle(self, *args, **options):
+        """Creates the agents, then generates and writes each kind of rows, and reports the rows per second.
+        """
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1.')
+        if options['musicians'] and options['agents'] < 1:
+            raise CommandError('--agents must be at least 1 to seed musicians.')
+        if options['albums'] and not options['labels'] and not RecordLabel.objects.exists():
+            raise CommandError('--labels must be at least 1 to seed albums.')
+
+        start = perf_counter()
+        agents = self.create_agents(options['agents'])
+        first_label, first_musician, first_album = get_next_id(RecordLabel), get_next_id(Musician), get_next_id(Album)
+        # Albums are only given the new labels and members only the new musicians, unless there are none.
+        labels = (first_label, options['labels']) if options['labels'] else (1, first_label - 1)
+        musicians = (first_musician, options['musicians']) if options['musicians'] else (1, first_musician - 1)
+        context = {'agents': agents, 'labels': labels, 'musicians': musicians, 'members': options['members']}
+        plan = [
+            ('labels', first_label, options['labels']),
+            ('musicians', first_musician, options['musicians']),
+            ('albums', first_album, options['albums']),
+            ('members', first_album, options['albums'] if musicians[1] else 0),
+        ]
+        tasks = [(kind, options['seed'], chunk, chunk_start, min(chunk_start + options['chunk_size'], first + count),
+                  context)
+                 for kind, first, count in plan
+                 for chunk, chunk_start in enumerate(range(first, first + count, options['chunk_size']))]
+
+        totals = {kind: [0, 0.0] for kind in GENERATORS}
+        for kind, rows in self.generate(tasks, options['workers']):
+            write_start = perf_counter()
+            instances = build_instances(kind, rows)
+            if instances:
+                with transaction.atomic():
+                    type(instances[0]).objects.bulk_create(instances)
+            totals[kind][0] += len(rows)
+            totals[kind][1] += perf_counter() - write_start
+        for model in (RecordLabel, Musician, Album):
+            invalidate_model_responses(model)
+        elapsed = perf_counter() - start
+
+        self.stdout.write(f'{"rows":<10} {"count":>10} {"write s":>9} {"rows/s":>10}')
+        for kind, (count, seconds) in totals.items():
+            self.stdout.write(f'{kind:<10} {count:>10} {seconds:>9.2f} {count / seconds if seconds else 0:>10.0f}')
+        total = sum(count for count, _ in totals.values())
+        self.stdout.write(f'{"total":<10} {total:>10} {elapsed:>9.2f} {total / elapsed if elapsed else 0:>10.0f}')
+
+    def create_agents(self, count):
+        """Returns the ids of 'count' users in the 'Talent Agents' group, creating those that don't exist yet.
+        """
+        usernames = [f'seed_agent{number}' for number in range(count)]
+        existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        # The agents can't log in until a password is set, and they all share one hash to save time.
+        password = make_password(None)
+        User.objects.bulk_create([User(username=username, password=password)
+                                  for username in usernames if username not in existing])
+        ids = list(User.objects.filter(username__in=usernames).order_by('pk').values_list('pk', flat=True))
+        group, _ = Group.objects.get_or_create(name='Talent Agents')
+        User.groups.through.objects.bulk_create([User.groups.through(user_id=pk, group_id=group.pk) for pk in ids],
+                                                ignore_conflicts=True)
+        # 'bulk_create' doesn't send 'm2m_changed', so the cached groups of the agents are removed here.
+        invalidate_authorization(ids)
+        return ids
+
+    def generate(self, tasks, workers):
+        """Yields the (kind, rows) of each task in order, generated by the worker processes while the previous ones
+        are written. At most two chunks per worker are waiting, so the memory used doesn't grow with the dataset.
+        """
+        if not workers:
+            for task in tasks:
+                yield task[0], generate_chunk(*task)
+            return
+
+        with ProcessPoolExecutor(workers, initializer=django.setup) as executor:
+            pending = deque()
+            for task in tasks:
+                pending.append((task[0], executor.submit(generate_chunk, *task)))
+                if len(pending) >= workers * 2:
+                    kind, future = pending.popleft()
+                    yield kind, future.result()
+            while pending:
+                kind, future = pending.popleft()
+                yield kind, future.result()
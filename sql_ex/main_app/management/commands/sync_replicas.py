@@ -0,0 +1,46 @@
+"""sync_replicas.py
+
+Management command that copies the primary SQLite database into its read replicas (see 'config/replicas.py'), to
+try the replica routing locally. Run it with:
+
+    DATABASE_REPLICAS=replica1.sqlite3,replica2.sqlite3 python manage.py sync_replicas --interval 1
+
+Each copy uses SQLite's online backup API, so the primary can be used while it runs. With '--interval', the replicas
+are copied again every '--interval' seconds until the command is stopped, which gives them a replication lag like
+the one of a real replica. The server must be started with the same 'DATABASE_REPLICAS'.
+"""
+
+# Import the timers.
+from time import perf_counter, sleep
+# Import 'BaseCommand' and 'CommandError' to define a custom 'manage.py' command.
+from django.core.management.base import BaseCommand, CommandError
+# Import the helpers listing the replicas and copying the primary into them.
+from config.replicas import get_replicas, sync_replicas
+
+
+class Command(BaseCommand):
+    """Copies the primary SQLite database into its read replicas, once or periodically.
+    """
+    help = 'Copies the primary SQLite database into the read replicas of the DATABASE_REPLICAS setting.'
+
+    def add_arguments(self, parser):
+        """Defines the command line options of the copy.
+        """
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Number of seconds between copies (0 copies the replicas once).')
+
+    def handle(self, *args, **options):
+        """Copies the primary into each replica, and repeats it every '--interval' seconds if set.
+        """
+        if not get_replicas():
+            raise CommandError('No replicas are configured, set the DATABASE_REPLICAS environment variable.')
+        while True:
+            start = perf_counter()
+            try:
+                aliases = sync_replicas()
+            except ValueError as error:
+                raise CommandError(str(error))
+            self.stdout.write(f'Copied the primary into {", ".join(aliases)} in {perf_counter() - start:.3f}s.')
+            if not options['interval']:
+                return
+            sleep(options['interval'])
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.13 on 2026-10-17 19:47
+
+from django.db import migrations, models
+
+
+# Django's 'icontains' lookup is written as UPPER("name") LIKE UPPER('%...%') on PostgreSQL, so a trigram index on
+# the same expression lets the 'searchName' filter use an index. Other backends have no trigram support and skip it.
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS recordlabel_name_trgm_idx '
+        'ON main_app_recordlabel USING gin (UPPER(name) gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS recordlabel_name_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0003_alter_musician_agent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recordlabel',
+            index=models.Index(fields=['name', 'id'], name='recordlabel_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recordlabel',
+            index=models.Index(fields=['address', 'id'], name='recordlabel_address_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recordlabel',
+            index=models.Index(fields=['email', 'id'], name='recordlabel_email_id_idx'),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,27 @@
+# Creates the full-text search tables (SQLite FTS5) or columns (PostgreSQL tsvector) used by 'main_app/search.py'.
+# The schema isn't described by the models, so it is created with the same function the app uses to repair it.
+
+from django.db import migrations
+
+from main_app.search import drop_search_schema, ensure_search_schema
+
+
+def create_search_schema(apps, schema_editor):
+    models = [apps.get_model('main_app', 'RecordLabel'), apps.get_model('main_app', 'Album')]
+    ensure_search_schema(schema_editor.connection, models)
+
+
+def remove_search_schema(apps, schema_editor):
+    models = [apps.get_model('main_app', 'RecordLabel'), apps.get_model('main_app', 'Album')]
+    drop_search_schema(schema_editor.connection, models)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0004_recordlabel_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_schema, remove_search_schema),
+    ]
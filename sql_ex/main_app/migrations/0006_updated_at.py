@@ -0,0 +1,30 @@
+# Generated by Django 5.1.13 on 2026-10-17 20:17
+
+from django.db import migrations, models
+
+
+# Existing rows get the time of the migration. On SQLite the tables are rebuilt to add the columns, which drops the
+# full-text search triggers, they are re-created by 'repair_search_schema' in 'signals.py' once 'migrate' finishes.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0005_full_text_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Last Updated'),
+        ),
+        migrations.AddField(
+            model_name='musician',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Last Updated'),
+        ),
+        migrations.AddField(
+            model_name='recordlabel',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Last Updated'),
+        ),
+    ]
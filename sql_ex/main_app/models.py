@@ -21,6 +21,19 @@ class RecordLabel(models.Model):
     name = models.CharField('Label Name', max_length=100)
     address = models.CharField('Address', max_length=300)
     email = models.EmailField('Contact Email')
+    # Time of the last change, set on every save. The API uses it to answer conditional requests (see 'views.py').
+    updated_at = models.DateTimeField('Last Updated', auto_now=True, db_index=True)
+
+    class Meta:
+        """Configures the model. Indexes are listed here so that Django creates them in the migrations.
+        """
+        indexes = [
+            # Each field that record labels can be ordered by is indexed together with 'id', the tie breaker used by
+            # the keyset pagination. This lets every page, and exact matches on 'name', be read straight from an index.
+            models.Index(fields=['name', 'id'], name='recordlabel_name_id_idx'),
+            models.Index(fields=['address', 'id'], name='recordlabel_address_id_idx'),
+            models.Index(fields=['email', 'id'], name='recordlabel_email_id_idx'),
+        ]
     
     def __str__(self):
         """Returns a string representation of the model, typically used in the Django admin site
@@ -36,6 +49,8 @@ class Musician(models.Model):
     # The agent field creates a ForeignKey relationship to the PrimaryKey ('id') of the imported 'User' model.
     # This links each musician to the 'id' of a specific user ('agent') who manages them.
     agent = models.ForeignKey(User, on_delete = models.CASCADE, blank = True)
+    # Time of the last change, set on every save. The API uses it to answer conditional requests (see 'views.py').
+    updated_at = models.DateTimeField('Last Updated', auto_now=True, db_index=True)
     
     def __str__(self):
         """Returns a string representation of the model, typically used in the Django admin site
@@ -56,6 +71,8 @@ class Album(models.Model):
     # This allows each album to have multiple musicians, and each musician to be part of multiple albums.
     # Django automatically creates a linking table using the 'id' fields from corresponding tables ('Album' and 'Musician').
     album_members = models.ManyToManyField(Musician, blank=True, verbose_name='Album Members')
+    # Time of the last change, set on every save. Adding or removing album members also updates it (see 'signals.py').
+    updated_at = models.DateTimeField('Last Updated', auto_now=True, db_index=True)
 
     def __str__(self):
         """Returns a string representation of the model, typically used in the Django admin site
@@ -0,0 +1,178 @@
+"""pagination.py
+
+This file defines the pagination classes used by the API views. Pagination splits large list responses into pages,
+so that a request never has to serialize the whole table at once.
+
+The keyset (cursor) pagination below remembers the position of the last row of a page, rather than a page number
+or offset. The next page is then fetched with a 'WHERE (ordering field, id) > (last value, last id)' style filter,
+so the database can seek straight to the right place in an index. This keeps deep pages just as cheap as the first
+one, whereas 'OFFSET 100000' has to step over every skipped row.
+"""
+
+# Import 'base64' and 'json' to encode the position of a page into an opaque cursor string.
+import base64
+import json
+# Import 'Q' to combine the filters that select rows after the current position, and the error raised by fields
+# for values they can't store.
+from django.db.models import Q
+from django.core.exceptions import ValidationError
+# Import the pagination base classes, exceptions and URL helpers from Django REST Framework.
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(value, pk, reverse=False):
+    """Encodes a page position (ordering value, primary key and direction) into a URL safe cursor string.
+    """
+    payload = json.dumps({'v': value, 'id': pk, 'r': reverse}, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Decodes a cursor string into a (value, pk, reverse) tuple. Raises ValueError for an invalid cursor.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        return payload['v'], payload['id'], bool(payload.get('r', False))
+    except (TypeError, KeyError, UnicodeError, json.JSONDecodeError, base64.binascii.Error) as error:
+        raise ValueError('Invalid cursor') from error
+
+
+def get_keyset_ordering(queryset):
+    """Returns the (field, descending) pair that a queryset is ordered by.
+
+    Only the first ordering term is used for the keyset, the primary key is always added as the tie breaker.
+    If the queryset has no ordering it falls back to the model's default ordering, then to the primary key.
+    """
+    ordering = list(queryset.query.order_by) or list(queryset.model._meta.ordering) or ['pk']
+    term = ordering[0]
+    if not isinstance(term, str):
+        raise TypeError('Keyset pagination requires the queryset to be ordered by a field name.')
+    descending = term.startswith('-')
+    field = term.lstrip('-')
+    if field in ('pk', queryset.model._meta.pk.name):
+        field = 'pk'
+    return field, descending
+
+
+def keyset_filter(queryset, field, descending, position):
+    """Orders a queryset by (field, pk) and filters it to the rows that come after the given position.
+
+    'position' is a (value, pk, reverse) tuple. When 'reverse' is True the rows before the position are
+    returned instead (closest first), which is used to step back to the previous page.
+    """
+    value, pk, reverse = position if position else (None, None, False)
+    # Walking backwards flips the direction of both the ordering field and the tie breaker.
+    ascending = descending == reverse
+    prefix = '' if ascending else '-'
+    if field == 'pk':
+        queryset = queryset.order_by(prefix + 'pk')
+    else:
+        queryset = queryset.order_by(prefix + field, prefix + 'pk')
+
+    if position:
+        lookup = 'gt' if ascending else 'lt'
+        if field == 'pk':
+            queryset = queryset.filter(**{f'pk__{lookup}': pk})
+        else:
+            queryset = queryset.filter(Q(**{f'{field}__{lookup}': value}) | Q(**{field: value, f'pk__{lookup}': pk}))
+    return queryset
+
+
+def get_item_value(item, field):
+    """Reads a field from a model instance or from a row dictionary returned by '.values()'.
+    """
+    if isinstance(item, dict):
+        return item['id'] if field == 'pk' and 'pk' not in item else item[field]
+    return getattr(item, field)
+
+
+class KeysetCursorPagination(pagination.CursorPagination):
+    """Keyset pagination keyed on (ordering field, id).
+
+    The ordering is taken from the queryset, so it works with the 'ordering' query parameter handled by
+    'OrderingFilter' and with any filtering applied in 'get_queryset' (e.g. 'searchName' and 'filter').
+
+    Query parameters:
+        - `cursor`: The opaque position returned in the `next` and `previous` links.
+        - `page_size`: Number of results per page, capped at `max_page_size`.
+
+    Returns:
+        A JSON object of the form {"next": url or null, "previous": url or null, "results": [...]}.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Returns a single page of results, recording the positions needed for the next/previous links.
+        """
+        queryset = self.get_page_queryset(queryset, request)
+        if queryset is None:
+            return None
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Async version of 'paginate_queryset', used by the async ViewSets.
+        """
+        queryset = self.get_page_queryset(queryset, request)
+        if queryset is None:
+            return None
+        return self.set_page([item async for item in queryset])
+
+    def get_page_queryset(self, queryset, request):
+        """Returns the queryset of the requested page (plus one row), or None if pagination is turned off.
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        encoded = request.query_params.get(self.cursor_query_param)
+        try:
+            self.position = decode_cursor(encoded) if encoded else None
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+        self.field, descending = get_keyset_ordering(queryset)
+        try:
+            queryset = keyset_filter(queryset, self.field, descending, self.position)
+        except (TypeError, ValueError, ValidationError):
+            # The cursor decoded, but its values don't fit the ordering field or the id (e.g. a tampered cursor).
+            raise NotFound(self.invalid_cursor_message)
+
+        # Fetch one extra row to find out whether there is another page in the direction of travel.
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        """Records the page of the rows fetched by the 'get_page_queryset' query, and returns it.
+        """
+        reverse = self.position[2] if self.position else False
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+
+        self.has_next = has_more if not reverse else self.position is not None
+        self.has_previous = has_more if reverse else self.position is not None
+        return self.page
+
+    def get_position(self, item, reverse):
+        """Encodes the position of an item on the current page.
+        """
+        return encode_cursor(get_item_value(item, self.field), get_item_value(item, 'pk'), reverse)
+
+    def get_next_link(self):
+        """Returns the URL of the next page, or None on the last page.
+        """
+        if not self.has_next or not self.page:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.get_position(self.page[-1], False))
+
+    def get_previous_link(self):
+        """Returns the URL of the previous page, or None on the first page.
+        """
+        if not self.has_previous or not self.page:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.get_position(self.page[0], True))
@@ -0,0 +1,34 @@
+"""permissions.py
+
+This file defines custom permission classes for the API views. Django REST Framework checks 'has_permission'
+before a view's action runs, and 'has_object_permission' when the view fetches a single object with 'get_object()'.
+Object level checks receive the instance that was already fetched, so they don't cost any extra queries.
+"""
+
+# Import 'permissions' from Django REST Framework to build on the base permission class.
+from rest_framework import permissions
+
+
+class IsManagingAgent(permissions.BasePermission):
+    """Object level permission that only allows the agent managing a musician to access it.
+
+    The check compares the musician's 'agent_id' column with the id of the authenticated user,
+    so the agent's User row never has to be loaded.
+    """
+    # Error messages returned for each action, matching the 'res' responses used elsewhere in the API.
+    messages = {
+        'retrieve': 'You do not have permission to view this musician.',
+        'update': 'You do not have permission to update this musician.',
+        'partial_update': 'You do not have permission to update this musician.',
+        'destroy': 'You do not have permission to delete this musician.',
+        'bulk': 'You do not have permission to modify one or more of these musicians.',
+    }
+
+    def has_object_permission(self, request, view, obj):
+        """Returns True if the authenticated user is the agent that manages the musician.
+        """
+        if obj.agent_id == request.user.pk:
+            return True
+        # The message is returned as the body of the 403 Forbidden response.
+        self.message = {'res': self.messages.get(view.action, 'You do not have permission to access this musician.')}
+        return False
@@ -0,0 +1,114 @@
+"""querysets.py
+
+This file provides a small query planning layer for the API views. It inspects the fields of a serializer
+(including nested serializers and dotted 'source' paths such as 'agent.username') and works out which related
+objects will be accessed while serializing. The matching 'select_related' and 'prefetch_related' calls are then
+applied to the queryset so that a list of N instances costs a constant number of queries instead of N + 1.
+"""
+
+# Import 'lru_cache' so the plan for each serializer class is only worked out once per process.
+from functools import lru_cache
+# Import 'FieldDoesNotExist' to detect serializer sources that are properties or methods rather than model fields.
+from django.core.exceptions import FieldDoesNotExist
+# Import 'Prefetch' to control the queryset used when fetching many-to-many and reverse relations.
+from django.db.models import Prefetch
+# Import 'serializers' from Django REST Framework to identify nested serializers and relational fields.
+from rest_framework import serializers
+
+
+def _is_to_many(model, name):
+    """Returns True if the named field on the model is a many-to-many or reverse foreign key relation,
+    False if it is a forward foreign key or one-to-one relation, and None if it is not a relation at all.
+    """
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+    if not field.is_relation:
+        return None
+    return bool(field.many_to_many or field.one_to_many)
+
+
+def _walk(serializer_class, model, prefix=''):
+    """Walks the fields of a serializer and collects the relations that will be accessed when serializing.
+
+    Returns a tuple of (select_related lookups, prefetch specifications). Each prefetch specification is a
+    tuple of (lookup, related model, nested serializer class or None) so that the nested queryset can be
+    planned recursively.
+    """
+    select_related = []
+    prefetch = []
+
+    for field in serializer_class().fields.values():
+        # Write only fields are never read during serialization.
+        if field.write_only or field.source == '*':
+            continue
+
+        # Nested serializers - either a single nested object or a list of them (many=True).
+        if isinstance(field, serializers.BaseSerializer):
+            many = isinstance(field, serializers.ListSerializer)
+            nested = field.child if many else field
+            nested_model = nested.Meta.model
+            lookup = prefix + '__'.join(field.source_attrs)
+            if many or _is_to_many(model, field.source_attrs[0]):
+                prefetch.append((lookup, nested_model, type(nested)))
+            else:
+                select_related.append(lookup)
+                # A single nested object is joined, so its own relations are planned relative to this one.
+                nested_select, nested_prefetch = _walk(type(nested), nested_model, lookup + '__')
+                select_related.extend(nested_select)
+                prefetch.extend(nested_prefetch)
+            continue
+
+        # Many related fields (e.g. PrimaryKeyRelatedField(many=True)) read the whole related set.
+        if isinstance(field, serializers.ManyRelatedField):
+            prefetch.append((prefix + '__'.join(field.source_attrs), None, None))
+            continue
+
+        # Dotted sources (e.g. source='agent.username') follow relations attribute by attribute.
+        current_model = model
+        path = []
+        for attr in field.source_attrs[:-1]:
+            to_many = _is_to_many(current_model, attr)
+            if to_many is None:
+                break
+            path.append(attr)
+            if to_many:
+                prefetch.append((prefix + '__'.join(path), None, None))
+                break
+            current_model = current_model._meta.get_field(attr).related_model
+        else:
+            if path:
+                select_related.append(prefix + '__'.join(path))
+
+    return select_related, prefetch
+
+
+@lru_cache(maxsize=None)
+def get_query_plan(serializer_class):
+    """Returns the cached (select_related, prefetch) plan for a ModelSerializer class.
+    """
+    select_related, prefetch = _walk(serializer_class, serializer_class.Meta.model)
+    # Remove duplicates while keeping the order the lookups were discovered in.
+    return tuple(dict.fromkeys(select_related)), tuple(dict.fromkeys(prefetch))
+
+
+def plan_queryset(queryset, serializer_class):
+    """Applies 'select_related' and 'prefetch_related' to a queryset based on what the serializer will read.
+
+    Nested many=True serializers are prefetched with their own planned queryset, so that for example
+    an Album's 'album_members' are fetched together with each musician's 'agent' in a single query.
+    """
+    if not hasattr(getattr(serializer_class, 'Meta', None), 'model'):
+        return queryset
+
+    select_related, prefetch = get_query_plan(serializer_class)
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    for lookup, model, nested_serializer_class in prefetch:
+        if nested_serializer_class is None:
+            queryset = queryset.prefetch_related(lookup)
+        else:
+            nested_queryset = plan_queryset(model._default_manager.all(), nested_serializer_class)
+            queryset = queryset.prefetch_related(Prefetch(lookup, queryset=nested_queryset))
+    return queryset
@@ -0,0 +1,216 @@
+"""row_serializers.py
+
+This file provides a read-only serialization path for list responses. A 'RowSerializer' is compiled once from a
+ModelSerializer class and produces the same data (same keys, in the same order, with the same value formats) from
+the rows of a '.values()' query, rather than from model instances.
+
+DRF serializes each instance by walking its fields: for every field it reads the attribute, checks it for None and
+calls the field's 'to_representation', and nested serializers repeat this for every related object. With a page of
+albums, each with a record label and several members, most of the time of a request is spent in these calls.
+The compiled serializer instead keeps one accessor per field (a plain item lookup for text and numbers, or a
+small formatting function for dates), and no model instances are created at all:
+    - Fields of the model, and of forward relations through dotted sources (e.g. 'agent.username') or nested
+      serializers (e.g. an album's 'label'), are read as columns of the main query, e.g. 'label__name'.
+    - Nested many=True serializers (e.g. an album's 'album_members') are read with one query for the whole page,
+      from the related model filtered to the page's ids, and grouped by the id of their parent.
+
+Only fields that can be computed from columns are supported. Compiling a serializer with, e.g., a
+SerializerMethodField or a source of '*' raises TypeError, those serializers must use the regular path.
+"""
+
+# Import 'lru_cache' so each serializer class is only compiled once per process, and 'itemgetter' for the accessors.
+from functools import lru_cache
+from operator import itemgetter
+# Import the settings module and 'timezone' to format datetimes the same way as DRF.
+from django.conf import settings
+from django.utils import timezone
+# Import 'serializers' to identify the fields being compiled, and the API settings for the default date formats.
+from rest_framework import serializers
+from rest_framework.settings import ISO_8601, api_settings
+
+# Field classes whose 'to_representation' returns the value read from the database unchanged.
+PLAIN_FIELDS = (serializers.CharField, serializers.IntegerField, serializers.ReadOnlyField,
+                serializers.PrimaryKeyRelatedField)
+
+
+def format_date(value):
+    """Formats a date as ISO 8601, like DRF's DateField.
+    """
+    return value.isoformat() if value else None
+
+
+def get_datetime_formatter(tzinfo):
+    """Returns the function formatting an aware datetime as ISO 8601 in a time zone, with 'Z' for UTC, like DRF's
+    DateTimeField.
+    """
+    def format_datetime(value):
+        if not value:
+            return None
+        value = value.astimezone(tzinfo).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return format_datetime
+
+
+def get_formatter(field, tzinfo):
+    """Returns the function formatting a database value for a serializer field, or None if the value is used as is.
+
+    'tzinfo' is the current time zone, which DRF converts datetimes to.
+    """
+    if isinstance(field, PLAIN_FIELDS) and not isinstance(field, serializers.ManyRelatedField):
+        return None
+    if (isinstance(field, serializers.DateTimeField) and settings.USE_TZ and not hasattr(field, 'timezone')
+            and str(getattr(field, 'format', api_settings.DATETIME_FORMAT)).lower() == ISO_8601):
+        return get_datetime_formatter(tzinfo)
+    if (isinstance(field, serializers.DateField)
+            and str(getattr(field, 'format', api_settings.DATE_FORMAT)).lower() == ISO_8601):
+        return format_date
+    # Any other field keeps its own 'to_representation', with the None check DRF's serializers make first.
+    return lambda value: None if value is None else field.to_representation(value)
+
+
+def get_accessor(column, formatter):
+    """Returns the function reading a column from a row and formatting it.
+    """
+    getter = itemgetter(column)
+    if formatter is None:
+        return getter
+    return lambda row: formatter(getter(row))
+
+
+def empty(row):
+    """Accessor of the many=True fields, which are filled in once the related rows are fetched.
+    """
+    return None
+
+
+class RowSerializer:
+    """Read-only serializer compiled from a ModelSerializer class, serializing rows of '.values()' queries.
+
+    Methods:
+        - get_queryset: Turns a queryset of the model into the '.values()' query of the columns it reads.
+        - serialize: Serializes the rows of that query, fetching the many=True fields with one query each.
+    """
+    def __init__(self, serializer_class, prefix=''):
+        """Compiles the fields of a ModelSerializer class. 'prefix' is the path of a nested serializer's relation.
+        """
+        self.serializer_class = serializer_class
+        self.model = serializer_class.Meta.model
+        self.pk_column = prefix + self.model._meta.pk.attname
+        # The columns read by the main query, the (name, field, column, nested serializer) of each field, and the
+        # (name, source, child serializer) of the many=True fields.
+        self.columns = [self.pk_column]
+        self.fields = []
+        self.relations = []
+        # The function building the data of a row, for each time zone it was used with.
+        self.builders = {}
+
+        for name, field in serializer_class().fields.items():
+            # Write only fields are never read during serialization.
+            if field.write_only:
+                continue
+            if field.source == '*' or isinstance(field, (serializers.SerializerMethodField,
+                                                          serializers.ManyRelatedField)):
+                raise TypeError(f"The '{name}' field of {serializer_class.__name__} can't be read from columns.")
+            path = '__'.join(field.source_attrs)
+
+            if isinstance(field, serializers.ListSerializer):
+                if prefix:
+                    raise TypeError(f"The '{name}' field of {serializer_class.__name__} is a list inside a nested "
+                                    f"serializer, which can't be read from columns.")
+                child = RowSerializer(type(field.child))
+                if child.relations:
+                    raise TypeError(f"The '{name}' field of {serializer_class.__name__} nests lists in a list.")
+                self.relations.append((name, path, child))
+                self.fields.append((name, field, None, None))
+            elif isinstance(field, serializers.BaseSerializer):
+                nested = RowSerializer(type(field), prefix + path + '__')
+                if nested.relations:
+                    raise TypeError(f"The '{name}' field of {serializer_class.__name__} nests a list.")
+                self.columns.extend(nested.columns)
+                self.fields.append((name, field, None, nested))
+            else:
+                self.columns.append(prefix + path)
+                self.fields.append((name, field, prefix + path, None))
+
+        # A column can be read by several fields (e.g. 'id' and the primary key), it is only selected once.
+        self.columns = list(dict.fromkeys(self.columns))
+
+    def get_builder(self, tzinfo):
+        """Returns the function building the data of a row (with the many=True fields set to None), formatting
+        datetimes in the given time zone.
+        """
+        builder = self.builders.get(tzinfo)
+        if builder is not None:
+            return builder
+
+        accessors = []
+        for name, field, column, nested in self.fields:
+            if column is not None:
+                accessors.append((name, get_accessor(column, get_formatter(field, tzinfo))))
+            elif nested is not None:
+                accessors.append((name, nested.get_nested_builder(tzinfo)))
+            else:
+                accessors.append((name, empty))
+
+        def build(row):
+            return {name: accessor(row) for name, accessor in accessors}
+        self.builders[tzinfo] = build
+        return build
+
+    def get_nested_builder(self, tzinfo):
+        """Returns the function building the data of a nested serializer's columns, or None if the relation is empty.
+        """
+        build, pk_column = self.get_builder(tzinfo), self.pk_column
+        return lambda row: None if row[pk_column] is None else build(row)
+
+    def get_queryset(self, queryset):
+        """Returns the '.values()' query of a queryset, selecting the columns of every field.
+
+        The queryset's annotations and ordering fields are selected too, so the keyset pagination can read the
+        position of the last row of a page (e.g. the 'search_rank' of ranked search results).
+        """
+        names = set(self.columns) | set(queryset.query.annotations)
+        ordering = [term.lstrip('-') for term in queryset.query.order_by if isinstance(term, str)]
+        extra = [name for name in dict.fromkeys(ordering) if name != 'pk' and name not in names]
+        return queryset.values(*self.columns, *queryset.query.annotations, *extra)
+
+    def serialize(self, rows, using='default'):
+        """Serializes rows of the query returned by 'get_queryset', in the same order.
+        """
+        # The current time zone is looked up once, rather than for every datetime as DRF does.
+        tzinfo = timezone.get_current_timezone()
+        build = self.get_builder(tzinfo)
+        data = [build(row) for row in rows]
+        if not self.relations or not data:
+            return data
+        ids = [row[self.pk_column] for row in rows]
+        for name, path, child in self.relations:
+            related = child.fetch_related(self.model, path, ids, using, tzinfo)
+            for item, pk in zip(data, ids):
+                item[name] = related.get(pk, [])
+        return data
+
+    def fetch_related(self, parent_model, path, parent_ids, using, tzinfo):
+        """Fetches the rows of a many=True relation for every parent id, with one query.
+
+        Returns a dict of {parent id: [serialized data]}. The rows are read from this serializer's model filtered
+        to the parents, the same query as the 'prefetch_related' used by the regular path.
+        """
+        relation = parent_model._meta.get_field(path)
+        # The name of the relation from this model back to the parent, e.g. 'album' for an album's members.
+        parent_lookup = relation.field.name if relation.auto_created else relation.related_query_name()
+        rows = (self.model._default_manager.using(using)
+                .filter(**{f'{parent_lookup}__in': parent_ids})
+                .values(parent_lookup, *self.columns))
+        build = self.get_builder(tzinfo)
+        related = {}
+        for row in rows:
+            related.setdefault(row[parent_lookup], []).append(build(row))
+        return related
+
+
+@lru_cache(maxsize=None)
+def get_row_serializer(serializer_class):
+    """Returns the RowSerializer compiled from a ModelSerializer class.
+    """
+    return RowSerializer(serializer_class)
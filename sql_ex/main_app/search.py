@@ -0,0 +1,264 @@
+"""search.py
+
+This file provides the full-text search engine used by the API views. A search backend filters a queryset down to
+the rows matching a search query and annotates each row with a 'search_rank' (higher is a better match).
+
+The backend is picked from the database engine in use:
+    - SQLite: FTS5 virtual tables ('<table>_fts') that index the searchable columns. Triggers keep them in sync
+      with the model tables, so rows written with 'bulk_create'/'bulk_update' or raw SQL are indexed too.
+    - PostgreSQL: a generated 'search_vector' tsvector column with a GIN index on each model table.
+    - Anything else (or SQLite built without FTS5): a case-insensitive 'icontains' match on each field.
+
+The tables, columns and triggers are created by the 'ensure_search_schema' function, which is run by the
+'0005_full_text_search' migration and again after every 'migrate' (see 'signals.py'), because SQLite drops a
+table's triggers when Django rebuilds the table to alter it.
+
+A backend can also be chosen explicitly with the 'MAIN_APP_SEARCH_BACKEND' setting (a dotted path to a class).
+"""
+
+# Import 're' to split search queries into words.
+import re
+# Import 'sync_to_async' to check the SQLite build from async views.
+from asgiref.sync import sync_to_async
+# Import the settings module to read the optional search backend override.
+from django.conf import settings
+# Import the database connections to find out which engine a queryset is using.
+from django.db import connections
+# Import the query expressions used to filter and rank the search results.
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+# Import 'import_string' to load a search backend from a dotted path in the settings.
+from django.utils.module_loading import import_string
+# Import 'filters' from Django REST Framework to provide the search as a filter backend for ViewSets.
+from rest_framework import filters
+# Import the REST framework settings to find the name of the 'ordering' query parameter.
+from rest_framework.settings import api_settings
+
+# The searchable fields of each model, in order of importance. Keys are '<app_label>.<ModelName>'.
+SEARCH_FIELDS = {
+    'main_app.RecordLabel': ('name',),
+    'main_app.Album': ('title', 'artist', 'genre'),
+}
+
+# Weights given to the fields of a PostgreSQL tsvector, in the same order as SEARCH_FIELDS.
+POSTGRES_WEIGHTS = ('A', 'B', 'C', 'D')
+
+# Whether each SQLite database alias supports FTS5, so the compile options are only checked once per process.
+_fts5_support = {}
+
+
+def get_search_fields(model):
+    """Returns the searchable fields of a model, or an empty tuple if the model isn't searchable.
+    """
+    return SEARCH_FIELDS.get(model._meta.label, ())
+
+
+def get_words(query):
+    """Splits a search query into words, dropping punctuation and any full-text query syntax.
+    """
+    return re.findall(r'\w+', query)
+
+
+class IcontainsSearchBackend:
+    """Fallback search that matches rows containing every word of the query in any searchable field.
+
+    This can't use an index ('LIKE %word%' scans the whole table), so it is only used when the database
+    has no full-text search support. Every match gets the same rank.
+    """
+    def search(self, queryset, query):
+        """Filters the queryset to the rows that match the query and annotates them with 'search_rank'.
+        """
+        fields = get_search_fields(queryset.model)
+        for word in get_words(query):
+            match = Q()
+            for field in fields:
+                match |= Q(**{f'{field}__icontains': word})
+            queryset = queryset.filter(match)
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class SQLiteFTS5SearchBackend:
+    """Search backed by SQLite FTS5 virtual tables, ranked with the BM25 algorithm.
+
+    Each word of the query is matched as a prefix ('sumer' matches 'Sumerian'), and every word must match.
+    """
+    def search(self, queryset, query):
+        """Filters the queryset to the rows that match the query and annotates them with 'search_rank'.
+        """
+        words = get_words(query)
+        if not words:
+            return queryset.none()
+        match = ' '.join(f'"{word}"*' for word in words)
+        table = queryset.model._meta.db_table
+        fts = f'{table}_fts'
+        pk = queryset.model._meta.pk.column
+        # The FTS5 table shares its rowid with the model's primary key, so the matching rowids are the matching rows.
+        queryset = queryset.filter(pk__in=RawSQL(f'SELECT rowid FROM "{fts}" WHERE "{fts}" MATCH %s', [match]))
+        # bm25() returns lower values for better matches, so it is negated to make higher ranks better.
+        rank = RawSQL(
+            f'SELECT -bm25("{fts}") FROM "{fts}" WHERE "{fts}" MATCH %s AND "{fts}".rowid = "{table}"."{pk}"',
+            [match], output_field=FloatField(),
+        )
+        return queryset.annotate(search_rank=rank)
+
+
+class PostgresSearchBackend:
+    """Search backed by a PostgreSQL tsvector column with a GIN index, ranked with ts_rank.
+
+    Each word of the query is matched as a prefix ('sumer' matches 'Sumerian'), and every word must match.
+    """
+    def search(self, queryset, query):
+        """Filters the queryset to the rows that match the query and annotates them with 'search_rank'.
+        """
+        words = get_words(query)
+        if not words:
+            return queryset.none()
+        tsquery = ' & '.join(f'{word}:*' for word in words)
+        table = queryset.model._meta.db_table
+        pk = queryset.model._meta.pk.column
+        queryset = queryset.filter(pk__in=RawSQL(
+            f'SELECT "{pk}" FROM "{table}" WHERE search_vector @@ to_tsquery(\'simple\', %s)', [tsquery]))
+        rank = RawSQL(f'ts_rank("{table}".search_vector, to_tsquery(\'simple\', %s))', [tsquery],
+                      output_field=FloatField())
+        return queryset.annotate(search_rank=rank)
+
+
+def has_fts5(connection):
+    """Returns True if the SQLite library in use was compiled with the FTS5 extension.
+    """
+    if connection.alias not in _fts5_support:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            _fts5_support[connection.alias] = bool(cursor.fetchone()[0])
+    return _fts5_support[connection.alias]
+
+
+def get_search_backend(using='default'):
+    """Returns the search backend for a database alias, following the rules described at the top of this file.
+    """
+    if getattr(settings, 'MAIN_APP_SEARCH_BACKEND', None):
+        return import_string(settings.MAIN_APP_SEARCH_BACKEND)()
+    connection = connections[using]
+    if connection.vendor == 'sqlite' and has_fts5(connection):
+        return SQLiteFTS5SearchBackend()
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    return IcontainsSearchBackend()
+
+
+def ensure_search_schema(connection, models):
+    """Creates the full-text search tables, columns, indexes and triggers for the given models if they are missing.
+
+    On SQLite a new FTS5 table is filled from the existing rows when it is created. Existing tables are left as
+    they are, only their triggers are re-created (SQLite drops them whenever Django rebuilds the model table).
+    """
+    with connection.cursor() as cursor:
+        for model in models:
+            fields = get_search_fields(model)
+            if not fields:
+                continue
+            table = model._meta.db_table
+            pk = model._meta.pk.column
+            columns = [model._meta.get_field(field).column for field in fields]
+
+            if connection.vendor == 'sqlite' and has_fts5(connection):
+                fts = f'{table}_fts'
+                names = ', '.join(f'"{column}"' for column in columns)
+                new_values = ', '.join(f'new."{column}"' for column in columns)
+                old_values = ', '.join(f'old."{column}"' for column in columns)
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [fts])
+                if cursor.fetchone() is None:
+                    # An external content table stores only the index, the text itself is read from the model table.
+                    cursor.execute(
+                        f'CREATE VIRTUAL TABLE "{fts}" USING fts5({names}, content=\'{table}\', '
+                        f'content_rowid=\'{pk}\', tokenize=\'unicode61 remove_diacritics 2\')'
+                    )
+                    cursor.execute(f'INSERT INTO "{fts}"("{fts}") VALUES (\'rebuild\')')
+                cursor.execute(
+                    f'CREATE TRIGGER IF NOT EXISTS "{fts}_insert" AFTER INSERT ON "{table}" BEGIN '
+                    f'INSERT INTO "{fts}"(rowid, {names}) VALUES (new."{pk}", {new_values}); END'
+                )
+                cursor.execute(
+                    f'CREATE TRIGGER IF NOT EXISTS "{fts}_delete" AFTER DELETE ON "{table}" BEGIN '
+                    f'INSERT INTO "{fts}"("{fts}", rowid, {names}) VALUES (\'delete\', old."{pk}", {old_values}); END'
+                )
+                cursor.execute(
+                    f'CREATE TRIGGER IF NOT EXISTS "{fts}_update" AFTER UPDATE ON "{table}" BEGIN '
+                    f'INSERT INTO "{fts}"("{fts}", rowid, {names}) VALUES (\'delete\', old."{pk}", {old_values}); '
+                    f'INSERT INTO "{fts}"(rowid, {names}) VALUES (new."{pk}", {new_values}); END'
+                )
+
+            elif connection.vendor == 'postgresql':
+                vector = ' || '.join(
+                    f"setweight(to_tsvector('simple', coalesce(\"{column}\", '')), '{weight}')"
+                    for column, weight in zip(columns, POSTGRES_WEIGHTS)
+                )
+                cursor.execute(
+                    f'ALTER TABLE "{table}" ADD COLUMN IF NOT EXISTS search_vector tsvector '
+                    f'GENERATED ALWAYS AS ({vector}) STORED'
+                )
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS "{table}_search_idx" ON "{table}" USING gin (search_vector)'
+                )
+
+
+def drop_search_schema(connection, models):
+    """Removes the full-text search tables, columns and triggers created by 'ensure_search_schema'.
+    """
+    with connection.cursor() as cursor:
+        for model in models:
+            if not get_search_fields(model):
+                continue
+            table = model._meta.db_table
+            if connection.vendor == 'sqlite':
+                fts = f'{table}_fts'
+                for suffix in ('insert', 'delete', 'update'):
+                    cursor.execute(f'DROP TRIGGER IF EXISTS "{fts}_{suffix}"')
+                cursor.execute(f'DROP TABLE IF EXISTS "{fts}"')
+            elif connection.vendor == 'postgresql':
+                cursor.execute(f'DROP INDEX IF EXISTS "{table}_search_idx"')
+                cursor.execute(f'ALTER TABLE "{table}" DROP COLUMN IF EXISTS search_vector')
+
+
+async def aget_search_backend(using='default'):
+    """Async version of 'get_search_backend'. Checking for FTS5 needs a query the first time, which runs in a thread.
+    """
+    if (not getattr(settings, 'MAIN_APP_SEARCH_BACKEND', None) and connections[using].vendor == 'sqlite'
+            and using not in _fts5_support):
+        await sync_to_async(lambda: has_fts5(connections[using]))()
+    return get_search_backend(using)
+
+
+class FullTextSearchFilter(filters.BaseFilterBackend):
+    """Filter backend that searches the ViewSet's queryset with the search backend of its database.
+
+    The query is read from the first of the ViewSet's 'full_text_search_params' that is present (default 'search').
+    Unless the request asks for an explicit 'ordering', the results are ordered by 'search_rank', best match first.
+    Add this after 'OrderingFilter' in 'filter_backends' so that the rank ordering isn't replaced by the default.
+    """
+    def get_search_query(self, request, view):
+        """Returns the search query of the request, or None if the request doesn't search.
+        """
+        for param in getattr(view, 'full_text_search_params', ['search']):
+            query = request.query_params.get(param)
+            if query:
+                return query
+        return None
+
+    def filter_queryset(self, request, queryset, view):
+        """Filters the queryset to the search results, ordered by rank unless an ordering was requested.
+        """
+        query = self.get_search_query(request, view)
+        if not query:
+            return queryset
+        queryset = get_search_backend(queryset.db).search(queryset, query)
+        if not request.query_params.get(api_settings.ORDERING_PARAM):
+            queryset = queryset.order_by('-search_rank')
+        return queryset
+
+    async def afilter_queryset(self, request, queryset, view):
+        """Async version of 'filter_queryset', used by the async ViewSets.
+        """
+        if self.get_search_query(request, view):
+            await aget_search_backend(queryset.db)
+        return self.filter_queryset(request, queryset, view)
@@ -10,8 +10,107 @@ Serializers also handle validation and deserialization of input data.
 from rest_framework import serializers
 # Import the models defined in the 'models.py' file to be serialized.
 from .models import RecordLabel, Musician, Album
+# Import the helper that invalidates cached API responses, since bulk writes don't send the model signals.
+from .caching import invalidate_model_responses
+# Import the helper that adds the time spent serializing to the request's measurements.
+from config.instrumentation import measure_serialization
 
-class RecordLabelSerializer(serializers.ModelSerializer):
+class MeasuredSerializerMixin:
+    """Mixin for serializers that adds the time spent building '.data' to the serialization time of the request
+    (see 'config/instrumentation.py').
+
+    Nested serializers are serialized by their parent's '.data', so only the outer serializer is measured.
+    """
+    @property
+    def data(self):
+        with measure_serialization():
+            return super().data
+
+class MeasuredListSerializer(MeasuredSerializerMixin, serializers.ListSerializer):
+    """List serializer used when a serializer is created with many=True, measuring the time spent building '.data'.
+    """
+
+class BulkListSerializer(MeasuredListSerializer):
+    """List serializer used when a serializer is created with many=True to write many instances at once.
+
+    Instead of saving each item with its own INSERT/UPDATE (and one query per many-to-many relation),
+    the instances are written with 'bulk_create'/'bulk_update' and all many-to-many rows are written
+    to the linking ('through') table with a single 'bulk_create'.
+    """
+    # Maximum number of rows written by each INSERT/UPDATE statement.
+    batch_size = 1000
+
+    def validate(self, attrs):
+        """Runs the child serializer's 'validate_references' hook once for the whole list, if it has one.
+
+        This lets a serializer check every referenced id with one query per related model, rather than
+        one query per item.
+        """
+        validate_references = getattr(self.child, 'validate_references', None)
+        if validate_references is not None:
+            validate_references(attrs)
+        return attrs
+
+    def split_many_to_many(self, validated_data):
+        """Removes many-to-many values from each item, returning them as a list of {field name: ids} dicts.
+        """
+        names = [field.name for field in self.child.Meta.model._meta.many_to_many]
+        return [{name: attrs.pop(name) for name in names if name in attrs} for attrs in validated_data]
+
+    def write_many_to_many(self, instances, relations, replace=False):
+        """Writes the many-to-many rows of all instances with one 'bulk_create' per relation.
+
+        When 'replace' is True, the existing rows of the instances that were given a new value are deleted first.
+        """
+        model = self.child.Meta.model
+        for field in model._meta.many_to_many:
+            through = field.remote_field.through
+            source, target = field.m2m_field_name(), field.m2m_reverse_field_name()
+            changed = [(instance, related[field.name]) for instance, related in zip(instances, relations)
+                       if field.name in related]
+            if not changed:
+                continue
+            if replace:
+                through.objects.filter(**{f'{source}__in': [instance.pk for instance, _ in changed]}).delete()
+            through.objects.bulk_create([
+                through(**{f'{source}_id': instance.pk, f'{target}_id': pk})
+                for instance, pks in changed for pk in dict.fromkeys(pks)
+            ], batch_size=self.batch_size)
+
+    def create(self, validated_data):
+        """Creates all instances with 'bulk_create', then writes their many-to-many rows.
+        """
+        model = self.child.Meta.model
+        relations = self.split_many_to_many(validated_data)
+        instances = model._default_manager.bulk_create([model(**attrs) for attrs in validated_data],
+                                                       batch_size=self.batch_size)
+        self.write_many_to_many(instances, relations)
+        invalidate_model_responses(model)
+        return instances
+
+    def update(self, instances, validated_data):
+        """Updates all instances with 'bulk_update', then replaces the many-to-many rows that were given.
+
+        'instances' must be in the same order as the validated items.
+        """
+        model = self.child.Meta.model
+        relations = self.split_many_to_many(validated_data)
+        # 'bulk_update' doesn't set 'auto_now' fields (such as 'updated_at') the way 'save' does, so they are set here.
+        auto_now = [field for field in model._meta.concrete_fields if getattr(field, 'auto_now', False)]
+        fields = {field.name for field in auto_now}
+        for instance, attrs in zip(instances, validated_data):
+            for attr, value in attrs.items():
+                setattr(instance, attr, value)
+                fields.add(attr)
+            for field in auto_now:
+                field.pre_save(instance, add=False)
+        if fields:
+            model._default_manager.bulk_update(instances, sorted(fields), batch_size=self.batch_size)
+        self.write_many_to_many(instances, relations, replace=True)
+        invalidate_model_responses(model)
+        return instances
+
+class RecordLabelSerializer(MeasuredSerializerMixin, serializers.ModelSerializer):
     """Serializer for the RecordLabel model.
     """
     class Meta:
@@ -21,8 +120,10 @@ class RecordLabelSerializer(serializers.ModelSerializer):
         model = RecordLabel
         # You can opt to include all fields from the associated model.
         fields = '__all__'
+        # Measure the serialization of lists of record labels (see 'MeasuredSerializerMixin').
+        list_serializer_class = MeasuredListSerializer
 
-class MusicianSerializer(serializers.ModelSerializer):
+class MusicianSerializer(MeasuredSerializerMixin, serializers.ModelSerializer):
     """Serializer for the Musician model.
     """
     # Custom field to display the agent's 'username' instead of the default agent 'id'.
@@ -34,15 +135,22 @@ class MusicianSerializer(serializers.ModelSerializer):
         """
         model = Musician
         # Specify the fields to be included to abstract the agent 'id' since we're using 'agent_username'.
-        fields = ['id', 'first_name', 'last_name', 'instrument', 'agent_username']
+        fields = ['id', 'first_name', 'last_name', 'instrument', 'agent_username', 'updated_at']
+        # Write lists of musicians with bulk queries (see 'BulkListSerializer').
+        list_serializer_class = BulkListSerializer
 
-class AlbumSerializer(serializers.ModelSerializer):
+class AlbumSerializer(MeasuredSerializerMixin, serializers.ModelSerializer):
     """Serializer for the Album model.
     """
     # Nested serializers to include serialized data representing other models.
     # This ensures that label/album_members outputs the serialized data and not just the 'id' numbers.
     label = RecordLabelSerializer(read_only=True)
     album_members = MusicianSerializer(many=True, read_only=True)
+    # Write only fields that accept the 'id' of the record label and the 'id's of the musicians when writing,
+    # since the nested serializers above are read only.
+    label_id = serializers.IntegerField(write_only=True)
+    album_member_ids = serializers.ListField(child=serializers.IntegerField(), source='album_members',
+                                             write_only=True, required=False)
     
     class Meta:
         """Configures the serializer. It defines the model to serialize and specifies 
@@ -50,3 +158,28 @@ class AlbumSerializer(serializers.ModelSerializer):
         """
         model = Album
         fields = '__all__'
+        # Write lists of albums with bulk queries (see 'BulkListSerializer').
+        list_serializer_class = BulkListSerializer
+
+    def validate(self, attrs):
+        """Checks the referenced record label and musicians exist. When validating a list of albums
+        the check is done once for the whole list by 'BulkListSerializer.validate' instead.
+        """
+        if not isinstance(self.parent, serializers.ListSerializer):
+            self.validate_references([attrs])
+        return attrs
+
+    def validate_references(self, items):
+        """Checks that every record label and musician referenced by the items exists, with one query for each model.
+        """
+        label_ids = {attrs['label_id'] for attrs in items if 'label_id' in attrs}
+        missing_labels = label_ids - set(RecordLabel.objects.filter(pk__in=label_ids).values_list('pk', flat=True))
+        if missing_labels:
+            raise serializers.ValidationError(
+                {'label_id': f'Invalid record label id(s): {sorted(missing_labels)}.'})
+
+        member_ids = {pk for attrs in items for pk in attrs.get('album_members', ())}
+        missing_members = member_ids - set(Musician.objects.filter(pk__in=member_ids).values_list('pk', flat=True))
+        if missing_members:
+            raise serializers.ValidationError(
+                {'album_member_ids': f'Invalid musician id(s): {sorted(missing_members)}.'})
@@ -0,0 +1,179 @@
+"""signals.py
+
+This file defines signal receivers for the Django app. Signals let the app react to events elsewhere in Django,
+such as a model being saved or a many-to-many relation being changed, without modifying the code that caused them.
+
+The receivers are connected when the module is imported in 'apps.py' (MainAppConfig.ready).
+"""
+
+# Import the signals sent by Django's ORM when models and many-to-many relations change.
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete, pre_save
+# Import the database connections and the migration recorder to repair the search schema after migrations.
+from django.db import connections
+from django.db.migrations.recorder import MigrationRecorder
+# Import 'timezone' to set the time albums were last updated.
+from django.utils import timezone
+# Import the 'receiver' decorator to connect functions to signals.
+from django.dispatch import receiver
+# Import the User and Group models whose changes affect a user's access rights.
+from django.contrib.auth.models import User, Group
+# Import the helper that removes cached groups and permissions.
+from .authorization import invalidate_authorization
+# Import the helper that invalidates the cached API responses showing a model.
+from .caching import invalidate_model_responses
+# Import the function that creates the full-text search tables and triggers, and the models that are searchable.
+from .search import ensure_search_schema
+from .models import RecordLabel, Musician, Album
+
+
+def _group_member_ids(group_ids, using):
+    """Returns the ids of the users that belong to any of the given groups.
+    """
+    return User.objects.using(using).filter(groups__in=group_ids).values_list('pk', flat=True).distinct()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, using, **kwargs):
+    """Invalidates cached authorization when users are added to or removed from groups.
+
+    The relation can be changed from either side, e.g. 'user.groups.add(group)' or 'group.user_set.add(user)'.
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_authorization([instance.pk], using=using)
+    elif action == 'pre_clear':
+        invalidate_authorization(_group_member_ids([instance.pk], using), using=using)
+    else:
+        invalidate_authorization(pk_set, using=using)
+
+
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def user_permissions_changed(sender, instance, action, reverse, pk_set, using, **kwargs):
+    """Invalidates cached authorization when permissions are granted to or removed from users directly.
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_authorization([instance.pk], using=using)
+    elif action == 'pre_clear':
+        user_ids = User.objects.using(using).filter(user_permissions=instance).values_list('pk', flat=True)
+        invalidate_authorization(user_ids, using=using)
+    else:
+        invalidate_authorization(pk_set, using=using)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(sender, instance, action, reverse, pk_set, using, **kwargs):
+    """Invalidates cached authorization of every member of a group when the group's permissions change.
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_authorization(_group_member_ids([instance.pk], using), using=using)
+    elif action == 'pre_clear':
+        groups = Group.objects.using(using).filter(permissions=instance)
+        invalidate_authorization(_group_member_ids(groups, using), using=using)
+    else:
+        invalidate_authorization(_group_member_ids(pk_set, using), using=using)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, using, **kwargs):
+    """Invalidates cached authorization of every member of a group when it is renamed or deleted.
+    """
+    if instance.pk is not None:
+        invalidate_authorization(_group_member_ids([instance.pk], using), using=using)
+
+
+@receiver(post_save, sender=RecordLabel)
+@receiver(post_delete, sender=RecordLabel)
+@receiver(post_save, sender=Musician)
+@receiver(post_delete, sender=Musician)
+@receiver(post_save, sender=Album)
+@receiver(post_delete, sender=Album)
+def cached_model_changed(sender, using, **kwargs):
+    """Invalidates the cached API responses that show a record label, musician or album when one is saved or deleted.
+
+    Writes that don't send these signals ('bulk_create', 'bulk_update' and 'QuerySet.update') must invalidate the
+    responses themselves, as 'BulkListSerializer' does.
+    """
+    invalidate_model_responses(sender, using=using)
+
+
+@receiver(m2m_changed, sender=Album.album_members.through)
+def album_members_changed(sender, instance, action, reverse, pk_set, using, **kwargs):
+    """Updates the 'updated_at' of albums and invalidates their cached responses when their members change.
+
+    The relation can be changed from either side, e.g. 'album.album_members.add(musician)' or
+    'musician.album_set.add(album)'.
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        return
+    # The same time is stored and set on the instance, so the instance matches the database.
+    now = timezone.now()
+    if not reverse:
+        if action == 'pre_clear':
+            return
+        albums = Album.objects.filter(pk=instance.pk)
+        instance.updated_at = now
+    elif action == 'pre_clear':
+        albums = Album.objects.filter(album_members=instance)
+    elif action == 'post_clear':
+        return
+    else:
+        albums = Album.objects.filter(pk__in=pk_set)
+    albums.using(using).update(updated_at=now)
+    invalidate_model_responses(Album, using=using)
+
+
+@receiver(pre_delete, sender=Musician)
+def musician_deleted(sender, instance, using, **kwargs):
+    """Updates the 'updated_at' of the albums a musician is removed from by being deleted.
+
+    The linking rows are deleted along with the musician without sending 'm2m_changed'.
+    """
+    Album.objects.using(using).filter(album_members=instance).update(updated_at=timezone.now())
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, raw, update_fields, using, **kwargs):
+    """Records on the user whether the save changes its username, for 'user_saved'.
+
+    Saves that can't change the username (such as updating 'last_login' on login) skip the lookup of the stored one.
+    """
+    instance._username_changed = False
+    if raw or instance.pk is None or (update_fields is not None and 'username' not in update_fields):
+        return
+    stored = User.objects.using(using).filter(pk=instance.pk).values_list('username', flat=True).first()
+    instance._username_changed = stored is not None and stored != instance.username
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, using, **kwargs):
+    """Updates the 'updated_at' of the musicians a user manages and of their albums, and invalidates their cached
+    responses, when a user's username changes, since musicians and albums show the username of each musician's agent.
+    Other changes, such as a new password or email, are ignored.
+    """
+    if created or not getattr(instance, '_username_changed', False):
+        return
+    now = timezone.now()
+    musicians = Musician.objects.using(using).filter(agent=instance)
+    Album.objects.using(using).filter(album_members__in=musicians).update(updated_at=now)
+    musicians.update(updated_at=now)
+    invalidate_model_responses(Musician, using=using)
+
+
+@receiver(post_migrate)
+def repair_search_schema(sender, using, **kwargs):
+    """Re-creates any missing full-text search triggers after 'migrate' has run.
+
+    SQLite drops a table's triggers when Django rebuilds the table to alter one of its columns, which would
+    leave the search index silently out of date. Nothing is done until the search migration has been applied.
+    """
+    if sender.name != 'main_app':
+        return
+    connection = connections[using]
+    if ('main_app', '0005_full_text_search') in MigrationRecorder(connection).applied_migrations():
+        ensure_search_schema(connection, [RecordLabel, Album])
@@ -1,3 +1,7 @@
+// State
+// URL of the next page of record labels, taken from the 'next' cursor link of the previous API response.
+let nextRecordLabelsUrl = null;
+
 // Functions
 function fetchRecordLabels() {
     const searchName = document.getElementById('searchName').value;
@@ -16,6 +20,23 @@ function fetchRecordLabels() {
         url += `ordering=${encodeURIComponent(orderBy)}&`;
     }
 
+    // Start a new table, then load the first page of results into it.
+    const recordLabelDataDiv = document.getElementById('recordLabelData');
+    recordLabelDataDiv.innerHTML = '';
+    loadRecordLabelPage(url);
+}
+
+function fetchMoreRecordLabels() {
+    // Follow the 'next' cursor to append the following page of results to the existing table.
+    if (nextRecordLabelsUrl) {
+        loadRecordLabelPage(nextRecordLabelsUrl);
+    }
+}
+
+function loadRecordLabelPage(url) {
+    const loadMoreButton = document.getElementById('loadMoreRecordLabels');
+    loadMoreButton.hidden = true;
+
     fetch(url)
         .then(response => {
             if (!response.ok) {
@@ -24,39 +45,48 @@ function fetchRecordLabels() {
             return response.json();
         })
         .then(data => {
-            const recordLabelDataDiv = document.getElementById('recordLabelData');
-            recordLabelDataDiv.innerHTML = '';
-
-            const table = document.createElement('table');
-            const headerRow = document.createElement('tr');
-
-            if (data.length > 0) {
-                Object.keys(data[0]).forEach(key => {
-                    const th = document.createElement('th');
-                    th.textContent = key.charAt(0).toUpperCase() + key.slice(1);
-                    headerRow.appendChild(th);
-                });
-                table.appendChild(headerRow);
-
-                data.forEach(record => {
-                    const row = document.createElement('tr');
-                    Object.values(record).forEach(value => {
-                        const td = document.createElement('td');
-                        td.textContent = value;
-                        row.appendChild(td);
-                    });
-                    table.appendChild(row);
-                });
-            } else {
-                recordLabelDataDiv.textContent = 'No record labels found.';
-            }
-
-            recordLabelDataDiv.appendChild(table);
+            appendRecordLabelRows(data.results);
+            nextRecordLabelsUrl = data.next;
+            loadMoreButton.hidden = !nextRecordLabelsUrl;
         })
         .catch(error => {
             console.error('There has been a problem with your fetch operation:', error);
         });
 }
 
+function appendRecordLabelRows(records) {
+    const recordLabelDataDiv = document.getElementById('recordLabelData');
+    let table = recordLabelDataDiv.querySelector('table');
+
+    if (!table) {
+        if (records.length === 0) {
+            recordLabelDataDiv.textContent = 'No record labels found.';
+            return;
+        }
+
+        // The header row is only created for the first page, later pages only add rows.
+        table = document.createElement('table');
+        const headerRow = document.createElement('tr');
+        Object.keys(records[0]).forEach(key => {
+            const th = document.createElement('th');
+            th.textContent = key.charAt(0).toUpperCase() + key.slice(1);
+            headerRow.appendChild(th);
+        });
+        table.appendChild(headerRow);
+        recordLabelDataDiv.appendChild(table);
+    }
+
+    records.forEach(record => {
+        const row = document.createElement('tr');
+        Object.values(record).forEach(value => {
+            const td = document.createElement('td');
+            td.textContent = value;
+            row.appendChild(td);
+        });
+        table.appendChild(row);
+    });
+}
+
 // Event listeners
 document.getElementById('fetchRecordLabels').addEventListener('click', fetchRecordLabels);
+document.getElementById('loadMoreRecordLabels').addEventListener('click', fetchMoreRecordLabels);
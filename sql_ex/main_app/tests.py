@@ -9,3 +9,1534 @@ that ensure your models, views, and other components behave as expected.
 from django.test import TestCase
 
 # Create your tests here.
+# Import 'CaptureQueriesContext' to count the queries issued by a block of code.
+from django.test.utils import CaptureQueriesContext
+# Import 'connection' to attach the query capture to the default database.
+from django.db import connection
+# Import the default cache to reset cached authorization data between tests.
+from django.core.cache import cache
+# Import the User, Group and Permission models to create users with the required access rights.
+from django.contrib.auth.models import User, Group, Permission
+# Import 'iscoroutinefunction' and 'resolve' to check the async ViewSets are served as coroutines.
+from asgiref.sync import iscoroutinefunction
+from django.urls import resolve
+# Import 'APIClient' from Django REST Framework to make authenticated requests against the API views.
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+# Import the views, and the DRF permissions and responses, to compare the queries of a previous implementation.
+from . import views
+from rest_framework import permissions
+from rest_framework.response import Response
+# Import the models defined in the 'models.py' file to create test data.
+from .models import RecordLabel, Musician, Album
+# Import the cursor encoder to build tampered cursors.
+from .pagination import encode_cursor
+# Import the authorization helpers to check the queries issued for group and permission lookups.
+from .authorization import get_cache_key, load_authorization
+# Import the search backends to test the full-text search directly, and the filter using them.
+from .search import FullTextSearchFilter, IcontainsSearchBackend, get_search_backend
+# Import the serializers, the query planner and the compiled row serializers to compare their output.
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from .serializers import RecordLabelSerializer, MusicianSerializer, AlbumSerializer
+from .querysets import plan_queryset
+from .row_serializers import RowSerializer, get_row_serializer
+# Import 'override_settings' and the request instrumentation to check the timing headers and the metrics endpoint.
+from django.test import override_settings
+from config.instrumentation import registry
+# Import 'call_command' and 'StringIO' to run the seed command and capture its report.
+from io import StringIO
+from django.core.management import call_command
+# Import 'os', 'tempfile', the settings module and the SQLite backend to open a database file with the SQLite profiles.
+import os
+import tempfile
+from django.conf import settings
+from django.db.backends.sqlite3.base import DatabaseWrapper
+# Import 're' and 'urlencode' to read query plans and build URLs, and the routers and filters of the ViewSets to
+# check the queries of every list they serve.
+import re
+from urllib.parse import urlencode
+from rest_framework import filters
+from .urls import router, async_router
+# Import 'TransactionTestCase', 'mock', 'time' and the replica routing to test reads against replicas kept in sync
+# with the primary.
+import time
+from unittest import mock
+from django.test import TransactionTestCase
+from django.db import OperationalError, connections
+from config.replicas import (
+    STICKY_COOKIE, ReplicaRouter, RequestState, current_state, read_primary, reset_health, sync_replicas,
+    use_replicas,
+)
+
+
+class AlbumQueryCountTests(TestCase):
+    """Tests that listing albums issues a constant number of queries regardless of how many albums are returned.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        """Creates an 'Admin' user with permission to view albums and a talent agent that manages the musicians.
+        """
+        admin_group = Group.objects.create(name='Admin')
+        admin_group.permissions.add(Permission.objects.get(codename='view_album'))
+        cls.admin = User.objects.create_user('admin', password='password')
+        cls.admin.groups.add(admin_group)
+        cls.agent = User.objects.create_user('agent', password='password')
+        cls.label = RecordLabel.objects.create(name='Kscope', address='1 Music Lane', email='info@kscope.com')
+
+    def create_albums(self, count):
+        """Creates albums that each have their own label and two musicians.
+        """
+        for index in range(count):
+            label = RecordLabel.objects.create(name=f'Label {index}', address='Address', email='label@example.com')
+            album = Album.objects.create(title=f'Album {index}', artist='Artist', release_date='2024-08-04',
+                                         genre='Rock', label=label)
+            album.album_members.add(
+                Musician.objects.create(first_name='First', last_name=f'{index}', instrument='Guitar', agent=self.agent),
+                Musician.objects.create(first_name='Second', last_name=f'{index}', instrument='Drums', agent=self.agent),
+            )
+
+    def count_list_queries(self):
+        """Returns the number of queries issued by a request to the album list endpoint.
+        """
+        client = APIClient()
+        # Fetch a fresh user and clear the cache so that each measurement includes the same permission lookup.
+        client.force_authenticate(User.objects.get(pk=self.admin.pk))
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/main_app/api/album/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_album_list_query_count_is_constant(self):
+        """The album list costs the same number of queries for 1 album as it does for 20 albums.
+        """
+        self.create_albums(1)
+        single_count, response = self.count_list_queries()
+        self.assertEqual(len(response.data['results']), 1)
+
+        self.create_albums(19)
+        many_count, response = self.count_list_queries()
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(single_count, many_count)
+
+    def test_album_list_serializes_nested_data(self):
+        """The prefetched data is serialized with the nested label, members and agent usernames.
+        """
+        self.create_albums(2)
+        _, response = self.count_list_queries()
+        album = response.data['results'][0]
+        self.assertEqual(album['label']['name'], 'Label 0')
+        self.assertEqual([member['agent_username'] for member in album['album_members']], ['agent', 'agent'])
+
+
+class KeysetPaginationTests(TestCase):
+    """Tests the keyset (cursor) pagination of the record label list.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        """Creates record labels with duplicate names so that the 'id' tie breaker is needed.
+        """
+        cls.user = User.objects.create_user('user', password='password')
+        for index in range(12):
+            RecordLabel.objects.create(name=f'Label {index % 4}', address=f'Address {index}',
+                                       email=f'label{index}@example.com')
+
+    def setUp(self):
+        """Authenticates the API client used by each test.
+        """
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def collect_pages(self, url):
+        """Follows the 'next' links from the given URL and returns the pages of ids in order.
+        """
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([record['id'] for record in response.data['results']])
+            url = response.data['next']
+        return pages
+
+    def test_pages_follow_ordering_field_and_id(self):
+        """Following 'next' returns every label exactly once in (name, id) order.
+        """
+        pages = self.collect_pages('/main_app/api/record_label/?ordering=name&page_size=5')
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+        expected = list(RecordLabel.objects.order_by('name', 'id').values_list('id', flat=True))
+        self.assertEqual([pk for page in pages for pk in page], expected)
+
+    def test_descending_ordering(self):
+        """A descending ordering walks both the ordering field and the tie breaker backwards.
+        """
+        pages = self.collect_pages('/main_app/api/record_label/?ordering=-email&page_size=4')
+        expected = list(RecordLabel.objects.order_by('-email', '-id').values_list('id', flat=True))
+        self.assertEqual([pk for page in pages for pk in page], expected)
+
+    def test_previous_link_returns_previous_page(self):
+        """The 'previous' link of the second page returns the first page again.
+        """
+        first = self.client.get('/main_app/api/record_label/?ordering=name&page_size=5')
+        second = self.client.get(first.data['next'])
+        previous = self.client.get(second.data['previous'])
+        self.assertEqual([record['id'] for record in previous.data['results']],
+                         [record['id'] for record in first.data['results']])
+
+    def test_search_and_filter_parameters_are_kept(self):
+        """The 'searchName' and 'filter' query parameters apply to every page.
+        """
+        pages = self.collect_pages('/main_app/api/record_label/?filter=Label 1&page_size=2')
+        expected = list(RecordLabel.objects.filter(name='Label 1').order_by('id').values_list('id', flat=True))
+        self.assertEqual([pk for page in pages for pk in page], expected)
+
+    def test_deep_pages_do_not_use_offset(self):
+        """Later pages seek with a WHERE clause instead of skipping rows with OFFSET.
+        """
+        first = self.client.get('/main_app/api/record_label/?ordering=name&page_size=5')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(first.data['next'])
+        self.assertFalse(any('OFFSET' in query['sql'] for query in queries))
+
+    def test_invalid_cursor(self):
+        """An invalid cursor returns 404 Not Found.
+        """
+        response = self.client.get('/main_app/api/record_label/?cursor=invalid')
+        self.assertEqual(response.status_code, 404)
+
+    def test_tampered_cursor(self):
+        """A well formed cursor whose values don't fit the id returns 404 Not Found.
+        """
+        for ordering, pk in [('name', 'abc'), ('name', {'id': 1}), ('id', 'abc'), ('id', [1])]:
+            cursor = encode_cursor('Label 1', pk)
+            response = self.client.get(f'/main_app/api/record_label/?ordering={ordering}&cursor={cursor}')
+            self.assertEqual(response.status_code, 404, (ordering, pk))
+
+
+class AuthorizationContextTests(TestCase):
+    """Tests that groups and permissions are loaded once per request and cached between requests.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        """Creates the 'Admin' and 'Talent Agents' groups and a talent agent that manages one musician.
+        """
+        cls.admin_group = Group.objects.create(name='Admin')
+        cls.admin_group.permissions.add(Permission.objects.get(codename='view_album'))
+        cls.agent_group = Group.objects.create(name='Talent Agents')
+        cls.agent = User.objects.create_user('agent', password='password')
+        cls.agent.groups.add(cls.agent_group)
+        cls.other_agent = User.objects.create_user('other', password='password')
+        Musician.objects.create(first_name='Luke', last_name='Wait', instrument='Guitar', agent=cls.agent)
+        Musician.objects.create(first_name='Other', last_name='Musician', instrument='Bass', agent=cls.other_agent)
+
+    def setUp(self):
+        """Clears cached authorization data left behind by other tests.
+        """
+        cache.clear()
+
+    def get(self, url, user):
+        """Makes a GET request as a freshly loaded user and returns the response and the executed queries.
+        """
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=user.pk))
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        return response, [query['sql'] for query in queries]
+
+    def authorization_queries(self, queries):
+        """Returns the queries that looked up groups or permissions.
+        """
+        return [sql for sql in queries if 'auth_group' in sql or 'auth_permission' in sql]
+
+    def test_groups_and_permissions_load_in_one_query(self):
+        """Groups and permissions (direct and through groups) are loaded by a single query.
+        """
+        self.agent.user_permissions.add(Permission.objects.get(codename='add_musician'))
+        with CaptureQueriesContext(connection) as queries:
+            data = load_authorization(self.agent)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(data, {'groups': ['Talent Agents'], 'permissions': ['main_app.add_musician']})
+
+    def test_lookup_is_cached_between_requests(self):
+        """The first request loads the user's groups, later requests reuse the cached result.
+        """
+        response, queries = self.get('/main_app/api/musician/', self.agent)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.authorization_queries(queries)), 1)
+        self.assertEqual([musician['first_name'] for musician in response.data['results']], ['Luke'])
+
+        response, queries = self.get('/main_app/api/musician/', self.agent)
+        self.assertEqual(self.authorization_queries(queries), [])
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_group_change_invalidates_cache(self):
+        """Adding a user to a group removes the cached entry so the next request sees the new group.
+        """
+        self.get('/main_app/api/musician/', self.agent)
+        self.agent_group.user_set.remove(self.agent)
+        self.assertIsNone(cache.get(get_cache_key(self.agent.pk)))
+
+        self.agent.groups.add(self.admin_group)
+        self.assertIsNone(cache.get(get_cache_key(self.agent.pk)))
+        response, _ = self.get('/main_app/api/musician/', self.agent)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_group_permission_change_invalidates_cache(self):
+        """Granting a permission to a group removes the cached entries of its members.
+        """
+        response, _ = self.get('/main_app/api/album/', self.agent)
+        self.assertEqual(response.status_code, 403)
+
+        self.agent_group.permissions.add(Permission.objects.get(codename='view_album'))
+        response, _ = self.get('/main_app/api/album/', self.agent)
+        self.assertEqual(response.status_code, 200)
+
+    def test_cache_invalidated_again_on_commit(self):
+        """The cached entries are deleted again on commit, dropping any entry cached before the change was visible.
+        """
+        key = get_cache_key(self.agent.pk)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.agent_group.permissions.clear()
+            self.assertIsNone(cache.get(key))
+            # Another request reads the old permissions before the change is committed and caches them again.
+            cache.set(key, {'groups': ['Talent Agents'], 'permissions': ['main_app.view_album']})
+        self.assertEqual(len(callbacks), 1)
+        self.assertIsNone(cache.get(key))
+
+
+class MusicianObjectPermissionTests(TestCase):
+    """Tests the object level 'IsManagingAgent' permission and the number of queries it costs per request.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        """Creates an admin, a talent agent and a musician managed by the agent.
+        """
+        admin_group = Group.objects.create(name='Admin')
+        agent_group = Group.objects.create(name='Talent Agents')
+        cls.admin = User.objects.create_user('admin', password='password')
+        cls.admin.groups.add(admin_group)
+        cls.agent = User.objects.create_user('agent', password='password')
+        cls.agent.groups.add(agent_group)
+        cls.musician = Musician.objects.create(first_name='Luke', last_name='Wait', instrument='Guitar',
+                                               agent=cls.agent)
+
+    def setUp(self):
+        """Clears cached authorization data and authenticates as the musician's agent.
+        """
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.agent)
+        self.url = f'/main_app/api/musician/{self.musician.pk}/'
+        # Warm the authorization cache so the counts below only include the work done by the action itself.
+        self.client.get(self.url)
+
+    def test_retrieve_is_a_single_query(self):
+        """A retrieve fetches the musician (joined with its agent) once and nothing else.
+        """
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['agent_username'], 'agent')
+
+    def test_retrieve_queries_before_and_after(self):
+        """Compares the queries of a retrieve with those of the previous implementation, which checked the agent in
+        an overridden 'retrieve' (fetching the musician, then its agent) before 'super().retrieve()' fetched the
+        musician again, without the query plan joining the agent for 'agent_username'.
+        """
+        class PreviousMusicianViewSet(views.MusicianViewSet):
+            permission_classes = [permissions.IsAuthenticated]
+
+            def retrieve(self, request, *args, **kwargs):
+                if self.get_object().agent != request.user:
+                    return Response({'res': 'You do not have permission to view this musician.'}, status=403)
+                return super().retrieve(request, *args, **kwargs)
+
+        def count_queries(viewset):
+            request = APIRequestFactory().get(self.url)
+            force_authenticate(request, user=User.objects.get(pk=self.agent.pk))
+            with CaptureQueriesContext(connection) as queries:
+                response = viewset.as_view({'get': 'retrieve'})(request, pk=self.musician.pk)
+            self.assertEqual((response.status_code, response.data['agent_username']), (200, 'agent'))
+            return len(queries)
+
+        after = count_queries(views.MusicianViewSet)
+        with mock.patch.object(views, 'plan_queryset', lambda queryset, serializer_class: queryset):
+            before = count_queries(PreviousMusicianViewSet)
+        # Two fetches of the musician and two lazy loads of its agent, down to one joined query.
+        self.assertEqual((before, after), (4, 1))
+
+    def test_update_and_destroy_fetch_the_musician_once(self):
+        """Update and destroy fetch the musician once before writing.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(self.url, {'instrument': 'Bass'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(query['sql'].startswith('SELECT') for query in queries), 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(self.url)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(sum(query['sql'].startswith('SELECT') for query in queries), 1)
+
+    def test_other_users_are_forbidden(self):
+        """An admin can see the musician but is not its agent, so every object action is forbidden.
+        """
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.get(self.url)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.data, {'res': 'You do not have permission to view this musician.'})
+        response = client.put(self.url, {'first_name': 'A', 'last_name': 'B', 'instrument': 'C'}, format='json')
+        self.assertEqual(response.data, {'res': 'You do not have permission to update this musician.'})
+        response = client.delete(self.url)
+        self.assertEqual(response.data, {'res': 'You do not have permission to delete this musician.'})
+        self.assertTrue(Musician.objects.filter(pk=self.musician.pk).exists())
+
+
+class BulkEndpointTests(TestCase):
+    """Tests the bulk create, update and delete endpoints of the Musician and Album ViewSets.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        """Creates an admin with every album permission, two talent agents and a record label.
+        """
+        admin_group = Group.objects.create(name='Admin')
+        admin_group.permissions.add(*Permission.objects.filter(content_type__model='album'))
+        agent_group = Group.objects.create(name='Talent Agents')
+        cls.admin = User.objects.create_user('admin', password='password')
+        cls.admin.groups.add(admin_group)
+        cls.agent = User.objects.create_user('agent', password='password')
+        cls.agent.groups.add(agent_group)
+        cls.other_agent = User.objects.create_user('other', password='password')
+        cls.other_agent.groups.add(agent_group)
+        cls.label = RecordLabel.objects.create(name='Kscope', address='1 Music Lane', email='info@kscope.com')
+
+    def setUp(self):
+        """Clears cached authorization data left behind by other tests.
+        """
+        cache.clear()
+
+    def client_for(self, user):
+        """Returns an API client authenticated as the given user.
+        """
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def musicians(self, count):
+        """Returns a list of musician payloads.
+        """
+        return [{'first_name': f'First {index}', 'last_name': 'Last', 'instrument': 'Guitar'} for index in range(count)]
+
+    def test_bulk_create_musicians(self):
+        """Talent agents can create many musicians at once, each managed by the requesting agent.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client_for(self.agent).post('/main_app/api/musician/bulk/', self.musicians(50),
+                                                        format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['ids']), 50)
+        self.assertEqual(Musician.objects.filter(agent=self.agent).count(), 50)
+        self.assertEqual(sum(query['sql'].startswith('INSERT') for query in queries), 1)
+
+    def test_bulk_create_musicians_requires_talent_agent(self):
+        """Users outside the 'Talent Agents' group cannot bulk create musicians.
+        """
+        response = self.client_for(self.admin).post('/main_app/api/musician/bulk/', self.musicians(2),
+                                                     format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Musician.objects.exists())
+
+    def test_bulk_update_and_delete_only_own_musicians(self):
+        """Bulk updates and deletes are rejected if any musician is managed by another agent.
+        """
+        own = Musician.objects.create(first_name='Own', last_name='Musician', instrument='Bass', agent=self.agent)
+        other = Musician.objects.create(first_name='Other', last_name='Musician', instrument='Bass',
+                                        agent=self.other_agent)
+        client = self.client_for(self.agent)
+
+        response = client.patch('/main_app/api/musician/bulk/', [{'id': own.pk, 'instrument': 'Drums'},
+                                                                 {'id': other.pk, 'instrument': 'Drums'}],
+                                format='json')
+        self.assertEqual(response.status_code, 404)
+        response = client.patch('/main_app/api/musician/bulk/', [{'id': own.pk, 'instrument': 'Drums'}],
+                                format='json')
+        self.assertEqual(response.status_code, 200)
+        own.refresh_from_db()
+        self.assertEqual((own.first_name, own.instrument), ('Own', 'Drums'))
+
+        response = client.delete('/main_app/api/musician/bulk/', [own.pk, other.pk], format='json')
+        self.assertEqual(response.status_code, 404)
+        response = client.delete('/main_app/api/musician/bulk/', [own.pk], format='json')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(list(Musician.objects.all()), [other])
+
+    def test_bulk_create_albums_writes_members_in_one_insert(self):
+        """Albums and their members are written with one INSERT for the albums and one for the linking table.
+        """
+        members = [Musician.objects.create(first_name='M', last_name=str(index), instrument='Guitar',
+                                           agent=self.agent).pk for index in range(3)]
+        albums = [{'title': f'Album {index}', 'artist': 'Artist', 'release_date': '2024-08-04', 'genre': 'Rock',
+                   'label_id': self.label.pk, 'album_member_ids': members[:index + 1]} for index in range(3)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client_for(self.admin).post('/main_app/api/album/bulk/', albums, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(sum(query['sql'].startswith('INSERT') for query in queries), 2)
+        self.assertEqual([album.album_members.count() for album in Album.objects.order_by('pk')], [1, 2, 3])
+
+    def test_bulk_album_validation(self):
+        """Unknown record labels and musicians are rejected before anything is written.
+        """
+        albums = [{'title': 'Album', 'artist': 'Artist', 'release_date': '2024-08-04', 'genre': 'Rock',
+                   'label_id': self.label.pk + 100, 'album_member_ids': [999]}]
+        response = self.client_for(self.admin).post('/main_app/api/album/bulk/', albums, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('label_id', response.data)
+        self.assertFalse(Album.objects.exists())
+
+    def test_bulk_update_and_delete_albums(self):
+        """Bulk updates replace the given fields and members, bulk deletes remove the albums.
+        """
+        musician = Musician.objects.create(first_name='M', last_name='M', instrument='Guitar', agent=self.agent)
+        album = Album.objects.create(title='Old', artist='Artist', release_date='2024-08-04', genre='Rock',
+                                     label=self.label)
+        client = self.client_for(self.admin)
+        response = client.patch('/main_app/api/album/bulk/',
+                                [{'id': album.pk, 'title': 'New', 'album_member_ids': [musician.pk]}], format='json')
+        self.assertEqual(response.status_code, 200)
+        album.refresh_from_db()
+        self.assertEqual(album.title, 'New')
+        self.assertEqual(list(album.album_members.all()), [musician])
+
+        response = client.delete('/main_app/api/album/bulk/', [album.pk], format='json')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Album.objects.exists())
+
+    def test_bulk_album_requires_permission(self):
+        """Users without the album permissions cannot use the bulk endpoint.
+        """
+        response = self.client_for(self.agent).post('/main_app/api/album/bulk/', [{'title': 'Album'}],
+                                                     format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_single_create_uses_write_fields(self):
+        """The single instance create endpoints accept the same input as the bulk endpoints.
+        """
+        response = self.client_for(self.agent).post('/main_app/api/musician/', self.musicians(1)[0], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['agent_username'], 'agent')
+
+        album = {'title': 'Album', 'artist': 'Artist', 'release_date': '2024-08-04', 'genre': 'Rock',
+                 'label_id': self.label.pk, 'album_member_ids': [response.data['id']]}
+        response = self.client_for(self.admin).post('/main_app/api/album/', album, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['label']['name'], 'Kscope')
+        self.assertEqual(len(response.data['album_members']), 1)
+
+
+class QueryPlanRegressionTests(TestCase):
+    """Seeds a large database and checks the SQLite query plan of every query the ViewSets issue, for every list
+    ordering and query parameter of each sync and async ViewSet, the page after it, and retrieve.
+
+    A plan fails the test if it scans a whole main_app table or index and either sorts the rows (ORDER BY) in a
+    temporary B-tree, has no LIMIT to stop the scan early, or filters the scanned rows on a column the scan isn't
+    ordered by. Ordered scans with a LIMIT are allowed, since they only read the rows of one page (e.g. the first
+    page ordered by 'id', or the next one from its keyset position). Sorting rows found through an index (e.g.
+    full-text search results ordered by rank) is allowed, since only the matching rows are sorted.
+    """
+    # Text searched or filtered on by the query parameters of each model's ViewSets.
+    sample_values = {RecordLabel: 'Label 42', Musician: 'Last 42', Album: 'Album 42'}
+    @classmethod
+    def setUpTestData(cls):
+        """Seeds thousands of record labels, musicians and albums, then gathers statistics with ANALYZE.
+        """
+        admin_group = Group.objects.create(name='Admin')
+        admin_group.permissions.add(*Permission.objects.filter(content_type__model='album'))
+        agent_group = Group.objects.create(name='Talent Agents')
+        cls.admin = User.objects.create_user('admin', password='password')
+        cls.admin.groups.add(admin_group)
+        cls.agents = User.objects.bulk_create([User(username=f'agent{index}') for index in range(20)])
+        agent_group.user_set.add(*cls.agents)
+
+        labels = RecordLabel.objects.bulk_create([
+            RecordLabel(name=f'Label {index % 5000}', address=f'{index} Music Lane', email=f'label{index}@example.com')
+            for index in range(20000)
+        ])
+        musicians = Musician.objects.bulk_create([
+            Musician(first_name=f'First {index}', last_name=f'Last {index}', instrument='Guitar',
+                     agent=cls.agents[index % len(cls.agents)])
+            for index in range(5000)
+        ])
+        albums = Album.objects.bulk_create([
+            Album(title=f'Album {index}', artist=f'Artist {index}', release_date='2024-08-04', genre='Rock',
+                  label=labels[index])
+            for index in range(5000)
+        ])
+        Album.album_members.through.objects.bulk_create([
+            Album.album_members.through(album_id=album.pk, musician_id=musicians[(index + offset) % 5000].pk)
+            for index, album in enumerate(albums) for offset in range(3)
+        ])
+        cls.musician = musicians[0]
+        cls.album = albums[0]
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        """Clears cached authorization data left behind by other tests.
+        """
+        cache.clear()
+
+    def capture_queries(self, user, url):
+        """Makes a GET request and returns the (sql, params) of every query it executed.
+        """
+        queries = []
+
+        def capture(execute, sql, params, many, context):
+            queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        client = APIClient()
+        client.force_authenticate(user)
+        with connection.execute_wrapper(capture):
+            response = client.get(url)
+        # Users without access to a resource still run the queries checking it.
+        self.assertIn(response.status_code, (200, 403), url)
+        return response, queries
+
+    def get_scan_columns(self, step):
+        """Returns the columns a SCAN step of a plan reads its rows in the order of: the columns of the index it
+        uses, or the rowid ('id') of the table.
+        """
+        match = re.search(r' USING (?:COVERING )?INDEX (\w+)', step)
+        if not match:
+            return {'id'}
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA index_info({match.group(1)})')
+            return {row[2] for row in cursor.fetchall()} | {'id'}
+
+    def get_filtered_columns(self, sql, table):
+        """Returns the columns of a table that the WHERE clause of a query filters on.
+        """
+        where = re.split(r' (?:ORDER BY|LIMIT) ', sql.partition(' WHERE ')[2])[0]
+        return set(re.findall(rf'"{table}"\."(\w+)"', where))
+
+    def assert_no_full_scans(self, url, sql, params):
+        """Runs EXPLAIN QUERY PLAN for a query and fails if any step on a main_app table is a full scan.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            steps = [row[-1] for row in cursor.fetchall()]
+        limited = ' LIMIT ' in sql
+        # FTS5 virtual tables are searched through their own full-text index, so they don't count as scans.
+        scans = [step for step in steps
+                 if 'main_app_' in step and step.startswith('SCAN') and 'VIRTUAL TABLE INDEX' not in step]
+        for step in steps:
+            if 'TEMP B-TREE' in step and 'ORDER BY' in step and scans:
+                self.fail(f'{url} sorts a whole table in a temporary B-tree: {steps}\n{sql}')
+        if scans and not limited:
+            self.fail(f'{url} scans a whole table or index: {steps}\n{sql}')
+        for step in scans:
+            table = step.split()[1]
+            unindexed = self.get_filtered_columns(sql, table) - self.get_scan_columns(step)
+            if unindexed:
+                self.fail(f'{url} scans {table} filtering on {sorted(unindexed)}, which no index used covers: '
+                          f'{steps}\n{sql}')
+
+    def check_urls(self, user, urls):
+        """Checks the plan of every query issued by each URL, and the first page after it (found via 'next').
+        """
+        for url in urls:
+            response, queries = self.capture_queries(user, url)
+            if isinstance(response.data, dict) and response.data.get('next'):
+                queries += self.capture_queries(user, response.data['next'])[1]
+            for sql, params in queries:
+                if sql.startswith('SELECT'):
+                    self.assert_no_full_scans(url, sql, params)
+
+    def get_list_urls(self, prefix, viewset):
+        """Returns the list URLs of a ViewSet: without parameters, in each ordering it supports (both directions),
+        and with each of its search and filter parameters, alone and in each ordering.
+        """
+        orderings = [None]
+        if filters.OrderingFilter in viewset.filter_backends:
+            orderings += [prefix + field for field in viewset.ordering_fields or [] for prefix in ('', '-')]
+        params = set(getattr(viewset, 'cache_query_params', [])) - {'cursor', 'page_size', 'ordering'}
+        if FullTextSearchFilter in viewset.filter_backends:
+            params |= set(getattr(viewset, 'full_text_search_params', ['search']))
+        value = self.sample_values[viewset.queryset.model]
+        urls = []
+        for param in [None, *sorted(params)]:
+            for ordering in orderings:
+                query = {name: text for name, text in [(param, value), ('ordering', ordering)] if name and text}
+                urls.append(f'{prefix}?{urlencode(query)}' if query else prefix)
+        return urls
+
+    def test_filtered_scan_fails(self):
+        """A scan with a LIMIT still fails when it filters on a column the scan isn't ordered by.
+        """
+        table = '"main_app_recordlabel"'
+        select = f'SELECT {table}."id" FROM {table} WHERE '
+        with self.assertRaisesMessage(AssertionError, "filtering on ['address']"):
+            self.assert_no_full_scans('address', select + f'{table}."address" LIKE %s ORDER BY {table}."id" LIMIT 51',
+                                      ['%42%'])
+        # A keyset page filters on the columns of the index it scans.
+        keyset = f'({table}."name" > %s OR ({table}."name" = %s AND {table}."id" > %s))'
+        self.assert_no_full_scans('keyset', select + keyset + f' ORDER BY {table}."name", {table}."id" LIMIT 51',
+                                  ['Label 42', 'Label 42', 1])
+
+    def test_viewset_queries(self):
+        """Every list, filter and ordering of each sync and async ViewSet, and retrieve, uses indexes for the admin
+        and for a talent agent.
+        """
+        instances = {RecordLabel: RecordLabel.objects.order_by('pk').first(), Musician: self.musician,
+                     Album: self.album}
+        for surface, registry in [('/main_app/api/', router.registry), ('/main_app/api/async/', async_router.registry)]:
+            for path, viewset, _ in registry:
+                prefix = f'{surface}{path}/'
+                urls = self.get_list_urls(prefix, viewset)
+                urls.append(f'{prefix}{instances[viewset.queryset.model].pk}/')
+                for user in (self.admin, self.agents[0]):
+                    with self.subTest(prefix=prefix, user=user.username):
+                        self.check_urls(user, urls)
+
+
+class FullTextSearchTests(TestCase):
+    """Tests the full-text search of record labels and albums.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        """Creates record labels and albums to search.
+        """
+        cls.admin = User.objects.create_superuser('admin', password='password')
+        cls.sumerian = RecordLabel.objects.create(name='Sumerian Records', address='A', email='a@example.com')
+        cls.century = RecordLabel.objects.create(name='Century Media Records', address='B', email='b@example.com')
+        cls.kscope = RecordLabel.objects.create(name='Kscope', address='C', email='c@example.com')
+        Album.objects.create(title='Scenes from a Memory', artist='Dream Theater', release_date='1999-10-26',
+                             genre='Progressive Metal', label=cls.century)
+        Album.objects.create(title='Hand. Cannot. Erase.', artist='Steven Wilson', release_date='2015-02-27',
+                             genre='Progressive Rock', label=cls.kscope)
+
+    def setUp(self):
+        """Authenticates the API client used by each test.
+        """
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def search(self, url):
+        """Returns the first field of each result of a search request.
+        """
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [result.get('name') or result.get('title') for result in response.data['results']]
+
+    def test_sqlite_uses_fts5(self):
+        """The SQLite test database uses the FTS5 backend rather than the icontains fallback.
+        """
+        self.assertNotIsInstance(get_search_backend(), IcontainsSearchBackend)
+
+    def test_search_matches_word_prefixes(self):
+        """Every word of the search must match the start of a word, in any order and any case.
+        """
+        self.assertEqual(self.search('/main_app/api/record_label/?searchName=sumer'), ['Sumerian Records'])
+        self.assertEqual(self.search('/main_app/api/record_label/?searchName=records media'),
+                         ['Century Media Records'])
+        self.assertEqual(self.search('/main_app/api/record_label/?searchName=metal'), [])
+
+    def test_results_are_ranked(self):
+        """The closest match comes first unless an ordering is requested.
+        """
+        RecordLabel.objects.create(name='Records Records Records', address='D', email='d@example.com')
+        self.assertEqual(self.search('/main_app/api/record_label/?searchName=records')[0], 'Records Records Records')
+        self.assertEqual(self.search('/main_app/api/record_label/?searchName=records&ordering=name'),
+                         ['Century Media Records', 'Records Records Records', 'Sumerian Records'])
+
+    def test_ranked_results_paginate(self):
+        """Following the 'next' links of ranked results returns every match once.
+        """
+        RecordLabel.objects.bulk_create([RecordLabel(name=f'Indie Label {index}', address='E', email='e@example.com')
+                                         for index in range(7)])
+        url, names = '/main_app/api/record_label/?searchName=indie&page_size=3', []
+        while url:
+            response = self.client.get(url)
+            names += [result['name'] for result in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(sorted(names), sorted(f'Indie Label {index}' for index in range(7)))
+
+    def test_index_follows_writes(self):
+        """Updates, deletes and bulk inserts are reflected in the search index by the triggers.
+        """
+        self.kscope.name = 'Inside Out Music'
+        self.kscope.save()
+        self.assertEqual(self.search('/main_app/api/record_label/?searchName=kscope'), [])
+        self.assertEqual(self.search('/main_app/api/record_label/?searchName=inside out'), ['Inside Out Music'])
+
+        self.sumerian.delete()
+        self.assertEqual(self.search('/main_app/api/record_label/?searchName=sumerian'), [])
+
+        RecordLabel.objects.bulk_create([RecordLabel(name='Nuclear Blast', address='F', email='f@example.com')])
+        self.assertEqual(self.search('/main_app/api/record_label/?searchName=nuclear'), ['Nuclear Blast'])
+
+    def test_album_search_covers_title_artist_and_genre(self):
+        """Albums are searched by title, artist and genre.
+        """
+        self.assertEqual(sorted(self.search('/main_app/api/album/?search=progressive')),
+                         ['Hand. Cannot. Erase.', 'Scenes from a Memory'])
+        self.assertEqual(self.search('/main_app/api/album/?search=wilson'), ['Hand. Cannot. Erase.'])
+        self.assertEqual(self.search('/main_app/api/album/?search=memory dream'), ['Scenes from a Memory'])
+
+    def test_fallback_backend(self):
+        """The icontains fallback matches the same rows, without using an index.
+        """
+        results = IcontainsSearchBackend().search(RecordLabel.objects.all(), 'records media')
+        self.assertEqual([label.name for label in results], ['Century Media Records'])
+
+
+class AsyncViewSetTests(TestCase):
+    """Tests the async ViewSets under 'api/async/' give the same responses and apply the same access rules.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        """Creates an admin with every album permission, two talent agents, their musicians and a few albums.
+        """
+        admin_group = Group.objects.create(name='Admin')
+        admin_group.permissions.add(*Permission.objects.filter(content_type__model='album'))
+        agent_group = Group.objects.create(name='Talent Agents')
+        cls.admin = User.objects.create_user('admin', password='password')
+        cls.admin.groups.add(admin_group)
+        cls.agent = User.objects.create_user('agent', password='password')
+        cls.agent.groups.add(agent_group)
+        cls.other_agent = User.objects.create_user('other', password='password')
+        cls.other_agent.groups.add(agent_group)
+        cls.label = RecordLabel.objects.create(name='Kscope', address='1 Music Lane', email='info@kscope.com')
+        cls.musician = Musician.objects.create(first_name='Steven', last_name='Wilson', instrument='Guitar',
+                                               agent=cls.agent)
+        Musician.objects.create(first_name='Other', last_name='Musician', instrument='Bass', agent=cls.other_agent)
+        for index in range(5):
+            album = Album.objects.create(title=f'Album {index}', artist='Porcupine Tree', release_date='2024-08-04',
+                                         genre='Rock' if index % 2 else 'Progressive', label=cls.label)
+            album.album_members.add(cls.musician)
+
+    def setUp(self):
+        """Clears cached authorization data left behind by other tests.
+        """
+        cache.clear()
+
+    def client_for(self, user):
+        """Returns an API client authenticated as the given user.
+        """
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_list_matches_sync(self):
+        """Every page of the async list is the same as the sync list, apart from the URLs of the links.
+        """
+        client = self.client_for(self.admin)
+        for query in ('?page_size=2', '?page_size=2&search=rock', '?ordering=name'):
+            for resource in ('album', 'record_label'):
+                sync = client.get(f'/main_app/api/{resource}/{query}').json()
+                async_ = client.get(f'/main_app/api/async/{resource}/{query}').json()
+                self.assertEqual(async_['results'], sync['results'])
+                self.assertEqual(async_['next'] and async_['next'].replace('/async', ''), sync['next'])
+
+        # The next page is read with the cursor of the async response.
+        response = client.get(client.get('/main_app/api/async/album/?page_size=2').json()['next'])
+        self.assertEqual([album['title'] for album in response.json()['results']], ['Album 2', 'Album 3'])
+
+    def test_retrieve_and_count(self):
+        """Single instances are fetched with 'aget' and counted with 'acount'.
+        """
+        self.assertTrue(iscoroutinefunction(resolve('/main_app/api/async/album/1/').func))
+        client = self.client_for(self.admin)
+        album = Album.objects.first()
+        self.assertEqual(client.get(f'/main_app/api/async/album/{album.pk}/').json(),
+                         client.get(f'/main_app/api/album/{album.pk}/').json())
+        self.assertEqual(client.get('/main_app/api/async/album/count/?search=rock').json(), {'count': 2})
+        self.assertEqual(client.get('/main_app/api/async/album/999/').status_code, 404)
+
+    def test_album_permissions(self):
+        """Users without the album permissions get the same 403 responses as from the sync ViewSet.
+        """
+        client = self.client_for(self.agent)
+        album = Album.objects.first()
+        for method, url in (('get', '/main_app/api/async/album/'), ('get', f'/main_app/api/async/album/{album.pk}/'),
+                            ('post', '/main_app/api/async/album/'), ('patch', f'/main_app/api/async/album/{album.pk}/'),
+                            ('delete', f'/main_app/api/async/album/{album.pk}/')):
+            response = getattr(client, method)(url, {}, format='json')
+            sync = getattr(client, method)(url.replace('/async', ''), {}, format='json')
+            self.assertEqual((response.status_code, response.json()), (403, sync.json()))
+        self.assertEqual(APIClient().get('/main_app/api/async/album/').status_code, 403)
+
+    def test_album_writes(self):
+        """Albums are created, updated and deleted through the async ViewSet.
+        """
+        client = self.client_for(self.admin)
+        response = client.post('/main_app/api/async/album/', {
+            'title': 'In Absentia', 'artist': 'Porcupine Tree', 'release_date': '2002-09-24', 'genre': 'Rock',
+            'label_id': self.label.pk, 'album_member_ids': [self.musician.pk]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['label']['name'], 'Kscope')
+        pk = response.json()['id']
+
+        response = client.patch(f'/main_app/api/async/album/{pk}/', {'album_member_ids': []}, format='json')
+        self.assertEqual((response.status_code, response.json()['album_members']), (200, []))
+        self.assertEqual(client.delete(f'/main_app/api/async/album/{pk}/').status_code, 204)
+        self.assertFalse(Album.objects.filter(pk=pk).exists())
+
+    def test_musician_access(self):
+        """Agents only see and change their own musicians, and only Talent Agents can create them.
+        """
+        client = self.client_for(self.agent)
+        response = client.get('/main_app/api/async/musician/')
+        self.assertEqual([musician['id'] for musician in response.json()['results']], [self.musician.pk])
+        self.assertEqual(client.get('/main_app/api/async/musician/count/').json(), {'count': 1})
+        other = Musician.objects.get(agent=self.other_agent)
+        self.assertEqual(client.delete(f'/main_app/api/async/musician/{other.pk}/').status_code, 404)
+
+        musician = {'first_name': 'Gavin', 'last_name': 'Harrison', 'instrument': 'Drums'}
+        response = client.post('/main_app/api/async/musician/', musician, format='json')
+        self.assertEqual((response.status_code, response.json()['agent_username']), (201, 'agent'))
+        response = self.client_for(self.admin).post('/main_app/api/async/musician/', musician, format='json')
+        self.assertEqual(response.json(), {'res': 'You do not have permission to create a musician.'})
+
+        # The bulk action is sync, it runs in a thread.
+        response = client.post('/main_app/api/async/musician/bulk/', [musician], format='json')
+        self.assertEqual(response.status_code, 201)
+
+
+class ResponseCacheTests(TestCase):
+    """Tests the record label and album responses are cached, revalidated with ETags and invalidated by changes.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        """Creates an admin who can view albums, a user without album permissions, and an album on a record label.
+        """
+        admin_group = Group.objects.create(name='Admin')
+        admin_group.permissions.add(Permission.objects.get(codename='view_album'))
+        cls.admin = User.objects.create_user('admin', password='password')
+        cls.admin.groups.add(admin_group)
+        cls.user = User.objects.create_user('user', password='password')
+        cls.label = RecordLabel.objects.create(name='Kscope', address='1 Music Lane', email='info@kscope.com')
+        cls.musician = Musician.objects.create(first_name='Steven', last_name='Wilson', instrument='Guitar',
+                                               agent=cls.user)
+        cls.album = Album.objects.create(title='In Absentia', artist='Porcupine Tree', release_date='2002-09-24',
+                                         genre='Rock', label=cls.label)
+        cls.album.album_members.add(cls.musician)
+
+    def setUp(self):
+        """Clears cached responses and authorization data left behind by other tests.
+        """
+        cache.clear()
+
+    def get(self, url, user=None, **headers):
+        """Makes a GET request as the admin (or the given user) and returns the response and the number of queries.
+        """
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=(user or self.admin).pk))
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url, headers=headers)
+        return response, len(queries)
+
+    def test_repeated_requests_are_cached(self):
+        """The second request for the same page is served from the cache, whatever the order of its parameters.
+        """
+        response, queries = self.get('/main_app/api/record_label/?ordering=name&page_size=10')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(queries, 0)
+
+        cached, queries = self.get('/main_app/api/record_label/?page_size=10&unused=1&ordering=name%20')
+        self.assertEqual(queries, 0)
+        self.assertEqual(cached.json(), response.json())
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+        _, queries = self.get('/main_app/api/record_label/?page_size=10&ordering=-name')
+        self.assertGreater(queries, 0)
+
+    def test_etag_returns_not_modified(self):
+        """A request sending back the ETag of the current response gets an empty 304 Not Modified.
+        """
+        url = f'/main_app/api/record_label/{self.label.pk}/'
+        response, _ = self.get(url)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        not_modified, queries = self.get(url, If_None_Match=response['ETag'])
+        self.assertEqual((not_modified.status_code, not_modified.content, queries), (304, b'', 0))
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+
+        self.assertEqual(self.get(url, If_None_Match='"outdated"')[0].status_code, 200)
+
+    def test_label_change_invalidates_labels_and_albums(self):
+        """Saving or deleting a record label replaces the cached labels and albums that show it.
+        """
+        label_response, _ = self.get('/main_app/api/record_label/')
+        album_response, _ = self.get('/main_app/api/album/')
+
+        self.label.name = 'Kscope Music'
+        self.label.save()
+        response, _ = self.get('/main_app/api/record_label/', If_None_Match=label_response['ETag'])
+        self.assertEqual(response.json()['results'][0]['name'], 'Kscope Music')
+        response, _ = self.get('/main_app/api/album/')
+        self.assertEqual(response.json()['results'][0]['label']['name'], 'Kscope Music')
+        self.assertNotEqual(response['ETag'], album_response['ETag'])
+
+        self.label.delete()
+        self.assertEqual(self.get('/main_app/api/album/')[0].json()['results'], [])
+
+    def test_album_changes_invalidate_albums(self):
+        """Album members, musicians (including bulk updates) and agent usernames shown by albums invalidate them.
+        """
+        self.get('/main_app/api/album/')
+        self.album.album_members.clear()
+        self.assertEqual(self.get('/main_app/api/album/')[0].json()['results'][0]['album_members'], [])
+
+        self.album.album_members.add(self.musician)
+        self.user.username = 'agent'
+        self.user.save()
+        response, _ = self.get('/main_app/api/album/')
+        self.assertEqual(response.json()['results'][0]['album_members'][0]['agent_username'], 'agent')
+
+        self.user.groups.add(Group.objects.create(name='Talent Agents'))
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.patch('/main_app/api/musician/bulk/', [{'id': self.musician.pk, 'last_name': 'W.'}],
+                                  format='json')
+        self.assertEqual(response.status_code, 200)
+        response, _ = self.get('/main_app/api/album/')
+        self.assertEqual(response.json()['results'][0]['album_members'][0]['last_name'], 'W.')
+
+    def test_album_permission_checked_before_cache(self):
+        """A cached album response is not served to a user without permission to view albums.
+        """
+        self.assertEqual(self.get(f'/main_app/api/album/{self.album.pk}/')[0].status_code, 200)
+        response, _ = self.get(f'/main_app/api/album/{self.album.pk}/', user=self.user)
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn('ETag', response)
+
+
+class ConditionalGetTests(TestCase):
+    """Tests 'updated_at' is maintained and the ViewSets answer conditional requests with 304 Not Modified.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        """Creates an admin with every album permission, two talent agents, their musicians and an album.
+        """
+        admin_group = Group.objects.create(name='Admin')
+        admin_group.permissions.add(*Permission.objects.filter(content_type__model='album'))
+        agent_group = Group.objects.create(name='Talent Agents')
+        cls.admin = User.objects.create_user('admin', password='password')
+        cls.admin.groups.add(admin_group)
+        cls.agent = User.objects.create_user('agent', password='password')
+        cls.agent.groups.add(agent_group)
+        cls.other_agent = User.objects.create_user('other', password='password')
+        cls.other_agent.groups.add(agent_group)
+        cls.label = RecordLabel.objects.create(name='Kscope', address='1 Music Lane', email='info@kscope.com')
+        cls.musician = Musician.objects.create(first_name='Steven', last_name='Wilson', instrument='Guitar',
+                                               agent=cls.agent)
+        cls.other_musician = Musician.objects.create(first_name='Gavin', last_name='Harrison', instrument='Drums',
+                                                     agent=cls.other_agent)
+        cls.album = Album.objects.create(title='In Absentia', artist='Porcupine Tree', release_date='2002-09-24',
+                                         genre='Rock', label=cls.label)
+
+    def setUp(self):
+        """Clears cached responses and authorization data left behind by other tests.
+        """
+        cache.clear()
+
+    def get(self, url, user, **headers):
+        """Makes a GET request as a user and returns the response and the executed queries.
+        """
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=user.pk))
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url, headers=headers)
+        return response, [query['sql'] for query in queries]
+
+    def album_updated_at(self):
+        """Returns the stored 'updated_at' of the album.
+        """
+        return Album.objects.values_list('updated_at', flat=True).get(pk=self.album.pk)
+
+    def test_album_members_update_album(self):
+        """Changing album members from either side, or deleting a member, updates the album's 'updated_at'.
+        """
+        updated_at = self.album_updated_at()
+        self.album.album_members.add(self.musician)
+        self.assertGreater(self.album_updated_at(), updated_at)
+        self.assertEqual(self.album.updated_at, self.album_updated_at())
+
+        updated_at = self.album_updated_at()
+        self.other_musician.album_set.add(self.album)
+        self.assertGreater(self.album_updated_at(), updated_at)
+
+        updated_at = self.album_updated_at()
+        self.musician.album_set.clear()
+        self.assertGreater(self.album_updated_at(), updated_at)
+
+        updated_at = self.album_updated_at()
+        self.other_musician.delete()
+        self.assertGreater(self.album_updated_at(), updated_at)
+
+    def test_bulk_update_sets_updated_at(self):
+        """Bulk updates set 'updated_at', which 'bulk_update' doesn't do on its own.
+        """
+        updated_at = Musician.objects.get(pk=self.musician.pk).updated_at
+        client = APIClient()
+        client.force_authenticate(self.agent)
+        response = client.patch('/main_app/api/musician/bulk/', [{'id': self.musician.pk, 'instrument': 'Vocals'}],
+                                format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(Musician.objects.get(pk=self.musician.pk).updated_at, updated_at)
+
+    def test_list_not_modified(self):
+        """A list requested again with its ETag gets 304 after one query, until it changes.
+        """
+        response, _ = self.get('/main_app/api/musician/', self.agent)
+        self.assertEqual(response.status_code, 200)
+        # Deleting a row doesn't change the latest 'updated_at' of a list, so lists have no Last-Modified.
+        self.assertNotIn('Last-Modified', response)
+
+        not_modified, queries = self.get('/main_app/api/musician/', self.agent, If_None_Match=response['ETag'])
+        self.assertEqual((not_modified.status_code, not_modified.content), (304, b''))
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+        self.assertEqual(len([sql for sql in queries if 'main_app_musician' in sql]), 1)
+
+        # Each agent sees different musicians, so another agent's ETag never matches.
+        other, _ = self.get('/main_app/api/musician/', self.other_agent, If_None_Match=response['ETag'])
+        self.assertEqual(other.status_code, 200)
+
+        self.musician.instrument = 'Vocals'
+        self.musician.save()
+        changed, _ = self.get('/main_app/api/musician/', self.agent, If_None_Match=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+
+        Musician.objects.create(first_name='Richard', last_name='Barbieri', instrument='Keys', agent=self.agent)
+        self.musician.delete()
+        changed_again, _ = self.get('/main_app/api/musician/', self.agent, If_None_Match=changed['ETag'])
+        self.assertEqual(changed_again.status_code, 200)
+
+        Musician.objects.filter(agent=self.agent).delete()
+        deleted, _ = self.get('/main_app/api/musician/', self.agent,
+                              If_Modified_Since='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual((deleted.status_code, deleted.json()['results']), (200, []))
+
+    def test_retrieve_checks_permissions_first(self):
+        """Retrieve answers 304 for the current ETag, but only after the object permissions are checked.
+        """
+        url = f'/main_app/api/musician/{self.musician.pk}/'
+        response, _ = self.get(url, self.agent)
+        self.assertEqual(self.get(url, self.agent, If_None_Match=response['ETag'])[0].status_code, 304)
+        self.assertEqual(self.get(url, self.admin, If_None_Match=response['ETag'])[0].status_code, 403)
+
+    def test_album_validators_follow_related_models(self):
+        """An album's ETag changes when its record label, one of its members or a member's agent changes.
+        """
+        self.album.album_members.add(self.musician)
+        for url in ['/main_app/api/album/', f'/main_app/api/album/{self.album.pk}/',
+                    '/main_app/api/async/album/', f'/main_app/api/async/album/{self.album.pk}/']:
+            cache.clear()
+            response, _ = self.get(url, self.admin)
+            cache.clear()
+            self.assertEqual(self.get(url, self.admin, If_None_Match=response['ETag'])[0].status_code, 304, url)
+
+            for instance in (self.label, self.musician):
+                instance.save()
+                cache.clear()
+                changed, _ = self.get(url, self.admin, If_None_Match=response['ETag'])
+                self.assertEqual(changed.status_code, 200, url)
+                response = changed
+
+            # Albums show the username of each member's agent.
+            self.agent.username = f'agent-{url}'
+            self.agent.save(update_fields=['username'])
+            cache.clear()
+            changed, _ = self.get(url, self.admin, If_None_Match=response['ETag'])
+            self.assertEqual(changed.status_code, 200, url)
+            response = changed
+            # Saves that don't change the username keep the ETag.
+            self.agent.save(update_fields=['last_login'])
+            self.agent.set_password('new password')
+            self.agent.email = 'agent@example.com'
+            self.agent.save()
+            cache.clear()
+            self.assertEqual(self.get(url, self.admin, If_None_Match=response['ETag'])[0].status_code, 304, url)
+
+
+class RowSerializerTests(TestCase):
+    """Tests the serializers compiled for '.values()' rows produce exactly the same JSON as the regular serializers.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        """Creates an admin who can view albums, and albums with no members, one member or several members.
+        """
+        admin_group = Group.objects.create(name='Admin')
+        admin_group.permissions.add(Permission.objects.get(codename='view_album'))
+        cls.admin = User.objects.create_user('admin', password='password')
+        cls.admin.groups.add(admin_group)
+        agents = [User.objects.create_user(f'agent{i}', password='password') for i in range(2)]
+        labels = [RecordLabel.objects.create(name=f'Label {i}', address=f'{i} Music Lane', email=f'label{i}@test.com')
+                  for i in range(2)]
+        musicians = [Musician.objects.create(first_name=f'First {i}', last_name=f'Last {i}', instrument='Drums',
+                                             agent=agents[i % 2]) for i in range(4)]
+        for i in range(7):
+            album = Album.objects.create(title=f'Rock Album {i}', artist=f'Artist {i}', release_date=f'200{i}-01-31',
+                                         genre='Rock', label=labels[i % 2])
+            album.album_members.set(musicians[:i % 4])
+
+    def setUp(self):
+        """Clears cached responses left behind by other tests.
+        """
+        cache.clear()
+
+    def render(self, data):
+        """Renders serialized data as JSON, so the key order and the value formats are compared too.
+        """
+        return JSONRenderer().render(data)
+
+    def test_matches_model_serializers(self):
+        """Every serializer compiles to a row serializer with the same output, and albums take two queries.
+        """
+        for serializer_class in (RecordLabelSerializer, MusicianSerializer, AlbumSerializer):
+            model = serializer_class.Meta.model
+            queryset = model.objects.order_by('pk')
+            expected = serializer_class(plan_queryset(queryset, serializer_class), many=True).data
+            row_serializer = get_row_serializer(serializer_class)
+            with CaptureQueriesContext(connection) as queries:
+                data = row_serializer.serialize(list(row_serializer.get_queryset(queryset)))
+            self.assertEqual(self.render(data), self.render(expected), serializer_class.__name__)
+            self.assertEqual(len(queries), 2 if serializer_class is AlbumSerializer else 1)
+
+    def test_list_pages_match_model_serializer(self):
+        """Album list pages, including ranked search results, have the same JSON as the regular serializer.
+        """
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        for url in ['/main_app/api/album/?page_size=3', '/main_app/api/album/?search=rock&page_size=3']:
+            pages = 0
+            while url:
+                response = client.get(url)
+                self.assertEqual(response.status_code, 200)
+                ids = [album['id'] for album in response.data['results']]
+                albums = plan_queryset(Album.objects.filter(pk__in=ids), AlbumSerializer).in_bulk()
+                expected = AlbumSerializer([albums[pk] for pk in ids], many=True).data
+                self.assertEqual(self.render(response.data['results']), self.render(expected))
+                url, pages = response.data['next'], pages + 1
+            self.assertEqual(pages, 3)
+
+    def test_unsupported_fields_raise(self):
+        """Serializers with fields that can't be read from columns are rejected when compiled.
+        """
+        class MethodSerializer(serializers.ModelSerializer):
+            name = serializers.SerializerMethodField()
+
+            class Meta:
+                model = RecordLabel
+                fields = ['id', 'name']
+
+        with self.assertRaises(TypeError):
+            RowSerializer(MethodSerializer)
+
+
+@override_settings(INSTRUMENTATION_SAMPLE_RATE=1.0, INSTRUMENTATION_SERVER_TIMING=True,
+                   INSTRUMENTATION_METRICS_TOKEN=None, DEBUG=True)
+class InstrumentationTests(TestCase):
+    """Tests the request instrumentation counts queries, times the serialization and rendering and serves Prometheus
+    metrics.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        """Creates an admin who can view albums, and an album with a member.
+        """
+        admin_group = Group.objects.create(name='Admin')
+        admin_group.permissions.add(Permission.objects.get(codename='view_album'))
+        cls.admin = User.objects.create_user('admin', password='password')
+        cls.admin.groups.add(admin_group)
+        label = RecordLabel.objects.create(name='Kscope', address='1 Music Lane', email='info@kscope.com')
+        album = Album.objects.create(title='In Absentia', artist='Porcupine Tree', release_date='2002-09-24',
+                                     genre='Rock', label=label)
+        album.album_members.add(Musician.objects.create(first_name='Steven', last_name='Wilson', instrument='Guitar',
+                                                        agent=cls.admin))
+
+    def setUp(self):
+        """Clears cached responses and the totals left behind by other tests.
+        """
+        cache.clear()
+        registry.reset()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_server_timing_counts_queries(self):
+        """Sampled responses report the number of queries they ran, the rendering time and the body size.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/main_app/api/album/')
+        self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+        self.assertIn('serialize;dur=', timing)
+        self.assertIn('render;dur=', timing)
+        self.assertIn(f'size;desc="{len(response.content)} bytes"', timing)
+
+    def test_serialization_time_includes_serializer_data(self):
+        """The serialization time includes building the serializer's data in the view, apart from the rendering.
+        """
+        to_representation = MusicianSerializer.to_representation
+
+        def slow_to_representation(serializer, instance):
+            time.sleep(0.05)
+            return to_representation(serializer, instance)
+
+        musician = Musician.objects.get()
+        with mock.patch.object(MusicianSerializer, 'to_representation', slow_to_representation):
+            response = self.client.get(f'/main_app/api/musician/{musician.pk}/')
+        self.assertEqual(response.status_code, 200)
+        timing = dict(re.findall(r'(\w+);dur=([\d.]+)', response['Server-Timing']))
+        self.assertGreaterEqual(float(timing['serialize']), 50)
+        self.assertLess(float(timing['render']), 50)
+
+    def test_unsampled_requests_are_only_counted(self):
+        """Requests that aren't sampled get no header, but still count towards the totals.
+        """
+        with self.settings(INSTRUMENTATION_SAMPLE_RATE=0):
+            response = self.client.get('/main_app/api/album/')
+        self.assertNotIn('Server-Timing', response)
+        metrics = self.client.get('/metrics/').content.decode()
+        self.assertIn('http_requests_total{view="album-list",method="GET",status="200"} 1', metrics)
+        self.assertNotIn('http_requests_sampled_total{view="album-list"}', metrics)
+
+    def test_metrics_endpoint(self):
+        """The metrics endpoint serves the totals in the Prometheus text format, behind a token if one is set.
+        """
+        self.client.get('/main_app/api/album/')
+        self.client.get('/main_app/api/album/')
+        response = self.client.get('/metrics/')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        metrics = response.content.decode()
+        self.assertIn('http_requests_total{view="album-list",method="GET",status="200"} 2', metrics)
+        self.assertIn('http_request_duration_seconds_count{view="album-list"} 2', metrics)
+        self.assertIn('http_requests_sampled_total{view="album-list"} 2', metrics)
+        self.assertIn('http_request_db_queries_total{view="album-list"}', metrics)
+        self.assertIn('http_request_render_seconds_total{view="album-list"}', metrics)
+
+        with self.settings(INSTRUMENTATION_METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics/').status_code, 403)
+            response = self.client.get('/metrics/', headers={'Authorization': 'Bearer secret'})
+            self.assertEqual(response.status_code, 200)
+
+    def test_metrics_endpoint_denied_without_token(self):
+        """Without a token, the metrics endpoint is only served when DEBUG is True.
+        """
+        with self.settings(DEBUG=False):
+            self.assertEqual(self.client.get('/metrics/').status_code, 403)
+            with self.settings(INSTRUMENTATION_METRICS_TOKEN='secret'):
+                response = self.client.get('/metrics/', headers={'Authorization': 'Bearer secret'})
+                self.assertEqual(response.status_code, 200)
+
+
+class SeedCommandTests(TestCase):
+    """Tests the 'seed' management command generates the same rows from the same seed.
+    """
+    options = {'labels': 3, 'agents': 2, 'musicians': 10, 'albums': 20, 'chunk_size': 7, 'stdout': StringIO()}
+
+    def get_rows(self):
+        """Returns every seeded row, in a form that can be compared.
+        """
+        return (list(RecordLabel.objects.order_by('pk').values_list('pk', 'name', 'address', 'email')),
+                list(Musician.objects.order_by('pk').values_list('pk', 'first_name', 'last_name', 'agent_id')),
+                list(Album.objects.order_by('pk').values_list('pk', 'title', 'release_date', 'label_id')),
+                list(Album.album_members.through.objects.order_by('album_id', 'musician_id')
+                     .values_list('album_id', 'musician_id')))
+
+    def test_seed_creates_rows_and_agents(self):
+        """The requested rows are created, with musicians managed by agents in the 'Talent Agents' group.
+        """
+        call_command('seed', workers=0, **self.options)
+        self.assertEqual((RecordLabel.objects.count(), Musician.objects.count(), Album.objects.count()), (3, 10, 20))
+        agents = User.objects.filter(groups__name='Talent Agents')
+        self.assertEqual(agents.count(), 2)
+        self.assertFalse(Musician.objects.exclude(agent__in=agents).exists())
+        self.assertTrue(Album.album_members.through.objects.exists())
+
+    def test_seed_is_deterministic_across_workers(self):
+        """The same seed gives the same rows whether they are generated in this process or by worker processes.
+        """
+        call_command('seed', workers=0, **self.options)
+        rows = self.get_rows()
+        for model in (Album, Musician, RecordLabel):
+            model.objects.all().delete()
+        call_command('seed', workers=2, **self.options)
+        self.assertEqual(self.get_rows(), rows)
+
+
+
+class SQLiteProfileTests(TestCase):
+    """Tests the 'production' SQLite profile of the settings configures each new connection.
+    """
+    def test_production_profile_applies_pragmas(self):
+        """New connections use WAL with the tuned PRAGMAs, and transactions take the write lock straight away.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            # A separate connection to a database file, since the test database is in memory and can't use WAL.
+            profile = DatabaseWrapper({**connection.settings_dict, **settings.SQLITE_PROFILES['production'],
+                                       'NAME': os.path.join(directory, 'profile.sqlite3')}, alias='profile')
+            try:
+                with profile.cursor() as cursor:
+                    pragmas = {name: cursor.execute(f'PRAGMA {name}').fetchone()[0]
+                               for name in ('journal_mode', 'synchronous', 'busy_timeout', 'temp_store')}
+            finally:
+                profile.close()
+        self.assertEqual(pragmas, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 5000, 'temp_store': 2})
+        self.assertEqual(profile.transaction_mode, 'IMMEDIATE')
+        self.assertGreater(settings.SQLITE_PROFILES['production']['CONN_MAX_AGE'], 0)
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """Tests the list and retrieve reads go to a replica, and writes, sticky clients and unhealthy replicas go to the
+    primary.
+
+    The replicas are SQLite files in a temporary directory, opened only by this class and copied from the primary
+    with 'sync_replicas()'. The copy waits for any open transaction on the primary, so these tests commit their data
+    instead of running in a transaction like 'TestCase'.
+    """
+    # Aliases of the replicas.
+    replicas = ['replica1', 'replica2']
+
+    @classmethod
+    def setUpClass(cls):
+        """Opens a connection to each replica file under its alias, for the thread running the tests.
+        """
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        for alias in cls.replicas:
+            connections[alias] = DatabaseWrapper({**connection.settings_dict,
+                                                  'NAME': os.path.join(cls.directory.name, f'{alias}.sqlite3')}, alias)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Closes and removes the replica connections and files.
+        """
+        for alias in cls.replicas:
+            connections[alias].close()
+            del connections[alias]
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        """Creates an agent and copies the primary into the replicas, then creates a musician on the primary, which
+        the replicas don't have until they are synced again.
+        """
+        cache.clear()
+        reset_health()
+        self.user = User.objects.create_user('agent', password='password')
+        self.user.groups.add(Group.objects.create(name='Talent Agents'))
+        sync_replicas(self.replicas)
+        self.musician = Musician.objects.create(first_name='Steven', last_name='Wilson', instrument='Guitar',
+                                                agent=self.user)
+
+    def tearDown(self):
+        """Forgets the health checks of the replicas, which may have been made unhealthy.
+        """
+        reset_health()
+
+    def get_client(self):
+        """Returns a client authenticated as the user.
+        """
+        client = APIClient()
+        client.force_authenticate(self.user)
+        return client
+
+    def get_names(self, client):
+        """Returns the last names of the musicians listed to the user.
+        """
+        cache.clear()
+        response = client.get('/main_app/api/musician/')
+        self.assertEqual(response.status_code, 200)
+        return [musician['last_name'] for musician in response.data['results']]
+
+    @override_settings(DATABASE_REPLICAS=['replica1'])
+    def test_list_and_retrieve_read_from_replica(self):
+        """Reads see the replica's data, which only includes the primary's once it has been synced.
+        """
+        client = self.get_client()
+        self.assertEqual(self.get_names(client), [])
+        self.assertEqual(client.get(f'/main_app/api/musician/{self.musician.pk}/').status_code, 404)
+        self.assertEqual(sync_replicas(), ['replica1'])
+        self.assertEqual(self.get_names(client), ['Wilson'])
+        self.assertEqual(client.get(f'/main_app/api/musician/{self.musician.pk}/').status_code, 200)
+
+    @override_settings(DATABASE_REPLICAS=['replica1'], DATABASE_REPLICA_CACHE_TIMEOUT=3, RESPONSE_CACHE_TIMEOUT=600)
+    def test_cache_miss_reads_from_replica(self):
+        """A cache miss of a cached ViewSet is read from the replica, and its response is only cached for
+        'DATABASE_REPLICA_CACHE_TIMEOUT' seconds. The authorization data stored in the cache is read from the primary.
+        """
+        label = RecordLabel.objects.create(name='Kscope', address='1 Music Lane', email='info@kscope.com')
+        self.user.groups.add(Group.objects.create(name='Admin'))
+        client = self.get_client()
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            with CaptureQueriesContext(connections['replica1']) as replica_queries:
+                response = client.get('/main_app/api/record_label/')
+                self.assertEqual(response.data['results'], [])
+                self.assertEqual(client.get(f'/main_app/api/record_label/{label.pk}/').status_code, 404)
+        self.assertTrue(any('main_app_recordlabel' in query['sql'] for query in replica_queries))
+        timeouts = [call.args[2] for call in cache_set.call_args_list if call.args[0].startswith('main_app:response:')]
+        # The retrieve isn't found on the replica, and responses other than 200 OK aren't cached.
+        self.assertEqual(timeouts, [3])
+        # The musician list reads the user's groups from the primary, which has the 'Admin' group the replica doesn't
+        # have yet.
+        self.assertEqual(client.get('/main_app/api/musician/').status_code, 200)
+        self.assertEqual(set(cache.get(get_cache_key(self.user.pk))['groups']), {'Admin', 'Talent Agents'})
+
+        # Responses read from the primary, here because the client just wrote, are cached for the full timeout.
+        cache.clear()
+        client.cookies[STICKY_COOKIE] = str(time.time() + 60)
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            response = client.get('/main_app/api/record_label/')
+        self.assertEqual([label['name'] for label in response.data['results']], ['Kscope'])
+        timeouts = [call.args[2] for call in cache_set.call_args_list if call.args[0].startswith('main_app:response:')]
+        self.assertEqual(timeouts, [600])
+
+    @override_settings(DATABASE_REPLICAS=['replica1'], DATABASE_REPLICA_STICKY_SECONDS=60)
+    def test_write_pins_client_to_primary(self):
+        """A write sets the sticky cookie, so the client then reads its own writes while other clients read the
+        replica.
+        """
+        client = self.get_client()
+        response = client.post('/main_app/api/musician/',
+                               {'first_name': 'Gavin', 'last_name': 'Harrison', 'instrument': 'Drums'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.cookies[STICKY_COOKIE]['max-age'], 60)
+        self.assertEqual(sorted(self.get_names(client)), ['Harrison', 'Wilson'])
+        self.assertEqual(self.get_names(self.get_client()), [])
+
+    def test_write_pins_rest_of_request_to_primary(self):
+        """Once a request writes, or inside 'read_primary()', its reads go to the primary even when the view allows
+        replicas.
+        """
+        router = ReplicaRouter()
+        with override_settings(DATABASE_REPLICAS=['replica1']):
+            token = current_state.set(RequestState())
+            try:
+                use_replicas()
+                self.assertEqual(router.db_for_read(Musician), 'replica1')
+                with read_primary():
+                    self.assertEqual(router.db_for_read(Musician), 'default')
+                self.assertEqual(router.db_for_read(Musician), 'replica1')
+                self.assertEqual(router.db_for_write(Musician), 'default')
+                self.assertEqual(router.db_for_read(Musician), 'default')
+            finally:
+                current_state.reset(token)
+            # Outside of a request, such as in management commands, reads go to the primary.
+            self.assertEqual(router.db_for_read(Musician), 'default')
+
+    @override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+    def test_unhealthy_replica_falls_back(self):
+        """An unreachable replica is left out, and reads go to the primary when no replica is healthy.
+        """
+        sync_replicas(['replica2'])
+        client = self.get_client()
+        error = OperationalError('unable to open database file')
+        with mock.patch.object(connections['replica1'], 'cursor', side_effect=error):
+            self.assertEqual(self.get_names(client), ['Wilson'])
+            reset_health()
+            with mock.patch.object(connections['replica2'], 'cursor', side_effect=error):
+                Musician.objects.create(first_name='Gavin', last_name='Harrison', instrument='Drums', agent=self.user)
+                self.assertEqual(sorted(self.get_names(client)), ['Harrison', 'Wilson'])
@@ -11,7 +11,7 @@ from django.urls import path, include
 from . import views
 
 # Import 'DefaultRouter' from Django REST Framework to create a router that automatically generates URL conf for ViewSets.
-from rest_framework.routers import DefaultRouter
+from rest_framework.routers import DefaultRouter, SimpleRouter
 # Initialize the router instance that will manage the URL routing for API endpoints, mapping them to the corresponding ViewSets.
 router = DefaultRouter()
 # Register ViewSets with the router. This allows for automatic generation of the standard CRUD URLs for each ViewSet.
@@ -20,6 +20,13 @@ router.register(r'record_label', views.RecordLabelViewSet)
 router.register(r'musician', views.MusicianViewSet)
 router.register(r'album', views.AlbumViewSet)
 
+# The async ViewSets serve the same resources under 'api/async/'. They are registered with their own basename so their
+# URL names (e.g. 'async-album-list') don't clash with the sync ones, and without a second API root view.
+async_router = SimpleRouter()
+async_router.register(r'record_label', views.AsyncRecordLabelViewSet, basename='async-recordlabel')
+async_router.register(r'musician', views.AsyncMusicianViewSet, basename='async-musician')
+async_router.register(r'album', views.AsyncAlbumViewSet, basename='async-album')
+
 # URL patterns define the routes for the application, mapping specific URL paths to their corresponding view functions.
 # The base URL is defined in 'config/urls.py' (main_app/), so these serve as an extension to that.
 # For example when using 'python manage.py runserver' -> http://127.0.0.1:8000/main_app/api/record_label/
@@ -28,5 +35,6 @@ urlpatterns = [
     path('', views.index, name='index'),
     # API endpoints - the registered routes need to be included in the urlpatterns. It's common practice to include 'api/' in the
     # path to ensure all your API endpoints have a clear distinction.
+    path('api/async/', include(async_router.urls)),
     path('api/', include(router.urls)),
 ]
@@ -5,16 +5,52 @@ interacts with the data models, and returns HTTP responses. The views can be cat
 and API views, where API views are designed for programmatic access to resources, typically in JSON format.
 """
 
+# Imports 'partial' to pass a ViewSet action, with its arguments, to the helper that only calls it when needed.
+from functools import partial
 # Imports the 'render' function to serve HTML files (templates) as HttpResponse.
 from django.shortcuts import render
 # Imports 'Response' class for returning responses in various formats.
 from rest_framework.response import Response
 # Imports HTTP viewsets, status codes, permissions ,and filter classes for controlling access to API views.
 from rest_framework import viewsets, status, permissions, filters
+# Imports the 'action' decorator to add extra endpoints (such as 'bulk/') to a ViewSet's router URLs.
+from rest_framework.decorators import action
+# Imports exceptions that Django REST Framework turns into 400 Bad Request and 404 Not Found responses.
+from rest_framework.exceptions import NotFound, ValidationError
+# Imports 'transaction' so that bulk writes either fully succeed or leave the database unchanged.
+from django.db import transaction
+# Imports the helpers that run the async ViewSets on the event loop, and hand sync code to a thread when needed.
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import Http404
+from django.utils.decorators import classonlymethod
+# Imports the default cache to serve cached responses, and the helpers that key them and answer conditional requests
+# with 304 Not Modified (see 'caching.py').
+from django.core.cache import cache
+from .caching import (
+    get_cache_timeout, get_not_modified_response, get_response_cache_key, make_etag, set_validators,
+)
+# Imports 'Max' to find the latest change to the related objects of a list, for its ETag.
+from django.db.models import Max
 # Import the models defined in the 'models.py' file to be accessed by API views.
 from .models import RecordLabel, Musician, Album
 # Imports serializers in 'serializers.py' to convert model instances to JSON and validate incoming data.
 from .serializers import RecordLabelSerializer, MusicianSerializer, AlbumSerializer
+# Imports the query planner that adds 'select_related'/'prefetch_related' based on the serializer's nested fields.
+from .querysets import plan_queryset
+# Imports the compiled serializers that build list responses from '.values()' rows instead of model instances.
+from .row_serializers import get_row_serializer
+# Imports the request-scoped authorization context that loads the user's groups and permissions once per request.
+from .authorization import aget_authorization_context, get_authorization_context
+# Imports custom permission classes, such as the object level check that a user is the agent managing a musician.
+from .permissions import IsManagingAgent
+# Imports the full-text search filter, which uses SQLite FTS5 or PostgreSQL tsvector indexes to search and rank results.
+from .search import FullTextSearchFilter
+# Imports the helpers that let the reads of the current request go to a read replica, and tell whether they did (see
+# 'config/replicas.py').
+from config.replicas import get_read_replica, use_replicas
+# Imports the helper that adds the time spent serializing rows to the request's measurements.
+from config.instrumentation import measure_serialization
 
 # Regular views - Regular views in Django respond to HTTP requests by returning HTML content. 
 # They can utilize the 'render' function, which points to a given template (like 'index.html') with context data to 
@@ -31,7 +67,314 @@ def index(request):
 # related API views for a model into a single class. They automatically handle requests based on HTTP methods (GET, POST, PUT, 
 # PATCH, DELETE) and support features like authentication, permissions, and data serialization. These features drastically reduce 
 # the amount of code required.
-class RecordLabelViewSet(viewsets.ModelViewSet):
+class QueryPlanMixin:
+    """Mixin for ViewSets that applies the query plan of the ViewSet's serializer to its queryset.
+
+    Without this, each nested serializer field (e.g. an Album's 'label' and 'album_members', or a Musician's
+    'agent_username') triggers its own query for every instance in a list response (the N + 1 query problem).
+    """
+    def get_queryset(self):
+        """Returns the base queryset with related objects joined or prefetched for serialization.
+        """
+        return plan_queryset(super().get_queryset(), self.get_serializer_class())
+
+class BulkModelMixin:
+    """Mixin for ViewSets that adds a 'bulk/' endpoint for writing many instances in one request.
+
+    Methods:
+        - bulk: (POST) Create instances from a JSON array of objects.
+                (PATCH) Update instances from a JSON array of objects that each include the 'id' of the instance.
+                (DELETE) Delete instances from a JSON array of 'id's.
+
+    Items are validated with the ViewSet's serializer (many=True) and written in a single transaction with
+    'bulk_create'/'bulk_update' (see 'BulkListSerializer' in 'serializers.py'). ViewSets enforce their access
+    rules by overriding 'check_bulk_permission', and object permissions are checked for every instance.
+
+    Returns:
+        - create: Status code 201 with a JSON object listing the 'ids' of the created instances.
+        - update: Status code 200 with a JSON object listing the 'ids' of the updated instances.
+        - destroy: Status code indicating success (204 No Content) with no body.
+    """
+    # Maps each HTTP method of the bulk endpoint to the operation it performs.
+    bulk_operations = {'POST': 'create', 'PATCH': 'update', 'DELETE': 'destroy'}
+
+    @action(detail=False, methods=['post', 'patch', 'delete'], url_path='bulk')
+    def bulk(self, request, *args, **kwargs):
+        """Checks the request contains a list of items and the user may perform the operation, then performs it.
+        """
+        if not isinstance(request.data, list) or not request.data:
+            return Response({'res': 'Expected a non-empty JSON array.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        operation = self.bulk_operations[request.method]
+        denied = self.check_bulk_permission(request, operation)
+        if denied is not None:
+            return denied
+
+        return getattr(self, f'bulk_{operation}')(request)
+
+    def check_bulk_permission(self, request, operation):
+        """Returns a 403 Forbidden response if the user may not perform the operation, otherwise None.
+        """
+        return None
+
+    def get_bulk_ids(self, items):
+        """Returns the 'id' of each item. Items can be objects with an 'id' key or the 'id' itself.
+        """
+        ids = [item.get('id') if isinstance(item, dict) else item for item in items]
+        if not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids) or len(set(ids)) != len(ids):
+            raise ValidationError({'res': 'Every item must have a unique integer id.'})
+        return ids
+
+    def get_bulk_instances(self, request, ids):
+        """Fetches the instances with the given 'id's in a single query, in the same order as the 'id's.
+
+        The ViewSet's queryset is used so instances the user cannot access are reported as not found,
+        and the object permissions are checked for every instance.
+        """
+        instances = self.get_queryset().prefetch_related(None).in_bulk(ids)
+        missing = [pk for pk in ids if pk not in instances]
+        if missing:
+            raise NotFound({'res': f'No {self.get_queryset().model._meta.verbose_name} found with id(s): {missing}.'})
+        for instance in instances.values():
+            self.check_object_permissions(request, instance)
+        return [instances[pk] for pk in ids]
+
+    def perform_bulk_create(self, serializer):
+        """Saves the validated list serializer, returning the created instances.
+        """
+        return serializer.save()
+
+    def bulk_create(self, request):
+        """Validates and creates all items in one transaction.
+        """
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            instances = self.perform_bulk_create(serializer)
+        return Response({'ids': [instance.pk for instance in instances]}, status=status.HTTP_201_CREATED)
+
+    def bulk_update(self, request):
+        """Validates and updates all items in one transaction. Only the fields present in each item are changed.
+        """
+        instances = self.get_bulk_instances(request, self.get_bulk_ids(request.data))
+        serializer = self.get_serializer(instances, data=request.data, many=True, partial=True)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            serializer.save()
+        return Response({'ids': [instance.pk for instance in instances]}, status=status.HTTP_200_OK)
+
+    def bulk_destroy(self, request):
+        """Deletes all items in one transaction.
+        """
+        ids = self.get_bulk_ids(request.data)
+        self.get_bulk_instances(request, ids)
+        with transaction.atomic():
+            self.get_queryset().model._default_manager.filter(pk__in=ids).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class ConditionalGetMixin:
+    """Mixin for ViewSets that answers conditional GET requests on 'list' and 'retrieve' with 304 Not Modified.
+
+    Responses carry an 'ETag' header, and retrieve responses a 'Last-Modified' header too. When a client sends them
+    back in 'If-None-Match' (or 'If-Modified-Since') and nothing has changed, an empty 304 response is returned without
+    serializing anything.
+        - list: The validators come from the ids and 'updated_at' of the rows of the requested page (plus the row that
+          tells whether there is a next page), read with the same keyset query as the page itself so the check never
+          scans the whole table. The rows are counted, their ids summed (so replacing a row with another changes the
+          ETag) and the latest 'updated_at' found. One aggregate query adds the latest 'updated_at' of the related
+          models in 'conditional_related_fields'. Lists have no 'Last-Modified', since deleting a row doesn't change
+          the latest 'updated_at' of the others.
+        - retrieve: The validators come from the instance and its related objects, fetched (with the object
+          permissions checked) by 'get_object()'.
+
+    Deleting an instance changes the ids of its page, and the signal receivers in 'signals.py' update an album's
+    'updated_at' when its members change or one of them is deleted, and a musician's (and its albums') when its
+    agent is renamed.
+    """
+    # Related models included in the responses, whose 'updated_at' also changes the validators.
+    conditional_related_fields = []
+    # Whether the queryset depends on the user, in which case the user is part of the ETag.
+    conditional_per_user = False
+    # The (etag, last_modified) of the last response, read by 'CachedResponseMixin' when caching it.
+    response_validators = None
+
+    def list(self, request, *args, **kwargs):
+        """Retrieve a page of instances, or 304 Not Modified if the client's copy is current.
+        """
+        validators = self.get_list_validators(self.filter_queryset(self.get_queryset()))
+        return self.get_conditional_response(request, validators, partial(super().list, request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        """Retrieve a specific instance by ID, or 304 Not Modified if the client's copy is current.
+        """
+        instance = self.get_object()
+        return self.get_conditional_response(request, self.get_instance_validators(instance),
+                                             lambda: Response(self.get_serializer(instance).data))
+
+    def get_conditional_response(self, request, validators, handler):
+        """Returns 304 Not Modified if the request's validators match, otherwise the handler's response.
+        """
+        response = get_not_modified_response(request, *validators)
+        if response is None:
+            response = handler()
+        return self.add_validators(response, validators)
+
+    def add_validators(self, response, validators):
+        """Adds the ETag and Last-Modified headers to a successful or 304 Not Modified response.
+        """
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            set_validators(response, *validators)
+            self.response_validators = validators
+        return response
+
+    def get_validator_rows(self, queryset):
+        """Returns the queryset of the (id, updated_at) of the rows of the requested page (or of the whole queryset
+        if it isn't paginated).
+        """
+        paginator = self.paginator
+        page = paginator.get_page_queryset(queryset, self.request) if paginator is not None else None
+        return (queryset if page is None else page).values_list('pk', 'updated_at')
+
+    def get_related_aggregates(self):
+        """Returns the aggregates finding the latest 'updated_at' of each of the 'conditional_related_fields'.
+        """
+        return {f'{field}_updated_at': Max(f'{field}__updated_at') for field in self.conditional_related_fields}
+
+    def get_list_values(self, rows):
+        """Returns the count, sum of ids and latest 'updated_at' of the (id, updated_at) rows of a list.
+        """
+        return {'count': len(rows), 'pk_sum': sum(pk for pk, _ in rows),
+                'updated_at': max((updated_at for _, updated_at in rows), default=None)}
+
+    def get_list_validators(self, queryset):
+        """Returns the (etag, None) of a list page, with one query (plus one for any related models).
+        """
+        rows = list(self.get_validator_rows(queryset))
+        values = self.get_list_values(rows)
+        if self.conditional_related_fields:
+            related = queryset.model._default_manager.filter(pk__in=[pk for pk, _ in rows])
+            values.update(related.aggregate(**self.get_related_aggregates()))
+        return self.make_validators(values, last_modified=False)
+
+    async def aget_list_validators(self, queryset):
+        """Async version of 'get_list_validators'.
+        """
+        rows = [row async for row in self.get_validator_rows(queryset)]
+        values = self.get_list_values(rows)
+        if self.conditional_related_fields:
+            related = queryset.model._default_manager.filter(pk__in=[pk for pk, _ in rows])
+            values.update(await related.aaggregate(**self.get_related_aggregates()))
+        return self.make_validators(values, last_modified=False)
+
+    def get_instance_validators(self, instance):
+        """Returns the (etag, last_modified) of an instance. The related objects are expected to be prefetched.
+        """
+        values = {'count': 1, 'pk_sum': instance.pk, 'updated_at': instance.updated_at}
+        for field in self.conditional_related_fields:
+            related = getattr(instance, field)
+            times = [obj.updated_at for obj in related.all()] if hasattr(related, 'all') else [related.updated_at]
+            values[f'{field}_updated_at'] = max(times, default=None)
+        return self.make_validators(values)
+
+    def make_validators(self, values, last_modified=True):
+        """Returns the (etag, last_modified) of a response from its count and 'updated_at' values, with a None
+        last_modified if 'last_modified' is False.
+
+        The ETag also covers the path and query string, since each page (and each ordering or search) of a list
+        shows different instances of the same queryset.
+        """
+        times = [value for name, value in values.items() if name.endswith('updated_at') and value is not None]
+        user = self.request.user.pk if self.conditional_per_user else None
+        etag = make_etag([self.request.get_full_path(), user, values])
+        return etag, max(times, default=None) if last_modified else None
+
+class CachedResponseMixin:
+    """Mixin for ViewSets that caches the responses of 'list' and 'retrieve' (see 'caching.py').
+
+    Responses are cached per 'cache_group', keyed by the request path and the 'cache_query_params' the ViewSet
+    reads. They must be the same for every user allowed to see them, so ViewSets whose results depend on the user
+    (such as musicians) can't use it. Access checks made before calling 'super().list()' or 'super().retrieve()'
+    still run on every request.
+
+    On a cache miss in views that read from replicas, the response is read from a replica like any other read, and
+    is then only cached for 'DATABASE_REPLICA_CACHE_TIMEOUT' seconds, so a lagging replica's data doesn't outlive
+    the replication lag.
+
+    Cached responses keep their ETag and Last-Modified headers (from 'ConditionalGetMixin' when the ViewSet uses it
+    after this mixin, otherwise an ETag of the data), and a request sending them back gets 304 Not Modified without
+    any query.
+    """
+    # Name of the cache group, whose version is bumped when a model included in the responses changes.
+    cache_group = None
+    # Query parameters that change the response, and so are part of the cache key.
+    cache_query_params = ['cursor', 'page_size']
+
+    def list(self, request, *args, **kwargs):
+        """Retrieve a page of instances, from the cache if possible.
+        """
+        return self.get_cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        """Retrieve a specific instance by ID, from the cache if possible.
+        """
+        return self.get_cached_response(request, super().retrieve, *args, **kwargs)
+
+    def get_cached_response(self, request, handler, *args, **kwargs):
+        """Returns the cached response of the request, or calls the handler and caches its response if it succeeds.
+        """
+        key = get_response_cache_key(self.cache_group, request, self.cache_query_params)
+        cached = cache.get(key)
+        if cached is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            validators = getattr(self, 'response_validators', None) or (make_etag(response.data), None)
+            cached = {'data': response.data, 'validators': validators}
+            cache.set(key, cached, get_cache_timeout(get_read_replica()))
+        else:
+            response = get_not_modified_response(request, *cached['validators']) or Response(cached['data'])
+
+        set_validators(response, *cached['validators'])
+        return response
+
+class RowSerializerMixin:
+    """Mixin for ViewSets that serializes the pages of 'list' from '.values()' rows (see 'row_serializers.py').
+
+    The response has the same shape as the regular serializer's, without creating model instances or calling each
+    field's 'to_representation', which makes serializing large pages several times faster. Other actions, and writes
+    in particular, still use the regular serializer.
+    """
+    def list(self, request, *args, **kwargs):
+        """Retrieve a page of instances, serialized from rows.
+        """
+        row_serializer = get_row_serializer(self.get_serializer_class())
+        queryset = row_serializer.get_queryset(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        rows = list(queryset) if page is None else page
+        with measure_serialization():
+            data = row_serializer.serialize(rows, queryset.db)
+        if page is None:
+            return Response(data)
+        return self.get_paginated_response(data)
+
+class ReplicaReadMixin:
+    """Mixin for ViewSets whose 'replica_actions' read from a replica (see 'config/replicas.py').
+
+    The authentication and permission checks of 'initial()' still read from the primary. A request that writes, or
+    comes from a client that wrote within the last 'DATABASE_REPLICA_STICKY_SECONDS', reads from the primary.
+    """
+    # Actions whose reads can go to a replica.
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        """Runs the checks of the request, then lets the reads of the replica actions go to a replica.
+        """
+        super().initial(request, *args, **kwargs)
+        if self.action in self.replica_actions:
+            use_replicas()
+
+class RecordLabelViewSet(ReplicaReadMixin, CachedResponseMixin, ConditionalGetMixin, QueryPlanMixin,
+                         viewsets.ModelViewSet):
     """This viewset handles HTTP requests for managing record labels.
 
     It provides the full range of CRUD (Create, Read, Update, Delete) operations for 
@@ -57,30 +400,44 @@ class RecordLabelViewSet(viewsets.ModelViewSet):
         }
 
     Returns:
-        - list: A JSON array of serialized RecordLabel instances.
+        - list: A paginated JSON object with 'next', 'previous' and 'results' (serialized RecordLabel instances).
         - create: A JSON object of the newly created RecordLabel instance.pip 
         - retrieve: A JSON object of the specific RecordLabel instance.
         - update: A JSON object of the updated RecordLabel instance.
         - destroy: Status code indicating success (204 No Content) with no body, or an error message if deletion fails.
         
     Filtering and Sorting:
-        - `searchName`: Used to filter record labels based on their name, performing a case-insensitive 
-          partial match. Example: `/main_app/api/record_label/?searchName=Sumerian`
+        - `searchName` (or `search`): Used to full-text search record labels by name, matching every word of the
+          search as a case-insensitive prefix of a word in the name. Results are ranked, best match first, unless
+          an `ordering` is given. Example: `/main_app/api/record_label/?searchName=Sumerian`
         - `filter`: Allows filtering of record labels by exact name match. Example: `/main_app/api/record_label/?filter=Sumerian Records`
         - `ordering`: Specify fields such as 'name', 'address', and 'email' to sort the results. 
           Default ordering is by 'id'. Example: `/main_app/api/record_label/?ordering=name` 
 
         You can combine multiple query parameters in a single URL. For instance: 
         `/main_app/api/record_label/?searchName=Sumerian&filter=Sumerian Records&ordering=name`
+
+    Pagination:
+        List responses are paginated with keyset pagination on (ordering field, id), see 'pagination.py'.
+        - `cursor`: The position of the page to fetch, taken from the `next` or `previous` link of a response.
+        - `page_size`: Number of results per page (default 50, maximum 500). Example: `/main_app/api/record_label/?page_size=10`
+
+    Caching:
+        List and retrieve responses are cached until a record label changes (see 'CachedResponseMixin'). They include
+        an `ETag` header (and retrieve responses a `Last-Modified` header), send it back in `If-None-Match` (or
+        `If-Modified-Since`) to get 304 Not Modified while the data is unchanged (see 'ConditionalGetMixin').
     """
     queryset = RecordLabel.objects.all()
     serializer_class = RecordLabelSerializer
     permission_classes = [permissions.IsAuthenticated]
+    # Cache the list and retrieve responses, keyed by every query parameter that changes them.
+    cache_group = 'record_label'
+    cache_query_params = ['searchName', 'search', 'filter', 'ordering', 'cursor', 'page_size']
     
-    # Add filter backends to support functions
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    # Add fields you want to allow filtering and ordering by
-    search_fields = ['name']
+    # Add filter backends to support functions. The search comes after the ordering so it can order by rank.
+    filter_backends = [filters.OrderingFilter, FullTextSearchFilter]
+    # Add the query parameters used for searching, and the fields you want to allow ordering by
+    full_text_search_params = ['searchName', 'search']
     ordering_fields = ['name', 'address', 'email']
     ordering = ['id'] # Default ordering parameter
     
@@ -88,20 +445,19 @@ class RecordLabelViewSet(viewsets.ModelViewSet):
         """Retrieves a queryset of RecordLabels based on search, filter, and order options.
         
         These options are appended to the URL as query parameters by JavaScript. It filters 
-        the queryset based on the provided search name or filter name if present.
+        the queryset based on the provided filter name if present. The search name is handled by
+        'FullTextSearchFilter' and the ordering by 'OrderingFilter' (see 'filter_backends').
         """
         queryset = super().get_queryset()
-        search_name = self.request.query_params.get('searchName', None)
         filter_name = self.request.query_params.get('filter', None)
 
-        if search_name:
-            queryset = queryset.filter(name__icontains=search_name)
         if filter_name:
             queryset = queryset.filter(name__exact=filter_name)
 
         return queryset
     
-class MusicianViewSet(viewsets.ModelViewSet):
+class MusicianViewSet(ReplicaReadMixin, ConditionalGetMixin, QueryPlanMixin, BulkModelMixin,
+                      viewsets.ModelViewSet):
     """This viewset handles HTTP requests for managing musicians.
 
     It provides the full range of CRUD (Create, Read, Update, Delete) operations for 
@@ -118,6 +474,8 @@ class MusicianViewSet(viewsets.ModelViewSet):
         - update: (PUT) Update a specific Musician instance by ID, only if the user manages it.
                   (PATCH) Update specific fields of a Musician instance by ID.
         - destroy: (DELETE) Delete a specific Musician instance by ID, only if the user manages it.
+        - bulk: (POST) Create many Musician instances at once, only if the user is a 'Talent Agent'.
+                (PATCH/DELETE) Update or delete many Musician instances at once, only if the user manages all of them.
 
     Parameters:
         The expected input for create and update actions is in JSON format:
@@ -128,7 +486,7 @@ class MusicianViewSet(viewsets.ModelViewSet):
         }
 
     Returns:
-        - list: A JSON array of serialized Musician instances based on user Group.
+        - list: A paginated JSON object with 'next', 'previous' and 'results' (serialized Musician instances based on user Group).
         - create: A JSON object of the newly created Musician instance.
         - retrieve: A JSON object of the specific Musician instance.
         - update: A JSON object of the updated Musician instance.
@@ -136,7 +494,11 @@ class MusicianViewSet(viewsets.ModelViewSet):
     """
     queryset = Musician.objects.all()
     serializer_class = MusicianSerializer
-    permission_classes = [permissions.IsAuthenticated]
+    # 'IsManagingAgent' is checked against the instance fetched by 'get_object()' in retrieve, update and destroy,
+    # so only the agent that manages a musician can access it without fetching the musician a second time.
+    permission_classes = [permissions.IsAuthenticated, IsManagingAgent]
+    # Each agent sees different musicians, so the ETag of a list depends on the user (see 'ConditionalGetMixin').
+    conditional_per_user = True
 
     def get_queryset(self):
         """Retrieve a queryset of Musician instances based on the user's group.
@@ -146,12 +508,14 @@ class MusicianViewSet(viewsets.ModelViewSet):
         This method is used by the parent class methods (e.g., list, retrieve, update, destroy) through the
         super() function to ensure that the queryset reflects the permissions of the authenticated user.
         """
-        if self.request.user.groups.filter(name='Admin').exists():
-            return Musician.objects.all()
-        elif self.request.user.groups.filter(name='Talent Agents').exists():
-            return Musician.objects.filter(agent=self.request.user)
+        queryset = super().get_queryset()
+        authorization = get_authorization_context(self.request)
+        if authorization.in_group('Admin'):
+            return queryset
+        elif authorization.in_group('Talent Agents'):
+            return queryset.filter(agent=self.request.user)
         else:
-            return Musician.objects.none()
+            return queryset.none()
 
     # Override the create method to enforce group-based authorization
     def create(self, request, *args, **kwargs):
@@ -159,52 +523,33 @@ class MusicianViewSet(viewsets.ModelViewSet):
 
         Only users belonging to the 'Talent Agents' Group can use this method.
         """
-        if not request.user.groups.filter(name='Talent Agents').exists():
+        if not get_authorization_context(request).in_group('Talent Agents'):
             return Response({'res': 'You do not have permission to create a musician.'},
                             status=status.HTTP_403_FORBIDDEN)
 
         return super().create(request, *args, **kwargs)
 
-    # Override the retrieve method to enforce group-based authorization
-    def retrieve(self, request, *args, **kwargs):
-        """Retrieve a specific Musician instance by ID.
-
-        Only the agent that manages a musician can perform this action.
+    def perform_create(self, serializer):
+        """Saves a new Musician with the current user as its agent.
         """
-        musician_instance = self.get_object()
-        if musician_instance.agent != request.user:
-            return Response({'res': 'You do not have permission to view this musician.'},
-                            status=status.HTTP_403_FORBIDDEN)
-
-        return super().retrieve(request, *args, **kwargs)
-
-    # Override the update method to enforce group-based authorization
-    def update(self, request, *args, **kwargs):
-        """Update a specific Musician instance by ID.
+        serializer.save(agent=self.request.user)
 
-        Only the agent that manages the musician can perform this action.
+    def check_bulk_permission(self, request, operation):
+        """Only 'Talent Agents' can bulk create musicians. Bulk updates and deletes are limited to the musicians
+        the user manages by 'get_queryset' and 'IsManagingAgent', the same as the single instance methods.
         """
-        musician_instance = self.get_object()
-        if musician_instance.agent != request.user:
-            return Response({'res': 'You do not have permission to update this musician.'},
+        if operation == 'create' and not get_authorization_context(request).in_group('Talent Agents'):
+            return Response({'res': 'You do not have permission to create musicians.'},
                             status=status.HTTP_403_FORBIDDEN)
+        return None
 
-        return super().update(request, *args, **kwargs)
-
-    # Override the destroy method to enforce group-based authorization
-    def destroy(self, request, *args, **kwargs):
-        """Delete a specific Musician instance by ID.
-
-        Only the agent that manages the musician can perform this action.
+    def perform_bulk_create(self, serializer):
+        """Saves the new Musicians with the current user as their agent.
         """
-        musician_instance = self.get_object()
-        if musician_instance.agent != request.user:
-            return Response({'res': 'You do not have permission to delete this musician.'},
-                            status=status.HTTP_403_FORBIDDEN)
-
-        return super().destroy(request, *args, **kwargs)
+        return serializer.save(agent=self.request.user)
  
-class AlbumViewSet(viewsets.ModelViewSet):
+class AlbumViewSet(ReplicaReadMixin, CachedResponseMixin, ConditionalGetMixin, RowSerializerMixin, QueryPlanMixin,
+                  BulkModelMixin, viewsets.ModelViewSet):
     """This viewset handles HTTP requests for managing albums.
 
     It provides the full range of CRUD (Create, Read, Update, Delete) operations for 
@@ -221,6 +566,7 @@ class AlbumViewSet(viewsets.ModelViewSet):
         - update: (PUT) Update a specific Album instance by ID, only if the user has permission to change it.
                   (PATCH) Update specific fields of an Album instance by ID, subject to permissions.
         - destroy: (DELETE) Delete a specific Album instance by ID, only if the user has permission to delete it.
+        - bulk: (POST/PATCH/DELETE) Create, update or delete many Album instances at once, subject to the same permissions.
 
     Parameters:
         The expected input for create and update actions is in JSON format:
@@ -229,20 +575,35 @@ class AlbumViewSet(viewsets.ModelViewSet):
             "artist": "Famous Artist",          # Expects a string with a maximum length of 200 characters.
             "release_date": "2024-08-04",       # Expects a string in the format YYYY-MM-DD.
             "genre": "Rock",                     # Expects a string with a maximum length of 100 characters.
-            "label": 1,                         # Expects an int representing an existing record label 'id'.
-            "album_members": [2, 3]             # Expects a list of ints representing existing musician 'id's.
+            "label_id": 1,                      # Expects an int representing an existing record label 'id'.
+            "album_member_ids": [2, 3]          # Expects a list of ints representing existing musician 'id's.
         }
 
     Returns:
-        - list: A JSON array of serialized Album instances that the user has permission to view.
+        - list: A paginated JSON object with 'next', 'previous' and 'results' (serialized Album instances).
         - create: A JSON object of the newly created Album instance.
         - retrieve: A JSON object of the specific Album instance.
         - update: A JSON object of the updated Album instance.
         - destroy: Status code indicating success (204 No Content) with no body, or an error message if deletion fails.
+
+    Searching:
+        - `search`: Full-text search across the album title, artist and genre, matching every word of the search
+          as a case-insensitive prefix. Results are ranked, best match first. Example: `/main_app/api/album/?search=rock`
+
+    Serialization:
+        - list: Pages are serialized from '.values()' rows by 'RowSerializerMixin', with the same JSON as
+          `AlbumSerializer`. Their members are read with one query per page.
     """
     queryset = Album.objects.all()
     serializer_class = AlbumSerializer
     permission_classes = [permissions.IsAuthenticated]
+    # Cache the list and retrieve responses. The permission checks in 'list' and 'retrieve' run before the cache.
+    cache_group = 'album'
+    cache_query_params = ['search', 'cursor', 'page_size']
+    # Albums show their record label and members, so a change to them also changes the ETag and Last-Modified.
+    conditional_related_fields = ['label', 'album_members']
+    # Full-text search across the album title, artist and genre with the 'search' query parameter.
+    filter_backends = [FullTextSearchFilter]
 
     # Override the list method to enforce permission based authorization
     def list(self, request, *args, **kwargs):
@@ -250,7 +611,7 @@ class AlbumViewSet(viewsets.ModelViewSet):
         
         Only users with the permission 'main_app.view_album' can use this method.
         """
-        if not request.user.has_perm('main_app.view_album'):
+        if not get_authorization_context(request).has_perm('main_app.view_album'):
             return Response({'res': 'You do not have permission to view albums.'},
                             status=status.HTTP_403_FORBIDDEN)
 
@@ -262,7 +623,7 @@ class AlbumViewSet(viewsets.ModelViewSet):
         
         Only users with the permission 'main_app.add_album' can use this method.
         """
-        if not request.user.has_perm('main_app.add_album'):
+        if not get_authorization_context(request).has_perm('main_app.add_album'):
             return Response({'res': 'You do not have permission to create an album.'},
                             status=status.HTTP_403_FORBIDDEN)
 
@@ -274,7 +635,7 @@ class AlbumViewSet(viewsets.ModelViewSet):
         
         Only users with the permission 'main_app.view_album' can use this method.
         """
-        if not request.user.has_perm('main_app.view_album'):
+        if not get_authorization_context(request).has_perm('main_app.view_album'):
             return Response({'res': 'You do not have permission to view this album.'},
                             status=status.HTTP_403_FORBIDDEN)
 
@@ -286,7 +647,7 @@ class AlbumViewSet(viewsets.ModelViewSet):
         
         Only users with the permission 'main_app.change_album' can use this method.
         """
-        if not request.user.has_perm('main_app.change_album'):
+        if not get_authorization_context(request).has_perm('main_app.change_album'):
             return Response({'res': 'You do not have permission to update this album.'},
                             status=status.HTTP_403_FORBIDDEN)
 
@@ -298,9 +659,218 @@ class AlbumViewSet(viewsets.ModelViewSet):
         
         Only users with the permission 'main_app.delete_album' can use this method.
         """
-        if not request.user.has_perm('main_app.delete_album'):
+        if not get_authorization_context(request).has_perm('main_app.delete_album'):
             return Response({'res': 'You do not have permission to delete this album.'},
                             status=status.HTTP_403_FORBIDDEN)
 
         return super().destroy(request, *args, **kwargs)
-    
\ No newline at end of file
+
+    # The permission required by each bulk operation, along with the message returned when it is missing.
+    bulk_permissions = {
+        'create': ('main_app.add_album', 'You do not have permission to create albums.'),
+        'update': ('main_app.change_album', 'You do not have permission to update albums.'),
+        'destroy': ('main_app.delete_album', 'You do not have permission to delete albums.'),
+    }
+
+    def check_bulk_permission(self, request, operation):
+        """Bulk operations require the same permissions as the single instance methods.
+        """
+        perm, message = self.bulk_permissions[operation]
+        if not get_authorization_context(request).has_perm(perm):
+            return Response({'res': message}, status=status.HTTP_403_FORBIDDEN)
+        return None
+
+
+# Async ViewSets - The ViewSets below serve the same resources under 'api/async/' (see 'urls.py'), with their actions
+# written as coroutines. Under an ASGI server (see 'config/asgi.py') they run on the event loop and read the database
+# with Django's async ORM ('aget', 'acount' and 'async for'), so a request waiting on the database doesn't hold a
+# thread. Each one extends its sync ViewSet, so the querysets, serializers and access rules are shared.
+class AsyncModelViewSetMixin:
+    """Mixin that runs a ModelViewSet's actions as coroutines. It must come before the ViewSet it extends.
+
+    Authentication, throttling and the permission classes run in a thread, because Django REST Framework's
+    authenticators are synchronous (e.g. the session lookup). The user's groups and permissions are then loaded
+    asynchronously, so the group and permission checks of the sync ViewSet (such as 'get_queryset') can read them
+    without querying. Serializer validation and saving also run in a thread, DRF has no async API for them.
+    Actions that are not coroutines (e.g. 'bulk') are run in a thread too.
+
+    The ViewSet must use 'ConditionalGetMixin' (as every sync ViewSet here does), whose validators 'list' and
+    'retrieve' compute to answer conditional requests. The responses are not cached by 'CachedResponseMixin'.
+
+    Subclasses list the permission or group each action needs in 'action_permissions' and 'action_groups', with
+    the message returned when it is missing, instead of overriding each action.
+    """
+    # Maps actions to the (permission, message) they require, e.g. {'list': ('main_app.view_album', '...')}.
+    action_permissions = {}
+    # Maps actions to the (group name, message) they require, e.g. {'create': ('Talent Agents', '...')}.
+    action_groups = {}
+
+    @classonlymethod
+    def as_view(cls, actions=None, **initkwargs):
+        """Returns the view function of the ViewSet, marked as async so Django awaits it on the event loop.
+        """
+        return markcoroutinefunction(super().as_view(actions, **initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        """Async version of 'APIView.dispatch'.
+        """
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            response = await self.check_action_permission(request)
+            if response is None:
+                if request.method.lower() in self.http_method_names:
+                    handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+                else:
+                    handler = self.http_method_not_allowed
+                if iscoroutinefunction(handler):
+                    response = await handler(request, *args, **kwargs)
+                else:
+                    response = await sync_to_async(handler)(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def check_action_permission(self, request):
+        """Returns a 403 Forbidden response if the user lacks the permission or group of the action, otherwise None.
+        """
+        authorization = await aget_authorization_context(request)
+        if self.action in self.action_permissions:
+            perm, message = self.action_permissions[self.action]
+            if not authorization.has_perm(perm):
+                return Response({'res': message}, status=status.HTTP_403_FORBIDDEN)
+        if self.action in self.action_groups:
+            group, message = self.action_groups[self.action]
+            if not authorization.in_group(group):
+                return Response({'res': message}, status=status.HTTP_403_FORBIDDEN)
+        return None
+
+    async def afilter_queryset(self, queryset):
+        """Async version of 'filter_queryset', for filter backends that may need to query the database.
+        """
+        for backend in self.filter_backends:
+            backend = backend()
+            if hasattr(backend, 'afilter_queryset'):
+                queryset = await backend.afilter_queryset(self.request, queryset, self)
+            else:
+                queryset = backend.filter_queryset(self.request, queryset, self)
+        return queryset
+
+    async def aget_object(self):
+        """Async version of 'get_object', fetching the instance with 'aget'.
+        """
+        queryset = await self.afilter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            instance = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (queryset.model.DoesNotExist, TypeError, ValueError, DjangoValidationError):
+            raise Http404
+        self.check_object_permissions(self.request, instance)
+        return instance
+
+    def save_serializer(self, serializer, perform_save):
+        """Validates and saves a serializer, then returns its data. Run in a thread by the write actions.
+        """
+        serializer.is_valid(raise_exception=True)
+        perform_save(serializer)
+        instance = serializer.instance
+        if getattr(instance, '_prefetched_objects_cache', None):
+            # The prefetched relations may have changed, they are read again for the response.
+            instance._prefetched_objects_cache = {}
+        return serializer.data
+
+    async def list(self, request, *args, **kwargs):
+        """Retrieve a page of instances, or 304 Not Modified if the client's copy is current.
+        """
+        queryset = await self.afilter_queryset(self.get_queryset())
+        validators = await self.aget_list_validators(queryset)
+        response = get_not_modified_response(request, *validators)
+        if response is None:
+            page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+            if page is None:
+                page = [instance async for instance in queryset]
+                response = Response(self.get_serializer(page, many=True).data)
+            else:
+                response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return self.add_validators(response, validators)
+
+    async def retrieve(self, request, *args, **kwargs):
+        """Retrieve a specific instance by ID, or 304 Not Modified if the client's copy is current.
+        """
+        instance = await self.aget_object()
+        validators = self.get_instance_validators(instance)
+        response = get_not_modified_response(request, *validators)
+        if response is None:
+            response = Response(self.get_serializer(instance).data)
+        return self.add_validators(response, validators)
+
+    async def create(self, request, *args, **kwargs):
+        """Create a new instance.
+        """
+        serializer = self.get_serializer(data=request.data)
+        data = await sync_to_async(self.save_serializer)(serializer, self.perform_create)
+        return Response(data, status=status.HTTP_201_CREATED, headers=self.get_success_headers(data))
+
+    async def update(self, request, *args, **kwargs):
+        """Update a specific instance by ID.
+        """
+        partial = kwargs.pop('partial', False)
+        serializer = self.get_serializer(await self.aget_object(), data=request.data, partial=partial)
+        return Response(await sync_to_async(self.save_serializer)(serializer, self.perform_update))
+
+    async def partial_update(self, request, *args, **kwargs):
+        """Update specific fields of an instance by ID.
+        """
+        kwargs['partial'] = True
+        return await self.update(request, *args, **kwargs)
+
+    async def destroy(self, request, *args, **kwargs):
+        """Delete a specific instance by ID.
+        """
+        instance = await self.aget_object()
+        await instance.adelete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, methods=['get'])
+    async def count(self, request, *args, **kwargs):
+        """Count the instances the user can see, with the same filters as 'list'.
+        """
+        queryset = await self.afilter_queryset(self.get_queryset())
+        return Response({'count': await queryset.acount()})
+
+class AsyncRecordLabelViewSet(AsyncModelViewSetMixin, RecordLabelViewSet):
+    """Async version of 'RecordLabelViewSet', with the same parameters and responses.
+
+    Also provides 'count/' (GET), which returns {"count": n} for the same filters as the list.
+    """
+
+class AsyncMusicianViewSet(AsyncModelViewSetMixin, MusicianViewSet):
+    """Async version of 'MusicianViewSet', with the same parameters, responses and access rules.
+
+    Also provides 'count/' (GET), which returns {"count": n} for the musicians the user can see.
+    """
+    action_groups = {
+        'create': ('Talent Agents', 'You do not have permission to create a musician.'),
+    }
+
+class AsyncAlbumViewSet(AsyncModelViewSetMixin, AlbumViewSet):
+    """Async version of 'AlbumViewSet', with the same parameters, responses and access rules.
+
+    Also provides 'count/' (GET), which returns {"count": n} and needs the 'main_app.view_album' permission.
+    """
+    action_permissions = {
+        'list': ('main_app.view_album', 'You do not have permission to view albums.'),
+        'count': ('main_app.view_album', 'You do not have permission to view albums.'),
+        'retrieve': ('main_app.view_album', 'You do not have permission to view this album.'),
+        'create': ('main_app.add_album', 'You do not have permission to create an album.'),
+        'update': ('main_app.change_album', 'You do not have permission to update this album.'),
+        'partial_update': ('main_app.change_album', 'You do not have permission to update this album.'),
+        'destroy': ('main_app.delete_album', 'You do not have permission to delete this album.'),
+    }